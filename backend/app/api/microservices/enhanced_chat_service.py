@@ -383,14 +383,28 @@ class EnhancedChatService:
             # 构建消息列表
             messages = [{"role": "user", "content": context.get('user_message', '')}]
             
-            # 调用LLM服务生成响应
-            response = self.llm_service.chat_completion(
+            # 通过共享异步连接池调用LLM服务，不阻塞事件循环
+            response = {}
+            async for event in self.llm_service.astream_chat_completion(
                 messages=messages,
                 model_name=None,  # 使用默认模型
                 max_tokens=4096,
                 temperature=0.7,
                 db=db
-            )
+            ):
+                if event["type"] in ("done", "error"):
+                    response = event
+            
+            if not response.get("success", False):
+                # 异步调用失败时回退到同步调用（支持备用模型），在线程中执行
+                response = await asyncio.to_thread(
+                    self.llm_service.chat_completion,
+                    messages=messages,
+                    model_name=None,
+                    max_tokens=4096,
+                    temperature=0.7,
+                    db=db
+                )
             
             db.close()
             
@@ -570,4 +584,5 @@ async def startup_event():
 @enhanced_chat_app.on_event("shutdown")
 async def shutdown_event():
     """服务关闭事件"""
+    await enhanced_chat_service.llm_service.http_transport.aclose()
     print("记忆增强聊天微服务已关闭")
\ No newline at end of file
@@ -29,6 +29,11 @@ class Settings(BaseSettings):
     # Redis配置
     redis_url: str = Field(default="redis://localhost:6379/0", env="REDIS_URL")
     
+    # 频率限制配置
+    rate_limit_backend: str = Field(default="memory", env="RATE_LIMIT_BACKEND", description="频率限制状态存储: memory 或 redis（多进程共享）")
+    rate_limit_max_keys: int = Field(default=100000, env="RATE_LIMIT_MAX_KEYS", description="内存模式下最多保留的限流键数量")
+    rate_limit_redis_timeout: float = Field(default=0.1, env="RATE_LIMIT_REDIS_TIMEOUT", description="Redis限流调用的套接字超时（秒），超时或失败时改用内存限流")
+    
     # API配置
     api_v1_str: str = Field(default="/api/v1", env="API_V1_STR")
     secret_key: str = Field(
@@ -104,6 +109,70 @@ class Settings(BaseSettings):
     vector_store_db_path: str = Field(default=os.path.join(BASE_DIR, "vector_store.db"), env="VECTOR_STORE_DB_PATH", description="SQLite向量存储数据库路径")
     chromadb_server_url: str = Field(default="http://localhost:8008", env="CHROMADB_SERVER_URL", description="ChromaDB服务地址")
     chromadb_collection: str = Field(default="documents", env="CHROMADB_COLLECTION", description="ChromaDB默认集合名称")
+    vector_store_storage_mode: str = Field(default="matrix", env="VECTOR_STORE_STORAGE_MODE", description="SQLite向量存储模式: json 或 matrix（float32 BLOB + 内存映射矩阵）")
+    vector_store_matrix_dir: str = Field(default=os.path.join(BASE_DIR, "vector_matrix_cache"), env="VECTOR_STORE_MATRIX_DIR", description="SQLite向量存储矩阵缓存目录")
+    chunk_insert_batch_size: int = Field(default=500, env="CHUNK_INSERT_BATCH_SIZE", description="文档分块批量写入数据库的每批行数")
+
+    # BM25关键词索引配置
+    bm25_index_dir: str = Field(default=os.path.join(BASE_DIR, "bm25_index"), env="BM25_INDEX_DIR", description="文档分块BM25倒排索引的持久化目录")
+    bm25_k1: float = Field(default=1.2, env="BM25_K1", description="BM25词频饱和参数k1")
+    bm25_b: float = Field(default=0.75, env="BM25_B", description="BM25文档长度归一化参数b")
+    bm25_reconcile_interval: float = Field(default=30.0, env="BM25_RECONCILE_INTERVAL", description="无写入通知时与数据库对账的最长间隔（秒）")
+
+    # 查询缓存配置
+    query_cache_semantic_enabled: bool = Field(default=True, env="QUERY_CACHE_SEMANTIC_ENABLED", description="是否启用语义查询缓存（相似改写查询复用检索结果）")
+    query_cache_semantic_threshold: float = Field(default=0.92, env="QUERY_CACHE_SEMANTIC_THRESHOLD", description="语义缓存命中的最低查询余弦相似度")
+    query_cache_semantic_max_entries: int = Field(default=2000, env="QUERY_CACHE_SEMANTIC_MAX_ENTRIES", description="每个知识库语义缓存索引的最大查询数")
+    query_cache_semantic_backend: str = Field(default="auto", env="QUERY_CACHE_SEMANTIC_BACKEND", description="语义缓存索引的HNSW后端: auto / hnswlib / faiss / numpy")
+
+    # 大模型HTTP传输配置
+    llm_http_max_connections: int = Field(default=20, env="LLM_HTTP_MAX_CONNECTIONS", description="每个供应商的最大保活连接数")
+    llm_http_max_concurrency: int = Field(default=16, env="LLM_HTTP_MAX_CONCURRENCY", description="每个供应商的最大并发请求数")
+    llm_http_keepalive_expiry: float = Field(default=60.0, env="LLM_HTTP_KEEPALIVE_EXPIRY", description="空闲连接保活时间（秒）")
+    llm_http2_enabled: bool = Field(default=True, env="LLM_HTTP2_ENABLED", description="可用时为异步客户端启用HTTP/2")
+
+    # 大模型供应商限流配置
+    llm_supplier_requests_per_second: float = Field(default=5.0, env="LLM_SUPPLIER_REQUESTS_PER_SECOND", description="每个供应商的默认请求速率上限（令牌桶补充速率，次/秒）")
+    llm_supplier_burst: int = Field(default=10, env="LLM_SUPPLIER_BURST", description="令牌桶容量（允许的突发请求数）")
+    llm_supplier_rate_limits: str = Field(default="ollama:2", env="LLM_SUPPLIER_RATE_LIMITS", description="按供应商覆盖请求速率，格式: 供应商:次每秒,供应商:次每秒")
+    llm_supplier_initial_concurrency: int = Field(default=4, env="LLM_SUPPLIER_INITIAL_CONCURRENCY", description="每个供应商的初始并发上限")
+    llm_supplier_max_concurrency: int = Field(default=16, env="LLM_SUPPLIER_MAX_CONCURRENCY", description="自适应并发上限的最大值")
+    llm_supplier_target_latency: float = Field(default=30.0, env="LLM_SUPPLIER_TARGET_LATENCY", description="平均延迟超过该值（秒）时收缩并发上限")
+
+    # 片段实体提取配置
+    entity_extraction_max_retries: int = Field(default=3, env="ENTITY_EXTRACTION_MAX_RETRIES", description="单个片段实体提取失败后的最大重试次数")
+    entity_extraction_write_batch_size: int = Field(default=50, env="ENTITY_EXTRACTION_WRITE_BATCH_SIZE", description="每累计多少个片段的实体批量写入一次数据库")
+    entity_extraction_pack_token_budget: int = Field(default=2000, env="ENTITY_EXTRACTION_PACK_TOKEN_BUDGET", description="多片段打包为一次LLM请求时片段文本的估算token上限，0表示不打包")
+    entity_extraction_pack_max_chunks: int = Field(default=8, env="ENTITY_EXTRACTION_PACK_MAX_CHUNKS", description="每次打包请求最多包含的片段数")
+
+    # 模型配置缓存
+    model_config_cache_ttl: float = Field(default=300.0, env="MODEL_CONFIG_CACHE_TTL", description="已解析模型配置的本地缓存有效期（秒），Redis失效通知不可用时的兜底")
+
+    # 模型调用观测（模型调度按实测延迟路由）
+    model_latency_window_size: int = Field(default=200, env="MODEL_LATENCY_WINDOW_SIZE", description="每个模型用于计算p50/p95延迟的最近成功请求数")
+    model_latency_ewma_alpha: float = Field(default=0.2, env="MODEL_LATENCY_EWMA_ALPHA", description="模型延迟与错误率EWMA的平滑系数")
+    model_latency_min_samples: int = Field(default=5, env="MODEL_LATENCY_MIN_SAMPLES", description="模型调度采用实测延迟所需的最少样本数，不足时使用估算值")
+
+    # 工作流调度配置
+    workflow_max_parallel_nodes: int = Field(default=8, env="WORKFLOW_MAX_PARALLEL_NODES", description="工作流同时执行的最大节点数")
+    workflow_node_concurrency_limits: str = Field(default="knowledge_search:4,entity_extraction:2,relationship_analysis:2,mcp:4", env="WORKFLOW_NODE_CONCURRENCY_LIMITS", description="按节点类型的并发上限，格式: 类型:上限,类型:上限")
+
+    # 实体对齐配置
+    entity_alignment_exact_max_entities: int = Field(default=300, env="ENTITY_ALIGNMENT_EXACT_MAX_ENTITIES", description="同类型实体数不超过该值时使用完整相似度矩阵与层次聚类，超过时使用分块候选与并查集")
+    entity_alignment_lsh_num_perm: int = Field(default=32, env="ENTITY_ALIGNMENT_LSH_NUM_PERM", description="实体对齐MinHash哈希函数个数")
+    entity_alignment_lsh_band_size: int = Field(default=2, env="ENTITY_ALIGNMENT_LSH_BAND_SIZE", description="实体对齐LSH每个带的行数")
+    entity_alignment_embedding_top_k: int = Field(default=10, env="ENTITY_ALIGNMENT_EMBEDDING_TOP_K", description="实体对齐嵌入近邻候选数")
+
+    # 图谱检索配置
+    graph_index_ttl: float = Field(default=300.0, env="GRAPH_INDEX_TTL", description="进程内知识图谱索引的有效期（秒），Redis失效通知不可用时的兜底")
+
+    # 图谱指标配置
+    graph_metrics_exact_max_nodes: int = Field(default=1000, env="GRAPH_METRICS_EXACT_MAX_NODES", description="节点数不超过该值时精确计算中心性与路径指标，否则采样近似")
+    graph_metrics_max_nodes: int = Field(default=200000, env="GRAPH_METRICS_MAX_NODES", description="超过该节点数时跳过图谱指标计算")
+    graph_metrics_error_budget: float = Field(default=0.1, env="GRAPH_METRICS_ERROR_BUDGET", description="近似介数中心性的误差预算ε")
+    graph_metrics_failure_probability: float = Field(default=0.1, env="GRAPH_METRICS_FAILURE_PROBABILITY", description="近似误差超出预算的概率δ")
+    graph_metrics_max_samples: int = Field(default=256, env="GRAPH_METRICS_MAX_SAMPLES", description="近似计算的最大枢纽节点数")
+    graph_metrics_cache_size: int = Field(default=32, env="GRAPH_METRICS_CACHE_SIZE", description="按图版本缓存的指标数量")
     
     class Config:
         env_file = ".env"
@@ -1,40 +1,116 @@
 """API频率限制中间件"""
+import asyncio
+import math
 import time
-from collections import defaultdict
-from typing import Dict, Tuple, Optional
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Tuple, Optional, Any
 from fastapi import Request, HTTPException, status
 from fastapi.responses import JSONResponse
+from app.core.config import settings
 from app.core.logging_config import logger
 
 
+# GCRA 原子检查脚本
+# KEYS[1]: 限流键; ARGV: 当前时间(秒), 发放间隔(秒), 窗口(秒)
+# 返回: {是否允许(1/0), 剩余次数, 需等待秒数(字符串)}
+GCRA_LUA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local window = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+if new_tat - now > window then
+    return {0, 0, tostring(new_tat - now - window)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, math.floor((now + window - new_tat) / interval), '0'}
+"""
+
+
+@dataclass
+class RateLimitDecision:
+    """单次频率限制检查结果"""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: float
+    window: int
+
+
 class RateLimiter:
-    """API频率限制器"""
-    
-    def __init__(self):
-        self.requests: Dict[str, list] = defaultdict(list)
-        self.banned_ips: Dict[str, float] = {}
-        self.cleanup_interval = 300  # 5分钟清理一次
-        self.last_cleanup = time.time()
-    
-    def _cleanup_old_requests(self):
-        """清理过期的请求记录"""
-        current_time = time.time()
-        if current_time - self.last_cleanup < self.cleanup_interval:
-            return
-        
-        self.last_cleanup = current_time
-        
-        for ip in list(self.requests.keys()):
-            self.requests[ip] = [
-                req_time for req_time in self.requests[ip]
-                if current_time - req_time < 3600  # 保留1小时内的记录
-            ]
-            if not self.requests[ip]:
-                del self.requests[ip]
-        
-        for ip in list(self.banned_ips.keys()):
-            if current_time - self.banned_ips[ip] > 3600:
-                del self.banned_ips[ip]
+    """
+    API频率限制器
+    
+    使用 GCRA（通用信元速率算法）：每个限流键只保存一个“理论到达时间”(TAT)，
+    每次请求 O(1) 时间、固定大小状态，效果等同于允许突发 max_requests 次的令牌桶。
+    
+    - memory 模式：状态保存在进程内的有序字典中，过期键在访问时顺带淘汰
+    - redis 模式：状态保存在 Redis 中并由 Lua 脚本原子更新，多个 uvicorn 进程共享限额；
+      Redis 不可用时自动退回 memory 模式，单次调用超时或失败时本次请求使用内存限流，
+      并在一段时间内跳过 Redis
+    """
+    
+    # Redis 调用失败后跳过 Redis 的时长（秒）
+    REDIS_RETRY_DELAY = 5.0
+    
+    def __init__(
+        self,
+        backend: str = "memory",
+        redis_client: Any = None,
+        key_prefix: str = "rate_limit",
+        max_keys: int = 100000,
+        redis_timeout: float = 0.1
+    ):
+        self.backend = backend
+        self.key_prefix = key_prefix
+        self.max_keys = max_keys
+        self.redis_timeout = redis_timeout
+        
+        # 限流键 -> (TAT, 发放间隔)，按最近更新时间排序
+        self._state: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.banned_ips: Dict[str, float] = {}  # IP -> 解封时间
+        self._lock = threading.Lock()
+        
+        self._redis = None
+        self._redis_retry_at = 0.0
+        self._gcra_script = None
+        if backend == "redis":
+            self._init_redis(redis_client)
+    
+    def _init_redis(self, redis_client: Any):
+        """初始化 Redis 后端"""
+        try:
+            if redis_client is None:
+                # 独立连接池，使用较短的套接字超时，避免 Redis 卡顿拖慢每个请求
+                import redis
+                redis_client = redis.Redis.from_url(
+                    settings.redis_url,
+                    socket_timeout=self.redis_timeout,
+                    socket_connect_timeout=self.redis_timeout,
+                    decode_responses=True
+                )
+                redis_client.ping()
+            self._redis = redis_client
+            self._gcra_script = redis_client.register_script(GCRA_LUA_SCRIPT)
+            logger.info("频率限制器使用Redis后端")
+        except Exception as e:
+            logger.warning(f"频率限制器Redis后端初始化失败，使用内存模式: {e}")
+            self.backend = "memory"
+            self._redis = None
+    
+    def _redis_available(self) -> bool:
+        """Redis 后端可用且不在失败后的冷却期内"""
+        return self._redis is not None and time.monotonic() >= self._redis_retry_at
+    
+    def _redis_failed(self, message: str, error: Exception):
+        """记录 Redis 调用失败，冷却期内改用内存限流"""
+        self._redis_retry_at = time.monotonic() + self.REDIS_RETRY_DELAY
+        logger.warning(f"{message}，{self.REDIS_RETRY_DELAY:.0f}秒内使用内存模式: {error}")
     
     def _get_client_ip(self, request: Request) -> str:
         """获取客户端IP地址"""
@@ -48,21 +124,128 @@ class RateLimiter:
         
         return request.client.host if request.client else "unknown"
     
-    def _get_rate_limit_key(self, request: Request) -> Tuple[str, str]:
-        """获取频率限制的键"""
+    def _get_rate_limit_key(self, request: Request, route: str = "default") -> str:
+        """获取频率限制的键（IP + 路由）"""
+        return f"{self.key_prefix}:{self._get_client_ip(request)}:{route}"
+    
+    def _evict_expired(self, now: float):
+        """淘汰最久未更新且已恢复满额的键，并限制键总数"""
+        while self._state:
+            key, (tat, _) = next(iter(self._state.items()))
+            if tat > now and len(self._state) <= self.max_keys:
+                break
+            self._state.popitem(last=False)
+    
+    def _acquire_memory(self, key: str, max_requests: int, window_seconds: int, now: float) -> Tuple[bool, int, float]:
+        """内存模式 GCRA 检查"""
+        interval = window_seconds / max_requests
+        with self._lock:
+            tat, _ = self._state.get(key, (now, interval))
+            tat = max(tat, now)
+            new_tat = tat + interval
+            if new_tat - now > window_seconds:
+                return False, 0, new_tat - now - window_seconds
+            
+            self._state[key] = (new_tat, interval)
+            self._state.move_to_end(key)
+            self._evict_expired(now)
+            return True, int((now + window_seconds - new_tat) // interval), 0.0
+    
+    def _acquire_redis(self, key: str, max_requests: int, window_seconds: int, now: float) -> Tuple[bool, int, float]:
+        """Redis 模式 GCRA 检查"""
+        allowed, remaining, retry_after = self._gcra_script(
+            keys=[key], args=[now, window_seconds / max_requests, window_seconds]
+        )
+        return bool(int(allowed)), int(remaining), float(retry_after)
+    
+    def check(
+        self,
+        request: Request,
+        max_requests: int = 100,
+        window_seconds: int = 60,
+        route: str = "default"
+    ) -> RateLimitDecision:
+        """
+        检查并记录一次请求
+        
+        Args:
+            request: 请求对象
+            max_requests: 窗口内最大请求数
+            window_seconds: 时间窗口（秒）
+            route: 路由限流分组，不同分组使用独立的限额
+        
+        Returns:
+            检查结果
+        """
+        now = time.time()
+        key = self._get_rate_limit_key(request, route)
+        
+        if self._redis_available():
+            try:
+                allowed, remaining, retry_after = self._acquire_redis(key, max_requests, window_seconds, now)
+                return RateLimitDecision(allowed, max_requests, remaining, retry_after, window_seconds)
+            except Exception as e:
+                self._redis_failed("Redis频率限制检查失败", e)
+        
+        allowed, remaining, retry_after = self._acquire_memory(key, max_requests, window_seconds, now)
+        return RateLimitDecision(allowed, max_requests, remaining, retry_after, window_seconds)
+    
+    def get_ban_remaining(self, request: Request) -> int:
+        """获取IP剩余封禁时间（秒），未封禁返回0"""
         ip = self._get_client_ip(request)
-        path = request.url.path
+        now = time.time()
         
-        if path.startswith("/api/v1/"):
-            return (ip, path)
+        if self._redis_available():
+            try:
+                ttl = self._redis.ttl(f"{self.key_prefix}:ban:{ip}")
+                return max(0, int(ttl))
+            except Exception as e:
+                self._redis_failed("Redis封禁检查失败", e)
         
-        return (ip, "default")
+        banned_until = self.banned_ips.get(ip)
+        if banned_until is None:
+            return 0
+        if banned_until <= now:
+            del self.banned_ips[ip]
+            return 0
+        return int(math.ceil(banned_until - now))
+    
+    def check_request(
+        self,
+        request: Request,
+        max_requests: int = 100,
+        window_seconds: int = 60,
+        route: str = "default"
+    ) -> Tuple[int, Optional[RateLimitDecision]]:
+        """
+        检查封禁并记录一次请求
+        
+        Returns:
+            (剩余封禁秒数, 检查结果)，已封禁时检查结果为 None
+        """
+        ban_remaining = self.get_ban_remaining(request)
+        if ban_remaining:
+            return ban_remaining, None
+        return 0, self.check(request, max_requests, window_seconds, route)
+    
+    async def acheck_request(
+        self,
+        request: Request,
+        max_requests: int = 100,
+        window_seconds: int = 60,
+        route: str = "default"
+    ) -> Tuple[int, Optional[RateLimitDecision]]:
+        """check_request 的异步版本：Redis 模式下在线程池中执行，不阻塞事件循环"""
+        if not self._redis_available():
+            return self.check_request(request, max_requests, window_seconds, route)
+        return await asyncio.to_thread(self.check_request, request, max_requests, window_seconds, route)
     
     def is_rate_limited(
         self,
         request: Request,
         max_requests: int = 100,
-        window_seconds: int = 60
+        window_seconds: int = 60,
+        route: str = "default"
     ) -> Tuple[bool, Optional[Dict]]:
         """
         检查是否达到频率限制
@@ -71,38 +254,27 @@ class RateLimiter:
             request: 请求对象
             max_requests: 最大请求数
             window_seconds: 时间窗口（秒）
+            route: 路由限流分组
         
         Returns:
             (是否限制, 限制信息字典)
         """
-        self._cleanup_old_requests()
-        
-        ip = self._get_client_ip(request)
-        
-        if ip in self.banned_ips:
-            remaining_time = int(3600 - (time.time() - self.banned_ips[ip]))
+        ban_remaining = self.get_ban_remaining(request)
+        if ban_remaining:
             return True, {
                 "error": "IP已被封禁",
-                "retry_after": remaining_time
+                "retry_after": ban_remaining
             }
         
-        key = self._get_rate_limit_key(request)
-        current_time = time.time()
-        
-        request_times = self.requests[key[0]]
-        
-        window_start = current_time - window_seconds
-        recent_requests = [t for t in request_times if t > window_start]
-        
-        if len(recent_requests) >= max_requests:
+        decision = self.check(request, max_requests, window_seconds, route)
+        if not decision.allowed:
             return True, {
                 "error": "请求过于频繁",
-                "retry_after": window_seconds,
+                "retry_after": int(math.ceil(decision.retry_after)),
                 "limit": max_requests,
                 "window": window_seconds
             }
         
-        self.requests[key[0]].append(current_time)
         return False, None
     
     def ban_ip(self, request: Request, duration: int = 3600):
@@ -114,36 +286,40 @@ class RateLimiter:
             duration: 封禁时长（秒）
         """
         ip = self._get_client_ip(request)
+        if self._redis is not None:
+            try:
+                self._redis.set(f"{self.key_prefix}:ban:{ip}", "1", ex=duration)
+            except Exception as e:
+                logger.warning(f"Redis封禁IP失败，仅在本进程生效: {e}")
         self.banned_ips[ip] = time.time() + duration
         logger.warning(f"IP {ip} 已被封禁 {duration} 秒")
     
-    def get_request_count(self, request: Request, window_seconds: int = 60) -> int:
+    def get_request_count(self, request: Request, window_seconds: int = 60, route: str = "default") -> int:
         """
-        获取指定时间窗口内的请求次数
+        获取指定时间窗口内的请求次数（由TAT估算，仅内存模式）
         
         Args:
             request: 请求对象
             window_seconds: 时间窗口（秒）
+            route: 路由限流分组
         
         Returns:
             请求次数
         """
-        ip = self._get_client_ip(request)
-        current_time = time.time()
-        window_start = current_time - window_seconds
-        
-        request_times = self.requests.get(ip, [])
-        recent_requests = [t for t in request_times if t > window_start]
-        
-        return len(recent_requests)
+        state = self._state.get(self._get_rate_limit_key(request, route))
+        if state is None:
+            return 0
+        tat, interval = state
+        return int(math.ceil(max(0.0, tat - time.time()) / interval))
 
 
 class RateLimitMiddleware:
     """频率限制中间件"""
     
     def __init__(self, rate_limiter: RateLimiter = None):
-        self.rate_limiter = rate_limiter or RateLimiter()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
         
+        # 每个路由前缀使用独立的限额，未匹配的路径共享 default 限额
         self.rate_limits = {
             "default": {"max_requests": 100, "window_seconds": 60},
             "/api/v1/auth/login": {"max_requests": 5, "window_seconds": 60},
@@ -154,6 +330,17 @@ class RateLimitMiddleware:
             "/api/v1/skills": {"max_requests": 40, "window_seconds": 60},
         }
     
+    def set_route_limit(self, route: str, max_requests: int, window_seconds: int = 60):
+        """
+        设置路由前缀的频率限制
+        
+        Args:
+            route: 路由前缀（"default" 为默认限额）
+            max_requests: 最大请求数
+            window_seconds: 时间窗口（秒）
+        """
+        self.rate_limits[route] = {"max_requests": max_requests, "window_seconds": window_seconds}
+    
     async def __call__(self, request: Request, call_next):
         """
         中间件处理函数
@@ -170,15 +357,23 @@ class RateLimitMiddleware:
         if not path.startswith("/api/"):
             return await call_next(request)
         
-        rate_limit_config = self._get_rate_limit_config(path)
+        route, rate_limit_config = self._get_rate_limit_config(path)
         
-        is_limited, limit_info = self.rate_limiter.is_rate_limited(
+        ban_remaining, decision = await self.rate_limiter.acheck_request(
             request,
             max_requests=rate_limit_config["max_requests"],
-            window_seconds=rate_limit_config["window_seconds"]
+            window_seconds=rate_limit_config["window_seconds"],
+            route=route
         )
+        if ban_remaining:
+            limit_info = {"error": "IP已被封禁", "retry_after": ban_remaining}
+        else:
+            limit_info = None if decision.allowed else {
+                "error": "请求过于频繁",
+                "retry_after": int(math.ceil(decision.retry_after))
+            }
         
-        if is_limited:
+        if limit_info:
             logger.warning(
                 f"频率限制触发 - IP: {self.rate_limiter._get_client_ip(request)}, "
                 f"路径: {path}, 原因: {limit_info.get('error', '未知')}"
@@ -194,31 +389,39 @@ class RateLimitMiddleware:
                         "limit": rate_limit_config["max_requests"],
                         "window": rate_limit_config["window_seconds"]
                     }
-                }
+                },
+                headers={"Retry-After": str(limit_info.get("retry_after", 60))}
             )
         
         response = await call_next(request)
         
-        request_count = self.rate_limiter.get_request_count(request)
         response.headers["X-RateLimit-Limit"] = str(rate_limit_config["max_requests"])
-        response.headers["X-RateLimit-Remaining"] = str(
-            max(0, rate_limit_config["max_requests"] - request_count)
-        )
+        response.headers["X-RateLimit-Remaining"] = str(decision.remaining)
         response.headers["X-RateLimit-Window"] = str(rate_limit_config["window_seconds"])
         
         return response
     
-    def _get_rate_limit_config(self, path: str) -> Dict:
-        """获取指定路径的频率限制配置"""
-        for route, config in self.rate_limits.items():
-            if path.startswith(route):
-                return config
-        return self.rate_limits["default"]
+    def _get_rate_limit_config(self, path: str) -> Tuple[str, Dict]:
+        """获取指定路径匹配的路由前缀及其频率限制配置（最长前缀优先）"""
+        for route in sorted(self.rate_limits, key=len, reverse=True):
+            if route != "default" and path.startswith(route):
+                return route, self.rate_limits[route]
+        return "default", self.rate_limits["default"]
+
+
+_rate_limiter: Optional[RateLimiter] = None
 
 
 def get_rate_limiter() -> RateLimiter:
-    """获取频率限制器实例"""
-    return RateLimiter()
+    """获取频率限制器实例（进程内共享）"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(
+            backend=getattr(settings, "rate_limit_backend", "memory"),
+            max_keys=getattr(settings, "rate_limit_max_keys", 100000),
+            redis_timeout=getattr(settings, "rate_limit_redis_timeout", 0.1)
+        )
+    return _rate_limiter
 
 
 def get_rate_limit_middleware() -> RateLimitMiddleware:
@@ -4,10 +4,11 @@
 提供日志数据的查询、过滤、统计和导出功能。
 """
 import json
-import gzip
+import heapq
 import re
+import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from pathlib import Path
 
 from fastapi import APIRouter, HTTPException, Query
@@ -15,6 +16,9 @@ from pydantic import BaseModel
 
 from .structured_logger import log_manager
 from .log_rotation import log_rotation_manager
+from .log_index import is_active_log, iter_lines_reverse, load_or_build_index, parse_timestamp
+
+logger = logging.getLogger("log_api")
 
 router = APIRouter(prefix="/api/logs", tags=["日志管理"])
 
@@ -85,7 +89,7 @@ class LogExportRequest(BaseModel):
 class LogSearchResponse(BaseModel):
     """日志搜索响应模型"""
     entries: List[LogEntryResponse]
-    total_count: int
+    total_count: int  # 搜索取满 offset+limit 后即停止，此时为已找到的匹配数（多出的一条表示还有更多）
     has_more: bool
     search_time_ms: float
 
@@ -104,11 +108,14 @@ class LogQueryEngine:
     def search_logs(self, request: LogQueryRequest) -> Tuple[List[Dict[str, Any]], int]:
         """搜索日志
         
+        各文件由新到旧流式产出匹配条目并按时间归并，取满 offset+limit 后
+        再多取一条用于判断是否还有更多结果，随即停止读取。
+        
         Args:
             request: 查询请求
             
         Returns:
-            (日志条目列表, 总数量)
+            (日志条目列表, 已找到的匹配数量)
         """
         try:
             # 获取日志文件列表
@@ -116,28 +123,32 @@ class LogQueryEngine:
             
             # 解析时间范围
             start_time, end_time = self._parse_time_range(request.start_time, request.end_time)
+            start_ts = parse_timestamp(start_time.isoformat()) if start_time else None
+            end_ts = parse_timestamp(end_time.isoformat()) if end_time else None
+            pattern = self._compile_message_pattern(request.message_pattern)
             
-            # 搜索日志
-            entries = []
-            total_count = 0
-            
-            for log_file in log_files:
-                file_entries, file_count = self._search_single_file(
-                    log_file, request, start_time, end_time
-                )
-                entries.extend(file_entries)
-                total_count += file_count
-                
-            # 排序和分页
-            entries.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+            # 各文件按时间倒序产出，归并后整体由新到旧
+            streams = [
+                self._search_single_file(log_file, request, start_ts, end_ts, pattern)
+                for log_file in log_files
+            ]
+            merged = heapq.merge(*streams, key=lambda x: x.get("timestamp", ""), reverse=True)
             
             # 应用分页
-            start_idx = request.offset
-            end_idx = request.offset + request.limit
-            paginated_entries = entries[start_idx:end_idx]
+            wanted = request.offset + request.limit
+            entries = []
+            total_count = 0
+            for entry in merged:
+                total_count += 1
+                if total_count > wanted:
+                    break
+                if total_count > request.offset:
+                    entries.append(entry)
             
-            return paginated_entries, total_count
+            return entries, total_count
             
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"搜索日志失败: {str(e)}")
             
@@ -202,31 +213,47 @@ class LogQueryEngine:
                 
         return start_dt, end_dt
         
+    def _iter_file_lines(self, log_file: Path, start_ts: Optional[float] = None,
+                         end_ts: Optional[float] = None, level: Optional[str] = None,
+                         logger_name: Optional[str] = None) -> Iterator[bytes]:
+        """由新到旧遍历日志文件的行
+        
+        正在写入的文件从末尾倒序读取；其余文件（轮转文件、归档）借助侧车索引
+        跳过时间范围、级别、记录器不匹配的数据块，按块倒序读取。
+        
+        Args:
+            log_file: 日志文件路径
+            start_ts: 开始时间（UTC秒）
+            end_ts: 结束时间（UTC秒）
+            level: 日志级别
+            logger_name: 日志记录器名称
+        """
+        if is_active_log(log_file):
+            yield from iter_lines_reverse(log_file)
+            return
+            
+        index = load_or_build_index(log_file)
+        for _, data in index.read_blocks_reverse(index.candidate_blocks(start_ts, end_ts, level, logger_name)):
+            yield from reversed(data.split(b"\n"))
+            
     def _search_single_file(self, log_file: Path, request: LogQueryRequest,
-                           start_time: Optional[datetime], end_time: Optional[datetime]) -> Tuple[List[Dict[str, Any]], int]:
-        """搜索单个日志文件
+                           start_ts: Optional[float], end_ts: Optional[float],
+                           pattern: Optional[re.Pattern]) -> Iterator[Dict[str, Any]]:
+        """搜索单个日志文件，由新到旧逐条产出匹配的条目
         
         Args:
             log_file: 日志文件路径
             request: 查询请求
-            start_time: 开始时间
-            end_time: 结束时间
+            start_ts: 开始时间（UTC秒）
+            end_ts: 结束时间（UTC秒）
+            pattern: 消息匹配正则
             
         Returns:
-            (日志条目列表, 数量)
+            日志条目迭代器
         """
-        entries = []
-        count = 0
-        
         try:
-            # 打开文件
-            if log_file.name.endswith(".gz"):
-                with gzip.open(log_file, 'rt', encoding='utf-8') as f:
-                    lines = f.readlines()
-            else:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    
+            lines = self._iter_file_lines(log_file, start_ts, end_ts, request.level, request.logger_name)
+            
             # 解析每一行
             for line in lines:
                 line = line.strip()
@@ -235,53 +262,58 @@ class LogQueryEngine:
                     
                 try:
                     log_entry = json.loads(line)
-                    
-                    # 应用过滤器
-                    if self._filter_log_entry(log_entry, request, start_time, end_time):
-                        entries.append(log_entry)
-                        count += 1
-                        
-                except json.JSONDecodeError:
+                except ValueError:
                     # 跳过非JSON格式的行
                     continue
                     
+                # 应用过滤器
+                if isinstance(log_entry, dict) and self._filter_log_entry(log_entry, request, start_ts, end_ts, pattern):
+                    yield log_entry
+                    
         except Exception as e:
             # 记录错误但继续处理其他文件
-            print(f"处理日志文件失败 {log_file}: {e}")
+            logger.error(f"处理日志文件失败 {log_file}: {e}")
             
-        return entries, count
+    def _compile_message_pattern(self, message_pattern: Optional[str]) -> Optional[re.Pattern]:
+        """编译消息匹配正则，不是合法正则时按普通文本匹配"""
+        if not message_pattern:
+            return None
+        try:
+            return re.compile(message_pattern, re.IGNORECASE)
+        except re.error:
+            return re.compile(re.escape(message_pattern), re.IGNORECASE)
         
     def _filter_log_entry(self, log_entry: Dict[str, Any], request: LogQueryRequest,
-                         start_time: Optional[datetime], end_time: Optional[datetime]) -> bool:
+                         start_ts: Optional[float], end_ts: Optional[float],
+                         pattern: Optional[re.Pattern]) -> bool:
         """过滤日志条目
         
         Args:
             log_entry: 日志条目
             request: 查询请求
-            start_time: 开始时间
-            end_time: 结束时间
+            start_ts: 开始时间（UTC秒）
+            end_ts: 结束时间（UTC秒）
+            pattern: 消息匹配正则
             
         Returns:
             是否匹配
         """
         # 时间过滤
         if "timestamp" in log_entry:
-            try:
-                log_time = datetime.fromisoformat(log_entry["timestamp"].replace('Z', '+00:00'))
-                
-                if start_time and log_time < start_time:
-                    return False
-                    
-                if end_time and log_time > end_time:
-                    return False
-                    
-            except ValueError:
+            log_ts = parse_timestamp(log_entry["timestamp"])
+            if log_ts is None:
                 # 时间格式错误，跳过此条目
                 return False
                 
+            if start_ts is not None and log_ts < start_ts:
+                return False
+                
+            if end_ts is not None and log_ts > end_ts:
+                return False
+                
         # 级别过滤
         if request.level and "level" in log_entry:
-            if log_entry["level"].upper() != request.level.upper():
+            if str(log_entry["level"]).upper() != request.level.upper():
                 return False
                 
         # 日志记录器过滤
@@ -290,15 +322,9 @@ class LogQueryEngine:
                 return False
                 
         # 消息模式过滤
-        if request.message_pattern and "message" in log_entry:
-            try:
-                pattern = re.compile(request.message_pattern, re.IGNORECASE)
-                if not pattern.search(log_entry["message"]):
-                    return False
-            except re.error:
-                # 正则表达式错误，使用简单包含匹配
-                if request.message_pattern.lower() not in log_entry["message"].lower():
-                    return False
+        if pattern and "message" in log_entry:
+            if not pattern.search(str(log_entry["message"])):
+                return False
                     
         return True
         
@@ -351,58 +377,48 @@ class LogQueryEngine:
             end_time: 结束时间
         """
         try:
-            # 打开文件
-            if log_file.name.endswith(".gz"):
-                with gzip.open(log_file, 'rt', encoding='utf-8') as f:
-                    lines = f.readlines()
-            else:
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    lines = f.readlines()
-                    
-            # 统计每一行
-            for line in lines:
+            start_ts = start_time.timestamp()
+            end_ts = end_time.timestamp()
+            
+            # 统计每一行（借助索引跳过时间范围外的数据块）
+            for line in self._iter_file_lines(log_file, start_ts, end_ts):
                 line = line.strip()
                 if not line:
                     continue
                     
                 try:
                     log_entry = json.loads(line)
-                    
-                    # 检查时间范围
-                    if "timestamp" in log_entry:
-                        try:
-                            log_time = datetime.fromisoformat(log_entry["timestamp"].replace('Z', '+00:00'))
-                            
-                            if log_time < start_time or log_time > end_time:
-                                continue
-                                
-                            # 更新统计
-                            stats["total_entries"] += 1
-                            
-                            # 级别统计
-                            level = log_entry.get("level", "UNKNOWN")
-                            stats["level_stats"][level] = stats["level_stats"].get(level, 0) + 1
-                            
-                            # 日志记录器统计
-                            logger = log_entry.get("logger", "UNKNOWN")
-                            stats["logger_stats"][logger] = stats["logger_stats"].get(logger, 0) + 1
-                            
-                            # 小时统计
-                            hour_key = log_time.strftime("%Y-%m-%d %H:00")
-                            if hour_key in stats["hourly_stats"]:
-                                stats["hourly_stats"][hour_key] += 1
-                                
-                        except ValueError:
-                            # 时间格式错误，跳过
-                            continue
-                            
-                except json.JSONDecodeError:
+                except ValueError:
                     # 跳过非JSON格式的行
                     continue
                     
+                if not isinstance(log_entry, dict) or "timestamp" not in log_entry:
+                    continue
+                    
+                # 检查时间范围
+                log_ts = parse_timestamp(log_entry["timestamp"])
+                if log_ts is None or log_ts < start_ts or log_ts > end_ts:
+                    continue
+                    
+                # 更新统计
+                stats["total_entries"] += 1
+                
+                # 级别统计
+                level = log_entry.get("level", "UNKNOWN")
+                stats["level_stats"][level] = stats["level_stats"].get(level, 0) + 1
+                
+                # 日志记录器统计
+                logger_name = log_entry.get("logger", "UNKNOWN")
+                stats["logger_stats"][logger_name] = stats["logger_stats"].get(logger_name, 0) + 1
+                
+                # 小时统计（按本地时间，与统计区间一致）
+                hour_key = datetime.fromtimestamp(log_ts).strftime("%Y-%m-%d %H:00")
+                if hour_key in stats["hourly_stats"]:
+                    stats["hourly_stats"][hour_key] += 1
+                    
         except Exception as e:
             # 记录错误但继续处理其他文件
-            print(f"统计日志文件失败 {log_file}: {e}")
+            logger.error(f"统计日志文件失败 {log_file}: {e}")
 
 
 # 创建日志查询引擎实例
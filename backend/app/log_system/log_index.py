@@ -0,0 +1,413 @@
+"""
+日志侧车索引模块
+
+为不再写入的日志文件（轮转后的文件、gzip 归档）生成侧车索引，记录每个数据块的
+位置、时间范围，以及块内出现过的日志级别和日志记录器（位图）。查询时据此跳过
+不相关的数据块，并按块倒序读取，实现由新到旧的流式搜索。
+
+- 普通文件：块为文件中的字节区间
+- gzip 归档：归档时每个块单独压缩为一个 gzip 成员，可直接定位解压；
+  旧归档按成员记录偏移，块位于成员内的解压偏移处，倒序读取时每个成员只解压一次
+"""
+import json
+import gzip
+import os
+import zlib
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+INDEX_DIR = ".index"
+INDEX_VERSION = 1
+BLOCK_SIZE = 256 * 1024  # 每块约256KB（解压后）
+READ_CHUNK = 64 * 1024
+
+# 缺少 level / logger 字段的条目在对应位图中占用的名称
+MISSING_FIELD = ""
+
+logger = logging.getLogger("log_index")
+
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """日志时间戳转为 UTC 秒（不带时区的按 UTC 处理），无法解析时返回 None"""
+    try:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def index_path(log_file: Path) -> Path:
+    """日志文件对应的侧车索引路径"""
+    return log_file.parent / INDEX_DIR / f"{log_file.name}.idx"
+
+
+def remove_index(log_file: Path):
+    """删除日志文件的侧车索引（不存在时忽略）"""
+    try:
+        index_path(log_file).unlink()
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"删除日志索引失败 {log_file}: {e}")
+
+
+def is_active_log(log_file: Path) -> bool:
+    """是否为正在写入的日志文件（如 app.log），这类文件不建索引"""
+    return log_file.name.endswith(".log") and log_file.name.count(".") == 1
+
+
+def iter_lines_reverse(log_file: Path) -> Iterator[bytes]:
+    """从文件末尾开始逐行倒序读取（按块读取，内存占用与文件大小无关）"""
+    with open(log_file, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        tail = b""
+        while position > 0:
+            size = min(READ_CHUNK, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + tail).split(b"\n")
+            tail = lines[0]
+            for line in reversed(lines[1:]):
+                yield line
+        if tail:
+            yield tail
+
+
+class _BlockBuilder:
+    """累积一个数据块的元数据"""
+
+    def __init__(self, levels: Dict[str, int], loggers: Dict[str, int], offset: int, start: int = 0):
+        self.levels = levels
+        self.loggers = loggers
+        self.offset = offset
+        self.start = start
+        self.length = 0
+        self.lines = 0
+        self.min_ts: Optional[float] = None
+        self.max_ts: Optional[float] = None
+        self.untimed = False
+        self.level_mask = 0
+        self.logger_mask = 0
+
+    @staticmethod
+    def _bit(names: Dict[str, int], name: str) -> int:
+        if name not in names:
+            names[name] = len(names)
+        return 1 << names[name]
+
+    def add(self, line: bytes):
+        self.length += len(line)
+        self.lines += 1
+        line = line.strip()
+        if not line:
+            return
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return
+        if not isinstance(entry, dict):
+            return
+
+        if "timestamp" in entry:
+            ts = parse_timestamp(entry["timestamp"])
+            if ts is not None:
+                self.min_ts = ts if self.min_ts is None else min(self.min_ts, ts)
+                self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+        else:
+            # 无时间戳的条目不受时间过滤影响
+            self.untimed = True
+
+        level = str(entry["level"]).upper() if "level" in entry else MISSING_FIELD
+        self.level_mask |= self._bit(self.levels, level)
+        logger_name = str(entry["logger"]) if "logger" in entry else MISSING_FIELD
+        self.logger_mask |= self._bit(self.loggers, logger_name)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "offset": self.offset,
+            "start": self.start,
+            "length": self.length,
+            "lines": self.lines,
+            "min_ts": None if self.untimed else self.min_ts,
+            "max_ts": None if self.untimed else self.max_ts,
+            "levels": self.level_mask,
+            "loggers": self.logger_mask
+        }
+
+
+class LogFileIndex:
+    """单个日志文件的侧车索引"""
+
+    def __init__(self, source: Path, compressed: bool, size: int = 0, mtime_ns: int = 0,
+                 levels: Optional[List[str]] = None, loggers: Optional[List[str]] = None,
+                 blocks: Optional[List[Dict[str, Any]]] = None):
+        self.source = source
+        self.compressed = compressed
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.levels = list(levels or [])
+        self.loggers = list(loggers or [])
+        self.blocks = list(blocks or [])
+
+    def is_current(self, stat: os.stat_result) -> bool:
+        """索引是否与文件当前状态一致（归档只校验大小，追加后会重建或扩展）"""
+        if stat.st_size != self.size:
+            return False
+        return self.compressed or stat.st_mtime_ns == self.mtime_ns
+
+    @classmethod
+    def load(cls, source: Path) -> Optional["LogFileIndex"]:
+        """加载侧车索引，不存在或已过期时返回 None"""
+        path = index_path(source)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != INDEX_VERSION:
+                return None
+            index = cls(
+                source, data["compressed"], data["size"], data["mtime_ns"],
+                data["levels"], data["loggers"], data["blocks"]
+            )
+            return index if index.is_current(source.stat()) else None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"读取日志索引失败 {path}: {e}")
+            return None
+
+    def save(self):
+        """原子写入侧车索引"""
+        path = index_path(self.source)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "compressed": self.compressed,
+                "size": self.size,
+                "mtime_ns": self.mtime_ns,
+                "levels": self.levels,
+                "loggers": self.loggers,
+                "blocks": self.blocks
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    def _mask(self, names: List[str], value: Optional[str]) -> Optional[int]:
+        """过滤值对应的位图（包含缺少该字段的条目），None 表示不过滤"""
+        if not value:
+            return None
+        mask = 0
+        for i, name in enumerate(names):
+            if name == value or name == MISSING_FIELD:
+                mask |= 1 << i
+        return mask
+
+    def candidate_blocks(self, start_ts: Optional[float] = None, end_ts: Optional[float] = None,
+                         level: Optional[str] = None, logger_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间范围、级别、记录器筛选可能包含匹配条目的数据块（按文件顺序）"""
+        level_mask = self._mask(self.levels, level.upper() if level else None)
+        logger_mask = self._mask(self.loggers, logger_name)
+
+        blocks = []
+        for block in self.blocks:
+            if block["min_ts"] is not None:
+                if start_ts is not None and block["max_ts"] < start_ts:
+                    continue
+                if end_ts is not None and block["min_ts"] > end_ts:
+                    continue
+            if level_mask is not None and not block["levels"] & level_mask:
+                continue
+            if logger_mask is not None and not block["loggers"] & logger_mask:
+                continue
+            blocks.append(block)
+        return blocks
+
+    def read_block(self, block: Dict[str, Any]) -> bytes:
+        """读取数据块内容（解压后）"""
+        if not self.compressed:
+            with open(self.source, 'rb') as f:
+                f.seek(block["offset"])
+                return f.read(block["length"])
+
+        needed = block["start"] + block["length"]
+        return bytes(self._decompress_member(block["offset"], needed)[block["start"]:needed])
+
+    def read_blocks_reverse(self, blocks: List[Dict[str, Any]]) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+        """
+        由后向前读取数据块（blocks 按文件顺序），产出 (块, 内容)
+
+        旧归档的一个 gzip 成员包含多个块，同一成员内的候选块只解压一次，
+        避免逐块从成员开头重复解压。
+        """
+        end = len(blocks)
+        while end > 0:
+            start = end - 1
+            if self.compressed:
+                while start > 0 and blocks[start - 1]["offset"] == blocks[end - 1]["offset"]:
+                    start -= 1
+            group = blocks[start:end]
+            if len(group) == 1:
+                yield group[0], self.read_block(group[0])
+            else:
+                member = self._decompress_member(
+                    group[0]["offset"], max(block["start"] + block["length"] for block in group)
+                )
+                for block in reversed(group):
+                    yield block, bytes(member[block["start"]:block["start"] + block["length"]])
+            end = start
+
+    def _decompress_member(self, offset: int, needed: int) -> bytearray:
+        """从 gzip 成员开头解压，至少得到 needed 字节（成员较短时到成员末尾）"""
+        with open(self.source, 'rb') as f:
+            f.seek(offset)
+            decompressor = zlib.decompressobj(31)
+            output = bytearray()
+            data = f.read(READ_CHUNK)
+            while data and len(output) < needed:
+                output += decompressor.decompress(data, needed - len(output))
+                if decompressor.eof:
+                    break
+                data = decompressor.unconsumed_tail or f.read(READ_CHUNK)
+            return output
+
+
+def _iter_plain_lines(source: Path, size: int) -> Iterator[Tuple[int, int, bytes]]:
+    """遍历普通文件的行，产出 (行偏移, 0, 行)"""
+    with open(source, 'rb') as f:
+        offset = 0
+        for line in f:
+            if offset >= size:
+                break
+            yield offset, 0, line
+            offset += len(line)
+
+
+def _iter_gzip_lines(source: Path, size: int) -> Iterator[Tuple[int, int, bytes]]:
+    """遍历 gzip 文件（支持多成员）的行，产出 (成员偏移, 行在成员内的解压偏移, 行)"""
+    with open(source, 'rb') as f:
+        member = 0
+        raw_position = 0
+        member_output = 0
+        pending = b""
+        decompressor = zlib.decompressobj(31)
+
+        while raw_position < size:
+            data = f.read(min(READ_CHUNK, size - raw_position))
+            if not data:
+                break
+            raw_position += len(data)
+
+            while data:
+                output = pending + decompressor.decompress(data)
+                lines = output.split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    line += b"\n"
+                    yield member, member_output, line
+                    member_output += len(line)
+
+                if not decompressor.eof:
+                    break
+                # 成员结束，剩余数据属于下一个成员
+                if pending:
+                    yield member, member_output, pending
+                    pending = b""
+                data = decompressor.unused_data
+                member = raw_position - len(data)
+                member_output = 0
+                decompressor = zlib.decompressobj(31)
+
+        if pending:
+            yield member, member_output, pending
+
+
+def build_index(source: Path, block_size: int = BLOCK_SIZE) -> LogFileIndex:
+    """扫描日志文件生成侧车索引（不写入磁盘）"""
+    stat = source.stat()
+    compressed = source.name.endswith(".gz")
+    levels: Dict[str, int] = {}
+    loggers: Dict[str, int] = {}
+    blocks: List[Dict[str, Any]] = []
+
+    lines = _iter_gzip_lines(source, stat.st_size) if compressed else _iter_plain_lines(source, stat.st_size)
+    builder: Optional[_BlockBuilder] = None
+    for offset, start, line in lines:
+        # 块不跨越 gzip 成员，以便单独定位
+        if builder is not None and (builder.length >= block_size or
+                                    (compressed and offset != builder.offset)):
+            blocks.append(builder.to_dict())
+            builder = None
+        if builder is None:
+            builder = _BlockBuilder(levels, loggers, offset, start)
+        builder.add(line)
+    if builder is not None and builder.lines:
+        blocks.append(builder.to_dict())
+
+    return LogFileIndex(
+        source, compressed, stat.st_size, stat.st_mtime_ns,
+        sorted(levels, key=levels.get), sorted(loggers, key=loggers.get), blocks
+    )
+
+
+def load_or_build_index(source: Path) -> LogFileIndex:
+    """加载侧车索引，不存在或已过期时重建并尽量写回"""
+    index = LogFileIndex.load(source)
+    if index is not None:
+        return index
+
+    index = build_index(source)
+    try:
+        index.save()
+    except Exception as e:
+        logger.warning(f"写入日志索引失败 {source}: {e}")
+    return index
+
+
+def append_to_archive(source: Path, archive: Path, block_size: int = BLOCK_SIZE):
+    """
+    把日志文件追加到 gzip 归档并更新归档的侧车索引
+
+    每个块单独压缩为一个 gzip 成员，查询时可直接定位到块所在的成员解压。
+    """
+    index = load_or_build_index(archive) if archive.exists() else LogFileIndex(archive, True)
+    levels = {name: i for i, name in enumerate(index.levels)}
+    loggers = {name: i for i, name in enumerate(index.loggers)}
+
+    with open(source, 'rb') as f_in, open(archive, 'ab') as f_out:
+        f_out.seek(0, os.SEEK_END)
+        offset = f_out.tell()
+        builder = _BlockBuilder(levels, loggers, offset)
+        buffer: List[bytes] = []
+
+        def flush():
+            nonlocal offset, builder, buffer
+            if not buffer:
+                return
+            compressed = gzip.compress(b"".join(buffer))
+            f_out.write(compressed)
+            index.blocks.append(builder.to_dict())
+            offset += len(compressed)
+            builder = _BlockBuilder(levels, loggers, offset)
+            buffer = []
+
+        for line in f_in:
+            builder.add(line)
+            buffer.append(line)
+            if builder.length >= block_size:
+                flush()
+        flush()
+
+    stat = archive.stat()
+    index.size = stat.st_size
+    index.mtime_ns = stat.st_mtime_ns
+    index.levels = sorted(levels, key=levels.get)
+    index.loggers = sorted(loggers, key=loggers.get)
+    try:
+        index.save()
+    except Exception as e:
+        logger.warning(f"写入归档索引失败 {archive}: {e}")
@@ -4,8 +4,6 @@
 实现日志文件的自动轮转、压缩归档和过期清理功能。
 """
 import os
-import gzip
-import shutil
 import logging
 import threading
 import time
@@ -14,6 +12,8 @@ from pathlib import Path
 from typing import List, Dict, Any, Optional
 from concurrent.futures import ThreadPoolExecutor
 
+from .log_index import load_or_build_index, append_to_archive, remove_index
+
 
 class LogRotationManager:
     """日志轮转管理器"""
@@ -130,6 +130,7 @@ class LogRotationManager:
             if len(backup_files) >= self.backup_count:
                 for old_file in backup_files[:len(backup_files) - self.backup_count + 1]:
                     old_file.unlink()
+                    remove_index(old_file)
                     self.logger.info(f"删除旧备份文件: {old_file}")
                     
             # 重命名当前日志文件
@@ -142,9 +143,24 @@ class LogRotationManager:
             # 创建新的日志文件
             log_file.touch()
             
+            # 异步为轮转出的文件生成侧车索引
+            self.executor.submit(self._index_rotated_file, backup_file)
+            
         except Exception as e:
             self.logger.error(f"轮转日志文件失败 {log_file}: {e}")
             
+    def _index_rotated_file(self, log_file: Path):
+        """为轮转出的日志文件生成侧车索引
+        
+        Args:
+            log_file: 轮转后的日志文件路径
+        """
+        try:
+            index = load_or_build_index(log_file)
+            self.logger.debug(f"生成日志索引: {log_file}, 数据块: {len(index.blocks)}")
+        except Exception as e:
+            self.logger.error(f"生成日志索引失败 {log_file}: {e}")
+            
     def check_and_archive_logs(self):
         """检查并归档日志文件"""
         try:
@@ -194,13 +210,12 @@ class LogRotationManager:
             timestamp = datetime.fromtimestamp(file_path.stat().st_mtime).strftime("%Y%m")
             archive_file = archive_dir / f"{file_path.stem}_{timestamp}.gz"
             
-            # 压缩文件
-            with open(file_path, 'rb') as f_in:
-                with gzip.open(archive_file, 'ab') as f_out:  # 追加模式
-                    shutil.copyfileobj(f_in, f_out)
+            # 按块压缩追加到归档（每块一个gzip成员），同时更新归档索引
+            append_to_archive(file_path, archive_file)
                     
             # 删除原文件
             file_path.unlink()
+            remove_index(file_path)
             
             self.logger.debug(f"归档文件: {file_path} -> {archive_file}")
             
@@ -237,6 +252,7 @@ class LogRotationManager:
         try:
             for file_path in files:
                 file_path.unlink()
+                remove_index(file_path)
                 self.logger.info(f"清理过期文件: {file_path}")
                 
             self.logger.info(f"清理完成: {len(files)} 个文件")
@@ -392,6 +408,7 @@ class LogRotationManager:
             for file_path in files_to_cleanup:
                 try:
                     file_path.unlink()
+                    remove_index(file_path)
                     result["files_cleaned"] += 1
                 except Exception as e:
                     result["errors"].append({
@@ -2245,7 +2245,8 @@ def _broadcast_document_load_progress(task_id: str):
                 asyncio.create_task(
                     message_handler.connection_manager.send_to_group(
                         f"kb_{knowledge_base_id}_document_load",
-                        progress_msg
+                        progress_msg,
+                        coalesce_key=f"document_load:{task_id}"
                     )
                 )
             except RuntimeError:
@@ -2257,7 +2258,8 @@ def _broadcast_document_load_progress(task_id: str):
                     loop.run_until_complete(
                         message_handler.connection_manager.send_to_group(
                             f"kb_{knowledge_base_id}_document_load",
-                            progress_msg
+                            progress_msg,
+                            coalesce_key=f"document_load:{task_id}"
                         )
                     )
                     loop.close()
@@ -2617,14 +2619,14 @@ async def subscribe_document_load_progress(
 @router.post("/documents/{document_id}/extract-chunk-entities")
 async def extract_document_chunk_entities(
     document_id: int,
-    max_workers: int = Query(4, ge=1, le=10, description="并行工作线程数"),
+    max_workers: int = Query(4, ge=1, le=32, description="并行提取的工作协程数（实际并发还受供应商自适应限流约束）"),
     db: Session = Depends(get_db)
 ):
     """
     对文档的所有片段进行并行实体识别（异步）
 
     - 复用现有LLMEntityExtractor
-    - 支持多线程并行处理
+    - 片段并发提取，按供应商令牌桶限速并根据429/延迟自适应调整并发
     - 适用于大文件（70万字）
     - 异步处理，立即返回任务ID
     """
@@ -112,7 +112,8 @@ def _broadcast_entity_extraction_progress(task_id: str):
                 asyncio.create_task(
                     message_handler.connection_manager.send_to_group(
                         f"kb_{knowledge_base_id}_entity_extraction",
-                        progress_msg
+                        progress_msg,
+                        coalesce_key=f"entity_extraction:{task_id}"
                     )
                 )
             except RuntimeError:
@@ -124,7 +125,8 @@ def _broadcast_entity_extraction_progress(task_id: str):
                     loop.run_until_complete(
                         message_handler.connection_manager.send_to_group(
                             f"kb_{knowledge_base_id}_entity_extraction",
-                            progress_msg
+                            progress_msg,
+                            coalesce_key=f"entity_extraction:{task_id}"
                         )
                     )
                     loop.close()
@@ -0,0 +1,242 @@
+"""大模型HTTP传输层 - 按供应商复用连接池并限制并发"""
+import asyncio
+import json
+import logging
+import threading
+import weakref
+from contextlib import contextmanager, asynccontextmanager
+from typing import Optional, Dict, Any, AsyncIterator, Iterator, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    httpx = None
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class LLMTransportError(Exception):
+    """供应商返回非200状态码"""
+
+    def __init__(self, supplier: str, status_code: int, body: str):
+        super().__init__(f"{supplier} API调用失败，状态码: {status_code}, 响应: {body}")
+        self.supplier = supplier
+        self.status_code = status_code
+        self.body = body
+
+
+class LLMHTTPTransport:
+    """
+    大模型HTTP传输层
+
+    - 同步：每个供应商一个 requests.Session，保活连接池，避免每次请求重新握手
+    - 异步：每个供应商一个 httpx.AsyncClient（可用时启用HTTP/2），按事件循环隔离；
+      客户端以事件循环对象为弱引用键，循环关闭后在下一次获取客户端时清理
+    - 每个供应商的并发请求数受信号量限制，超出的请求排队等待而不是占满连接
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_concurrency: int = 16,
+        keepalive_expiry: float = 60.0,
+        http2: bool = True
+    ):
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and HTTP2_AVAILABLE
+
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sync_limits: Dict[str, threading.BoundedSemaphore] = {}
+        # 事件循环 -> {供应商: (客户端, 并发信号量)}
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 同步
+    # ------------------------------------------------------------------
+
+    def _get_session(self, supplier: str) -> Tuple[requests.Session, threading.BoundedSemaphore]:
+        """获取供应商的连接池会话和并发信号量"""
+        with self._lock:
+            session = self._sessions.get(supplier)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_connections)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[supplier] = session
+                self._sync_limits[supplier] = threading.BoundedSemaphore(self.max_concurrency)
+                logger.info(f"创建供应商连接池: {supplier}, 最大连接数: {self.max_connections}")
+            return session, self._sync_limits[supplier]
+
+    @contextmanager
+    def stream(self, supplier: str, method: str, url: str, **kwargs) -> Iterator[requests.Response]:
+        """
+        发送流式请求（同步）
+
+        与 requests.post(..., stream=True) 用法一致，响应在退出上下文时归还连接池。
+        """
+        session, limit = self._get_session(supplier)
+        with limit:
+            with session.request(method, url, stream=True, **kwargs) as response:
+                yield response
+
+    def request(self, supplier: str, method: str, url: str, **kwargs) -> requests.Response:
+        """发送非流式请求（同步），返回已读取完毕的响应"""
+        session, limit = self._get_session(supplier)
+        with limit:
+            return session.request(method, url, **kwargs)
+
+    # ------------------------------------------------------------------
+    # 异步
+    # ------------------------------------------------------------------
+
+    def _get_async_client(self, supplier: str) -> Tuple[Any, asyncio.Semaphore]:
+        """获取当前事件循环下供应商的异步客户端和并发信号量"""
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("未安装httpx库，无法使用异步传输")
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._prune_closed_loops()
+            clients = self._async_clients.setdefault(loop, {})
+            entry = clients.get(supplier)
+            if entry is None or entry[0].is_closed:
+                client = httpx.AsyncClient(
+                    http2=self.http2,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=self.keepalive_expiry
+                    )
+                )
+                entry = (client, asyncio.Semaphore(self.max_concurrency))
+                clients[supplier] = entry
+                logger.info(f"创建供应商异步客户端: {supplier}, HTTP/2: {self.http2}")
+            return entry
+
+    def _prune_closed_loops(self):
+        """
+        丢弃已关闭事件循环的客户端（调用方需持有 _lock）
+
+        客户端的连接会强引用所属事件循环，弱引用键无法自行回收，
+        因此在循环关闭后显式移除；连接随客户端一起被垃圾回收。
+        """
+        for loop in [loop for loop in self._async_clients.keys() if loop.is_closed()]:
+            clients = self._async_clients.pop(loop, {})
+            logger.debug(f"清理已关闭事件循环的异步客户端: {len(clients)} 个")
+
+    @asynccontextmanager
+    async def astream(self, supplier: str, method: str, url: str,
+                      timeout: Optional[float] = None, **kwargs):
+        """
+        发送流式请求（异步）
+
+        非200响应读取前200个字符后抛出 LLMTransportError。
+        """
+        client, limit = self._get_async_client(supplier)
+        async with limit:
+            async with client.stream(method, url, timeout=timeout, **kwargs) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", errors="replace")[:200]
+                    raise LLMTransportError(supplier, response.status_code, body)
+                yield response
+
+    async def aiter_sse(self, supplier: str, url: str, headers: Dict[str, str],
+                        payload: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        """
+        发送POST请求并逐个产出服务端事件（SSE）中的JSON数据块
+
+        非流式响应（Content-Type 不是 text/event-stream）会作为单个数据块产出。
+        """
+        async with self.astream(supplier, "POST", url, headers=headers, json=payload, timeout=timeout) as response:
+            if "text/event-stream" not in response.headers.get("Content-Type", ""):
+                yield json.loads(await response.aread())
+                return
+
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    return
+                try:
+                    yield json.loads(data)
+                except json.JSONDecodeError as e:
+                    logger.error(f"解析{supplier}流式响应块失败: {e}，行内容: {data[:100]}...")
+
+    async def aiter_ndjson(self, supplier: str, url: str, headers: Dict[str, str],
+                           payload: Dict[str, Any], timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        """发送POST请求并逐行产出换行分隔的JSON数据块（Ollama流式格式）"""
+        async with self.astream(supplier, "POST", url, headers=headers, json=payload, timeout=timeout) as response:
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.error(f"解析{supplier}流式响应行失败: {e}，行内容: {line[:100]}...")
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    def close(self):
+        """关闭全部同步会话"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._sync_limits.clear()
+
+    async def aclose(self):
+        """关闭当前事件循环下的全部异步客户端（长期运行的服务应在关闭时调用）"""
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client, _ in clients.values():
+            await client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """连接池统计"""
+        with self._lock:
+            return {
+                "sync_suppliers": list(self._sessions.keys()),
+                "async_clients": sum(len(clients) for clients in self._async_clients.values()),
+                "http2": self.http2,
+                "max_connections": self.max_connections,
+                "max_concurrency": self.max_concurrency
+            }
+
+
+_llm_http_transport: Optional[LLMHTTPTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_llm_http_transport() -> LLMHTTPTransport:
+    """获取全局大模型HTTP传输层实例"""
+    global _llm_http_transport
+    if _llm_http_transport is None:
+        with _transport_lock:
+            if _llm_http_transport is None:
+                _llm_http_transport = LLMHTTPTransport(
+                    max_connections=getattr(settings, 'llm_http_max_connections', 20),
+                    max_concurrency=getattr(settings, 'llm_http_max_concurrency', 16),
+                    keepalive_expiry=getattr(settings, 'llm_http_keepalive_expiry', 60.0),
+                    http2=getattr(settings, 'llm_http2_enabled', True)
+                )
+    return _llm_http_transport
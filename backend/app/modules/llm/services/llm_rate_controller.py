@@ -0,0 +1,321 @@
+"""大模型供应商限流 - 令牌桶限速与按429/延迟自适应的并发上限"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Deque, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(error: Any) -> bool:
+    """判断供应商错误是否为限流（HTTP 429 / rate limit）"""
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return True
+    message = str(error or "").lower()
+    return "429" in message or "rate limit" in message or "too many requests" in message
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    以 rate 个/秒的速度补充令牌，最多积攒 capacity 个，每个请求消耗一个令牌。
+    状态由线程锁保护，可被不同线程中的事件循环共享。
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """预订一个令牌，返回需要等待的秒数（令牌不足时允许透支，按透支量排队）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        """获取一个令牌（异步等待）"""
+        delay = self._reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """收到限流响应后清空令牌，使后续请求至少等待 seconds 秒"""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+            self._updated_at = time.monotonic()
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    自适应并发上限（AIMD）
+
+    - 请求成功且延迟不超过目标值时，上限每轮（约等于当前上限个请求）加 1
+    - 收到429时上限减半；延迟持续高于目标值时上限缩小 10%
+    - 同一轮内只缩小一次，避免一批并发请求同时失败时上限被连续减半
+
+    等待者可以来自不同线程的事件循环，放行通过 call_soon_threadsafe 唤醒。
+    """
+
+    def __init__(self, initial_limit: int, min_limit: int = 1, max_limit: int = 16,
+                 target_latency: float = 30.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.target_latency = target_latency
+        self.limit = float(min(max(initial_limit, self.min_limit), self.max_limit))
+
+        self.avg_latency = 0.0
+        self.rate_limited = 0
+        self.completed = 0
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self):
+        """获取一个并发名额"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._in_flight < int(self.limit):
+                self._in_flight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove(waiter)
+                    granted = False
+                except ValueError:
+                    granted = True
+            if granted:
+                self.release()
+            raise
+
+    def release(self):
+        """归还一个并发名额"""
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_locked()
+
+    def _grant_locked(self):
+        """在上限允许的范围内唤醒等待者（调用方持有锁）"""
+        while self._waiters and self._in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            self._in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._wake, future)
+            except RuntimeError:
+                # 等待者所在的事件循环已关闭
+                self._in_flight -= 1
+
+    def _wake(self, future: asyncio.Future):
+        # 等待者被放行后名额归 acquire() 所有，已取消时由其取消处理归还
+        if not future.done():
+            future.set_result(None)
+
+    def record(self, latency: float, rate_limited: bool = False):
+        """记录一次请求结果并调整上限"""
+        with self._lock:
+            now = time.monotonic()
+            self.completed += 1
+            if not rate_limited:
+                self.avg_latency = latency if self.avg_latency == 0 else 0.8 * self.avg_latency + 0.2 * latency
+
+            # 一轮请求大约耗时一个平均延迟，轮内已缩小过则不再缩小
+            can_decrease = now - self._last_decrease > max(self.avg_latency, 1.0)
+            if rate_limited:
+                self.rate_limited += 1
+                if can_decrease:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+                    logger.warning(f"供应商限流，并发上限降至 {int(self.limit)}")
+            elif self.avg_latency > self.target_latency:
+                if can_decrease:
+                    self.limit = max(self.min_limit, self.limit * 0.9)
+                    self._last_decrease = now
+            elif self._in_flight >= int(self.limit) - 1:
+                # 只有上限确实被用满时才继续放大
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._grant_locked()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "avg_latency": round(self.avg_latency, 3),
+                "completed": self.completed,
+                "rate_limited": self.rate_limited
+            }
+
+
+class SupplierRateController:
+    """单个供应商的限速（令牌桶）与并发控制（AIMD）"""
+
+    def __init__(self, supplier: str, requests_per_second: float, burst: int,
+                 initial_concurrency: int, max_concurrency: int, target_latency: float):
+        self.supplier = supplier
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=initial_concurrency,
+            max_limit=max_concurrency,
+            target_latency=target_latency
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        占用一个请求名额（先取并发名额再取令牌）
+
+        yield 一个结果记录字典，调用方把 rate_limited 置为 True 表示请求被限流；
+        退出时按耗时与是否限流调整并发上限。
+        """
+        await self.limiter.acquire()
+        try:
+            await self.bucket.acquire()
+        except BaseException:
+            self.limiter.release()
+            raise
+
+        outcome = {"rate_limited": False}
+        started = time.monotonic()
+        try:
+            yield outcome
+        finally:
+            if outcome["rate_limited"]:
+                self.bucket.pause(1.0)
+            self.limiter.record(time.monotonic() - started, outcome["rate_limited"])
+            self.limiter.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.limiter.get_stats()
+        stats.update({
+            "supplier": self.supplier,
+            "requests_per_second": self.bucket.rate,
+            "burst": self.bucket.capacity
+        })
+        return stats
+
+
+def retry_delay(attempt: int, base: float = 1.0, maximum: float = 30.0) -> float:
+    """第 attempt 次重试前的退避时间（指数退避 + 随机抖动）"""
+    delay = min(maximum, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class LLMRateControllerRegistry:
+    """按供应商维护限流控制器，同一进程内的所有任务共享"""
+
+    def __init__(self, requests_per_second: float = 5.0, burst: int = 10,
+                 initial_concurrency: int = 4, max_concurrency: int = 16,
+                 target_latency: float = 30.0, overrides: Optional[Dict[str, float]] = None):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.overrides = {k.lower(): v for k, v in (overrides or {}).items()}
+        self._controllers: Dict[str, SupplierRateController] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_overrides(spec: str) -> Dict[str, float]:
+        """解析按供应商的请求速率配置，格式: deepseek:10,ollama:2"""
+        overrides = {}
+        for item in (spec or "").split(","):
+            if ":" not in item:
+                continue
+            supplier, _, rate = item.partition(":")
+            try:
+                overrides[supplier.strip().lower()] = max(0.001, float(rate))
+            except ValueError:
+                logger.warning(f"供应商速率配置无效: {item}")
+        return overrides
+
+    def get(self, supplier: Optional[str]) -> SupplierRateController:
+        """获取供应商的限流控制器（未知供应商归入 default）"""
+        key = (supplier or "default").lower()
+        with self._lock:
+            controller = self._controllers.get(key)
+            if controller is None:
+                controller = SupplierRateController(
+                    supplier=key,
+                    requests_per_second=self.overrides.get(key, self.requests_per_second),
+                    burst=self.burst,
+                    initial_concurrency=self.initial_concurrency,
+                    max_concurrency=self.max_concurrency,
+                    target_latency=self.target_latency
+                )
+                self._controllers[key] = controller
+                logger.info(f"创建供应商限流控制器: {key}, 速率: {controller.bucket.rate}/s")
+            return controller
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            controllers = list(self._controllers.values())
+        return {controller.supplier: controller.get_stats() for controller in controllers}
+
+
+_llm_rate_controller: Optional[LLMRateControllerRegistry] = None
+_controller_lock = threading.Lock()
+
+
+def get_llm_rate_controller() -> LLMRateControllerRegistry:
+    """获取全局供应商限流控制器注册表"""
+    global _llm_rate_controller
+    if _llm_rate_controller is None:
+        with _controller_lock:
+            if _llm_rate_controller is None:
+                _llm_rate_controller = LLMRateControllerRegistry(
+                    requests_per_second=getattr(settings, 'llm_supplier_requests_per_second', 5.0),
+                    burst=getattr(settings, 'llm_supplier_burst', 10),
+                    initial_concurrency=getattr(settings, 'llm_supplier_initial_concurrency', 4),
+                    max_concurrency=getattr(settings, 'llm_supplier_max_concurrency', 16),
+                    target_latency=getattr(settings, 'llm_supplier_target_latency', 30.0),
+                    overrides=LLMRateControllerRegistry.parse_overrides(
+                        getattr(settings, 'llm_supplier_rate_limits', '')
+                    )
+                )
+    return _llm_rate_controller
+
+
+_llm_call_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_llm_call_executor() -> ThreadPoolExecutor:
+    """
+    获取执行同步LLM调用的线程池
+
+    默认线程池按CPU核数设置大小，会把I/O密集的LLM调用并发度压在很低的水平，
+    这里按供应商并发上限单独设置。
+    """
+    global _llm_call_executor
+    if _llm_call_executor is None:
+        with _controller_lock:
+            if _llm_call_executor is None:
+                max_workers = max(32, 2 * getattr(settings, 'llm_supplier_max_concurrency', 16))
+                _llm_call_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-call")
+    return _llm_call_executor
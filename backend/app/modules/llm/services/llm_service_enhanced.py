@@ -2,13 +2,15 @@
 import os
 import time
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator
 from datetime import datetime
 
 from app.core.config import settings
-from app.models.supplier_db import ModelDB, SupplierDB
 from sqlalchemy.orm import Session
-from app.core.encryption import decrypt_string
+from app.models.supplier_db import ModelDB, SupplierDB
+from app.services.model_config_cache import model_config_cache
+from app.modules.llm.services.llm_http_transport import get_llm_http_transport, LLMTransportError
+from app.modules.llm.services.model_latency_tracker import get_model_latency_tracker
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +24,11 @@ class EnhancedLLMService:
         self.default_model = getattr(settings, 'DEFAULT_MODEL', "gpt-3.5-turbo")
         self.default_chat_model = getattr(settings, 'DEFAULT_CHAT_MODEL', "gpt-3.5-turbo")
         
+        # 按供应商复用连接池的HTTP传输层
+        self.http_transport = get_llm_http_transport()
+        # 按模型记录实际调用延迟与错误率，供模型调度使用
+        self.latency_tracker = get_model_latency_tracker()
+        
         # 配置OpenAI客户端（兼容性）
         if hasattr(settings, 'OPENAI_API_KEY') and settings.OPENAI_API_KEY:
             import openai
@@ -29,66 +36,18 @@ class EnhancedLLMService:
             if hasattr(settings, 'OPENAI_API_BASE') and settings.OPENAI_API_BASE:
                 openai.api_base = settings.OPENAI_API_BASE
     
-    def _get_model_and_supplier_from_db(self, db: Session, model_name: str) -> tuple:
-        """从数据库获取模型和供应商信息"""
-        try:
-            logger.info(f"=== 开始从数据库查询模型: {model_name} ===")
-            # 查询模型信息
-            model = db.query(ModelDB).filter(
-                (ModelDB.model_id == model_name) | 
-                (ModelDB.model_name == model_name)
-            ).first()
-            
-            if not model:
-                logger.warning(f"数据库中未找到模型: {model_name}")
-                return None, None
-            
-            logger.info(f"找到模型: {model.model_id} (ID: {model.id}), 供应商ID: {model.supplier_id}")
-            # 查询供应商信息
-            supplier = db.query(SupplierDB).filter(
-                SupplierDB.id == model.supplier_id,
-                SupplierDB.is_active == True
-            ).first()
-            
-            if not supplier:
-                logger.warning(f"模型 {model_name} 的供应商不存在或未激活")
-                return model, None
-            
-            logger.info(f"找到供应商: {supplier.name} (显示名称: {supplier.display_name}), 活跃状态: {supplier.is_active}")
-            
-            # 解密API密钥
-            if supplier._api_key:
-                try:
-                    supplier.api_key = decrypt_string(supplier._api_key)
-                except Exception as e:
-                    logger.warning(f"解密API密钥失败: {e}")
-                    supplier.api_key = None
-            else:
-                supplier.api_key = None
-            
-            return model, supplier
-            
-        except Exception as e:
-            logger.error(f"查询数据库失败: {e}")
-            return None, None
-    
     def _get_api_config_from_db(self, db: Session, model_name: str) -> Dict[str, Any]:
-        """从数据库获取API配置"""
-        model, supplier = self._get_model_and_supplier_from_db(db, model_name)
-        
-        if not model or not supplier:
+        """从数据库获取API配置（经模型配置缓存，配置变更后自动失效）"""
+        resolved = model_config_cache.get_model_config(db, model_name, match_display_name=True)
+        if resolved is None:
             return {}
-        
-        config = {
-            "model": model.model_id,
-            "supplier_name": supplier.name,
-            "api_endpoint": supplier.api_endpoint,
-            "api_key": supplier.api_key,
-            "api_key_required": supplier.api_key_required,
-            "supplier_display_name": supplier.display_name
-        }
-        
-        logger.info(f"从数据库获取配置: {supplier.display_name} - {model.model_name}")
+
+        config = resolved.to_api_config()
+        if not config:
+            logger.warning(f"模型 {model_name} 的供应商不存在或未激活")
+            return {}
+
+        logger.debug(f"获取模型配置: {resolved.supplier_display_name} - {resolved.model_name}")
         return config
     
     def chat_completion(
@@ -159,11 +118,13 @@ class EnhancedLLMService:
                     if db:
                         db_config = self._get_api_config_from_db(db, current_model)
                         if db_config:
-                            response = self._call_api_with_db_config(
-                                openai, messages, db_config, max_tokens, temperature, 
-                                top_p, n, stop, frequency_penalty, presence_penalty, start_time,
-                                enable_thinking_chain, file_upload_data
-                            )
+                            with self.latency_tracker.track(db_config["model"]) as call:
+                                response = self._call_api_with_db_config(
+                                    openai, messages, db_config, max_tokens, temperature, 
+                                    top_p, n, stop, frequency_penalty, presence_penalty, start_time,
+                                    enable_thinking_chain, file_upload_data
+                                )
+                                response = self._track_response(call, response)
                             
                             # 检查是否是流式响应（生成器）
                             if hasattr(response, '__iter__') and not isinstance(response, (list, dict)):
@@ -191,10 +152,12 @@ class EnhancedLLMService:
                                 break
                     
                     # 只有当数据库配置不存在时，才使用环境变量配置
-                    response = self._call_api_with_env_config(
-                        openai, messages, current_model, max_tokens, temperature, 
-                        top_p, n, stop, frequency_penalty, presence_penalty, start_time
-                    )
+                    with self.latency_tracker.track(current_model) as call:
+                        response = self._call_api_with_env_config(
+                            openai, messages, current_model, max_tokens, temperature, 
+                            top_p, n, stop, frequency_penalty, presence_penalty, start_time
+                        )
+                        response = self._track_response(call, response)
                     
                     # 检查是否是流式响应（生成器）
                     if hasattr(response, '__iter__') and not isinstance(response, (list, dict)):
@@ -246,6 +209,13 @@ class EnhancedLLMService:
         logger.error(f"所有模型调用失败: {models_to_try}")
         return self._get_all_models_failed_response(models_to_try, start_time, attempt_history)
     
+    def _track_response(self, call: Dict[str, Any], response):
+        """登记调用结果：流式响应交给生成器继续跟踪在途请求与延迟，其余按 success 字段记录"""
+        if hasattr(response, '__iter__') and not isinstance(response, (list, dict)):
+            return self.latency_tracker.track_stream(call, response)
+        call["success"] = bool(response.get("success", False))
+        return response
+    
     def _call_api_with_db_config(self, openai, messages, db_config, max_tokens, temperature, 
                                 top_p, n, stop, frequency_penalty, presence_penalty, start_time,
                                 enable_thinking_chain=False, file_upload_data=None):
@@ -385,11 +355,10 @@ class EnhancedLLMService:
                 raise Exception("硅基流动API端点未配置")
             
             logger.info(f"发送硅基流动流式请求，超时时间: {timeout}秒")
-            with requests.post(
-                f"{api_endpoint}/chat/completions",
+            with self.http_transport.stream(
+                "硅基流动", "POST", f"{api_endpoint}/chat/completions",
                 headers=headers,
                 json=payload,
-                stream=True,
                 timeout=timeout
             ) as response:
                 
@@ -584,11 +553,10 @@ class EnhancedLLMService:
                 raise Exception("DeepSeek API端点未配置")
             
             logger.info(f"发送DeepSeek流式请求，超时时间: {timeout}秒")
-            with requests.post(
-                f"{api_endpoint}/chat/completions",
+            with self.http_transport.stream(
+                "DeepSeek", "POST", f"{api_endpoint}/chat/completions",
                 headers=headers,
                 json=payload,
-                stream=True,
                 timeout=timeout
             ) as response:
                 
@@ -766,11 +734,10 @@ class EnhancedLLMService:
                 raise Exception("OpenAI API端点未配置")
             
             logger.info(f"发送OpenAI流式请求，超时时间: {timeout}秒")
-            with requests.post(
-                f"{api_endpoint}/chat/completions",
+            with self.http_transport.stream(
+                "OpenAI", "POST", f"{api_endpoint}/chat/completions",
                 headers=headers,
                 json=payload,
-                stream=True,
                 timeout=timeout
             ) as response:
                 
@@ -902,11 +869,10 @@ class EnhancedLLMService:
                 raise Exception(f"{supplier_display_name} API端点未配置")
             
             logger.info(f"发送通用API流式请求，超时时间: {timeout}秒")
-            with requests.post(
-                f"{api_endpoint}/chat/completions",
+            with self.http_transport.stream(
+                supplier_display_name, "POST", f"{api_endpoint}/chat/completions",
                 headers=headers,
                 json=payload,
-                stream=True,
                 timeout=timeout
             ) as response:
                 
@@ -1047,11 +1013,10 @@ class EnhancedLLMService:
                 chat_endpoint = api_endpoint.rstrip('/') + "/compatible-mode/v1/chat/completions"
             
             logger.info(f"发送阿里云百炼流式请求，端点: {chat_endpoint}，超时时间: {timeout}秒")
-            with requests.post(
-                chat_endpoint,
+            with self.http_transport.stream(
+                supplier_display_name, "POST", chat_endpoint,
                 headers=headers,
                 json=payload,
-                stream=True,
                 timeout=timeout
             ) as response:
                 
@@ -1148,7 +1113,6 @@ class EnhancedLLMService:
                                  temperature, supplier_display_name, start_time):
         """直接调用Ollama API（绕过OpenAI客户端）"""
         try:
-            import requests
             import json
             
             # 准备请求数据
@@ -1170,8 +1134,8 @@ class EnhancedLLMService:
             url = f"{api_endpoint}/chat"
             logger.info(f"直接调用Ollama API: {url}")
             
-            response = requests.post(
-                url,
+            response = self.http_transport.request(
+                supplier_display_name, "POST", url,
                 json=payload,
                 timeout=30
             )
@@ -1635,7 +1599,6 @@ class EnhancedLLMService:
         Returns:
             API响应
         """
-        import requests
         import base64
         import json
         from pathlib import Path
@@ -1693,11 +1656,10 @@ class EnhancedLLMService:
             timeout = 60
             logger.info(f"发送带文件上传的流式请求，超时时间: {timeout}秒")
             
-            with requests.post(
-                f"{api_endpoint}/chat/completions",
+            with self.http_transport.stream(
+                supplier_display_name, "POST", f"{api_endpoint}/chat/completions",
                 headers=headers,
                 json=payload,
-                stream=True,
                 timeout=timeout
             ) as response:
                 
@@ -1904,6 +1866,234 @@ class EnhancedLLMService:
         
         return '\n'.join(analysis) if analysis else "无法确定具体失败原因"
     
+    # ==================== 异步流式调用 ====================
+    
+    async def astream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model_name: Optional[str] = None,
+        max_tokens: int = 4096,
+        temperature: float = 0.7,
+        db: Optional[Session] = None,
+        enable_thinking_chain: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        异步流式聊天补全 - 使用共享连接池，不占用工作线程
+        
+        逐块产出 {"type": "thinking"/"content", ...}，结束时产出 type 为 done 的汇总结果；
+        失败时产出 type 为 error 的结果。仅支持数据库配置的模型。
+        """
+        start_time = time.time()
+        model_name = model_name or self.default_chat_model
+        
+        db_config = self._get_api_config_from_db(db, model_name) if db else {}
+        if not db_config:
+            yield {"type": "error", **self._get_error_response(f"未找到模型 {model_name} 的数据库配置", model_name, start_time)}
+            return
+        
+        supplier_display_name = db_config["supplier_display_name"]
+        api_key = db_config["api_key"]
+        if db_config["api_key_required"] and (not api_key or api_key == "your-api-key-here"):
+            yield {"type": "error", **self._get_db_config_error_response(supplier_display_name, model_name, start_time)}
+            return
+        
+        try:
+            async for event in self._astream_api_directly(
+                messages, db_config["model"], db_config["api_endpoint"], api_key,
+                max_tokens, temperature, supplier_display_name, start_time, enable_thinking_chain
+            ):
+                yield event
+        except Exception as e:
+            logger.error(f"异步流式调用失败: {supplier_display_name} - {model_name}: {e}")
+            yield {"type": "error", **self._get_api_error_response(supplier_display_name, str(e), model_name, start_time)}
+    
+    def _astream_api_directly(self, messages, model_name, api_endpoint, api_key,
+                              max_tokens, temperature, supplier_display_name, start_time,
+                              enable_thinking_chain=False) -> AsyncIterator[Dict[str, Any]]:
+        """按供应商选择异步流式调用方式（与 _call_api_directly 的分派规则一致）"""
+        if not api_endpoint:
+            raise Exception(f"{supplier_display_name} API端点未配置")
+        
+        if supplier_display_name == "硅基流动":
+            return self._astream_siliconflow_api(messages, model_name, api_endpoint, api_key,
+                                                 max_tokens, temperature, start_time)
+        elif supplier_display_name in ["DeepSeek", "深度求索"]:
+            return self._astream_deepseek_api(messages, model_name, api_endpoint, api_key,
+                                              max_tokens, temperature, start_time,
+                                              enable_thinking_chain=enable_thinking_chain)
+        elif supplier_display_name == "OpenAI":
+            return self._astream_openai_api(messages, model_name, api_endpoint, api_key,
+                                            max_tokens, temperature, start_time)
+        elif supplier_display_name == "Ollama":
+            return self._astream_ollama_api(messages, model_name, api_endpoint,
+                                            max_tokens, temperature, supplier_display_name, start_time)
+        elif "dashscope" in supplier_display_name.lower() or "阿里" in supplier_display_name or "aliyun" in supplier_display_name.lower():
+            return self._astream_dashscope_api(messages, model_name, api_endpoint, api_key,
+                                               max_tokens, temperature, supplier_display_name, start_time)
+        else:
+            return self._astream_generic_api(messages, model_name, api_endpoint, api_key,
+                                             max_tokens, temperature, supplier_display_name, start_time)
+    
+    @staticmethod
+    def _build_chat_payload(messages, model_name, max_tokens, temperature) -> Dict[str, Any]:
+        """构建OpenAI兼容格式的流式请求数据"""
+        return {
+            "model": model_name,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True
+        }
+    
+    @staticmethod
+    def _build_auth_headers(api_key) -> Dict[str, str]:
+        """构建请求头"""
+        headers = {"Content-Type": "application/json"}
+        if api_key and api_key != "dummy-key":
+            headers["Authorization"] = f"Bearer {api_key}"
+        return headers
+    
+    async def _astream_openai_compatible(self, supplier, url, headers, payload, timeout,
+                                         model_name, start_time) -> AsyncIterator[Dict[str, Any]]:
+        """消费OpenAI兼容的SSE流，产出思维链/内容块和最终汇总结果"""
+        full_response = []
+        full_reasoning = []
+        tokens_used = 0
+        
+        async for chunk in self.http_transport.aiter_sse(supplier, url, headers, payload, timeout):
+            # 阿里云百炼原生格式将结果包在 output 中
+            body = chunk.get("output", chunk)
+            tokens_used = (chunk.get("usage") or {}).get("total_tokens", tokens_used)
+            choices = body.get("choices") or []
+            if not choices:
+                continue
+            
+            # 流式块使用 delta，非流式响应使用 message
+            delta = choices[0].get("delta") or choices[0].get("message") or {}
+            reasoning_chunk = delta.get("reasoning_content")
+            if reasoning_chunk:
+                full_reasoning.append(reasoning_chunk)
+                yield {"type": "thinking", "content": reasoning_chunk, "model": model_name, "supplier": supplier}
+            content_chunk = delta.get("content")
+            if content_chunk:
+                full_response.append(content_chunk)
+                yield {"type": "content", "content": content_chunk, "model": model_name, "supplier": supplier}
+        
+        execution_time = round((time.time() - start_time) * 1000, 2)
+        logger.info(f"{supplier}异步流式调用成功: {model_name}，执行时间: {execution_time}ms")
+        
+        final_response = {
+            "type": "done",
+            "generated_text": "".join(full_response).strip(),
+            "model": model_name,
+            "supplier": supplier,
+            "tokens_used": tokens_used,
+            "execution_time_ms": execution_time,
+            "success": True
+        }
+        reasoning = "".join(full_reasoning).strip()
+        if reasoning:
+            final_response["reasoning_content"] = reasoning
+        yield final_response
+    
+    def _astream_siliconflow_api(self, messages, model_name, api_endpoint, api_key,
+                                 max_tokens, temperature, start_time) -> AsyncIterator[Dict[str, Any]]:
+        """异步流式调用硅基流动API（不支持 enable_thinking 参数）"""
+        return self._astream_openai_compatible(
+            "硅基流动", f"{api_endpoint}/chat/completions", self._build_auth_headers(api_key),
+            self._build_chat_payload(messages, model_name, max_tokens, temperature), 60,
+            model_name, start_time
+        )
+    
+    async def _astream_deepseek_api(self, messages, model_name, api_endpoint, api_key,
+                                    max_tokens, temperature, start_time,
+                                    enable_thinking_chain=False) -> AsyncIterator[Dict[str, Any]]:
+        """异步流式调用DeepSeek API，模型不支持思考模式时去掉该参数重试"""
+        payload = self._build_chat_payload(messages, model_name, max_tokens, temperature)
+        thinking_enabled = enable_thinking_chain or "deepseek" in model_name.lower()
+        if thinking_enabled:
+            payload["enable_thinking"] = True
+        
+        url = f"{api_endpoint}/chat/completions"
+        headers = self._build_auth_headers(api_key)
+        try:
+            async for event in self._astream_openai_compatible(
+                "DeepSeek", url, headers, payload, 120 if thinking_enabled else 60, model_name, start_time
+            ):
+                yield event
+        except LLMTransportError as e:
+            if not thinking_enabled or "does not support parameter enable_thinking" not in e.body:
+                raise
+            logger.warning(f"模型 {model_name} 不支持 thinking 参数，重试不使用 thinking 参数")
+            payload.pop("enable_thinking")
+            async for event in self._astream_openai_compatible(
+                "DeepSeek", url, headers, payload, 60, model_name, start_time
+            ):
+                yield event
+    
+    def _astream_openai_api(self, messages, model_name, api_endpoint, api_key,
+                            max_tokens, temperature, start_time) -> AsyncIterator[Dict[str, Any]]:
+        """异步流式调用OpenAI API"""
+        return self._astream_openai_compatible(
+            "OpenAI", f"{api_endpoint}/chat/completions", self._build_auth_headers(api_key),
+            self._build_chat_payload(messages, model_name, max_tokens, temperature), 60,
+            model_name, start_time
+        )
+    
+    def _astream_generic_api(self, messages, model_name, api_endpoint, api_key,
+                             max_tokens, temperature, supplier_display_name, start_time) -> AsyncIterator[Dict[str, Any]]:
+        """异步流式调用OpenAI兼容的通用API"""
+        return self._astream_openai_compatible(
+            supplier_display_name, f"{api_endpoint}/chat/completions", self._build_auth_headers(api_key),
+            self._build_chat_payload(messages, model_name, max_tokens, temperature), 60,
+            model_name, start_time
+        )
+    
+    def _astream_dashscope_api(self, messages, model_name, api_endpoint, api_key,
+                               max_tokens, temperature, supplier_display_name, start_time) -> AsyncIterator[Dict[str, Any]]:
+        """异步流式调用阿里云百炼API（compatible-mode 端点，OpenAI兼容格式）"""
+        return self._astream_openai_compatible(
+            supplier_display_name, api_endpoint.rstrip('/') + "/compatible-mode/v1/chat/completions",
+            self._build_auth_headers(api_key),
+            self._build_chat_payload(messages, model_name, max_tokens, temperature), 60,
+            model_name, start_time
+        )
+    
+    async def _astream_ollama_api(self, messages, model_name, api_endpoint, max_tokens,
+                                  temperature, supplier_display_name, start_time) -> AsyncIterator[Dict[str, Any]]:
+        """异步流式调用Ollama API（换行分隔的JSON流）"""
+        payload = {
+            "model": model_name,
+            "messages": messages,
+            "stream": True,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens
+            }
+        }
+        
+        full_response = []
+        tokens_used = 0
+        async for chunk in self.http_transport.aiter_ndjson(
+            supplier_display_name, f"{api_endpoint}/chat", {"Content-Type": "application/json"}, payload, 60
+        ):
+            content_chunk = (chunk.get("message") or {}).get("content") or chunk.get("response")
+            if content_chunk:
+                full_response.append(content_chunk)
+                yield {"type": "content", "content": content_chunk, "model": model_name, "supplier": supplier_display_name}
+            if chunk.get("done"):
+                tokens_used = chunk.get("prompt_eval_count", 0) + chunk.get("eval_count", 0)
+        
+        yield {
+            "type": "done",
+            "generated_text": "".join(full_response).strip(),
+            "model": model_name,
+            "supplier": supplier_display_name,
+            "tokens_used": tokens_used,
+            "execution_time_ms": round((time.time() - start_time) * 1000, 2),
+            "success": True
+        }
+    
     # 兼容性方法
     def chat(self, messages, **kwargs):
         """兼容chat方法"""
@@ -0,0 +1,225 @@
+"""大模型调用观测 - 按模型统计实际延迟（EWMA / p50 / p95）、错误率与在途请求数"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Deque, Iterator, List
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ModelLatencyStats:
+    """
+    单个模型的调用统计
+
+    成功请求的延迟进入固定大小的滑动窗口，用于计算分位数；
+    延迟与错误率同时维护 EWMA，反映最近的变化趋势。
+    """
+
+    def __init__(self, window_size: int = 200, alpha: float = 0.2):
+        self.alpha = alpha
+        self.in_flight = 0
+        self.total = 0
+        self.errors = 0
+        self.ewma_latency = 0.0
+        self.ewma_error_rate = 0.0
+        self.last_used = 0.0
+        self._samples: Deque[float] = deque(maxlen=window_size)
+        self._sorted: Optional[List[float]] = None
+
+    def record(self, latency: float, success: bool):
+        self.total += 1
+        self.last_used = time.time()
+        error = 0.0 if success else 1.0
+        self.ewma_error_rate = error if self.total == 1 else (1 - self.alpha) * self.ewma_error_rate + self.alpha * error
+        if not success:
+            self.errors += 1
+            return
+        # 失败请求往往很快返回，不计入延迟统计
+        self.ewma_latency = latency if not self._samples else (1 - self.alpha) * self.ewma_latency + self.alpha * latency
+        self._samples.append(latency)
+        self._sorted = None
+
+    def percentile(self, q: float) -> Optional[float]:
+        """滑动窗口内成功请求延迟的分位数（秒），没有样本时返回 None"""
+        if not self._samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+        index = min(len(self._sorted) - 1, int(q * len(self._sorted)))
+        return self._sorted[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "samples": len(self._samples),
+            "p50_ms": int(p50 * 1000) if p50 is not None else None,
+            "p95_ms": int(p95 * 1000) if p95 is not None else None,
+            "ewma_ms": int(self.ewma_latency * 1000),
+            "error_rate": round(self.ewma_error_rate, 4),
+            "in_flight": self.in_flight,
+            "total": self.total,
+            "errors": self.errors
+        }
+
+
+class ModelLatencyTracker:
+    """按模型ID汇总LLM调用的实际表现，进程内所有服务共享"""
+
+    def __init__(self, window_size: int = 200, alpha: float = 0.2):
+        self.window_size = window_size
+        self.alpha = alpha
+        self._stats: Dict[str, ModelLatencyStats] = {}
+        self._lock = threading.Lock()
+
+    def _get_locked(self, model: str) -> ModelLatencyStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = ModelLatencyStats(self.window_size, self.alpha)
+            self._stats[model] = stats
+        return stats
+
+    def begin(self, model: Optional[str]) -> float:
+        """登记一个在途请求，返回开始时间"""
+        if model:
+            with self._lock:
+                self._get_locked(model).in_flight += 1
+        return time.monotonic()
+
+    def end(self, model: Optional[str], started: float, success: Optional[bool],
+            record_model: Optional[str] = None):
+        """
+        结束一个在途请求
+
+        Args:
+            model: begin 时使用的模型ID
+            started: begin 返回的开始时间
+            success: 是否成功；None 表示不记录样本（如流式响应）
+            record_model: 实际使用的模型ID（与 model 不同时，样本记到该模型上）
+        """
+        latency = time.monotonic() - started
+        with self._lock:
+            if model:
+                stats = self._get_locked(model)
+                stats.in_flight = max(0, stats.in_flight - 1)
+            target = record_model or model
+            if target and success is not None:
+                self._get_locked(target).record(latency, success)
+
+    @contextmanager
+    def track(self, model: Optional[str]):
+        """
+        跟踪一次模型调用
+
+        yield 一个结果记录字典：调用方可将 success 置为 False 表示调用失败、
+        置为 None 表示不记录延迟样本，并可通过 model 指明实际使用的模型；
+        块内抛出异常时按失败记录。调用开始时尚未确定模型（如使用默认模型）时，
+        可在确定后通过 bind_model 登记在途请求；返回流式响应时通过 track_stream
+        将在途请求交给生成器。
+        """
+        started = self.begin(model)
+        outcome = {"success": True, "model": None, "in_flight_model": model, "started": started}
+        try:
+            yield outcome
+        except BaseException:
+            outcome["success"] = False
+            raise
+        finally:
+            if not outcome.get("stream"):
+                self.end(outcome["in_flight_model"], started, outcome["success"], outcome["model"])
+
+    def track_stream(self, call: Dict[str, Any], stream: Iterator) -> Iterator:
+        """
+        将 track 记录的在途请求交给流式响应（在 track 块内调用）
+
+        在途计数保持到流耗尽或关闭：耗尽时记录从调用开始到最后一块的延迟，
+        迭代出错按失败记录，提前关闭（客户端断开）不记录延迟样本。
+        """
+        call["stream"] = True
+        return _TrackedStream(self, call, stream)
+
+    def bind_model(self, call: Dict[str, Any], model: Optional[str]):
+        """将 track 记录的在途请求转移到已确定的模型上"""
+        previous = call.get("in_flight_model")
+        if not model or model == previous:
+            return
+        with self._lock:
+            if previous:
+                stats = self._get_locked(previous)
+                stats.in_flight = max(0, stats.in_flight - 1)
+            self._get_locked(model).in_flight += 1
+            call["in_flight_model"] = model
+
+    def snapshot(self, model: Optional[str]) -> Optional[Dict[str, Any]]:
+        """获取模型的当前统计，没有记录时返回 None"""
+        if not model:
+            return None
+        with self._lock:
+            stats = self._stats.get(model)
+            return stats.snapshot() if stats else None
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {model: stats.snapshot() for model, stats in self._stats.items()}
+
+
+class _TrackedStream:
+    """流式响应包装：迭代结束、关闭或被回收时结束在途请求"""
+
+    def __init__(self, tracker: ModelLatencyTracker, call: Dict[str, Any], stream: Iterator):
+        self._tracker = tracker
+        self._call = call
+        self._stream = iter(stream)
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._stream)
+        except StopIteration:
+            self._finish(True)
+            raise
+        except BaseException:
+            self._finish(False)
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self._stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._finish(None)
+
+    def __del__(self):
+        self._finish(None)
+
+    def _finish(self, success: Optional[bool]):
+        if self._finished:
+            return
+        self._finished = True
+        call = self._call
+        self._tracker.end(call["in_flight_model"], call["started"], success, call["model"])
+
+
+_model_latency_tracker: Optional[ModelLatencyTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_model_latency_tracker() -> ModelLatencyTracker:
+    """获取全局模型调用观测器"""
+    global _model_latency_tracker
+    if _model_latency_tracker is None:
+        with _tracker_lock:
+            if _model_latency_tracker is None:
+                _model_latency_tracker = ModelLatencyTracker(
+                    window_size=getattr(settings, 'model_latency_window_size', 200),
+                    alpha=getattr(settings, 'model_latency_ewma_alpha', 0.2)
+                )
+    return _model_latency_tracker
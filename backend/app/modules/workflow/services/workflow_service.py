@@ -1,4 +1,4 @@
-from typing import Dict, Any, List, Optional, Callable
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
 from functools import wraps
@@ -9,6 +9,10 @@ import json
 import logging
 import traceback
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+
+from app.core.config import settings
 
 # 导入缓存服务
 from app.core.cache import cache_service
@@ -721,6 +725,26 @@ class WorkflowEngine:
         self.workflow_service = WorkflowService(db)
         self.node_executors = {}
         self.register_node_executors()
+        
+        # 并行调度配置：全局并行节点数与按节点类型的并发上限
+        self.max_parallel_nodes = max(1, getattr(settings, 'workflow_max_parallel_nodes', 8))
+        self.node_concurrency_limits = self._parse_concurrency_limits(
+            getattr(settings, 'workflow_node_concurrency_limits', '')
+        )
+    
+    @staticmethod
+    def _parse_concurrency_limits(spec: str) -> Dict[str, int]:
+        """解析按节点类型的并发上限配置，格式: knowledge_search:4,mcp:2"""
+        limits = {}
+        for item in (spec or "").split(","):
+            if ":" not in item:
+                continue
+            node_type, _, limit = item.partition(":")
+            try:
+                limits[node_type.strip()] = max(1, int(limit))
+            except ValueError:
+                logger.warning(f"节点并发上限配置无效: {item}")
+        return limits
     
     def register_node_executors(self):
         """注册节点执行器"""
@@ -940,21 +964,111 @@ class WorkflowEngine:
                 logger.error(f"更新执行状态失败: {str(update_error)}")
     
     def execute_workflow_by_connections(self, execution_id: int, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]], input_data: Dict[str, Any]) -> Dict[str, Any]:
-        """按节点连接关系执行工作流"""
-        logger.info("开始按节点连接关系执行工作流")
+        """按节点连接关系执行工作流（同步入口，内部按拓扑顺序并行调度）"""
+        coroutine = self.execute_workflow_by_connections_async(execution_id, nodes, edges, input_data)
         
-        # 将节点列表转换为字典，便于查找
-        node_dict = {node['id']: node for node in nodes}
+        try:
+            asyncio.get_running_loop()
+            in_event_loop = True
+        except RuntimeError:
+            in_event_loop = False
+        
+        if in_event_loop:
+            # 当前线程已有运行中的事件循环，在独立线程中执行调度
+            with ThreadPoolExecutor(max_workers=1) as runner:
+                return runner.submit(asyncio.run, coroutine).result()
+        
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+    
+    def _build_execution_dag(self, start_ids: List[str], node_dict: Dict[str, Dict[str, Any]],
+                             edges: List[Dict[str, Any]]) -> Tuple[Dict[str, List[str]], Dict[str, List[str]]]:
+        """
+        构建从开始节点可达的执行 DAG
         
-        # 构建邻接表，表示节点之间的连接关系
-        adjacency_list = {node_id: [] for node_id in node_dict.keys()}
+        丢弃指向不存在节点的边和重复边；回边（环）被忽略，每个节点只执行一次。
+        
+        Returns:
+            (父节点表, 子节点表)，键为全部可达节点
+        """
+        successors: Dict[str, List[str]] = {node_id: [] for node_id in node_dict}
         for edge in edges:
             source = edge.get('source')
             target = edge.get('target')
-            if source and target and source in adjacency_list:
-                adjacency_list[source].append(target)
+            if source in successors and target in node_dict and target not in successors[source]:
+                successors[source].append(target)
+            elif source and target:
+                logger.warning(f"忽略无效连接: {source} -> {target}")
+        
+        parents: Dict[str, List[str]] = {}
+        children: Dict[str, List[str]] = {}
+        in_progress = set()
+        for start_id in start_ids:
+            if start_id in children:
+                continue
+            parents.setdefault(start_id, [])
+            children[start_id] = []
+            in_progress.add(start_id)
+            stack = [(start_id, iter(successors[start_id]))]
+            while stack:
+                node_id, pending = stack[-1]
+                next_id = next(pending, None)
+                if next_id is None:
+                    in_progress.discard(node_id)
+                    stack.pop()
+                    continue
+                if next_id in in_progress:
+                    logger.warning(f"检测到环，忽略连接: {node_id} -> {next_id}")
+                    continue
+                children[node_id].append(next_id)
+                parents.setdefault(next_id, []).append(node_id)
+                if next_id not in children:
+                    children[next_id] = []
+                    in_progress.add(next_id)
+                    stack.append((next_id, iter(successors[next_id])))
+        
+        return parents, children
+    
+    @staticmethod
+    def _merge_node_result(context: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """将节点执行结果合并到上下文"""
+        if result.get('success'):
+            if 'context_data' in result:
+                context.update(result['context_data'])
+            if 'final_result' in result:
+                context.update(result['final_result'])
+            if 'output_data' in result:
+                context.update(result['output_data'])
+            if 'processed_value' in result and 'output_field' in result:
+                context[result['output_field']] = result['processed_value']
+        return context
+    
+    @staticmethod
+    def _context_delta(base: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+        """节点对上下文的修改（新增或值发生变化的键）"""
+        return {
+            key: value for key, value in context.items()
+            if key not in base or (base[key] is not value and base[key] != value)
+        }
+    
+    async def execute_workflow_by_connections_async(self, execution_id: int, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]], input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按节点连接关系并行执行工作流
+        
+        - 节点的全部父节点完成后才会执行（汇合语义），就绪节点并发执行
+        - 每个节点使用独立的上下文副本，只记录节点对上下文的修改；节点的输入为初始输入
+          依次应用全部祖先节点的修改（按静态拓扑序，并行分支写同一键时与完成先后无关），
+          汇合时不会被其他分支未修改的继承值覆盖
+        - 并发受全局并行节点数与按节点类型的并发上限约束
+        - 节点执行器在线程池中运行，节点执行记录的读写保持在调度线程中
+        """
+        logger.info("开始按节点连接关系执行工作流")
         
-        logger.debug(f"邻接表: {adjacency_list}")
+        # 将节点列表转换为字典，便于查找
+        node_dict = {node['id']: node for node in nodes}
         
         # 查找开始节点
         start_nodes = [node for node in nodes if node.get('type') == 'start']
@@ -963,69 +1077,141 @@ class WorkflowEngine:
             start_nodes = [nodes[0]]
             logger.warning("未找到开始节点，使用第一个节点作为开始")
         
-        # 执行上下文
-        context = input_data.copy()
+        parents, children = self._build_execution_dag(
+            [node['id'] for node in start_nodes], node_dict, edges
+        )
+        logger.debug(f"执行DAG: {children}")
         
-        # 已执行的节点
-        executed_nodes = set()
+        waiting = {node_id: len(node_parents) for node_id, node_parents in parents.items()}
         
-        # 执行节点的函数
-        def execute_node_recursive(node_id: str):
-            """递归执行节点及其后续节点"""
-            if node_id in executed_nodes:
-                logger.debug(f"节点 {node_id} 已执行，跳过")
-                return
-            
-            executed_nodes.add(node_id)
-            node = node_dict.get(node_id)
-            if not node:
-                logger.warning(f"节点 {node_id} 不存在，跳过")
-                return
-            
-            try:
-                # 执行当前节点
-                logger.info(f"执行节点: {node_id}")
-                result = self.execute_node(execution_id, node, context)
-                
-                # 将节点执行结果添加到上下文
-                if result.get('success'):
-                    if 'context_data' in result:
-                        context.update(result['context_data'])
-                    if 'final_result' in result:
-                        context.update(result['final_result'])
-                    if 'output_data' in result:
-                        context.update(result['output_data'])
-                    if 'processed_value' in result and 'output_field' in result:
-                        context[result['output_field']] = result['processed_value']
+        # 静态拓扑序（按连接顺序），决定各节点修改的应用顺序
+        remaining = dict(waiting)
+        order = [node_id for node_id, count in remaining.items() if count == 0]
+        for node_id in order:
+            for next_node_id in children[node_id]:
+                remaining[next_node_id] -= 1
+                if remaining[next_node_id] == 0:
+                    order.append(next_node_id)
+        rank = {node_id: position for position, node_id in enumerate(order)}
+        
+        ancestors: Dict[str, set] = {}
+        deltas: Dict[str, Dict[str, Any]] = {}
+        executed_nodes: List[str] = []
+        
+        global_semaphore = asyncio.Semaphore(self.max_parallel_nodes)
+        type_semaphores = {
+            node_type: asyncio.Semaphore(limit)
+            for node_type, limit in self.node_concurrency_limits.items()
+        }
+        thread_pool = ThreadPoolExecutor(
+            max_workers=self.max_parallel_nodes, thread_name_prefix="workflow-node"
+        )
+        running: Dict[asyncio.Future, str] = {}
+        
+        async def run_node(node: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
+            async with AsyncExitStack() as stack:
+                type_semaphore = type_semaphores.get(node.get('type'))
+                if type_semaphore is not None:
+                    await stack.enter_async_context(type_semaphore)
+                await stack.enter_async_context(global_semaphore)
                 
-                # 执行后续节点
-                for next_node_id in adjacency_list[node_id]:
-                    logger.debug(f"从节点 {node_id} 连接到节点 {next_node_id}")
-                    execute_node_recursive(next_node_id)
-                    
-            except Exception as e:
-                logger.error(f"节点 {node_id} 执行失败: {str(e)}")
-                raise
+                logger.info(f"执行节点: {node['id']}")
+                base = context.copy()
+                result = await self.execute_node_async(execution_id, node, context, thread_pool)
+            return self._context_delta(base, self._merge_node_result(context, result))
+        
+        def merged_context(node_ids) -> Dict[str, Any]:
+            context = input_data.copy()
+            for node_id in sorted(node_ids, key=rank.__getitem__):
+                context.update(deltas[node_id])
+            return context
+        
+        def launch(node_id: str):
+            node_ancestors = set(parents[node_id])
+            for parent_id in parents[node_id]:
+                node_ancestors |= ancestors[parent_id]
+            ancestors[node_id] = node_ancestors
+            context = merged_context(node_ancestors)
+            running[asyncio.ensure_future(run_node(node_dict[node_id], context))] = node_id
         
         try:
-            # 执行所有开始节点
-            for start_node in start_nodes:
-                execute_node_recursive(start_node['id'])
+            for node_id, count in waiting.items():
+                if count == 0:
+                    launch(node_id)
+            
+            while running:
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node_id = running.pop(task)
+                    deltas[node_id] = task.result()
+                    executed_nodes.append(node_id)
+                    
+                    for next_node_id in children[node_id]:
+                        logger.debug(f"从节点 {node_id} 连接到节点 {next_node_id}")
+                        waiting[next_node_id] -= 1
+                        if waiting[next_node_id] == 0:
+                            launch(next_node_id)
+            
+            # 最终上下文为初始输入依次应用全部已执行节点的修改
+            context = merged_context(deltas)
             
             logger.info(f"工作流执行完成: 已执行 {len(executed_nodes)} 个节点")
             
             return {
                 "message": "工作流执行完成",
-                "executed_nodes": list(executed_nodes),
+                "executed_nodes": executed_nodes,
                 "final_context": context
             }
             
         except Exception as e:
             logger.error(f"按连接关系执行工作流失败: {str(e)}")
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.keys(), return_exceptions=True)
             raise
+        
+        finally:
+            thread_pool.shutdown(wait=False)
     
     def execute_node(self, execution_id: int, node: Dict[str, Any], context_data: Dict[str, Any]) -> Dict[str, Any]:
         """执行单个节点"""
+        node_id, node_type, node_config, node_execution = self._start_node_execution(execution_id, node)
+        
+        try:
+            executor = self._get_node_executor(node_type)
+            result = self._invoke_node_executor(executor, node_id, node_config, context_data)
+            self._complete_node_execution(node_execution, node_id, result)
+            return result
+            
+        except Exception as e:
+            self._fail_node_execution(node_execution, node_id, node_type, node_config, e)
+            raise
+    
+    async def execute_node_async(self, execution_id: int, node: Dict[str, Any], context_data: Dict[str, Any],
+                                 thread_pool: Optional[ThreadPoolExecutor] = None) -> Dict[str, Any]:
+        """执行单个节点（节点执行器在线程池中运行，执行记录在调用线程中读写）"""
+        node_id, node_type, node_config, node_execution = self._start_node_execution(execution_id, node)
+        
+        try:
+            executor = self._get_node_executor(node_type)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                thread_pool, self._invoke_node_executor, executor, node_id, node_config, context_data
+            )
+            self._complete_node_execution(node_execution, node_id, result)
+            return result
+            
+        except asyncio.CancelledError:
+            # 其他分支失败导致工作流中止
+            self._fail_node_execution(node_execution, node_id, node_type, node_config, RuntimeError("工作流已中止"))
+            raise
+        except Exception as e:
+            self._fail_node_execution(node_execution, node_id, node_type, node_config, e)
+            raise
+    
+    def _start_node_execution(self, execution_id: int, node: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any], NodeExecution]:
+        """校验节点信息并创建节点执行记录"""
         node_id = node.get("id", "unknown")
         node_type = node.get("type", "unknown")
         # 同时支持config和data属性，以兼容前端ReactFlow的数据结构
@@ -1061,56 +1247,70 @@ class WorkflowEngine:
             logger.error(f"错误堆栈: {traceback.format_exc()}")
             raise
         
+        return node_id, node_type, node_config, node_execution
+    
+    def _get_node_executor(self, node_type: str):
+        """获取节点执行器"""
+        executor = self.node_executors.get(node_type)
+        if not executor:
+            error_msg = f"未知的节点类型: {node_type}, 可用类型: {list(self.node_executors.keys())}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        
+        logger.info(f"找到节点执行器: {node_type}")
+        
+        # 验证执行器是否实现了execute方法
+        if not hasattr(executor, 'execute') or not callable(getattr(executor, 'execute')):
+            error_msg = f"节点执行器缺少execute方法: {node_type}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        
+        return executor
+    
+    @staticmethod
+    def _invoke_node_executor(executor, node_id: str, node_config: Dict[str, Any],
+                              context_data: Dict[str, Any]) -> Dict[str, Any]:
+        """调用节点执行器并校验结果（可在工作线程中运行）"""
+        # 部分执行器通过 get_event_loop().run_until_complete 调用异步接口，工作线程需要自己的事件循环
+        try:
+            asyncio.get_event_loop()
+        except RuntimeError:
+            asyncio.set_event_loop(asyncio.new_event_loop())
+        
+        # 执行节点
+        logger.info(f"开始执行节点逻辑: ID={node_id}")
+        logger.debug(f"节点配置: {node_config}")
+        logger.debug(f"上下文数据: {context_data}")
+        
+        result = executor.execute(node_config, context_data)
+        
+        # 验证执行结果
+        if not isinstance(result, dict):
+            error_msg = f"节点执行结果格式错误: 期望字典类型, 实际类型={type(result)}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        
+        return result
+    
+    def _complete_node_execution(self, node_execution: NodeExecution, node_id: str, result: Dict[str, Any]):
+        """更新节点执行记录为完成状态"""
+        success = result.get("success", False)
+        logger.info(f"节点执行完成: ID={node_id}, 成功={success}")
+        
+        self.workflow_service.update_node_execution(
+            node_execution.id, "completed", result
+        )
+    
+    def _fail_node_execution(self, node_execution: NodeExecution, node_id: str, node_type: str,
+                             node_config: Dict[str, Any], error: Exception):
+        """更新节点执行记录为失败状态"""
+        logger.error(f"节点执行失败: ID={node_id}, 类型={node_type}, 错误: {str(error)}")
+        logger.error(f"节点配置: {node_config}")
+        logger.error(f"错误堆栈: {traceback.format_exc()}")
+        
         try:
-            # 获取节点执行器
-            executor = self.node_executors.get(node_type)
-            if not executor:
-                error_msg = f"未知的节点类型: {node_type}, 可用类型: {list(self.node_executors.keys())}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-            
-            logger.info(f"找到节点执行器: {node_type}")
-            
-            # 验证执行器是否实现了execute方法
-            if not hasattr(executor, 'execute') or not callable(getattr(executor, 'execute')):
-                error_msg = f"节点执行器缺少execute方法: {node_type}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-            
-            # 执行节点
-            logger.info(f"开始执行节点逻辑: ID={node_id}")
-            logger.debug(f"节点配置: {node_config}")
-            logger.debug(f"上下文数据: {context_data}")
-            
-            result = executor.execute(node_config, context_data)
-            
-            # 验证执行结果
-            if not isinstance(result, dict):
-                error_msg = f"节点执行结果格式错误: 期望字典类型, 实际类型={type(result)}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
-            
-            success = result.get("success", False)
-            logger.info(f"节点执行完成: ID={node_id}, 成功={success}")
-            
-            # 更新节点执行记录
             self.workflow_service.update_node_execution(
-                node_execution.id, "completed", result
+                node_execution.id, "failed", error_message=str(error)
             )
-            
-            return result
-            
-        except Exception as e:
-            logger.error(f"节点执行失败: ID={node_id}, 类型={node_type}, 错误: {str(e)}")
-            logger.error(f"节点配置: {node_config}")
-            logger.error(f"错误堆栈: {traceback.format_exc()}")
-            
-            # 更新节点执行记录为失败状态
-            try:
-                self.workflow_service.update_node_execution(
-                    node_execution.id, "failed", error_message=str(e)
-                )
-            except Exception as update_error:
-                logger.error(f"更新节点执行记录失败: {str(update_error)}")
-            
-            raise
\ No newline at end of file
+        except Exception as update_error:
+            logger.error(f"更新节点执行记录失败: {str(update_error)}")
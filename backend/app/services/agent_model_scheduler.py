@@ -2,14 +2,18 @@
 from typing import List, Dict, Any, Optional, Tuple
 from enum import Enum
 from pydantic import BaseModel
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from datetime import datetime
 import logging
 
-from app.models.supplier_db import ModelDB
+from app.core.config import settings
+from app.models.supplier_db import ModelDB, SupplierDB
 from app.models.model_capability import ModelCapability, ModelCapabilityAssociation
 from app.models.default_model import DefaultModel, ModelPerformance
 from app.services.capability_assessment_service import CapabilityAssessmentService
+from app.services.model_config_cache import model_config_cache
+from app.modules.llm.services.model_latency_tracker import get_model_latency_tracker
 
 
 class SchedulingStrategy(Enum):
@@ -38,8 +42,13 @@ class ScheduledModel(BaseModel):
     capability_strength: Dict[str, int]  # 能力名称 -> 强度
     confidence_score: Dict[str, int]  # 能力名称 -> 置信度
     estimated_cost: float
-    estimated_response_time: int
+    estimated_response_time: int  # p50（毫秒），有足够实测样本时取实测值
     selection_reason: str
+    model_key: Optional[str] = None  # 模型ID字符串（调用观测的键）
+    p95_response_time: Optional[int] = None
+    error_rate: float = 0.0
+    in_flight: int = 0
+    fallback_model_id: Optional[int] = None
 
 
 class SchedulingResult(BaseModel):
@@ -53,13 +62,121 @@ class SchedulingResult(BaseModel):
     scheduling_strategy: SchedulingStrategy
 
 
+def _estimate_model_cost(model_name: str) -> float:
+    """估算模型使用成本"""
+    # 基于模型类型和供应商的简单成本估算
+    cost_mapping = {
+        "gpt-4": 0.03,  # 每千token
+        "gpt-3.5-turbo": 0.002,
+        "claude-3": 0.025,
+        "codellama": 0.001,  # 本地模型成本较低
+        "llama": 0.001
+    }
+    
+    model_name_lower = (model_name or "").lower()
+    for key, cost in cost_mapping.items():
+        if key in model_name_lower:
+            return cost
+    
+    return 0.01  # 默认成本
+
+
+def _estimate_response_time(model_name: str) -> int:
+    """估算模型响应时间（毫秒），没有实测数据时使用"""
+    # 基于模型类型和上下文的简单响应时间估算
+    time_mapping = {
+        "gpt-4": 2000,
+        "gpt-3.5-turbo": 1000,
+        "claude-3": 1500,
+        "codellama": 5000,  # 本地模型可能较慢
+        "llama": 4000
+    }
+    
+    model_name_lower = (model_name or "").lower()
+    for key, time in time_mapping.items():
+        if key in model_name_lower:
+            return time
+    
+    return 2000  # 默认响应时间
+
+
+def load_capability_matrix(db: Session) -> Dict[int, Dict[str, Any]]:
+    """
+    一次联表查询加载所有活跃模型的能力矩阵
+    
+    Returns:
+        模型整数ID -> 模型信息（供应商、能力强度/置信度、成本与响应时间先验）
+    """
+    performance = db.query(
+        ModelPerformance.model_id.label("model_id"),
+        func.avg(ModelPerformance.avg_response_time).label("avg_response_time")
+    ).group_by(ModelPerformance.model_id).subquery()
+    
+    rows = db.query(
+        ModelDB.id, ModelDB.model_id, ModelDB.model_name, SupplierDB.name,
+        ModelCapability.name, ModelCapabilityAssociation.actual_strength,
+        ModelCapabilityAssociation.confidence_score, performance.c.avg_response_time
+    ).outerjoin(
+        SupplierDB, SupplierDB.id == ModelDB.supplier_id
+    ).outerjoin(
+        ModelCapabilityAssociation, ModelCapabilityAssociation.model_id == ModelDB.id
+    ).outerjoin(
+        ModelCapability, ModelCapability.id == ModelCapabilityAssociation.capability_id
+    ).outerjoin(
+        performance, performance.c.model_id == ModelDB.id
+    ).filter(
+        ModelDB.is_active == True
+    ).order_by(ModelDB.id).all()
+    
+    matrix: Dict[int, Dict[str, Any]] = {}
+    for (model_id, model_key, model_name, supplier_name, capability_name,
+         strength, confidence, avg_response_time) in rows:
+        model = matrix.get(model_id)
+        if model is None:
+            # 历史性能数据（秒）优先于按名称的估算
+            if avg_response_time:
+                prior_response_time = int(float(avg_response_time) * 1000)
+            else:
+                prior_response_time = _estimate_response_time(model_name)
+            model = matrix[model_id] = {
+                "model_id": model_id,
+                "model_key": model_key,
+                "model_name": model_name,
+                "supplier_name": supplier_name or "Unknown",
+                "capabilities": {},
+                "estimated_cost": _estimate_model_cost(model_name),
+                "prior_response_time": prior_response_time
+            }
+        if capability_name:
+            model["capabilities"][capability_name] = {
+                "strength": strength,
+                "confidence": confidence
+            }
+    
+    return matrix
+
+
 class AgentModelScheduler:
-    """智能体模型调度器"""
+    """
+    智能体模型调度器
+    
+    模型能力矩阵一次联表加载并缓存在模型配置缓存中（模型/能力变更后失效）；
+    响应时间、错误率与在途请求数取自调用观测器记录的实际LLM调用。
+    """
+    
+    # 每个在途请求使预计耗时增加的比例
+    LOAD_PENALTY = 0.25
+    # 主模型在途请求数超过该值时强制切换
+    MAX_PRIMARY_LOAD = 10
+    # 备用模型预计耗时低于主模型的该比例时切换
+    SWITCH_RATIO = 0.8
     
     def __init__(self, db: Session):
         self.db = db
         self.capability_service = CapabilityAssessmentService()
         self.logger = logging.getLogger(__name__)
+        self.latency_tracker = get_model_latency_tracker()
+        self.min_samples = getattr(settings, 'model_latency_min_samples', 5)
     
     def schedule_models(self, task_id: str, criteria: ModelSelectionCriteria, 
                        strategy: SchedulingStrategy = SchedulingStrategy.BALANCED,
@@ -173,74 +290,20 @@ class AgentModelScheduler:
     
     def _create_scheduled_model_from_default(self, default_model: DefaultModel, role: str) -> ScheduledModel:
         """根据默认模型配置创建调度模型对象"""
-        model = self.db.query(ModelDB).filter(ModelDB.id == default_model.model_id).first()
+        model_info = self._get_model_info(default_model.model_id)
         
-        if not model:
+        if not model_info:
             raise ValueError(f"默认模型关联的模型不存在 (ID: {default_model.model_id})")
-            
-        # 获取模型能力，使用selectinload预加载避免N+1查询
-        from sqlalchemy.orm import selectinload
-        
-        associations = self.db.query(ModelCapabilityAssociation).options(
-            selectinload(ModelCapabilityAssociation.capability)
-        ).filter(
-            ModelCapabilityAssociation.model_id == model.id
-        ).all()
-        
-        for association in associations:
-            capability = association.capability
-            
-            if capability:
-                capabilities[capability.name] = {
-                    "strength": association.actual_strength,
-                    "confidence": association.confidence_score
-                }
-        
-        # 获取模型性能数据（用于成本和响应时间估算）
-        model_performance = self.db.query(ModelPerformance).filter(
-            ModelPerformance.model_id == model.id
-        ).all()
-        
-        # 估算响应时间（如果没有性能数据，使用默认值）
-        estimated_response_time = self._estimate_response_time(model)
-        if model_performance and model_performance[0].avg_response_time:
-            estimated_response_time = int(float(model_performance[0].avg_response_time) * 1000)  # 转换为毫秒
         
-        # 估算成本（如果没有性能数据，使用默认值）
-        estimated_cost = self._estimate_model_cost(model)
+        scheduled_model = self._create_scheduled_model(model_info, role)
         
         # 设置角色和选择原因
         if role == "primary":
-            selection_reason = f"基于默认模型配置选择为主模型"
+            scheduled_model.selection_reason = f"基于默认模型配置选择为主模型"
+            # 主模型记录默认配置中的备用模型ID
+            scheduled_model.fallback_model_id = default_model.fallback_model_id
         else:
-            selection_reason = f"基于默认模型配置选择为备用模型"
-        
-        # 如果是备用模型，直接设置备用模型ID
-        fallback_model_id = default_model.fallback_model_id if role == "primary" else None
-        
-        # 构建能力强度和置信度字典
-        capability_strength = {}
-        confidence_score = {}
-        
-        for capability_name, capability_data in capabilities.items():
-            capability_strength[capability_name] = capability_data["strength"]
-            confidence_score[capability_name] = capability_data["confidence"]
-        
-        # 创建ScheduledModel对象
-        scheduled_model = ScheduledModel(
-            model_id=model.id,
-            model_name=model.model_name,
-            supplier_name=model.supplier.name if model.supplier else "Unknown",
-            capability_strength=capability_strength,
-            confidence_score=confidence_score,
-            estimated_cost=estimated_cost,
-            estimated_response_time=estimated_response_time,
-            selection_reason=selection_reason
-        )
-        
-        # 如果有备用模型ID，设置到对象上（通过扩展属性）
-        if fallback_model_id:
-            scheduled_model.fallback_model_id = fallback_model_id
+            scheduled_model.selection_reason = f"基于默认模型配置选择为备用模型"
         
         return scheduled_model
     
@@ -251,71 +314,65 @@ class AgentModelScheduler:
                 return True
         return False
     
+    def _get_capability_matrix(self) -> Dict[int, Dict[str, Any]]:
+        """获取缓存的模型能力矩阵（只读，跨请求共享）"""
+        return model_config_cache.get_snapshot(
+            ("capability_matrix",), lambda: load_capability_matrix(self.db)
+        )
+    
+    def _latency_profile(self, model_key: Optional[str], prior_response_time: int) -> Dict[str, Any]:
+        """
+        模型的延迟画像
+        
+        实测样本足够时使用实测的 p50/p95，否则使用先验值；错误率与在途请求数始终取实测值。
+        """
+        snapshot = self.latency_tracker.snapshot(model_key)
+        profile = {
+            "estimated_response_time": prior_response_time,
+            "p95_response_time": prior_response_time,
+            "error_rate": 0.0,
+            "in_flight": 0,
+            "measured": False
+        }
+        if not snapshot:
+            return profile
+        
+        profile["in_flight"] = snapshot["in_flight"]
+        if snapshot["total"] >= self.min_samples:
+            profile["error_rate"] = snapshot["error_rate"]
+        if snapshot["samples"] >= self.min_samples:
+            profile["estimated_response_time"] = snapshot["p50_ms"]
+            profile["p95_response_time"] = snapshot["p95_ms"]
+            profile["measured"] = True
+        return profile
+    
+    def _with_live_stats(self, model: Dict[str, Any]) -> Dict[str, Any]:
+        """在能力矩阵条目上叠加实时调用统计（返回新字典，不修改缓存）"""
+        model_info = dict(model)
+        model_info.update(self._latency_profile(model["model_key"], model["prior_response_time"]))
+        return model_info
+    
+    def _get_model_info(self, model_id: int) -> Optional[Dict[str, Any]]:
+        """获取单个模型的信息（含实时调用统计）"""
+        model = self._get_capability_matrix().get(model_id)
+        return self._with_live_stats(model) if model else None
+    
     def _get_available_models(self) -> List[Dict[str, Any]]:
         """获取所有可用模型及其能力信息"""
-        models = self.db.query(ModelDB).filter(ModelDB.is_active == True).all()
-        
-        available_models = []
-        for model in models:
-            model_info = {
-                "model_id": model.id,
-                "model_name": model.model_name,
-                "supplier_name": model.supplier.name if model.supplier else "Unknown",
-                "capabilities": {},
-                "estimated_cost": self._estimate_model_cost(model),
-                "estimated_response_time": self._estimate_response_time(model)
-            }
-            
-            # 获取模型的能力关联，使用selectinload预加载避免N+1查询
-            associations = self.db.query(ModelCapabilityAssociation).options(
-                selectinload(ModelCapabilityAssociation.capability)
-            ).filter(
-                ModelCapabilityAssociation.model_id == model.id
-            ).all()
-            
-            for association in associations:
-                capability = association.capability
-                
-                if capability:
-                    model_info["capabilities"][capability.name] = {
-                        "strength": association.actual_strength,
-                        "confidence": association.confidence_score
-                    }
-            
-            available_models.append(model_info)
-        
-        return available_models
-        
-        available_models = []
-        for model in models:
-            model_info = {
-                "model_id": model.id,
-                "model_name": model.model_name,
-                "supplier_name": model.supplier.name if model.supplier else "Unknown",
-                "capabilities": {},
-                "estimated_cost": self._estimate_model_cost(model),
-                "estimated_response_time": self._estimate_response_time(model)
-            }
-            
-            # 获取模型的能力关联，使用selectinload预加载避免N+1查询
-            associations = self.db.query(ModelCapabilityAssociation).options(
-                selectinload(ModelCapabilityAssociation.capability)
-            ).filter(
-                ModelCapabilityAssociation.model_id == model.id
-            ).all()
-            
-            for association in associations:
-                capability = association.capability
-                
-                if capability:
-                    model_info["capabilities"][capability.name] = {
-                        "strength": association.actual_strength,
-                        "confidence": association.confidence_score
-                    }
-            
-            available_models.append(model_info)
+        return [self._with_live_stats(model) for model in self._get_capability_matrix().values()]
+    
+    def _routing_latency(self, p95_response_time: int, error_rate: float, in_flight: int) -> float:
+        """
+        路由用的预计耗时（毫秒）
         
-        return available_models
+        以 p95 衡量尾延迟，按在途请求数线性放大排队等待，
+        并按错误率放大（失败后需要重试或回退）。
+        """
+        latency = p95_response_time * (1 + self.LOAD_PENALTY * in_flight)
+        return latency / (1 - min(error_rate, 0.9))
+    
+    def _model_routing_latency(self, model: Dict[str, Any]) -> float:
+        return self._routing_latency(model["p95_response_time"], model["error_rate"], model["in_flight"])
     
     def _filter_models_by_criteria(self, models: List[Dict[str, Any]], 
                                  criteria: ModelSelectionCriteria) -> List[Dict[str, Any]]:
@@ -367,16 +424,22 @@ class AgentModelScheduler:
             return sorted(models, key=lambda x: self._calculate_capability_score(x, criteria), reverse=True)
         
         elif strategy == SchedulingStrategy.COST_EFFECTIVE:
-            # 成本优先：按成本排序
-            return sorted(models, key=lambda x: x["estimated_cost"])
+            # 成本优先：按成本排序，成本相同时按预计耗时
+            return sorted(models, key=lambda x: (x["estimated_cost"], self._model_routing_latency(x)))
         
         elif strategy == SchedulingStrategy.PERFORMANCE_OPTIMIZED:
-            # 性能优先：按响应时间排序
-            return sorted(models, key=lambda x: x["estimated_response_time"])
+            # 性能优先：按实测尾延迟与当前负载下的预计耗时排序
+            return sorted(models, key=self._model_routing_latency)
         
         else:  # BALANCED
-            # 平衡策略：综合考虑能力、成本、性能
-            return sorted(models, key=lambda x: self._calculate_balanced_score(x, criteria))
+            # 平衡策略：综合考虑能力、成本、性能（得分越高越好）
+            max_cost = max(m["estimated_cost"] for m in models)
+            max_latency = max(self._model_routing_latency(m) for m in models)
+            return sorted(
+                models,
+                key=lambda x: self._calculate_balanced_score(x, criteria, max_cost, max_latency),
+                reverse=True
+            )
     
     def _calculate_capability_score(self, model: Dict[str, Any], criteria: ModelSelectionCriteria) -> float:
         """计算模型能力得分"""
@@ -393,20 +456,21 @@ class AgentModelScheduler:
         
         return total_score / capability_count if capability_count > 0 else 0
     
-    def _calculate_balanced_score(self, model: Dict[str, Any], criteria: ModelSelectionCriteria) -> float:
-        """计算平衡得分"""
+    def _calculate_balanced_score(self, model: Dict[str, Any], criteria: ModelSelectionCriteria,
+                                  max_cost: float, max_latency: float) -> float:
+        """计算平衡得分（max_cost/max_latency 为候选模型中的最大值）"""
         # 能力得分（权重0.5）
         capability_score = self._calculate_capability_score(model, criteria)
         
         # 成本得分（权重0.3）
-        max_cost = max(m["estimated_cost"] for m in self._get_available_models()) if self._get_available_models() else 1
         cost_score = 1 - (model["estimated_cost"] / max_cost) if max_cost > 0 else 1
         
         # 性能得分（权重0.2）
-        max_time = max(m["estimated_response_time"] for m in self._get_available_models()) if self._get_available_models() else 1
-        performance_score = 1 - (model["estimated_response_time"] / max_time) if max_time > 0 else 1
+        performance_score = 1 - (self._model_routing_latency(model) / max_latency) if max_latency > 0 else 1
         
-        return (capability_score * 0.5) + (cost_score * 0.3) + (performance_score * 0.2)
+        score = (capability_score * 0.5) + (cost_score * 0.3) + (performance_score * 0.2)
+        # 按实测错误率折减
+        return score * (1 - model["error_rate"])
     
     def _select_primary_and_fallback(self, sorted_models: List[Dict[str, Any]]) -> Tuple[ScheduledModel, List[ScheduledModel]]:
         """选择主模型和备用模型"""
@@ -444,45 +508,13 @@ class AgentModelScheduler:
             confidence_score=confidence_score,
             estimated_cost=model_info["estimated_cost"],
             estimated_response_time=model_info["estimated_response_time"],
-            selection_reason=selection_reason
+            selection_reason=selection_reason,
+            model_key=model_info.get("model_key"),
+            p95_response_time=model_info.get("p95_response_time"),
+            error_rate=model_info.get("error_rate", 0.0),
+            in_flight=model_info.get("in_flight", 0)
         )
     
-    def _estimate_model_cost(self, model: ModelDB) -> float:
-        """估算模型使用成本"""
-        # 基于模型类型和供应商的简单成本估算
-        cost_mapping = {
-            "gpt-4": 0.03,  # 每千token
-            "gpt-3.5-turbo": 0.002,
-            "claude-3": 0.025,
-            "codellama": 0.001,  # 本地模型成本较低
-            "llama": 0.001
-        }
-        
-        model_name_lower = model.model_name.lower()
-        for key, cost in cost_mapping.items():
-            if key in model_name_lower:
-                return cost
-        
-        return 0.01  # 默认成本
-    
-    def _estimate_response_time(self, model: ModelDB) -> int:
-        """估算模型响应时间（毫秒）"""
-        # 基于模型类型和上下文的简单响应时间估算
-        time_mapping = {
-            "gpt-4": 2000,
-            "gpt-3.5-turbo": 1000,
-            "claude-3": 1500,
-            "codellama": 5000,  # 本地模型可能较慢
-            "llama": 4000
-        }
-        
-        model_name_lower = model.model_name.lower()
-        for key, time in time_mapping.items():
-            if key in model_name_lower:
-                return time
-        
-        return 2000  # 默认响应时间
-    
     def _calculate_total_cost(self, models: List[ScheduledModel]) -> float:
         """计算总成本"""
         return sum(model.estimated_cost for model in models)
@@ -624,39 +656,61 @@ class AgentModelScheduler:
         """
         基于当前负载进行负载均衡
         
+        按实测 p95 延迟、错误率与在途请求数估算每个已选模型的预计耗时，
+        主模型负载过高或明显慢于某个备用模型时切换到预计耗时最短的备用模型。
+        
         Args:
-            current_workload: 当前各模型的负载情况
+            current_workload: 当前各模型的负载情况（模型名称 -> 在途请求数），与实测在途数取较大值
             scheduling_result: 原始调度结果
             
         Returns:
             SchedulingResult: 负载均衡后的调度结果
         """
-        # 简单的负载均衡策略：如果主模型负载过高，切换到备用模型
-        primary_model_name = scheduling_result.primary_model.model_name
+        if not scheduling_result.fallback_models:
+            return scheduling_result
         
-        if primary_model_name in current_workload and current_workload[primary_model_name] > 10:
-            # 主模型负载过高，切换到第一个备用模型
-            if scheduling_result.fallback_models:
-                new_primary = scheduling_result.fallback_models[0]
-                remaining_fallbacks = scheduling_result.fallback_models[1:] + [scheduling_result.primary_model]
-                
-                # 更新选择原因
-                new_primary.selection_reason = "负载均衡：原主模型负载过高"
-                
-                # 创建新的调度结果
-                balanced_result = SchedulingResult(
-                    task_id=scheduling_result.task_id,
-                    selected_models=[new_primary] + remaining_fallbacks,
-                    primary_model=new_primary,
-                    fallback_models=remaining_fallbacks,
-                    total_estimated_cost=scheduling_result.total_estimated_cost,
-                    total_estimated_time=scheduling_result.total_estimated_time,
-                    scheduling_strategy=scheduling_result.scheduling_strategy
-                )
-                
-                # 记录负载均衡日志
-                self.logger.info(f"负载均衡：切换主模型 {scheduling_result.primary_model.model_name} 到备用模型 {new_primary.model_name}")
-                
-                return balanced_result
+        expected = {}
+        loads = {}
+        for model in scheduling_result.selected_models:
+            prior = model.p95_response_time or model.estimated_response_time
+            profile = self._latency_profile(model.model_key, prior)
+            loads[model.model_id] = max(current_workload.get(model.model_name, 0), profile["in_flight"])
+            expected[model.model_id] = self._routing_latency(
+                profile["p95_response_time"], profile["error_rate"], loads[model.model_id]
+            )
+        
+        primary = scheduling_result.primary_model
+        candidates = sorted(scheduling_result.fallback_models, key=lambda m: expected[m.model_id])
+        best = candidates[0]
+        overloaded = loads[primary.model_id] > self.MAX_PRIMARY_LOAD
+        
+        if not overloaded and expected[best.model_id] >= expected[primary.model_id] * self.SWITCH_RATIO:
+            return scheduling_result
+        
+        new_primary = best
+        remaining_fallbacks = candidates[1:] + [primary]
+        
+        # 更新选择原因
+        if overloaded:
+            new_primary.selection_reason = "负载均衡：原主模型负载过高"
+        else:
+            new_primary.selection_reason = (
+                f"负载均衡：原主模型预计耗时 {int(expected[primary.model_id])}ms，"
+                f"高于该模型的 {int(expected[best.model_id])}ms"
+            )
+        
+        # 创建新的调度结果
+        balanced_result = SchedulingResult(
+            task_id=scheduling_result.task_id,
+            selected_models=[new_primary] + remaining_fallbacks,
+            primary_model=new_primary,
+            fallback_models=remaining_fallbacks,
+            total_estimated_cost=scheduling_result.total_estimated_cost,
+            total_estimated_time=scheduling_result.total_estimated_time,
+            scheduling_strategy=scheduling_result.scheduling_strategy
+        )
+        
+        # 记录负载均衡日志
+        self.logger.info(f"负载均衡：切换主模型 {primary.model_name} 到备用模型 {new_primary.model_name}")
         
-        return scheduling_result
\ No newline at end of file
+        return balanced_result
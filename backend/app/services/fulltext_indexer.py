@@ -3,22 +3,32 @@
 
 负责构建和维护技能全文索引，支持中文分词、倒排索引和快速全文检索。
 提供高效的全文搜索能力，替代现有的简单文本匹配。
+
+索引以不可变磁盘段 + 内存写缓冲 + 预写日志的方式持久化，后台合并段。
 """
 
 import os
 import re
 import json
+import mmap
 import pickle
+import shutil
 import threading
-from typing import Dict, List, Set, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple
 from collections import defaultdict, Counter
 from dataclasses import dataclass
 from pathlib import Path
 
+import numpy as np
+
 from app.core.logging_config import logger
 from app.schemas.skill_metadata import SkillMetadata
 
 
+# 段格式版本
+SEGMENT_FORMAT_VERSION = 1
+
+
 @dataclass
 class SearchResult:
     """搜索结果"""
@@ -75,29 +85,247 @@ class ChineseTokenizer:
         return tokens
 
 
+class IndexSegment:
+    """
+    不可变的磁盘索引段
+
+    目录内容：
+    - terms.txt           有序词项（每行一个）
+    - term_offsets.npy    各词项倒排表在 post_* 数组中的起止位置
+    - post_docs.npy       倒排表中的文档序号
+    - post_tf.npy         预计算的归一化词频（词项出现次数 / 文档长度）
+    - doc_lengths.npy     文档长度（词元数）
+    - skill_ids.json      文档序号 -> 技能ID
+    - documents.jsonl     文档存储字段（每行一个 JSON，按 doc_offsets.npy 定位按需读取）
+
+    数组以内存映射方式加载，启动时无需反序列化整个索引。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+
+        with open(os.path.join(path, 'terms.txt'), 'r', encoding='utf-8') as f:
+            content = f.read()
+        self.terms = content.split('\n') if content else []
+        self.term_ids = {term: i for i, term in enumerate(self.terms)}
+
+        self.term_offsets = self._load_array('term_offsets.npy')
+        self.post_docs = self._load_array('post_docs.npy')
+        self.post_tf = self._load_array('post_tf.npy')
+        self.doc_lengths = self._load_array('doc_lengths.npy')
+        self.doc_offsets = self._load_array('doc_offsets.npy')
+
+        with open(os.path.join(path, 'skill_ids.json'), 'r', encoding='utf-8') as f:
+            self.skill_ids: List[str] = json.load(f)
+
+        self._documents_file = open(os.path.join(path, 'documents.jsonl'), 'rb')
+        if os.fstat(self._documents_file.fileno()).st_size:
+            self._documents = mmap.mmap(self._documents_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._documents = b''
+
+    def _load_array(self, filename: str) -> np.ndarray:
+        array = np.load(os.path.join(self.path, filename), mmap_mode='r')
+        return array if array.size else np.asarray(array)
+
+    def __len__(self) -> int:
+        return len(self.skill_ids)
+
+    def postings(self, token: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """词项倒排表：(文档序号, 归一化词频)"""
+        i = self.term_ids.get(token)
+        if i is None:
+            return None
+        start, end = int(self.term_offsets[i]), int(self.term_offsets[i + 1])
+        return self.post_docs[start:end], self.post_tf[start:end]
+
+    def document_bytes(self, ordinal: int) -> bytes:
+        """文档存储字段的原始 JSON 行"""
+        return self._documents[int(self.doc_offsets[ordinal]):int(self.doc_offsets[ordinal + 1])]
+
+    def get_document(self, ordinal: int) -> Dict[str, Any]:
+        """读取文档存储字段"""
+        return json.loads(self.document_bytes(ordinal))
+
+    def close(self):
+        """释放内存映射"""
+        if isinstance(self._documents, mmap.mmap):
+            self._documents.close()
+        self._documents_file.close()
+
+    @classmethod
+    def write(cls, path: str, documents: List[Tuple[str, Dict[str, Any], Counter, int]]) -> "IndexSegment":
+        """
+        将文档写为新段
+
+        Args:
+            path: 段目录
+            documents: (技能ID, 文档存储字段, 词项计数, 文档长度) 列表
+        """
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for ordinal, (_, _, term_counts, length) in enumerate(documents):
+            for token, count in term_counts.items():
+                postings[token].append((ordinal, count / length))
+
+        terms = sorted(postings)
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, token in enumerate(terms):
+            term_offsets[i + 1] = term_offsets[i] + len(postings[token])
+        entries = [entry for token in terms for entry in postings[token]]
+
+        cls._write_files(
+            path,
+            terms,
+            term_offsets,
+            np.asarray([ordinal for ordinal, _ in entries], dtype=np.int32),
+            np.asarray([tf for _, tf in entries], dtype=np.float32),
+            np.asarray([length for _, _, _, length in documents], dtype=np.int32),
+            [skill_id for skill_id, _, _, _ in documents],
+            [json.dumps(fields, ensure_ascii=False, default=str).encode('utf-8') for _, fields, _, _ in documents]
+        )
+        return cls(path)
+
+    @classmethod
+    def merge(cls, path: str, sources: List[Tuple["IndexSegment", np.ndarray]]) -> Tuple["IndexSegment", List[Tuple[str, int]]]:
+        """
+        合并多个段的存活文档（直接拼接倒排表，不重新分词）
+
+        Args:
+            path: 新段目录
+            sources: (段, 存活标记) 列表
+
+        Returns:
+            (新段, 新段各文档来源的 (段名, 文档序号))
+        """
+        remaps = []
+        positions: List[Tuple[str, int]] = []
+        for segment, alive in sources:
+            remap = np.cumsum(alive, dtype=np.int64) - 1 + len(positions)
+            remaps.append(remap)
+            positions.extend((segment.name, int(ordinal)) for ordinal in np.flatnonzero(alive))
+
+        terms: List[str] = []
+        offsets = [0]
+        post_docs: List[np.ndarray] = []
+        post_tf: List[np.ndarray] = []
+        for token in sorted(set().union(*(segment.terms for segment, _ in sources))):
+            count = 0
+            for (segment, alive), remap in zip(sources, remaps):
+                postings = segment.postings(token)
+                if postings is None:
+                    continue
+                docs, tf = postings
+                keep = alive[docs]
+                if keep.any():
+                    post_docs.append(remap[docs[keep]].astype(np.int32))
+                    post_tf.append(np.asarray(tf[keep], dtype=np.float32))
+                    count += int(keep.sum())
+            # 只出现在已删除文档中的词项不再保留
+            if count:
+                terms.append(token)
+                offsets.append(offsets[-1] + count)
+
+        lengths = [np.asarray(segment.doc_lengths)[alive] for segment, alive in sources]
+        segments = {segment.name: segment for segment, _ in sources}
+        cls._write_files(
+            path,
+            terms,
+            np.asarray(offsets, dtype=np.int64),
+            np.concatenate(post_docs) if post_docs else np.zeros(0, dtype=np.int32),
+            np.concatenate(post_tf) if post_tf else np.zeros(0, dtype=np.float32),
+            np.concatenate(lengths).astype(np.int32) if lengths else np.zeros(0, dtype=np.int32),
+            [segments[name].skill_ids[ordinal] for name, ordinal in positions],
+            [segments[name].document_bytes(ordinal) for name, ordinal in positions]
+        )
+        return cls(path), positions
+
+    @staticmethod
+    def _write_files(path: str, terms: List[str], term_offsets: np.ndarray, post_docs: np.ndarray,
+                     post_tf: np.ndarray, doc_lengths: np.ndarray, skill_ids: List[str],
+                     document_lines: List[bytes]):
+        """写入段文件（先写临时目录，完成后改名）"""
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        with open(os.path.join(tmp_path, 'terms.txt'), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(terms))
+        np.save(os.path.join(tmp_path, 'term_offsets.npy'), term_offsets)
+        np.save(os.path.join(tmp_path, 'post_docs.npy'), post_docs)
+        np.save(os.path.join(tmp_path, 'post_tf.npy'), post_tf)
+        np.save(os.path.join(tmp_path, 'doc_lengths.npy'), doc_lengths)
+        with open(os.path.join(tmp_path, 'skill_ids.json'), 'w', encoding='utf-8') as f:
+            json.dump(skill_ids, f, ensure_ascii=False)
+
+        doc_offsets = np.zeros(len(document_lines) + 1, dtype=np.int64)
+        with open(os.path.join(tmp_path, 'documents.jsonl'), 'wb') as f:
+            for i, line in enumerate(document_lines):
+                f.write(line)
+                f.write(b'\n')
+                doc_offsets[i + 1] = doc_offsets[i] + len(line) + 1
+        np.save(os.path.join(tmp_path, 'doc_offsets.npy'), doc_offsets)
+
+        os.replace(tmp_path, path)
+
+
+@dataclass
+class _BufferedDocument:
+    """写缓冲中的文档"""
+    fields: Dict[str, Any]
+    term_counts: Counter
+    length: int
+
+
 class FullTextIndexer:
-    """全文索引器"""
+    """
+    全文索引器
+
+    索引由若干不可变的磁盘段和一个内存写缓冲组成：
+    - 新增、更新、删除先追加到预写日志（wal.jsonl）并作用于写缓冲或段的删除标记，
+      单个技能的更新代价只与该文档大小相关
+    - 写缓冲达到 buffer_size 时落盘为新段并清空预写日志；段数超过 max_segments 时在后台线程合并
+    - 段内保存预计算的归一化词频与文档长度，检索时不再重新分词
+    - 启动时内存映射各段（manifest.json 记录段列表与删除标记）并重放预写日志
+    """
+    
+    MANIFEST_FILE = 'manifest.json'
+    LOG_FILE = 'wal.jsonl'
+    LEGACY_INDEX_FILE = 'index.pkl'
     
-    def __init__(self, index_path: Optional[str] = None):
+    def __init__(self, index_path: Optional[str] = None, buffer_size: int = 64, max_segments: int = 8):
         """
         初始化全文索引器
         
         Args:
             index_path: 索引存储路径
+            buffer_size: 写缓冲落盘为新段的文档数
+            max_segments: 触发后台合并的段数
         """
         self.index_path = index_path or "data/fulltext_index"
         self.tokenizer = ChineseTokenizer()
+        self.buffer_size = buffer_size
+        self.max_segments = max_segments
         self._lock = threading.RLock()
-        
-        # 索引数据结构
-        self.inverted_index: Dict[str, Set[str]] = defaultdict(set)  # 词项 -> 技能ID集合
-        self.document_store: Dict[str, Dict] = {}                    # 技能ID -> 文档信息
-        self.document_lengths: Dict[str, int] = {}                  # 技能ID -> 文档长度
+        self._merge_thread: Optional[threading.Thread] = None
         self.statistics = IndexStatistics()
         
+        self._reset_state()
+        
         # 加载现有索引
         self._load_index()
     
+    def _reset_state(self):
+        """清空内存中的索引状态"""
+        self._segments: Dict[str, IndexSegment] = {}
+        self._alive: Dict[str, np.ndarray] = {}              # 段名 -> 文档存活标记
+        self._locations: Dict[str, Tuple[str, int]] = {}     # 技能ID -> (段名, 文档序号)
+        self._buffer: Dict[str, _BufferedDocument] = {}      # 技能ID -> 写缓冲文档
+        self._next_segment = 0
+        self._total_tokens = 0
+        # 索引整体重建时递增，使进行中的后台合并结果作废
+        self._generation = 0
+    
     def build_index(self, skills: List[SkillMetadata]) -> bool:
         """
         构建全文索引
@@ -112,45 +340,28 @@ class FullTextIndexer:
             try:
                 logger.info(f"开始构建全文索引，共 {len(skills)} 个技能")
                 
-                # 清空现有索引
-                self.inverted_index.clear()
-                self.document_store.clear()
-                self.document_lengths.clear()
-                
-                # 构建索引
-                total_tokens = 0
-                
+                documents: Dict[str, Tuple[str, Dict[str, Any], Counter, int]] = {}
                 for skill in skills:
-                    # 提取技能文本内容
-                    text_content = self._extract_skill_text(skill)
-                    
-                    # 分词
-                    tokens = self.tokenizer.tokenize(text_content)
-                    
-                    # 更新倒排索引
-                    for token in tokens:
-                        self.inverted_index[token].add(skill.skill_id)
-                    
-                    # 存储文档信息
-                    self.document_store[skill.skill_id] = {
-                        'name': skill.name,
-                        'description': skill.description,
-                        'category': skill.category,
-                        'tags': skill.tags,
-                        'content': text_content
-                    }
-                    
-                    # 记录文档长度
-                    self.document_lengths[skill.skill_id] = len(tokens)
-                    total_tokens += len(tokens)
+                    fields = self._document_fields(skill)
+                    term_counts, length = self._analyze(fields['content'])
+                    documents[skill.skill_id] = (skill.skill_id, fields, term_counts, length)
+                
+                # 清空现有索引
+                old_segments = list(self._segments.values())
+                generation, next_segment = self._generation + 1, self._next_segment
+                self._reset_state()
+                self._generation, self._next_segment = generation, next_segment
                 
-                # 更新统计信息
-                self._update_statistics(len(skills), total_tokens)
+                os.makedirs(self.index_path, exist_ok=True)
+                if documents:
+                    self._add_segment(IndexSegment.write(self._new_segment_path(), list(documents.values())))
+                self._write_manifest()
+                self._truncate_log()
+                self._discard_segments(old_segments)
                 
-                # 保存索引
-                self._save_index()
+                self._update_statistics()
                 
-                logger.info(f"全文索引构建完成，共索引 {len(skills)} 个文档，{len(self.inverted_index)} 个唯一词项")
+                logger.info(f"全文索引构建完成，共索引 {len(documents)} 个文档，{self._count_unique_tokens()} 个唯一词项")
                 return True
                 
             except Exception as e:
@@ -169,7 +380,8 @@ class FullTextIndexer:
             搜索结果列表
         """
         with self._lock:
-            if not self.inverted_index:
+            total_docs = self._document_count()
+            if total_docs == 0:
                 logger.warning("全文索引为空，请先构建索引")
                 return []
             
@@ -181,41 +393,50 @@ class FullTextIndexer:
                     return []
                 
                 # 计算TF-IDF分数
-                results = {}
+                results: Dict[str, float] = {}
                 
                 for token in query_tokens:
-                    if token in self.inverted_index:
-                        # 计算IDF（逆文档频率）
-                        idf = self._calculate_idf(token)
-                        
-                        for skill_id in self.inverted_index[token]:
-                            # 计算TF（词频）
-                            tf = self._calculate_tf(token, skill_id)
-                            
-                            # TF-IDF分数
-                            score = tf * idf
-                            
-                            if skill_id not in results:
-                                results[skill_id] = 0
-                            results[skill_id] += score
-                
-                # 转换为搜索结果并排序
-                search_results = []
-                for skill_id, score in results.items():
-                    # 计算高亮片段
-                    highlights = self._generate_highlights(skill_id, query_tokens)
+                    matches = []
+                    doc_count = 0
+                    for name, segment in self._segments.items():
+                        postings = segment.postings(token)
+                        if postings is None:
+                            continue
+                        docs, tfs = postings
+                        alive = self._alive[name][docs]
+                        if alive.any():
+                            matches.append((segment, docs[alive], tfs[alive]))
+                            doc_count += int(alive.sum())
+                    buffered = [
+                        (skill_id, document.term_counts[token] / document.length)
+                        for skill_id, document in self._buffer.items()
+                        if token in document.term_counts
+                    ]
+                    doc_count += len(buffered)
+                    if doc_count == 0:
+                        continue
                     
-                    search_results.append(SearchResult(
+                    # 计算IDF（逆文档频率）
+                    idf = 1.0 + (total_docs / (1.0 + doc_count))
+                    
+                    # TF-IDF分数（TF为段内预计算的归一化词频）
+                    for segment, docs, tfs in matches:
+                        for ordinal, tf in zip(docs.tolist(), tfs.tolist()):
+                            skill_id = segment.skill_ids[ordinal]
+                            results[skill_id] = results.get(skill_id, 0) + tf * idf
+                    for skill_id, tf in buffered:
+                        results[skill_id] = results.get(skill_id, 0) + tf * idf
+                
+                # 按分数排序并限制结果数量，只为返回的结果生成高亮片段
+                ranked = sorted(results.items(), key=lambda x: x[1], reverse=True)[:limit]
+                return [
+                    SearchResult(
                         skill_id=skill_id,
                         score=score,
-                        highlights=highlights
-                    ))
-                
-                # 按分数排序
-                search_results.sort(key=lambda x: x.score, reverse=True)
-                
-                # 限制结果数量
-                return search_results[:limit]
+                        highlights=self._generate_highlights(skill_id, query_tokens)
+                    )
+                    for skill_id, score in ranked
+                ]
                 
             except Exception as e:
                 logger.error(f"全文搜索失败: {e}")
@@ -233,42 +454,11 @@ class FullTextIndexer:
         """
         with self._lock:
             try:
-                skill_id = skill.skill_id
-                
-                # 如果技能已存在，先移除
-                if skill_id in self.document_store:
-                    self._remove_document(skill_id)
-                
-                # 提取技能文本内容
-                text_content = self._extract_skill_text(skill)
-                
-                # 分词
-                tokens = self.tokenizer.tokenize(text_content)
-                
-                # 更新倒排索引
-                for token in tokens:
-                    self.inverted_index[token].add(skill_id)
-                
-                # 更新文档存储
-                self.document_store[skill_id] = {
-                    'name': skill.name,
-                    'description': skill.description,
-                    'category': skill.category,
-                    'tags': skill.tags,
-                    'content': text_content
-                }
-                
-                # 更新文档长度
-                self.document_lengths[skill_id] = len(tokens)
-                
-                # 更新统计信息
-                self._update_statistics(
-                    len(self.document_store),
-                    sum(self.document_lengths.values())
-                )
-                
-                # 保存索引
-                self._save_index()
+                fields = self._document_fields(skill)
+                self._append_log({'op': 'upsert', 'skill_id': skill.skill_id, 'fields': fields})
+                self._upsert_document(skill.skill_id, fields)
+                self._maybe_flush()
+                self._update_statistics()
                 
                 logger.info(f"索引更新成功: {skill.name}")
                 return True
@@ -289,21 +479,13 @@ class FullTextIndexer:
         """
         with self._lock:
             try:
-                if skill_id not in self.document_store:
+                if skill_id not in self._buffer and skill_id not in self._locations:
                     logger.warning(f"技能不存在于索引中: {skill_id}")
                     return False
                 
-                # 从索引中移除
+                self._append_log({'op': 'remove', 'skill_id': skill_id})
                 self._remove_document(skill_id)
-                
-                # 更新统计信息
-                self._update_statistics(
-                    len(self.document_store),
-                    sum(self.document_lengths.values())
-                )
-                
-                # 保存索引
-                self._save_index()
+                self._update_statistics()
                 
                 logger.info(f"从索引中移除技能: {skill_id}")
                 return True
@@ -313,32 +495,40 @@ class FullTextIndexer:
                 return False
     
     def optimize_index(self) -> bool:
-        """优化索引（清理无用词项等）"""
-        with self._lock:
-            try:
-                # 清理低频词项（出现次数少于2次）
-                tokens_to_remove = []
-                for token, skill_ids in self.inverted_index.items():
-                    if len(skill_ids) < 2:
-                        tokens_to_remove.append(token)
-                
-                for token in tokens_to_remove:
-                    del self.inverted_index[token]
-                
-                logger.info(f"索引优化完成，清理了 {len(tokens_to_remove)} 个低频词项")
-                
-                # 保存优化后的索引
-                self._save_index()
-                
-                return True
-                
-            except Exception as e:
-                logger.error(f"优化索引失败: {e}")
-                return False
+        """优化索引（落盘写缓冲，并将全部段合并为一个段以清除删除标记）"""
+        try:
+            with self._lock:
+                self._flush_buffer()
+            
+            self._merge_segments(force=True)
+            
+            with self._lock:
+                self._update_statistics()
+                logger.info(f"索引优化完成，当前 {len(self._segments)} 个段")
+            return True
+            
+        except Exception as e:
+            logger.error(f"优化索引失败: {e}")
+            return False
     
     def get_statistics(self) -> IndexStatistics:
         """获取索引统计信息"""
-        return self.statistics
+        with self._lock:
+            self.statistics.unique_tokens = self._count_unique_tokens()
+            self.statistics.index_size_bytes = self._index_size_bytes()
+            return self.statistics
+    
+    def get_document(self, skill_id: str) -> Optional[Dict[str, Any]]:
+        """获取技能的文档存储字段（name / description / category / tags / content）"""
+        with self._lock:
+            document = self._buffer.get(skill_id)
+            if document is not None:
+                return document.fields
+            location = self._locations.get(skill_id)
+            if location is None:
+                return None
+            name, ordinal = location
+            return self._segments[name].get_document(ordinal)
     
     def _extract_skill_text(self, skill: SkillMetadata) -> str:
         """提取技能文本内容"""
@@ -362,44 +552,28 @@ class FullTextIndexer:
         
         return ' '.join(text_parts)
     
-    def _calculate_tf(self, token: str, skill_id: str) -> float:
-        """计算词频（TF）"""
-        if skill_id not in self.document_store:
-            return 0.0
-        
-        # 获取文档内容
-        content = self.document_store[skill_id]['content']
-        
-        # 计算词频
-        tokens = self.tokenizer.tokenize(content)
-        token_count = tokens.count(token)
-        
-        # 标准化TF（避免长文档优势）
-        return token_count / len(tokens) if tokens else 0.0
+    def _document_fields(self, skill: SkillMetadata) -> Dict[str, Any]:
+        """技能的文档存储字段"""
+        return {
+            'name': skill.name,
+            'description': skill.description,
+            'category': skill.category,
+            'tags': skill.tags,
+            'content': self._extract_skill_text(skill)
+        }
     
-    def _calculate_idf(self, token: str) -> float:
-        """计算逆文档频率（IDF）"""
-        if token not in self.inverted_index:
-            return 0.0
-        
-        # 包含该词项的文档数
-        doc_count = len(self.inverted_index[token])
-        
-        # 总文档数
-        total_docs = len(self.document_store)
-        
-        # IDF计算
-        if doc_count == 0 or total_docs == 0:
-            return 0.0
-        
-        return 1.0 + (total_docs / (1.0 + doc_count))
+    def _analyze(self, content: str) -> Tuple[Counter, int]:
+        """分词并统计词项出现次数，返回 (词项计数, 文档长度)"""
+        tokens = self.tokenizer.tokenize(content)
+        return Counter(tokens), len(tokens)
     
     def _generate_highlights(self, skill_id: str, query_tokens: List[str]) -> List[str]:
         """生成高亮片段"""
-        if skill_id not in self.document_store:
+        document = self.get_document(skill_id)
+        if document is None:
             return []
         
-        content = self.document_store[skill_id]['content']
+        content = document['content']
         highlights = []
         
         # 简单的片段生成（生产环境应使用更复杂的算法）
@@ -419,100 +593,261 @@ class FullTextIndexer:
         
         return highlights
     
+    def _document_count(self) -> int:
+        return len(self._locations) + len(self._buffer)
+    
+    def _upsert_document(self, skill_id: str, fields: Dict[str, Any]):
+        """写入写缓冲（已存在的旧版本先删除）"""
+        self._remove_document(skill_id)
+        term_counts, length = self._analyze(fields['content'])
+        self._buffer[skill_id] = _BufferedDocument(fields, term_counts, length)
+        self._total_tokens += length
+    
     def _remove_document(self, skill_id: str):
-        """从索引中移除文档"""
-        # 从倒排索引中移除
-        tokens_to_remove = []
-        for token, skill_ids in self.inverted_index.items():
-            if skill_id in skill_ids:
-                skill_ids.remove(skill_id)
-                if not skill_ids:
-                    tokens_to_remove.append(token)
-        
-        # 清理空词项
-        for token in tokens_to_remove:
-            del self.inverted_index[token]
-        
-        # 从文档存储中移除
-        if skill_id in self.document_store:
-            del self.document_store[skill_id]
-        
-        # 从文档长度中移除
-        if skill_id in self.document_lengths:
-            del self.document_lengths[skill_id]
+        """从写缓冲移除或在所在段中标记删除"""
+        document = self._buffer.pop(skill_id, None)
+        if document is not None:
+            self._total_tokens -= document.length
+            return
+        location = self._locations.pop(skill_id, None)
+        if location is not None:
+            name, ordinal = location
+            self._alive[name][ordinal] = False
+            self._total_tokens -= int(self._segments[name].doc_lengths[ordinal])
     
-    def _update_statistics(self, total_documents: int, total_tokens: int):
-        """更新统计信息"""
-        self.statistics.total_documents = total_documents
-        self.statistics.total_tokens = total_tokens
-        self.statistics.unique_tokens = len(self.inverted_index)
-        self.statistics.average_document_length = (
-            total_tokens / total_documents if total_documents > 0 else 0.0
+    def _new_segment_path(self) -> str:
+        self._next_segment += 1
+        return os.path.join(self.index_path, f"segment_{self._next_segment:06d}")
+    
+    def _add_segment(self, segment: IndexSegment, alive: Optional[np.ndarray] = None):
+        """登记新段（段内后出现的同一技能覆盖先出现的）"""
+        alive = np.ones(len(segment), dtype=bool) if alive is None else alive
+        self._segments[segment.name] = segment
+        self._alive[segment.name] = alive
+        for ordinal in np.flatnonzero(alive).tolist():
+            skill_id = segment.skill_ids[ordinal]
+            self._remove_document(skill_id)
+            self._locations[skill_id] = (segment.name, ordinal)
+            self._total_tokens += int(segment.doc_lengths[ordinal])
+    
+    @staticmethod
+    def _discard_segments(segments: List[IndexSegment]):
+        """关闭并删除不再使用的段"""
+        for segment in segments:
+            segment.close()
+            shutil.rmtree(segment.path, ignore_errors=True)
+    
+    def _maybe_flush(self):
+        """写缓冲已满时落盘，段数过多时触发后台合并"""
+        if len(self._buffer) < self.buffer_size:
+            return
+        self._flush_buffer()
+        if len(self._segments) > self.max_segments:
+            self._schedule_merge()
+    
+    def _flush_buffer(self):
+        """将写缓冲落盘为新段"""
+        if not self._buffer:
+            return
+        
+        documents = [
+            (skill_id, document.fields, document.term_counts, document.length)
+            for skill_id, document in self._buffer.items()
+        ]
+        segment = IndexSegment.write(self._new_segment_path(), documents)
+        self._buffer.clear()
+        self._total_tokens -= sum(length for _, _, _, length in documents)
+        self._add_segment(segment)
+        
+        self._write_manifest()
+        self._truncate_log()
+        logger.debug(f"写缓冲已落盘为索引段: {segment.name}，{len(segment)} 个文档")
+    
+    def _schedule_merge(self):
+        """在后台线程合并段"""
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return
+        self._merge_thread = threading.Thread(
+            target=self._merge_segments, name="fulltext-segment-merge", daemon=True
         )
+        self._merge_thread.start()
+    
+    def _merge_segments(self, force: bool = False):
+        """
+        合并全部段
         
-        # 估算索引大小
-        import sys
-        self.statistics.index_size_bytes = (
-            sys.getsizeof(self.inverted_index) +
-            sys.getsizeof(self.document_store) +
-            sys.getsizeof(self.document_lengths)
-        )
+        合并在锁外进行，期间的新增写入缓冲、删除只修改存活标记；
+        替换时对比技能位置，合并期间被删除或更新的文档在新段中标记删除。
         
-        from datetime import datetime
-        self.statistics.last_updated = datetime.now().isoformat()
-    
-    def _save_index(self):
-        """保存索引到文件"""
+        Args:
+            force: 只有一个段时也重写（清除删除标记）
+        """
         try:
-            # 创建目录
-            os.makedirs(self.index_path, exist_ok=True)
+            with self._lock:
+                sources = [(segment, self._alive[segment.name].copy()) for segment in self._segments.values()]
+                if not sources or (len(sources) < 2 and not force):
+                    return
+                generation = self._generation
+                path = self._new_segment_path()
             
-            # 保存索引数据
-            index_data = {
-                'inverted_index': dict(self.inverted_index),
-                'document_store': self.document_store,
-                'document_lengths': self.document_lengths,
-                'statistics': self.statistics.__dict__
-            }
+            merged, positions = IndexSegment.merge(path, sources)
             
-            index_file = os.path.join(self.index_path, 'index.pkl')
-            with open(index_file, 'wb') as f:
-                pickle.dump(index_data, f)
+            with self._lock:
+                if generation != self._generation or any(
+                    segment.name not in self._segments for segment, _ in sources
+                ):
+                    # 合并期间索引被重建或段已被其他合并替换，丢弃结果
+                    self._discard_segments([merged])
+                    return
+                
+                alive = np.ones(len(merged), dtype=bool)
+                for ordinal, location in enumerate(positions):
+                    skill_id = merged.skill_ids[ordinal]
+                    if self._locations.get(skill_id) == location:
+                        self._locations[skill_id] = (merged.name, ordinal)
+                    else:
+                        alive[ordinal] = False
+                for segment, _ in sources:
+                    del self._segments[segment.name]
+                    del self._alive[segment.name]
+                self._segments[merged.name] = merged
+                self._alive[merged.name] = alive
+                self._write_manifest()
             
-            logger.debug("索引保存成功")
+            self._discard_segments([segment for segment, _ in sources])
+            logger.info(f"索引段合并完成: {len(sources)} 个段 -> {merged.name}，{int(alive.sum())} 个文档")
             
         except Exception as e:
-            logger.error(f"保存索引失败: {e}")
+            logger.error(f"合并索引段失败: {e}")
+    
+    def _update_statistics(self):
+        """更新统计信息（唯一词项数与索引大小在获取统计信息时计算）"""
+        total_documents = self._document_count()
+        self.statistics.total_documents = total_documents
+        self.statistics.total_tokens = self._total_tokens
+        self.statistics.average_document_length = (
+            self._total_tokens / total_documents if total_documents > 0 else 0.0
+        )
+        
+        from datetime import datetime
+        self.statistics.last_updated = datetime.now().isoformat()
+    
+    def _count_unique_tokens(self) -> int:
+        """唯一词项数（含已删除文档遗留、在合并前仍保留的词项）"""
+        tokens = set()
+        for segment in self._segments.values():
+            tokens.update(segment.terms)
+        for document in self._buffer.values():
+            tokens.update(document.term_counts)
+        return len(tokens)
+    
+    def _index_size_bytes(self) -> int:
+        """磁盘索引大小"""
+        total = 0
+        for segment in self._segments.values():
+            for entry in os.scandir(segment.path):
+                total += entry.stat().st_size
+        log_file = os.path.join(self.index_path, self.LOG_FILE)
+        if os.path.exists(log_file):
+            total += os.path.getsize(log_file)
+        return total
+    
+    def _append_log(self, record: Dict[str, Any]):
+        """追加预写日志"""
+        os.makedirs(self.index_path, exist_ok=True)
+        with open(os.path.join(self.index_path, self.LOG_FILE), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+    
+    def _truncate_log(self):
+        """清空预写日志（写缓冲已落盘）"""
+        log_file = os.path.join(self.index_path, self.LOG_FILE)
+        if os.path.exists(log_file):
+            open(log_file, 'w').close()
+    
+    def _write_manifest(self):
+        """写入段清单（段列表与删除标记）"""
+        manifest = {
+            'format_version': SEGMENT_FORMAT_VERSION,
+            'next_segment': self._next_segment,
+            'segments': [
+                {'name': name, 'deleted': np.flatnonzero(~self._alive[name]).tolist()}
+                for name in self._segments
+            ]
+        }
+        os.makedirs(self.index_path, exist_ok=True)
+        manifest_file = os.path.join(self.index_path, self.MANIFEST_FILE)
+        with open(f"{manifest_file}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(f"{manifest_file}.tmp", manifest_file)
     
     def _load_index(self):
-        """从文件加载索引"""
+        """从磁盘加载索引：映射各段并重放预写日志"""
         try:
-            index_file = os.path.join(self.index_path, 'index.pkl')
+            manifest_file = os.path.join(self.index_path, self.MANIFEST_FILE)
             
-            if not os.path.exists(index_file):
+            if os.path.exists(manifest_file):
+                with open(manifest_file, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                self._next_segment = manifest.get('next_segment', 0)
+                for entry in manifest.get('segments', []):
+                    segment = IndexSegment(os.path.join(self.index_path, entry['name']))
+                    alive = np.ones(len(segment), dtype=bool)
+                    alive[entry.get('deleted', [])] = False
+                    self._add_segment(segment, alive)
+            elif os.path.exists(os.path.join(self.index_path, self.LEGACY_INDEX_FILE)):
+                self._migrate_legacy_index()
+            else:
                 logger.info("索引文件不存在，将创建新索引")
                 return
             
-            with open(index_file, 'rb') as f:
-                index_data = pickle.load(f)
+            replayed = self._replay_log()
+            self._update_statistics()
             
-            # 加载索引数据
-            self.inverted_index = defaultdict(set, index_data.get('inverted_index', {}))
-            self.document_store = index_data.get('document_store', {})
-            self.document_lengths = index_data.get('document_lengths', {})
-            
-            # 加载统计信息
-            stats_dict = index_data.get('statistics', {})
-            self.statistics = IndexStatistics(**stats_dict)
-            
-            logger.info(f"索引加载成功，共 {len(self.document_store)} 个文档")
+            logger.info(
+                f"索引加载成功，共 {self._document_count()} 个文档，"
+                f"{len(self._segments)} 个段，重放日志 {replayed} 条"
+            )
             
         except Exception as e:
             logger.error(f"加载索引失败: {e}")
             # 初始化空索引
-            self.inverted_index = defaultdict(set)
-            self.document_store = {}
-            self.document_lengths = {}
+            self._reset_state()
+    
+    def _replay_log(self) -> int:
+        """重放预写日志到写缓冲"""
+        log_file = os.path.join(self.index_path, self.LOG_FILE)
+        if not os.path.exists(log_file):
+            return 0
+        
+        count = 0
+        with open(log_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 进程中断时可能留下不完整的末行
+                    logger.warning("预写日志存在不完整的记录，已跳过")
+                    continue
+                if record.get('op') == 'upsert':
+                    self._upsert_document(record['skill_id'], record['fields'])
+                elif record.get('op') == 'remove':
+                    self._remove_document(record['skill_id'])
+                count += 1
+        return count
+    
+    def _migrate_legacy_index(self):
+        """将旧版整体 pickle 索引转换为段格式"""
+        with open(os.path.join(self.index_path, self.LEGACY_INDEX_FILE), 'rb') as f:
+            index_data = pickle.load(f)
+        
+        documents = []
+        for skill_id, fields in index_data.get('document_store', {}).items():
+            term_counts, length = self._analyze(fields.get('content', ''))
+            documents.append((skill_id, fields, term_counts, length))
+        if documents:
+            self._add_segment(IndexSegment.write(self._new_segment_path(), documents))
+        self._write_manifest()
+        logger.info(f"旧版全文索引已转换为段格式，共 {len(documents)} 个文档")
 
 
 def create_fulltext_indexer(index_path: Optional[str] = None) -> FullTextIndexer:
@@ -1,18 +1,23 @@
 """实体对齐服务模块"""
 
 import numpy as np
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
 from collections import defaultdict
 from difflib import SequenceMatcher
 import logging
 
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.modules.knowledge.models.knowledge_document import (
     DocumentEntity, KBEntity, KnowledgeDocument
 )
 from app.services.knowledge.alignment.bert_entity_aligner import (
     BERTEntityAligner, get_bert_aligner
 )
+from app.services.knowledge.alignment.scalable_alignment import (
+    GramSetIndex, UnionFind, char_ngrams, minhash_lsh_candidates,
+    embedding_neighbor_candidates, rowwise_cosine
+)
 
 logger = logging.getLogger(__name__)
 
@@ -25,12 +30,19 @@ class EntityAlignmentService:
     核心功能：实体聚类、相似度计算、别名发现
 
     增强功能：集成BERT语义理解
+
+    实体数超过 exact_max_entities 的类型组改用可扩展路径：
+    MinHash LSH / 嵌入近邻分块产生候选对，批量计算候选对相似度，并查集单遍聚类。
     """
 
     def __init__(self, db: Session, use_bert: bool = True):
         self.db = db
         self.text_similarity_threshold = 0.75
         self.semantic_similarity_threshold = 0.70
+        self.exact_max_entities = getattr(settings, 'entity_alignment_exact_max_entities', 300)
+        self.lsh_num_perm = getattr(settings, 'entity_alignment_lsh_num_perm', 32)
+        self.lsh_band_size = getattr(settings, 'entity_alignment_lsh_band_size', 2)
+        self.embedding_top_k = getattr(settings, 'entity_alignment_embedding_top_k', 10)
 
         # 初始化BERT对齐器
         self.bert_aligner = None
@@ -131,11 +143,15 @@ class EntityAlignmentService:
             kb_entity = self._create_kb_entity(knowledge_base_id, entity_type, entities)
             return [kb_entity], 1
 
-        # 1. 计算相似度矩阵
-        similarity_matrix = self._compute_similarity_matrix(entities)
+        if len(entities) > self.exact_max_entities:
+            # 大实体组：分块候选 + 并查集
+            clusters = self._scalable_clustering(entities)
+        else:
+            # 1. 计算相似度矩阵
+            similarity_matrix = self._compute_similarity_matrix(entities)
 
-        # 2. 层次聚类
-        clusters = self._hierarchical_clustering(entities, similarity_matrix)
+            # 2. 层次聚类
+            clusters = self._hierarchical_clustering(entities, similarity_matrix)
 
         # 3. 为每个聚类创建KB实体
         kb_entities = []
@@ -217,6 +233,132 @@ class EntityAlignmentService:
 
         return similarity
 
+    def _scalable_clustering(
+        self,
+        entities: List[DocumentEntity]
+    ) -> List[List[DocumentEntity]]:
+        """
+        可扩展的实体聚类
+
+        1. 标准化文本相同的实体直接合并，后续只处理去重后的代表实体
+        2. 字符 bigram MinHash LSH（BERT模型可用时再加嵌入近邻）产生候选对
+        3. 批量计算候选对的加权相似度（权重与 _compute_similarity_matrix 一致）
+        4. 相似度超过阈值的候选对在并查集中合并（单链接）
+        """
+        n = len(entities)
+        union_find = UnionFind(n)
+
+        # 1. 按标准化文本去重
+        representatives: List[int] = []
+        first_index: Dict[str, int] = {}
+        for idx, entity in enumerate(entities):
+            key = (entity.entity_text or '').lower().strip()
+            if not key:
+                representatives.append(idx)
+                continue
+            if key in first_index:
+                union_find.union(first_index[key], idx)
+            else:
+                first_index[key] = idx
+                representatives.append(idx)
+
+        rep_entities = [entities[idx] for idx in representatives]
+        texts = [(entity.entity_text or '').lower().strip() for entity in rep_entities]
+        gram_index = GramSetIndex([char_ngrams(text) for text in texts])
+        word_index = GramSetIndex([(entity.entity_text or '').lower().split() for entity in rep_entities])
+        vectors = self._encode_entity_vectors(rep_entities)
+
+        # 2. 候选对
+        left, right = minhash_lsh_candidates(
+            gram_index, num_perm=self.lsh_num_perm, band_size=self.lsh_band_size
+        )
+        if vectors is not None and getattr(self.bert_aligner, '_model_loaded', False):
+            emb_left, emb_right = embedding_neighbor_candidates(vectors, top_k=self.embedding_top_k)
+            size = len(rep_entities)
+            keys = np.unique(np.concatenate([left * size + right, emb_left * size + emb_right]))
+            left, right = keys // size, keys % size
+
+        # 3. 批量打分
+        document_ids = np.array([entity.document_id or 0 for entity in rep_entities], dtype=np.int64)
+        scores = self._score_candidate_pairs(gram_index, word_index, document_ids, vectors, left, right)
+
+        # 4. 并查集合并
+        accepted = scores > self.text_similarity_threshold
+        for i, j in zip(left[accepted].tolist(), right[accepted].tolist()):
+            union_find.union(representatives[i], representatives[j])
+
+        clusters = union_find.groups()
+        logger.info(
+            f"可扩展实体聚类完成: 实体 {n} 个，去重后 {len(rep_entities)} 个，"
+            f"候选对 {len(left)} 个，合并对 {int(accepted.sum())} 个，聚类 {len(clusters)} 个"
+        )
+        return [[entities[idx] for idx in cluster] for cluster in clusters]
+
+    def _encode_entity_vectors(self, entities: List[DocumentEntity]) -> Optional[np.ndarray]:
+        """使用BERT编码实体并归一化，不可用时返回 None"""
+        if not self.bert_aligner:
+            return None
+        try:
+            embeddings = self.bert_aligner.encode_entities([
+                {
+                    'id': entity.id,
+                    'text': entity.entity_text,
+                    'type': entity.entity_type,
+                    'context': entity.context or ''
+                }
+                for entity in entities
+            ])
+            vectors = np.array([e.embedding for e in embeddings], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            return vectors / norms
+        except Exception as e:
+            logger.warning(f"BERT实体编码失败: {e}")
+            return None
+
+    def _score_candidate_pairs(
+        self,
+        gram_index: GramSetIndex,
+        word_index: GramSetIndex,
+        document_ids: np.ndarray,
+        vectors: Optional[np.ndarray],
+        left: np.ndarray,
+        right: np.ndarray
+    ) -> np.ndarray:
+        """
+        批量计算候选对的加权相似度
+
+        文本相似度以字符 bigram 近似 _text_similarity：
+        一方的 bigram 全部包含于另一方视为包含关系（0.9），否则取 Dice 系数。
+        """
+        if len(left) == 0:
+            return np.empty(0, dtype=np.float64)
+
+        # 文本相似度
+        gram_inter = gram_index.intersection_sizes(left, right)
+        size_l, size_r = gram_index.sizes[left], gram_index.sizes[right]
+        min_size = np.minimum(size_l, size_r)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dice = np.where(size_l + size_r > 0, 2.0 * gram_inter / (size_l + size_r), 0.0)
+        text_sim = np.where((min_size > 0) & (gram_inter == min_size), 0.9, dice)
+
+        # 传统语义相似度（词 Jaccard）
+        word_inter = word_index.intersection_sizes(left, right)
+        word_union = word_index.sizes[left] + word_index.sizes[right] - word_inter
+        with np.errstate(divide='ignore', invalid='ignore'):
+            semantic_sim = np.where(
+                (word_index.sizes[left] > 0) & (word_index.sizes[right] > 0),
+                word_inter / np.maximum(word_union, 1), 0.0
+            )
+
+        # 上下文相似度
+        context_sim = np.where(document_ids[left] == document_ids[right], 1.0, 0.5)
+
+        bert_sim = rowwise_cosine(vectors, left, right)
+        if bert_sim is not None:
+            return 0.30 * text_sim + 0.40 * bert_sim + 0.10 * semantic_sim + 0.20 * context_sim
+        return 0.40 * text_sim + 0.40 * semantic_sim + 0.20 * context_sim
+
     def _compute_bert_similarity_matrix(
         self,
         entities: List[DocumentEntity]
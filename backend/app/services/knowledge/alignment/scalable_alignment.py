@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+大规模实体对齐工具
+
+为 EntityAlignmentService 的大实体组提供可扩展的对齐组件：
+
+- GramSetIndex      : 以扁平数组保存每个实体的 n-gram 集合，批量计算实体对的交集大小
+- MinHash LSH 分块  : 基于字符 n-gram 的局部敏感哈希，只产出可能相似的候选实体对
+- 嵌入近邻分块      : 基于归一化嵌入的分块矩阵乘法取 top-k 近邻
+- UnionFind         : 路径减半 + 按大小合并的并查集，单遍完成聚类
+
+全部候选对的相似度以 numpy 数组批量计算，不再构建 n×n 矩阵。
+"""
+
+import logging
+from typing import List, Dict, Tuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# MinHash 使用的梅森素数
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """
+    提取字符 n-gram（短于 n 的文本整体作为一个 gram）
+
+    不加边界填充，因此子串的全部 gram 一定包含在原串的 gram 集合中。
+    """
+    if not text:
+        return []
+    if len(text) <= n:
+        return [text]
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+class GramSetIndex:
+    """
+    实体 gram 集合索引
+
+    第 k 个实体的 gram 位于 grams[offsets[k]:offsets[k + 1]]，
+    另维护 (实体, gram) 组合键的有序数组用于批量成员判断。
+    """
+
+    def __init__(self, gram_lists: List[List[str]]):
+        vocabulary: Dict[str, int] = {}
+        grams: List[int] = []
+        sizes = np.zeros(len(gram_lists), dtype=np.int64)
+
+        for idx, gram_list in enumerate(gram_lists):
+            unique = set(gram_list)
+            sizes[idx] = len(unique)
+            for gram in unique:
+                grams.append(vocabulary.setdefault(gram, len(vocabulary)))
+
+        self.size = len(gram_lists)
+        self.vocab_size = max(len(vocabulary), 1)
+        self.sizes = sizes
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.grams = np.asarray(grams, dtype=np.int64)
+        self.owners = np.repeat(np.arange(self.size, dtype=np.int64), sizes)
+        self._keys = np.sort(self.owners * self.vocab_size + self.grams)
+
+    def intersection_sizes(self, left: np.ndarray, right: np.ndarray,
+                           chunk_size: int = 200000) -> np.ndarray:
+        """
+        批量计算实体对 (left[p], right[p]) 的 gram 交集大小
+
+        Args:
+            left: 左侧实体下标数组
+            right: 右侧实体下标数组
+            chunk_size: 每批处理的实体对数量
+
+        Returns:
+            交集大小数组
+        """
+        result = np.zeros(len(left), dtype=np.int64)
+        for start in range(0, len(left), chunk_size):
+            l = left[start:start + chunk_size]
+            r = right[start:start + chunk_size]
+            counts = self.sizes[l]
+            total = int(counts.sum())
+            if total == 0:
+                continue
+
+            # 展开左侧实体的全部 gram，逐个探测右侧实体是否包含
+            pair_idx = np.repeat(np.arange(len(l), dtype=np.int64), counts)
+            within = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+            positions = np.repeat(self.offsets[l], counts) + within
+            probe = r[pair_idx] * self.vocab_size + self.grams[positions]
+
+            loc = np.minimum(np.searchsorted(self._keys, probe), len(self._keys) - 1)
+            hit = self._keys[loc] == probe
+            result[start:start + len(l)] = np.bincount(pair_idx[hit], minlength=len(l))
+        return result
+
+
+def _pairs_in_group(members: np.ndarray, max_bucket_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """桶内两两配对，超大桶按 max_bucket_size 切块后分别配对"""
+    lefts, rights = [], []
+    for start in range(0, len(members), max_bucket_size):
+        block = members[start:start + max_bucket_size]
+        if len(block) < 2:
+            continue
+        i, j = np.triu_indices(len(block), k=1)
+        lefts.append(block[i])
+        rights.append(block[j])
+    if not lefts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(lefts), np.concatenate(rights)
+
+
+def _unique_pairs(lefts: List[np.ndarray], rights: List[np.ndarray],
+                  size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """合并候选对并去重，保证 left < right"""
+    if not lefts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    left = np.concatenate(lefts)
+    right = np.concatenate(rights)
+    low = np.minimum(left, right)
+    high = np.maximum(left, right)
+    keys = np.unique(low * size + high)
+    return keys // size, keys % size
+
+
+def minhash_lsh_candidates(
+    gram_index: GramSetIndex,
+    num_perm: int = 32,
+    band_size: int = 2,
+    max_bucket_size: int = 200,
+    seed: int = 42
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    基于 MinHash LSH 的候选实体对
+
+    签名分为 num_perm / band_size 个带，任一带完全相同的实体进入同一个桶。
+    Jaccard 相似度约高于 (band_size / num_perm) ** (1 / band_size) 的实体对大概率成为候选。
+
+    Args:
+        gram_index: gram 集合索引
+        num_perm: 哈希函数个数
+        band_size: 每个带的行数
+        max_bucket_size: 桶大小上限，超出时切块配对，避免高频 gram 产生平方级候选
+        seed: 随机种子
+
+    Returns:
+        (left, right) 候选实体对下标数组
+    """
+    non_empty = np.flatnonzero(gram_index.sizes > 0)
+    if len(non_empty) < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+    b = rng.randint(0, _MERSENNE_PRIME, size=(num_perm, 1), dtype=np.int64)
+
+    # grams 按实体顺序连续存放，reduceat 即可得到每个实体的最小哈希
+    hashed = (a * gram_index.grams[np.newaxis, :] + b) % _MERSENNE_PRIME
+    signatures = np.minimum.reduceat(hashed, gram_index.offsets[non_empty], axis=1)
+
+    lefts, rights = [], []
+    oversized = 0
+    for band_start in range(0, num_perm - band_size + 1, band_size):
+        band = signatures[band_start:band_start + band_size].T
+        _, bucket_ids = np.unique(band, axis=0, return_inverse=True)
+        bucket_ids = bucket_ids.ravel()
+
+        order = np.argsort(bucket_ids, kind='stable')
+        sorted_ids = bucket_ids[order]
+        boundaries = np.flatnonzero(np.diff(sorted_ids)) + 1
+        starts = np.concatenate([[0], boundaries])
+        ends = np.concatenate([boundaries, [len(sorted_ids)]])
+
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            if end - start > max_bucket_size:
+                oversized += 1
+            left, right = _pairs_in_group(non_empty[order[start:end]], max_bucket_size)
+            lefts.append(left)
+            rights.append(right)
+
+    if oversized:
+        logger.debug(f"LSH分块: {oversized} 个桶超过上限 {max_bucket_size}，已切块配对")
+
+    return _unique_pairs(lefts, rights, gram_index.size)
+
+
+def embedding_neighbor_candidates(
+    vectors: np.ndarray,
+    top_k: int = 10,
+    min_similarity: float = 0.5,
+    block_size: int = 1024
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    基于嵌入余弦相似度的 top-k 近邻候选实体对
+
+    Args:
+        vectors: 已归一化的嵌入矩阵 (n, dim)
+        top_k: 每个实体保留的近邻数
+        min_similarity: 近邻的最低余弦相似度
+        block_size: 分块矩阵乘法的行块大小
+
+    Returns:
+        (left, right) 候选实体对下标数组
+    """
+    n = len(vectors)
+    if n < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    k = min(top_k, n - 1)
+    lefts, rights = [], []
+    for start in range(0, n, block_size):
+        block = vectors[start:start + block_size]
+        sims = block @ vectors.T
+        rows = np.arange(len(block))
+        sims[rows, start + rows] = -np.inf
+
+        neighbors = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        neighbor_sims = np.take_along_axis(sims, neighbors, axis=1)
+        keep = neighbor_sims >= min_similarity
+
+        lefts.append(np.repeat(start + rows, k)[keep.ravel()])
+        rights.append(neighbors.ravel()[keep.ravel()])
+
+    return _unique_pairs(lefts, rights, n)
+
+
+class UnionFind:
+    """并查集（路径减半 + 按大小合并）"""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+        self.set_size = [1] * size
+
+    def find(self, x: int) -> int:
+        """查找根节点"""
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> bool:
+        """合并两个集合，已在同一集合时返回 False"""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return False
+        if self.set_size[root_a] < self.set_size[root_b]:
+            root_a, root_b = root_b, root_a
+        self.parent[root_b] = root_a
+        self.set_size[root_a] += self.set_size[root_b]
+        return True
+
+    def groups(self) -> List[List[int]]:
+        """按首次出现顺序返回全部集合"""
+        members: Dict[int, List[int]] = {}
+        for x in range(len(self.parent)):
+            members.setdefault(self.find(x), []).append(x)
+        return list(members.values())
+
+
+def rowwise_cosine(vectors: Optional[np.ndarray], left: np.ndarray, right: np.ndarray,
+                   chunk_size: int = 65536) -> Optional[np.ndarray]:
+    """批量计算实体对的余弦相似度（vectors 需已归一化）"""
+    if vectors is None:
+        return None
+    result = np.empty(len(left), dtype=np.float64)
+    for start in range(0, len(left), chunk_size):
+        l = left[start:start + chunk_size]
+        r = right[start:start + chunk_size]
+        result[start:start + len(l)] = np.einsum('ij,ij->i', vectors[l], vectors[r])
+    return result
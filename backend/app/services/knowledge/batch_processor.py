@@ -84,17 +84,11 @@ class BatchEntityExtractor:
             
             logger.info(f"处理第 {batch_num}/{total_batches} 批，共 {len(batch)} 个文本")
             
-            # 并发处理批次内的文本
-            batch_tasks = []
-            for idx, text in enumerate(batch):
-                global_idx = i + idx
-                task = self._process_single_text(
-                    text, global_idx, use_cache
-                )
-                batch_tasks.append(task)
-            
-            # 等待批次完成
-            batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
+            # 缓存未命中的文本打包提取实体与关系
+            try:
+                batch_results = await self._process_batch(batch, use_cache)
+            except Exception as e:
+                batch_results = [e] * len(batch)
             
             # 处理结果
             for idx, result in enumerate(batch_results):
@@ -148,39 +142,51 @@ class BatchEntityExtractor:
             cache_hits=cache_hits
         )
     
-    async def _process_single_text(
+    async def _process_batch(
         self,
-        text: str,
-        index: int,
+        texts: List[str],
         use_cache: bool
-    ) -> Tuple[List[Dict], List[Dict], bool]:
+    ) -> List[Tuple[List[Dict], List[Dict], bool]]:
         """
-        处理单个文本
+        处理一批文本
+        
+        缓存命中的文本直接返回；其余文本按token预算打包，一次请求提取多个文本的实体，
+        再以同样方式提取关系（每个文本只与自身的实体配对）。
         
         Args:
-            text: 输入文本
-            index: 文本索引
+            texts: 文本列表
             use_cache: 是否使用缓存
             
         Returns:
-            (实体列表, 关系列表, 是否来自缓存)
+            与输入顺序一致的 (实体列表, 关系列表, 是否来自缓存) 列表
         """
-        if not text or not text.strip():
-            return [], [], False
-        
-        # 检查缓存
-        if use_cache:
-            cached = await self.cache.get_cached_result(text, use_redis=True)
-            if cached:
-                logger.debug(f"文本 {index} 缓存命中")
-                return cached[0], cached[1], True
-        
-        # 提取实体和关系
-        entities, relationships = await self.extractor.extract_entities_and_relationships(
-            text, use_cache=use_cache
-        )
-        
-        return entities, relationships, False
+        results: List[Tuple[List[Dict], List[Dict], bool]] = [([], [], False) for _ in texts]
+        missing = []
+        for index, text in enumerate(texts):
+            if not text or not text.strip():
+                continue
+            if use_cache:
+                cached = await self.cache.get_cached_result(text, use_redis=True)
+                if cached:
+                    logger.debug(f"文本 {index} 缓存命中")
+                    results[index] = (cached[0], cached[1], True)
+                    continue
+            missing.append(index)
+        
+        if not missing:
+            return results
+        
+        missing_texts = [texts[index] for index in missing]
+        entities = await self.extractor.extract_entities_packed(missing_texts)
+        relationships = await self.extractor.extract_relationships_packed(list(zip(missing_texts, entities)))
+        
+        for index, text, text_entities, text_relationships in zip(missing, missing_texts, entities, relationships):
+            results[index] = (text_entities, text_relationships, False)
+            # 打包接口提取失败时返回空列表，不缓存
+            if use_cache and text_entities:
+                await self.cache.cache_result(text, text_entities, text_relationships)
+        
+        return results
 
 
 class BatchDocumentProcessor:
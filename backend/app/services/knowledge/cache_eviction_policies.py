@@ -0,0 +1,337 @@
+"""
+缓存淘汰策略
+
+为 QueryCacheManager 的本地缓存提供常数时间的淘汰簿记：
+
+- LRUEvictionPolicy      : 有序哈希表实现的 LRU，命中时移到队尾
+- FIFOEvictionPolicy     : 按插入顺序淘汰，命中不改变顺序
+- LFUEvictionPolicy      : 频次桶双向链表（O(1) LFU），同频次内按 LRU 淘汰
+- TTLEvictionPolicy      : 按过期时间淘汰最早过期的条目（堆 + 惰性删除）
+- SizeEvictionPolicy     : 优先淘汰最大的条目（堆 + 惰性删除）
+- WTinyLFUEvictionPolicy : 窗口 LRU + 分段 LRU 主区，以 Count-Min Sketch 频次估计决定准入
+
+策略只负责维护淘汰顺序，条目数据与字节计数由缓存管理器持有。
+"""
+
+import heapq
+import itertools
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class EvictionPolicy(ABC):
+    """淘汰策略接口（调用方负责加锁）"""
+
+    def record(self, key: str):
+        """记录一次查询（无论是否命中），用于频次估计"""
+
+    @abstractmethod
+    def insert(self, key: str, size: int = 0, expires_at: float = 0.0):
+        """记录新条目（调用方保证 key 不在缓存中）"""
+        pass
+
+    @abstractmethod
+    def touch(self, key: str):
+        """记录一次命中"""
+        pass
+
+    @abstractmethod
+    def remove(self, key: str):
+        """移除条目（不存在时忽略）"""
+        pass
+
+    @abstractmethod
+    def evict(self) -> Optional[str]:
+        """选出并移除一个淘汰条目，没有条目时返回 None"""
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """清空"""
+        pass
+
+
+class LRUEvictionPolicy(EvictionPolicy):
+    """最近最少使用"""
+
+    def __init__(self):
+        self._order: "OrderedDict[str, None]" = OrderedDict()
+
+    def insert(self, key: str, size: int = 0, expires_at: float = 0.0):
+        self._order[key] = None
+
+    def touch(self, key: str):
+        if key in self._order:
+            self._order.move_to_end(key)
+
+    def remove(self, key: str):
+        self._order.pop(key, None)
+
+    def evict(self) -> Optional[str]:
+        if not self._order:
+            return None
+        return self._order.popitem(last=False)[0]
+
+    def clear(self):
+        self._order.clear()
+
+
+class FIFOEvictionPolicy(LRUEvictionPolicy):
+    """先进先出"""
+
+    def touch(self, key: str):
+        pass
+
+
+class _FrequencyNode:
+    """LFU 频次链表节点，保存该频次下按访问先后排列的键"""
+
+    __slots__ = ("frequency", "keys", "prev", "next")
+
+    def __init__(self, frequency: int):
+        self.frequency = frequency
+        self.keys: "OrderedDict[str, None]" = OrderedDict()
+        self.prev: Optional["_FrequencyNode"] = None
+        self.next: Optional["_FrequencyNode"] = None
+
+
+class LFUEvictionPolicy(EvictionPolicy):
+    """
+    最不经常使用
+
+    频次节点按频次递增串成双向链表，每个键指向所在节点：
+    命中时移动到下一频次节点（不存在则创建），淘汰时取链表头节点中最久未访问的键。
+    """
+
+    def __init__(self):
+        self._head = _FrequencyNode(0)  # 哨兵
+        self._head.next = self._head.prev = self._head
+        self._nodes: Dict[str, _FrequencyNode] = {}
+
+    def _insert_after(self, node: _FrequencyNode, frequency: int) -> _FrequencyNode:
+        new_node = _FrequencyNode(frequency)
+        new_node.prev, new_node.next = node, node.next
+        node.next.prev = new_node
+        node.next = new_node
+        return new_node
+
+    def _unlink_if_empty(self, node: _FrequencyNode):
+        if not node.keys and node is not self._head:
+            node.prev.next = node.next
+            node.next.prev = node.prev
+
+    def insert(self, key: str, size: int = 0, expires_at: float = 0.0):
+        first = self._head.next
+        if first is self._head or first.frequency != 1:
+            first = self._insert_after(self._head, 1)
+        first.keys[key] = None
+        self._nodes[key] = first
+
+    def touch(self, key: str):
+        node = self._nodes.get(key)
+        if node is None:
+            return
+        target = node.next
+        if target is self._head or target.frequency != node.frequency + 1:
+            target = self._insert_after(node, node.frequency + 1)
+        del node.keys[key]
+        target.keys[key] = None
+        self._nodes[key] = target
+        self._unlink_if_empty(node)
+
+    def remove(self, key: str):
+        node = self._nodes.pop(key, None)
+        if node is not None:
+            del node.keys[key]
+            self._unlink_if_empty(node)
+
+    def evict(self) -> Optional[str]:
+        node = self._head.next
+        if node is self._head:
+            return None
+        key, _ = node.keys.popitem(last=False)
+        del self._nodes[key]
+        self._unlink_if_empty(node)
+        return key
+
+    def frequency(self, key: str) -> int:
+        """当前访问频次"""
+        node = self._nodes.get(key)
+        return node.frequency if node else 0
+
+    def clear(self):
+        self._head.next = self._head.prev = self._head
+        self._nodes.clear()
+
+
+class _HeapEvictionPolicy(EvictionPolicy):
+    """按优先级淘汰的堆（移除与覆盖通过序号惰性失效）"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str]] = []
+        self._live: Dict[str, int] = {}
+        self._sequence = itertools.count()
+
+    def _priority(self, size: int, expires_at: float) -> float:
+        raise NotImplementedError
+
+    def insert(self, key: str, size: int = 0, expires_at: float = 0.0):
+        sequence = next(self._sequence)
+        self._live[key] = sequence
+        heapq.heappush(self._heap, (self._priority(size, expires_at), sequence, key))
+        # 失效条目过多时重建堆，避免无限增长
+        if len(self._heap) > 2 * len(self._live) + 64:
+            self._heap = [item for item in self._heap if self._live.get(item[2]) == item[1]]
+            heapq.heapify(self._heap)
+
+    def touch(self, key: str):
+        pass
+
+    def remove(self, key: str):
+        self._live.pop(key, None)
+
+    def evict(self) -> Optional[str]:
+        while self._heap:
+            _, sequence, key = heapq.heappop(self._heap)
+            if self._live.get(key) == sequence:
+                del self._live[key]
+                return key
+        return None
+
+    def clear(self):
+        self._heap.clear()
+        self._live.clear()
+
+
+class TTLEvictionPolicy(_HeapEvictionPolicy):
+    """淘汰最早过期的条目"""
+
+    def _priority(self, size: int, expires_at: float) -> float:
+        return expires_at
+
+
+class SizeEvictionPolicy(_HeapEvictionPolicy):
+    """淘汰最大的条目"""
+
+    def _priority(self, size: int, expires_at: float) -> float:
+        return -size
+
+
+class CountMinSketch:
+    """
+    4 位饱和计数的 Count-Min Sketch
+
+    计数总次数达到 sample_size 时全部计数减半（老化），使频次估计反映近期访问。
+    """
+
+    DEPTH = 4
+    MAX_COUNT = 15
+    _SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+    def __init__(self, capacity: int):
+        width = 64
+        while width < capacity:
+            width <<= 1
+        self._mask = width - 1
+        self._tables = [bytearray(width) for _ in range(self.DEPTH)]
+        self.sample_size = 10 * max(capacity, 64)
+        self._additions = 0
+
+    def _indexes(self, key: str):
+        h = hash(key)
+        for seed, table in zip(self._SEEDS, self._tables):
+            yield table, ((h ^ seed) * seed >> 7) & self._mask
+
+    def increment(self, key: str):
+        added = False
+        for table, index in self._indexes(key):
+            if table[index] < self.MAX_COUNT:
+                table[index] += 1
+                added = True
+        if added:
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._age()
+
+    def estimate(self, key: str) -> int:
+        return min(table[index] for table, index in self._indexes(key))
+
+    def _age(self):
+        for table in self._tables:
+            counters = np.frombuffer(table, dtype=np.uint8)
+            counters >>= 1
+        self._additions //= 2
+
+    def clear(self):
+        for table in self._tables:
+            table[:] = bytes(len(table))
+        self._additions = 0
+
+
+class WTinyLFUEvictionPolicy(EvictionPolicy):
+    """
+    W-TinyLFU
+
+    新条目先进入窗口 LRU（约 1% 容量），溢出后进入主区的试用段；
+    试用段条目再次命中时晋升保护段（约主区 80%），保护段溢出时降级回试用段。
+    需要淘汰时，以最新进入试用段的候选与试用段最久未访问的条目比较 Sketch 频次，
+    频次较低者被淘汰，使偶发的一次性查询无法挤出高频查询。
+    """
+
+    def __init__(self, capacity: int):
+        capacity = max(capacity, 2)
+        self.window_capacity = max(1, capacity // 100)
+        main_capacity = capacity - self.window_capacity
+        self.protected_capacity = max(1, int(main_capacity * 0.8))
+        self.sketch = CountMinSketch(capacity)
+        self._window: "OrderedDict[str, None]" = OrderedDict()
+        self._probation: "OrderedDict[str, None]" = OrderedDict()
+        self._protected: "OrderedDict[str, None]" = OrderedDict()
+
+    def record(self, key: str):
+        self.sketch.increment(key)
+
+    def insert(self, key: str, size: int = 0, expires_at: float = 0.0):
+        self._window[key] = None
+        if len(self._window) > self.window_capacity:
+            candidate, _ = self._window.popitem(last=False)
+            self._probation[candidate] = None
+
+    def touch(self, key: str):
+        if key in self._window:
+            self._window.move_to_end(key)
+        elif key in self._probation:
+            del self._probation[key]
+            self._protected[key] = None
+            if len(self._protected) > self.protected_capacity:
+                demoted, _ = self._protected.popitem(last=False)
+                self._probation[demoted] = None
+        elif key in self._protected:
+            self._protected.move_to_end(key)
+
+    def remove(self, key: str):
+        for segment in (self._window, self._probation, self._protected):
+            if key in segment:
+                del segment[key]
+                return
+
+    def evict(self) -> Optional[str]:
+        if len(self._probation) >= 2:
+            victim = next(iter(self._probation))
+            candidate = next(reversed(self._probation))
+            loser = candidate if self.sketch.estimate(candidate) <= self.sketch.estimate(victim) else victim
+            del self._probation[loser]
+            return loser
+        for segment in (self._probation, self._protected, self._window):
+            if segment:
+                return segment.popitem(last=False)[0]
+        return None
+
+    def clear(self):
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+        self.sketch.clear()
@@ -11,9 +11,12 @@ import uuid
 import threading
 from typing import Dict, Any, Optional, List
 from datetime import datetime
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
 
-from app.modules.knowledge.models.knowledge_document import DocumentChunk, ChunkEntity
+from app.core.config import settings
+from app.modules.knowledge.models.knowledge_document import DocumentChunk, ChunkEntity, KnowledgeDocument
+from app.modules.llm.services.llm_rate_controller import retry_delay
 from app.services.knowledge.extraction.llm_extractor import LLMEntityExtractor
 from app.core.database import SessionLocal
 
@@ -35,7 +38,7 @@ class ChunkEntityTaskService:
 
         Args:
             document_id: 文档ID
-            max_workers: 并行工作线程数
+            max_workers: 并行提取的工作协程数
 
         Returns:
             任务ID
@@ -43,11 +46,9 @@ class ChunkEntityTaskService:
         task_id = str(uuid.uuid4())
 
         # 获取文档信息
-        chunks = self.db.query(DocumentChunk).filter(
+        total_chunks = self.db.query(DocumentChunk).filter(
             DocumentChunk.document_id == document_id
-        ).all()
-
-        total_chunks = len(chunks)
+        ).count()
 
         # 更新文档状态为处理中
         self._update_document_status(document_id, "processing")
@@ -60,6 +61,7 @@ class ChunkEntityTaskService:
             "total_chunks": total_chunks,
             "completed_chunks": 0,
             "failed_chunks": 0,
+            "total_entities": 0,
             "created_at": datetime.now().isoformat(),
             "updated_at": datetime.now().isoformat(),
             "message": "等待开始处理",
@@ -107,10 +109,13 @@ class ChunkEntityTaskService:
         """
         异步处理任务
 
+        相邻的短片段打包为一次请求，各包由 max_workers 个协程并发提取（实际并发度同时受供应商限流控制），
+        提取结果交给单独的写入协程按批写入数据库，LLM调用不等待数据库写入。
+
         Args:
             task_id: 任务ID
             document_id: 文档ID
-            max_workers: 并行工作线程数
+            max_workers: 并行工作协程数
         """
         task = ChunkEntityTaskService._tasks.get(task_id)
         if not task:
@@ -126,10 +131,10 @@ class ChunkEntityTaskService:
         db = SessionLocal()
 
         try:
-            # 获取所有片段
-            chunks = db.query(DocumentChunk).filter(
+            # 获取所有片段（只加载ID和文本）
+            chunks = db.query(DocumentChunk.id, DocumentChunk.chunk_text).filter(
                 DocumentChunk.document_id == document_id
-            ).all()
+            ).order_by(DocumentChunk.chunk_index).all()
 
             if not chunks:
                 task["status"] = "completed"
@@ -140,66 +145,65 @@ class ChunkEntityTaskService:
                 return
 
             # 获取知识库ID
-            knowledge_base_id = None
-            if chunks and hasattr(chunks[0], 'document') and chunks[0].document:
-                knowledge_base_id = chunks[0].document.knowledge_base_id
+            knowledge_base_id = db.query(KnowledgeDocument.knowledge_base_id).filter(
+                KnowledgeDocument.id == document_id
+            ).scalar()
 
-            # 创建提取器
+            # 创建提取器，模型只解析一次
             extractor = LLMEntityExtractor(db, knowledge_base_id=knowledge_base_id)
-
-            # 串行处理每个片段（避免线程问题）
-            completed = 0
-            failed = 0
-            total_entities = 0
-
-            for i, chunk in enumerate(chunks):
-                try:
-                    # 更新进度
-                    progress = int((i / len(chunks)) * 100)
-                    task["progress"] = progress
-                    task["message"] = f"正在处理片段 {i+1}/{len(chunks)}..."
-                    task["updated_at"] = datetime.now().isoformat()
-
-                    # 提取实体
-                    entities = await extractor.extract_entities(chunk.chunk_text)
-
-                    # 保存实体到数据库
-                    for entity in entities:
-                        chunk_entity = ChunkEntity(
-                            chunk_id=chunk.id,
-                            document_id=document_id,
-                            entity_text=entity.get("text", ""),
-                            entity_type=entity.get("type", "UNKNOWN"),
-                            start_pos=entity.get("start_pos", 0),
-                            end_pos=entity.get("end_pos", 0),
-                            confidence=entity.get("confidence", 0.8),
-                            context=entity.get("context", "")
+            model_name = extractor._get_model_for_extraction()
+
+            max_retries = max(0, getattr(settings, 'entity_extraction_max_retries', 3))
+            write_batch_size = max(1, getattr(settings, 'entity_extraction_write_batch_size', 50))
+
+            # 相邻的短片段按token预算打包，一次请求提取多个片段；空白片段不打包，直接记为无实体
+            pending: asyncio.Queue = asyncio.Queue()
+            packs = extractor.pack_indices([chunk_text for _, chunk_text in chunks])
+            packed = {i for pack in packs for i in pack}
+            for pack in [[i] for i in range(len(chunks)) if i not in packed] + packs:
+                pending.put_nowait([chunks[i] for i in pack])
+            # 写入队列有界，数据库写入跟不上时反压LLM调用
+            results: asyncio.Queue = asyncio.Queue(maxsize=write_batch_size * 4)
+
+            async def worker():
+                while True:
+                    try:
+                        pack = pending.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    found = {}
+                    if len(pack) > 1:
+                        found = await self._extract_pack_with_retry(
+                            extractor, task_id, pack, model_name, max_retries
                         )
-                        db.add(chunk_entity)
-
-                    db.commit()
-                    completed += 1
-                    total_entities += len(entities)
-
-                    logger.info(f"[任务 {task_id}] 片段 {chunk.id} 处理完成，提取 {len(entities)} 个实体")
-
-                except Exception as e:
-                    db.rollback()
-                    failed += 1
-                    logger.error(f"[任务 {task_id}] 处理片段 {chunk.id} 失败: {e}")
+                    # 打包失败或响应中缺失的片段单独提取
+                    for index, (chunk_id, chunk_text) in enumerate(pack):
+                        entities = found.get(index)
+                        if entities is None and not (chunk_text and chunk_text.strip()):
+                            entities = []
+                        if entities is None:
+                            entities = await self._extract_chunk_with_retry(
+                                extractor, task_id, chunk_id, chunk_text, model_name, max_retries
+                            )
+                        await results.put((chunk_id, entities))
+
+            writer = asyncio.create_task(
+                self._write_results(task, document_id, results, len(chunks), write_batch_size)
+            )
+            workers = [asyncio.create_task(worker()) for _ in range(min(max(1, max_workers), len(chunks)))]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                await results.put(None)
+                await writer
 
-                # 每处理5个片段提交一次，避免事务过大
-                if i % 5 == 0:
-                    db.commit()
-
-            # 最终提交
-            db.commit()
+            completed = task["completed_chunks"]
+            failed = task["failed_chunks"]
+            total_entities = task["total_entities"]
 
             # 更新任务完成状态
             task["status"] = "completed"
             task["progress"] = 100
-            task["completed_chunks"] = completed
-            task["failed_chunks"] = failed
             task["message"] = f"处理完成: 成功 {completed}, 失败 {failed}"
             task["result"] = {
                 "completed": completed,
@@ -233,6 +237,125 @@ class ChunkEntityTaskService:
                 logger.error(f"更新文档失败状态失败: {update_e}", exc_info=True)
         finally:
             db.close()
+
+    async def _extract_chunk_with_retry(self, extractor: LLMEntityExtractor, task_id: str, chunk_id: int,
+                                        chunk_text: str, model_name: Optional[str],
+                                        max_retries: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        提取单个片段的实体，失败时按指数退避重试
+
+        Returns:
+            实体列表；重试次数用尽仍失败时返回 None
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                return await extractor.extract_entities_checked(chunk_text, model_name=model_name)
+            except Exception as e:
+                if attempt >= max_retries:
+                    logger.error(f"[任务 {task_id}] 处理片段 {chunk_id} 失败（已重试 {max_retries} 次）: {e}")
+                    return None
+                # 被限流时退避更久，给供应商恢复时间
+                delay = retry_delay(attempt + 1 if getattr(e, "rate_limited", False) else attempt)
+                logger.warning(f"[任务 {task_id}] 片段 {chunk_id} 第 {attempt + 1} 次提取失败，{delay:.1f}秒后重试: {e}")
+                await asyncio.sleep(delay)
+
+    async def _extract_pack_with_retry(self, extractor: LLMEntityExtractor, task_id: str, pack: List[Any],
+                                       model_name: Optional[str], max_retries: int) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        以一次打包请求提取多个片段的实体，失败时按指数退避重试
+
+        Returns:
+            包内下标 -> 实体列表；重试次数用尽仍失败时返回空字典（由调用方逐个提取）
+        """
+        texts = [chunk_text for _, chunk_text in pack]
+        for attempt in range(max_retries + 1):
+            try:
+                return await extractor.extract_entities_pack_checked(texts, model_name=model_name)
+            except Exception as e:
+                if attempt >= max_retries:
+                    logger.warning(f"[任务 {task_id}] {len(pack)} 个片段的打包提取失败，改为逐个提取: {e}")
+                    return {}
+                delay = retry_delay(attempt + 1 if getattr(e, "rate_limited", False) else attempt)
+                logger.warning(f"[任务 {task_id}] 打包提取第 {attempt + 1} 次失败，{delay:.1f}秒后重试: {e}")
+                await asyncio.sleep(delay)
+        return {}
+
+    async def _write_results(self, task: Dict[str, Any], document_id: int, results: asyncio.Queue,
+                             total_chunks: int, batch_size: int):
+        """
+        消费提取结果，按批写入数据库并更新任务进度
+
+        写入使用独立的数据库会话，在工作线程中执行，不阻塞事件循环中的LLM调用。
+        结果队列中的 None 表示所有片段已处理完毕。
+        """
+        db = SessionLocal()
+        rows: List[Dict[str, Any]] = []
+        batch_chunks = 0
+        processed = 0
+
+        async def flush():
+            nonlocal rows, batch_chunks
+            if batch_chunks == 0:
+                return
+            batch_rows, chunk_count = rows, batch_chunks
+            rows, batch_chunks = [], 0
+            try:
+                await asyncio.to_thread(self._insert_entity_rows, db, batch_rows)
+                task["completed_chunks"] += chunk_count
+                task["total_entities"] += len(batch_rows)
+            except Exception as e:
+                logger.error(f"[任务 {task['task_id']}] 批量写入 {chunk_count} 个片段的实体失败: {e}")
+                task["failed_chunks"] += chunk_count
+
+        try:
+            while True:
+                item = await results.get()
+                if item is None:
+                    break
+
+                chunk_id, entities = item
+                processed += 1
+                if entities is None:
+                    task["failed_chunks"] += 1
+                else:
+                    rows.extend(
+                        {
+                            "chunk_id": chunk_id,
+                            "document_id": document_id,
+                            "entity_text": entity.get("text", ""),
+                            "entity_type": entity.get("type", "UNKNOWN"),
+                            "start_pos": entity.get("start_pos", 0),
+                            "end_pos": entity.get("end_pos", 0),
+                            "confidence": entity.get("confidence", 0.8),
+                            "context": entity.get("context", "")
+                        }
+                        for entity in entities
+                    )
+                    batch_chunks += 1
+                    logger.debug(f"[任务 {task['task_id']}] 片段 {chunk_id} 处理完成，提取 {len(entities)} 个实体")
+
+                if batch_chunks >= batch_size:
+                    await flush()
+
+                # 更新进度
+                task["progress"] = int((processed / total_chunks) * 100)
+                task["message"] = f"正在处理片段 {processed}/{total_chunks}..."
+                task["updated_at"] = datetime.now().isoformat()
+
+            await flush()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _insert_entity_rows(db: Session, rows: List[Dict[str, Any]]):
+        """以 executemany 方式批量插入片段实体并提交"""
+        try:
+            if rows:
+                db.execute(insert(ChunkEntity.__table__), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
     
     def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -2,10 +2,14 @@ import logging
 import re
 import gc
 import sys
-from typing import Dict, Any, List, Optional
+import hashlib
+from itertools import islice
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Iterable, Iterator
 from datetime import datetime
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.services.knowledge.processing_progress_service import processing_progress_service
 
 logger = logging.getLogger(__name__)
@@ -41,6 +45,57 @@ def estimate_tokens(text: str) -> int:
     return max(1, estimated_tokens)
 
 
+def chunk_content_hash(text: str) -> str:
+    """
+    计算分块内容哈希
+
+    用于判断分块是否变化，以及在不同文档/知识库之间复用相同内容的向量
+
+    Args:
+        text: 分块文本
+
+    Returns:
+        SHA-256 十六进制摘要
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class ChunkSyncPlan:
+    """分块增量同步计划
+
+    将新分块与数据库中已有分块按内容哈希匹配：
+    匹配上的分块保留原有向量和数据库行，只有新增/变更的分块需要向量化。
+    """
+    chunks: List[str]
+    hashes: List[str]
+    vector_ids: List[str]                      # 与 chunks 一一对应的向量ID
+    row_ids: List[Optional[int]]               # 已存在的分块行ID，新分块为 None
+    moved: List[int] = field(default_factory=list)               # 已存在但序号/总数变化的分块索引
+    removed_row_ids: List[int] = field(default_factory=list)     # 需要删除的分块行ID
+    removed_vector_ids: List[str] = field(default_factory=list)  # 需要删除的向量ID
+
+    @property
+    def added(self) -> List[int]:
+        """需要向量化的分块索引"""
+        return [idx for idx, row_id in enumerate(self.row_ids) if row_id is None]
+
+    @property
+    def reused_count(self) -> int:
+        """复用已有向量的分块数量"""
+        return len(self.chunks) - len(self.added)
+
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """将可迭代对象按固定大小切分为批次（不预先展开为完整列表）"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
 def release_memory():
     """主动释放内存，删除大对象并强制垃圾回收
     
@@ -86,6 +141,9 @@ class DocumentProcessor:
         from app.services.knowledge.retrieval.retrieval_service import RetrievalService
         self.retrieval_service = RetrievalService()
 
+        # 分块批量写入数据库的每批行数
+        self.chunk_insert_batch_size = max(1, getattr(settings, 'chunk_insert_batch_size', 500))
+
     def _simple_chunking(self, text: str, max_chunk_size: int = 1000,
                          min_chunk_size: int = 200, overlap: int = 50,
                          use_token_based: bool = True) -> List[str]:
@@ -283,140 +341,30 @@ class DocumentProcessor:
             chunks = self._simple_chunking(cleaned_text, max_chunk_size=1000, min_chunk_size=200, overlap=50)
             logger.info(f"文档分块完成，共 {len(chunks)} 个块")
             
-            # 4. 向量化处理 - 分批次批量处理优化版
+            # 4. 向量化处理 - 按内容哈希增量处理，仅向量化新增/变更的分块
             # 注：实体识别、实体对齐、知识图谱构建已分离到独立服务
-            vector_results = []
-            success_count = 0
-            failed_chunks = []
-
-            # 根据chunks数量决定批次大小
-            # 增加批次大小以减少HTTP请求次数，提升处理速度
-            total_chunks = len(chunks)
-            if total_chunks <= 100:
-                batch_size = total_chunks  # 小文件一次性处理
-            elif total_chunks <= 500:
-                batch_size = 100  # 中等文件每批100个
-            else:
-                batch_size = 100  # 大文件每批100个chunks
-
-            total_batches = (total_chunks + batch_size - 1) // batch_size
-            logger.info(f"开始分批次向量化处理: {total_chunks} 个块, 分成 {total_batches} 批, 每批 {batch_size} 个")
-
-            for batch_idx in range(total_batches):
-                start_idx = batch_idx * batch_size
-                end_idx = min(start_idx + batch_size, total_chunks)
-                current_batch_chunks = chunks[start_idx:end_idx]
-
-                # 更新进度（步骤6：向量化）
-                processing_progress_service.update_progress(
-                    doc_id_str, 6, "向量化处理",
-                    f"正在处理第 {batch_idx + 1}/{total_batches} 批向量数据...",
-                    {
-                        "batch": batch_idx + 1,
-                        "total_batches": total_batches,
-                        "progress": f"{start_idx + 1}-{end_idx}/{total_chunks}"
-                    }
-                )
-
-                # 准备当前批次数据
-                batch_documents = []
-                for i, chunk in enumerate(current_batch_chunks):
-                    global_idx = start_idx + i
-                    chunk_id = f"{document_id}_chunk_{global_idx}"
-                    metadata = {
-                        "document_id": document_id,
-                        "knowledge_base_id": knowledge_base_id,
-                        "chunk_index": global_idx,
-                        "total_chunks": total_chunks,
-                        "title": f"文档 {document_id} 第 {global_idx + 1} 块"
-                    }
-                    batch_documents.append({
-                        "document_id": chunk_id,
-                        "text": chunk,
-                        "metadata": metadata
-                    })
-
-                # 批量添加当前批次到向量数据库
-                logger.info(f"处理批次 {batch_idx + 1}/{total_batches}: {len(batch_documents)} 个块")
-                batch_result = self.vector_store.add_documents_batch(batch_documents)
-
-                if batch_result.get("success"):
-                    batch_success = batch_result.get("count", 0)
-                    success_count += batch_success
-                    logger.info(f"批次 {batch_idx + 1} 处理成功: {batch_success}/{len(batch_documents)} 个块")
-
-                    # 构建结果列表
-                    for i, chunk in enumerate(current_batch_chunks):
-                        global_idx = start_idx + i
-                        chunk_id = f"{document_id}_chunk_{global_idx}"
-                        vector_results.append({
-                            "chunk_id": chunk_id,
-                            "chunk_index": global_idx,
-                            "vector_id": chunk_id,
-                            "content": chunk[:200] + "..." if len(chunk) > 200 else chunk,
-                            "status": "success"
-                        })
-                else:
-                    # 批量失败，回退到逐个处理当前批次
-                    logger.warning(f"批次 {batch_idx + 1} 批量处理失败: {batch_result.get('message')}, 回退到逐个处理")
-                    for i, chunk in enumerate(current_batch_chunks):
-                        global_idx = start_idx + i
-                        chunk_id = f"{document_id}_chunk_{global_idx}"
-                        metadata = {
-                            "document_id": document_id,
-                            "knowledge_base_id": knowledge_base_id,
-                            "chunk_index": global_idx,
-                            "total_chunks": total_chunks,
-                            "title": f"文档 {document_id} 第 {global_idx + 1} 块",
-                            "chunk_id": chunk_id
-                        }
-
-                        try:
-                            self.vector_store.add_document(chunk_id, chunk, metadata)
-                            success_count += 1
-                            vector_results.append({
-                                "chunk_id": chunk_id,
-                                "chunk_index": global_idx,
-                                "vector_id": chunk_id,
-                                "content": chunk[:200] + "..." if len(chunk) > 200 else chunk,
-                                "status": "success"
-                            })
-                        except Exception as e:
-                            failed_chunks.append({"index": global_idx, "chunk_id": chunk_id, "reason": str(e)})
-                            vector_results.append({
-                                "chunk_id": chunk_id,
-                                "chunk_index": global_idx,
-                                "vector_id": chunk_id,
-                                "content": chunk[:200] + "..." if len(chunk) > 200 else chunk,
-                                "status": "failed"
-                            })
-                            logger.error(f"向量化块 {global_idx} 失败: {e}")
-
-                # 每处理完一批，释放资源
-                if batch_idx < total_batches - 1:
-                    # 删除当前批次的大对象
-                    del batch_documents
-                    del current_batch_chunks
-                    
-                    # 触发垃圾回收
-                    gc.collect()
-                    
-                    # 仅在大量批次时短暂暂停，避免系统过载
-                    if total_batches > 10:
-                        import time
-                        time.sleep(0.1)
+            plan = self._plan_chunk_sync(db, document_id, chunks)
+            vector_results, success_count, failed_chunks = self._vectorize_chunks(
+                doc_id_str, document_id, knowledge_base_id, plan
+            )
 
             # 计算向量化成功率
             vectorization_rate = success_count / len(chunks) if chunks else 0
-            logger.info(f"向量化处理完成，成功率: {vectorization_rate:.2%} ({success_count}/{len(chunks)})")
+            logger.info(f"向量化处理完成，成功率: {vectorization_rate:.2%} ({success_count}/{len(chunks)})，复用 {plan.reused_count} 个")
 
             if failed_chunks:
                 logger.warning(f"以下块向量化失败: {failed_chunks}")
 
+            # 清理已删除分块的向量，并同步移动分块的元数据
+            self._apply_vector_changes(document_id, knowledge_base_id, plan)
+
             # 5. 保存分块到PostgreSQL（供实体识别使用）
             if db and chunks:
                 try:
-                    self._save_chunks_to_db(db, document_id, knowledge_base_id, chunks)
+                    self._save_chunks_to_db(
+                        db, document_id, knowledge_base_id, chunks, plan=plan,
+                        failed_indices={item["index"] for item in failed_chunks}
+                    )
                     logger.info(f"分块已保存到PostgreSQL: {len(chunks)} 个")
                 except Exception as e:
                     logger.error(f"保存分块到PostgreSQL失败: {e}")
@@ -429,6 +377,7 @@ class DocumentProcessor:
                 {
                     "vectorization_rate": vectorization_rate,
                     "success_count": success_count,
+                    "reused_count": plan.reused_count,
                     "total_chunks": len(chunks)
                 }
             )
@@ -441,6 +390,7 @@ class DocumentProcessor:
                 "vectors": vector_results,
                 "vectorization_rate": vectorization_rate,
                 "success_count": success_count,
+                "reused_count": plan.reused_count,
                 "total_chunks": len(chunks),
                 "failed_chunks": failed_chunks,
                 "success": True
@@ -453,7 +403,7 @@ class DocumentProcessor:
             del raw_text
             del cleaned_text
             del chunks
-            del batch_documents
+            del plan
             del vector_results
             
             # 触发垃圾回收
@@ -524,68 +474,320 @@ class DocumentProcessor:
         """计算文本相似度"""
         return self.text_processor.calculate_similarity_sync(text1, text2)
 
-    def _save_chunks_to_db(self, db: Session, document_id: int,
-                           knowledge_base_id: Optional[int], chunks: List[str]):
-        """保存分块到PostgreSQL数据库
-
-        供实体识别服务使用
+    def _plan_chunk_sync(self, db: Optional[Session], document_id: int,
+                         chunks: List[str]) -> ChunkSyncPlan:
+        """按内容哈希比对新旧分块，生成增量同步计划
 
         Args:
-            db: 数据库会话
+            db: 数据库会话（为空时所有分块视为新增）
             document_id: 文档ID
-            knowledge_base_id: 知识库ID
-            chunks: 分块文本列表
+            chunks: 新分块文本列表
+
+        Returns:
+            分块同步计划
         """
         from app.modules.knowledge.models.knowledge_document import DocumentChunk
 
-        # 先删除旧的分块
-        db.query(DocumentChunk).filter(
-            DocumentChunk.document_id == document_id
-        ).delete(synchronize_session=False)
+        hashes = [chunk_content_hash(chunk) for chunk in chunks]
+        total_chunks = len(chunks)
+
+        # 已有分块：内容哈希 -> 行列表（按原序号）
+        existing: Dict[str, List[Any]] = {}
+        if db is not None:
+            rows = db.query(
+                DocumentChunk.id, DocumentChunk.chunk_index, DocumentChunk.total_chunks,
+                DocumentChunk.vector_id, DocumentChunk.chunk_text
+            ).filter(
+                DocumentChunk.document_id == document_id
+            ).order_by(DocumentChunk.chunk_index).all()
+            for row in rows:
+                existing.setdefault(chunk_content_hash(row.chunk_text), []).append(row)
+
+        plan = ChunkSyncPlan(chunks=chunks, hashes=hashes, vector_ids=[], row_ids=[])
+        used_vector_ids = set()
+        for idx, content_hash in enumerate(hashes):
+            candidates = existing.get(content_hash)
+            # 没有向量ID的旧分块（上次向量化失败）按新增处理
+            while candidates and not candidates[0].vector_id:
+                stale = candidates.pop(0)
+                plan.removed_row_ids.append(stale.id)
+            if candidates:
+                row = candidates.pop(0)
+                plan.vector_ids.append(row.vector_id)
+                plan.row_ids.append(row.id)
+                used_vector_ids.add(row.vector_id)
+                if row.chunk_index != idx or row.total_chunks != total_chunks:
+                    plan.moved.append(idx)
+                continue
+
+            vector_id = f"{document_id}_chunk_{content_hash[:16]}"
+            if vector_id in used_vector_ids:
+                vector_id = f"{vector_id}_{idx}"
+            plan.vector_ids.append(vector_id)
+            plan.row_ids.append(None)
+            used_vector_ids.add(vector_id)
+
+        for rows in existing.values():
+            for row in rows:
+                plan.removed_row_ids.append(row.id)
+                if row.vector_id and row.vector_id not in used_vector_ids:
+                    plan.removed_vector_ids.append(row.vector_id)
+
+        logger.info(
+            f"分块增量比对完成 (文档ID: {document_id}): 共 {total_chunks} 块，"
+            f"复用 {plan.reused_count} 块，新增/变更 {len(plan.added)} 块，删除 {len(plan.removed_row_ids)} 块"
+        )
+        return plan
+
+    def _chunk_metadata(self, document_id: int, knowledge_base_id: Optional[int],
+                        plan: ChunkSyncPlan, idx: int) -> Dict[str, Any]:
+        """构建分块向量元数据"""
+        return {
+            "document_id": document_id,
+            "knowledge_base_id": knowledge_base_id,
+            "chunk_index": idx,
+            "total_chunks": len(plan.chunks),
+            "title": f"文档 {document_id} 第 {idx + 1} 块",
+            "chunk_id": plan.vector_ids[idx],
+            "content_hash": plan.hashes[idx]
+        }
+
+    def _vectorize_chunks(self, doc_id_str: str, document_id: int,
+                          knowledge_base_id: Optional[int], plan: ChunkSyncPlan) -> tuple:
+        """分批次向量化计划中新增/变更的分块
 
-        # 保存新的分块
+        Returns:
+            (向量化结果列表, 成功数量（含复用）, 失败分块列表)
+        """
+        chunks = plan.chunks
         total_chunks = len(chunks)
-        current_pos = 0
-        for idx, chunk_text in enumerate(chunks):
-            chunk_len = len(chunk_text)
-            chunk = DocumentChunk(
-                document_id=document_id,
-                chunk_text=chunk_text,
-                chunk_index=idx,
-                total_chunks=total_chunks,
-                chunk_metadata={
-                    "knowledge_base_id": knowledge_base_id,
-                    "vector_id": f"{document_id}_chunk_{idx}"
-                },
-                vector_id=f"{document_id}_chunk_{idx}"
-            )
+        pending = plan.added
+
+        # 复用的分块直接计为成功
+        vector_results = [
+            {
+                "chunk_id": plan.vector_ids[idx],
+                "chunk_index": idx,
+                "vector_id": plan.vector_ids[idx],
+                "content": chunks[idx][:200] + "..." if len(chunks[idx]) > 200 else chunks[idx],
+                "status": "unchanged"
+            }
+            for idx, row_id in enumerate(plan.row_ids) if row_id is not None
+        ]
+        success_count = len(vector_results)
+        failed_chunks = []
+
+        if not pending:
+            logger.info(f"文档 {document_id} 分块内容未变化，跳过向量化")
+            return vector_results, success_count, failed_chunks
+
+        # 增加批次大小以减少HTTP请求次数，提升处理速度
+        batch_size = min(len(pending), 100)
+        total_batches = (len(pending) + batch_size - 1) // batch_size
+        logger.info(f"开始分批次向量化处理: {len(pending)}/{total_chunks} 个块, 分成 {total_batches} 批, 每批 {batch_size} 个")
 
-            # 设置数据库表必需的字段（使用 SQLAlchemy 的 ORM 属性设置）
-            # 这些字段在模型中未定义但在数据库表中存在
-            from sqlalchemy import text
-            db.execute(
-                text("""
-                    INSERT INTO document_chunks 
-                    (document_id, chunk_text, chunk_index, total_chunks, 
-                     start_pos, end_pos, vector_id, is_vectorized, created_at)
-                    VALUES 
-                    (:doc_id, :text, :idx, :total, 
-                     :start_pos, :end_pos, :vector_id, 0, CURRENT_TIMESTAMP)
-                """),
+        for batch_idx in range(total_batches):
+            batch_indices = pending[batch_idx * batch_size:(batch_idx + 1) * batch_size]
+
+            # 更新进度（步骤6：向量化）
+            processing_progress_service.update_progress(
+                doc_id_str, 6, "向量化处理",
+                f"正在处理第 {batch_idx + 1}/{total_batches} 批向量数据...",
                 {
-                    "doc_id": document_id,
-                    "text": chunk_text,
-                    "idx": idx,
-                    "total": total_chunks,
-                    "start_pos": current_pos,
-                    "end_pos": current_pos + chunk_len,
-                    "vector_id": f"{document_id}_chunk_{idx}"
+                    "batch": batch_idx + 1,
+                    "total_batches": total_batches,
+                    "progress": f"{batch_idx * batch_size + len(batch_indices)}/{len(pending)}"
                 }
             )
-            current_pos += chunk_len
+
+            # 准备当前批次数据
+            batch_documents = [
+                {
+                    "document_id": plan.vector_ids[idx],
+                    "text": chunks[idx],
+                    "metadata": self._chunk_metadata(document_id, knowledge_base_id, plan, idx)
+                }
+                for idx in batch_indices
+            ]
+
+            # 批量添加当前批次到向量数据库
+            logger.info(f"处理批次 {batch_idx + 1}/{total_batches}: {len(batch_documents)} 个块")
+            batch_result = self.vector_store.add_documents_batch(batch_documents)
+
+            if batch_result.get("success"):
+                batch_success = batch_result.get("count", 0)
+                success_count += batch_success
+                logger.info(f"批次 {batch_idx + 1} 处理成功: {batch_success}/{len(batch_documents)} 个块")
+                statuses = [(idx, "success") for idx in batch_indices]
+            else:
+                # 批量失败，回退到逐个处理当前批次
+                logger.warning(f"批次 {batch_idx + 1} 批量处理失败: {batch_result.get('message')}, 回退到逐个处理")
+                statuses = []
+                for doc_data, idx in zip(batch_documents, batch_indices):
+                    try:
+                        self.vector_store.add_document(doc_data["document_id"], doc_data["text"], doc_data["metadata"])
+                        success_count += 1
+                        statuses.append((idx, "success"))
+                    except Exception as e:
+                        failed_chunks.append({"index": idx, "chunk_id": plan.vector_ids[idx], "reason": str(e)})
+                        statuses.append((idx, "failed"))
+                        logger.error(f"向量化块 {idx} 失败: {e}")
+
+            # 构建结果列表
+            for idx, chunk_status in statuses:
+                chunk = chunks[idx]
+                vector_results.append({
+                    "chunk_id": plan.vector_ids[idx],
+                    "chunk_index": idx,
+                    "vector_id": plan.vector_ids[idx],
+                    "content": chunk[:200] + "..." if len(chunk) > 200 else chunk,
+                    "status": chunk_status
+                })
+
+            # 每处理完一批，释放资源
+            if batch_idx < total_batches - 1:
+                del batch_documents
+                gc.collect()
+
+                # 仅在大量批次时短暂暂停，避免系统过载
+                if total_batches > 10:
+                    import time
+                    time.sleep(0.1)
+
+        vector_results.sort(key=lambda item: item["chunk_index"])
+        return vector_results, success_count, failed_chunks
+
+    def _apply_vector_changes(self, document_id: int, knowledge_base_id: Optional[int],
+                              plan: ChunkSyncPlan):
+        """删除已移除分块的向量，并更新序号变化分块的向量元数据（不重新向量化）"""
+        try:
+            if plan.removed_vector_ids:
+                deleted = self.vector_store.delete_documents_batch(plan.removed_vector_ids)
+                logger.info(f"已删除文档 {document_id} 的过期向量: {deleted}/{len(plan.removed_vector_ids)} 个")
+
+            if plan.moved:
+                updated = self.vector_store.update_metadata_batch({
+                    plan.vector_ids[idx]: self._chunk_metadata(document_id, knowledge_base_id, plan, idx)
+                    for idx in plan.moved
+                })
+                if not updated:
+                    logger.warning(f"向量存储不支持元数据更新，{len(plan.moved)} 个分块的序号元数据未同步")
+        except Exception as e:
+            logger.error(f"同步文档 {document_id} 的向量变更失败: {e}")
+
+        if plan.added or plan.moved or plan.removed_vector_ids:
+            self._invalidate_query_cache(knowledge_base_id)
+
+    def _invalidate_query_cache(self, knowledge_base_id: Optional[int]):
+        """文档内容变化后使所属知识库的查询缓存（含语义缓存）失效"""
+        try:
+            from app.services.knowledge.query_cache_manager import query_cache_manager
+            query_cache_manager.invalidate_knowledge_base(knowledge_base_id)
+        except Exception as e:
+            logger.warning(f"使知识库 {knowledge_base_id} 的查询缓存失效失败: {e}")
+
+    def _iter_chunk_rows(self, document_id: int, knowledge_base_id: Optional[int],
+                         chunks: List[str], plan: ChunkSyncPlan, failed_indices: set,
+                         new_rows: bool) -> Iterator[Dict[str, Any]]:
+        """逐个生成分块行参数（new_rows 为 True 时生成新分块的插入参数，否则生成保留分块的更新参数）"""
+        total_chunks = len(chunks)
+        current_pos = 0
+        for idx, chunk_text in enumerate(chunks):
+            start_pos = current_pos
+            current_pos += len(chunk_text)
+            row_id = plan.row_ids[idx]
+
+            if not new_rows:
+                if row_id is not None:
+                    yield {
+                        "row_id": row_id,
+                        "chunk_index": idx,
+                        "total_chunks": total_chunks,
+                        "start_pos": start_pos,
+                        "end_pos": current_pos
+                    }
+                continue
+
+            if row_id is None:
+                vector_id = plan.vector_ids[idx] if idx not in failed_indices else None
+                yield {
+                    "document_id": document_id,
+                    "chunk_text": chunk_text,
+                    "chunk_index": idx,
+                    "total_chunks": total_chunks,
+                    "start_pos": start_pos,
+                    "end_pos": current_pos,
+                    "chunk_metadata": {
+                        "knowledge_base_id": knowledge_base_id,
+                        "vector_id": vector_id,
+                        "content_hash": plan.hashes[idx]
+                    },
+                    "vector_id": vector_id,
+                    "is_vectorized": vector_id is not None
+                }
+
+    def _bulk_execute(self, db: Session, statement, rows: Iterable[Dict[str, Any]]) -> int:
+        """按 chunk_insert_batch_size 分批以 executemany 方式执行语句
+
+        Returns:
+            处理的行数
+        """
+        count = 0
+        for batch in iter_batches(rows, self.chunk_insert_batch_size):
+            db.execute(statement, batch)
+            count += len(batch)
+        return count
+
+    def _save_chunks_to_db(self, db: Session, document_id: int,
+                           knowledge_base_id: Optional[int], chunks: List[str],
+                           plan: Optional[ChunkSyncPlan] = None,
+                           failed_indices: Optional[set] = None):
+        """保存分块到PostgreSQL数据库（增量）
+
+        供实体识别服务使用。内容未变化的分块保留原有行（及其片段级实体），
+        仅更新序号和位置；已删除的分块连同片段级实体一起删除；新分块插入。
+
+        Args:
+            db: 数据库会话
+            document_id: 文档ID
+            knowledge_base_id: 知识库ID
+            chunks: 分块文本列表
+            plan: 分块同步计划（为空时根据数据库现有分块重新计算）
+            failed_indices: 向量化失败的分块索引（不记录向量ID，下次重新向量化）
+        """
+        from sqlalchemy import insert, update, bindparam
+        from app.modules.knowledge.models.knowledge_document import DocumentChunk, ChunkEntity
+
+        if plan is None:
+            plan = self._plan_chunk_sync(db, document_id, chunks)
+        failed_indices = failed_indices or set()
+
+        # 删除过期分块及其片段级实体
+        if plan.removed_row_ids:
+            db.query(ChunkEntity).filter(
+                ChunkEntity.chunk_id.in_(plan.removed_row_ids)
+            ).delete(synchronize_session=False)
+            db.query(DocumentChunk).filter(
+                DocumentChunk.id.in_(plan.removed_row_ids)
+            ).delete(synchronize_session=False)
+
+        # 新分块以多行 VALUES 批量插入，保留的分块只批量更新序号与位置
+        inserted = self._bulk_execute(
+            db, insert(DocumentChunk.__table__),
+            self._iter_chunk_rows(document_id, knowledge_base_id, chunks, plan, failed_indices, new_rows=True)
+        )
+        kept = self._bulk_execute(
+            db,
+            update(DocumentChunk.__table__).where(DocumentChunk.__table__.c.id == bindparam("row_id")),
+            self._iter_chunk_rows(document_id, knowledge_base_id, chunks, plan, failed_indices, new_rows=False)
+        )
+        total_chunks = len(chunks)
 
         db.commit()
-        logger.info(f"已保存 {total_chunks} 个分块到PostgreSQL (文档ID: {document_id})")
+        logger.info(
+            f"已同步 {total_chunks} 个分块到PostgreSQL (文档ID: {document_id})，"
+            f"新增 {inserted} 个，保留 {kept} 个，删除 {len(plan.removed_row_ids)} 个"
+        )
 
     def get_document_chunks(self, document_id: int) -> List[Dict[str, Any]]:
         """获取文档的分块信息"""
@@ -624,91 +826,76 @@ class DocumentProcessor:
             logger.error(f"删除文档向量数据失败: {e}")
             return False
     
-    def update_document_vectors(self, document_id: int, new_content: str, use_llm_chunking: bool = False) -> Dict[str, Any]:
-        """更新文档的向量数据
+    def update_document_vectors(self, document_id: int, new_content: str, use_llm_chunking: bool = False,
+                                db: Optional[Session] = None) -> Dict[str, Any]:
+        """更新文档的向量数据（增量）
+
+        仅向量化内容变化的分块，未变化的分块保留原有向量与数据库行
 
         Args:
             document_id: 文档ID
             new_content: 新文档内容
             use_llm_chunking: 是否使用LLM语义分块（默认False，使用高性能规则分块）
+            db: 数据库会话（为空时从连接池获取）
         """
+        if db is None:
+            from app.core.database import get_db_pool
+            with get_db_pool().get_db_session() as session:
+                return self.update_document_vectors(document_id, new_content, use_llm_chunking, db=session)
+
         try:
-            # 1. 删除旧的向量数据
-            self.delete_document_vectors(document_id)
+            from app.modules.knowledge.models.knowledge_document import KnowledgeDocument
 
-            # 2. 重新处理文档内容
-            # 智能分块 - 默认使用高性能规则分块，避免LLM调用
+            document = db.query(KnowledgeDocument.knowledge_base_id).filter(
+                KnowledgeDocument.id == document_id
+            ).first()
+            knowledge_base_id = document.knowledge_base_id if document else None
+
+            # 1. 智能分块 - 默认使用高性能规则分块，避免LLM调用
             if use_llm_chunking:
                 chunks = self.text_processor.semantic_chunking_sync(new_content)
             else:
                 chunks = self._simple_chunking(new_content, max_chunk_size=1000, min_chunk_size=200, overlap=50)
-            
-            # 3. 重新向量化（带验证）
-            vector_results = []
-            success_count = 0
-            failed_chunks = []
-            
-            for i, chunk in enumerate(chunks):
-                chunk_id = f"{document_id}_chunk_{i}"
-                metadata = {
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks),
-                    "title": f"文档 {document_id} 第 {i+1} 块"
-                }
-                
-                try:
-                    # 添加到向量存储
-                    result = self.vector_store.add_document(chunk_id, chunk, metadata)
-                    
-                    if result.get("success"):
-                        success_count += 1
-                        vector_results.append({
-                            "chunk_id": chunk_id,
-                            "chunk_index": i,
-                            "vector_id": chunk_id,
-                            "status": "success"
-                        })
-                    else:
-                        failed_chunks.append({"index": i, "chunk_id": chunk_id, "reason": result.get("message", "添加失败")})
-                        vector_results.append({
-                            "chunk_id": chunk_id,
-                            "chunk_index": i,
-                            "vector_id": chunk_id,
-                            "status": "failed"
-                        })
-                except Exception as e:
-                    failed_chunks.append({"index": i, "chunk_id": chunk_id, "reason": str(e)})
-                    vector_results.append({
-                        "chunk_id": chunk_id,
-                        "chunk_index": i,
-                        "vector_id": chunk_id,
-                        "status": "failed"
-                    })
-                    logger.error(f"向量化块 {i} 失败: {e}")
-            
+
+            # 2. 与已有分块比对，只向量化新增/变更的分块
+            plan = self._plan_chunk_sync(db, document_id, chunks)
+            vector_results, success_count, failed_chunks = self._vectorize_chunks(
+                str(document_id), document_id, knowledge_base_id, plan
+            )
+
+            # 3. 清理过期向量并同步分块表
+            self._apply_vector_changes(document_id, knowledge_base_id, plan)
+            self._save_chunks_to_db(
+                db, document_id, knowledge_base_id, chunks, plan=plan,
+                failed_indices={item["index"] for item in failed_chunks}
+            )
+
             # 计算向量化成功率
             vectorization_rate = success_count / len(chunks) if chunks else 0
-            logger.info(f"文档 {document_id} 向量数据更新完成，成功率: {vectorization_rate:.2%} ({success_count}/{len(chunks)})")
-            
+            logger.info(
+                f"文档 {document_id} 向量数据更新完成，成功率: {vectorization_rate:.2%} "
+                f"({success_count}/{len(chunks)})，复用 {plan.reused_count} 个"
+            )
+
             if failed_chunks:
                 logger.warning(f"以下块向量化失败: {failed_chunks}")
-            
+
             return {
                 "success": True,
                 "chunks_count": len(vector_results),
                 "success_count": success_count,
+                "reused_count": plan.reused_count,
                 "vectorization_rate": vectorization_rate,
                 "failed_chunks": failed_chunks
             }
-            
+
         except Exception as e:
             logger.error(f"更新文档向量数据失败: {e}")
             return {
                 "success": False,
                 "error": str(e)
             }
-    
+
     def process_document_text(self, text: str, use_llm_chunking: bool = False) -> List[str]:
         """处理纯文本文档，返回分块结果
 
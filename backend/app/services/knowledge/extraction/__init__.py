@@ -4,6 +4,6 @@
 提供实体识别、关系抽取等功能
 """
 
-from app.services.knowledge.extraction.llm_extractor import LLMEntityExtractor
+from app.services.knowledge.extraction.llm_extractor import LLMEntityExtractor, EntityExtractionError
 
-__all__ = ['LLMEntityExtractor']
+__all__ = ['LLMEntityExtractor', 'EntityExtractionError']
@@ -5,18 +5,33 @@ LLM实体提取器模块
 提供高质量的实体识别、关系抽取和实体消歧功能。
 """
 
+import asyncio
 import json
 import logging
 from typing import List, Dict, Any, Tuple, Optional
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.services.llm_service import LLMService
+from app.modules.llm.services.llm_rate_controller import (
+    get_llm_rate_controller, get_llm_call_executor, is_rate_limit_error
+)
 from app.services.default_model_cache_service import DefaultModelCacheService
+from app.services.model_config_cache import model_config_cache
 from app.services.knowledge.entity_config_manager import EntityConfigManager
+from app.utils.llm_utils import count_tokens
 
 logger = logging.getLogger(__name__)
 
 
+class EntityExtractionError(Exception):
+    """实体提取失败（LLM调用失败或响应无法解析）"""
+
+    def __init__(self, message: str, rate_limited: bool = False):
+        super().__init__(message)
+        self.rate_limited = rate_limited
+
+
 def _get_model_string_id_from_db(model_int_id: int, db: Session = None) -> Optional[str]:
     """
     将模型整数ID转换为字符串ID
@@ -193,6 +208,36 @@ def _fix_json_common(json_str: str) -> str:
     return json_str
 
 
+def pack_texts(texts: List[str], token_budget: int, max_items: int) -> List[List[int]]:
+    """
+    将相邻文本按估算token预算打包
+
+    每个包内文本的估算token数之和不超过 token_budget，且最多 max_items 个；
+    单个文本超出预算时独占一个包。
+
+    Args:
+        texts: 文本列表
+        token_budget: 每个包的token预算
+        max_items: 每个包的最大文本数
+
+    Returns:
+        按顺序排列的包，每个包是文本下标列表
+    """
+    packs: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = count_tokens(text or "")
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_items):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
 class LLMEntityExtractor:
     """
     LLM实体提取器
@@ -270,18 +315,24 @@ class LLMEntityExtractor:
         3. 如果所有场景都未配置，使用全局默认模型
         4. 如果全局也未配置，使用LLM服务默认模型
 
+        场景解析结果按场景层级缓存在模型配置缓存中，默认模型配置变更后自动失效。
+
         Returns:
             模型ID或None（使用LLM服务默认模型）
         """
-        logger.info(f"[_get_model_for_extraction] 开始获取模型, knowledge_base_id={self.knowledge_base_id}")
-        logger.info(f"[_get_model_for_extraction] 场景层级: {self.scene_hierarchy}")
-        logger.info(f"[_get_model_for_extraction] 外部指定模型ID: {self.specified_model_id}")
-
         # 1. 优先使用外部指定的模型ID
         if self.specified_model_id:
-            logger.info(f"[_get_model_for_extraction] 使用外部指定的模型: {self.specified_model_id}")
             return self.specified_model_id
 
+        return model_config_cache.get_scene_model(
+            ("extraction",) + tuple(self.scene_hierarchy), self._resolve_model_for_extraction
+        )
+
+    def _resolve_model_for_extraction(self) -> Optional[str]:
+        """按场景层级和全局默认模型解析实体提取模型（不含外部指定模型）"""
+        logger.info(f"[_get_model_for_extraction] 开始解析模型, knowledge_base_id={self.knowledge_base_id}")
+        logger.info(f"[_get_model_for_extraction] 场景层级: {self.scene_hierarchy}")
+
         # 2. 按优先级遍历场景层级
         for scene in self.scene_hierarchy:
             logger.info(f"[_get_model_for_extraction] 尝试场景: {scene}")
@@ -395,18 +446,8 @@ class LLMEntityExtractor:
         """
         return _fix_json_common(json_str)
     
-    def _build_entity_extraction_prompt(self, text: str) -> str:
-        """
-        构建实体提取的Prompt
-
-        根据配置动态构建Prompt，支持自定义实体类型
-
-        Args:
-            text: 输入文本
-
-        Returns:
-            用于实体提取的Prompt
-        """
+    def _build_entity_type_list(self) -> str:
+        """根据配置构建实体类型说明（未启用任何类型时使用默认类型）"""
         # 获取启用的实体类型配置
         entity_types = self.config_manager.get_entity_types()
 
@@ -430,7 +471,21 @@ class LLMEntityExtractor:
                 "- EVENT: 事件（如：奥运会、发布会）"
             ]
 
-        type_list = "\n".join(type_descriptions)
+        return "\n".join(type_descriptions)
+
+    def _build_entity_extraction_prompt(self, text: str) -> str:
+        """
+        构建实体提取的Prompt
+
+        根据配置动态构建Prompt，支持自定义实体类型
+
+        Args:
+            text: 输入文本
+
+        Returns:
+            用于实体提取的Prompt
+        """
+        type_list = self._build_entity_type_list()
 
         prompt = f"""请从以下文本中提取所有实体，并以JSON格式返回。
 
@@ -512,6 +567,123 @@ class LLMEntityExtractor:
         
         return prompt
     
+    PACK_START = "<<<片段 {}>>>"
+    PACK_END = "<<<片段结束 {}>>>"
+
+    def _format_packed_texts(self, texts: List[str]) -> str:
+        """用带编号的分隔符拼接多个片段（编号从1开始）"""
+        return "\n\n".join(
+            f"{self.PACK_START.format(i)}\n{text}\n{self.PACK_END.format(i)}"
+            for i, text in enumerate(texts, 1)
+        )
+
+    def _build_packed_entity_extraction_prompt(self, texts: List[str]) -> str:
+        """
+        构建多片段打包的实体提取Prompt
+
+        说明与实体类型只出现一次，各片段以编号分隔；位置信息由本地校准，不要求模型返回。
+
+        Args:
+            texts: 片段文本列表
+
+        Returns:
+            用于实体提取的Prompt
+        """
+        type_list = self._build_entity_type_list()
+
+        prompt = f"""请从以下{len(texts)}个文本片段中分别提取所有实体，并以JSON格式返回。
+每个片段以 <<<片段 编号>>> 开始、以 <<<片段结束 编号>>> 结束，各片段相互独立。
+
+{self._format_packed_texts(texts)}
+
+请识别以下类型的实体：
+{type_list}
+
+请按以下JSON格式返回结果，按编号顺序为每个片段返回一项，没有实体的片段返回空列表：
+{{
+    "chunks": [
+        {{
+            "id": 片段编号,
+            "entities": [
+                {{
+                    "text": "实体文本",
+                    "type": "实体类型"
+                }}
+            ]
+        }}
+    ]
+}}
+
+注意：
+1. 确保提取所有相关实体，不要遗漏
+2. 实体只归属于它所出现的片段，实体文本与片段原文保持一致
+3. 准确标注实体类型
+4. 只返回JSON格式，不要其他解释"""
+
+        return prompt
+
+    def _build_packed_relationship_extraction_prompt(self, items: List[Tuple[str, List[Dict[str, Any]]]]) -> str:
+        """
+        构建多片段打包的关系提取Prompt
+
+        Args:
+            items: (片段文本, 该片段已提取的实体列表) 列表
+
+        Returns:
+            用于关系提取的Prompt
+        """
+        sections = []
+        for i, (text, entities) in enumerate(items, 1):
+            entity_names = json.dumps(
+                [{"text": e.get("text", ""), "type": e.get("type", "")} for e in entities],
+                ensure_ascii=False
+            )
+            sections.append(
+                f"{self.PACK_START.format(i)}\n{text}\n已识别的实体：{entity_names}\n{self.PACK_END.format(i)}"
+            )
+        packed = "\n\n".join(sections)
+
+        prompt = f"""请从以下{len(items)}个文本片段中分别提取实体之间的关系，并以JSON格式返回。
+每个片段以 <<<片段 编号>>> 开始、以 <<<片段结束 编号>>> 结束，附带该片段已识别的实体，各片段相互独立。
+
+{packed}
+
+请识别以下类型的关系：
+- 工作于: 人员与组织机构的关系
+- 创立: 人员创建组织机构
+- 位于: 实体与地点的关系
+- 开发: 人员或组织开发技术/产品
+- 使用: 实体使用技术/产品
+- 包含: 实体之间的包含关系
+- 合作: 实体之间的合作关系
+- 属于: 实体之间的从属关系
+- 相关: 其他相关关系
+
+请按以下JSON格式返回结果，按编号顺序为每个片段返回一项，没有关系的片段返回空列表：
+{{
+    "chunks": [
+        {{
+            "id": 片段编号,
+            "relationships": [
+                {{
+                    "subject": "主体实体",
+                    "relation": "关系类型",
+                    "object": "客体实体",
+                    "confidence": 0.95
+                }}
+            ]
+        }}
+    ]
+}}
+
+注意：
+1. 只提取片段中明确表达的关系
+2. 为每个关系提供置信度(0-1)
+3. 确保主体和客体都在该片段的已识别实体中
+4. 只返回JSON格式，不要其他解释"""
+
+        return prompt
+
     MAX_TEXT_LENGTH = 80000
     
     async def extract_entities(self, text: str) -> List[Dict[str, Any]]:
@@ -625,63 +797,80 @@ class LLMEntityExtractor:
             logger.error(f"[LLMExtractor] 实体提取失败: {e}", exc_info=True)
             return []
     
-    async def _extract_entities_from_long_text(self, text: str) -> List[Dict[str, Any]]:
+    async def extract_entities_checked(self, text: str, model_name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        从文本中提取实体，失败时抛出异常而不是返回空列表
+
+        供需要区分"没有实体"与"提取失败"的调用方（如片段级任务的重试）使用。
+        LLM调用受供应商限流控制，并在工作线程中以独立数据库会话执行，可并发调用。
+
+        Args:
+            text: 输入文本
+            model_name: 模型ID，为空时按场景层级获取
+
+        Returns:
+            实体列表
+
+        Raises:
+            EntityExtractionError: LLM调用失败或响应无法解析
+        """
+        if not text or not text.strip():
+            return []
+
+        model_name = model_name or self._get_model_for_extraction()
+        if len(text) > self.MAX_TEXT_LENGTH:
+            return await self._extract_entities_from_long_text(text, model_name, raise_on_error=True)
+        return await self._request_entities(text, model_name)
+
+    async def _extract_entities_from_long_text(self, text: str, model_name: Optional[str] = None,
+                                               raise_on_error: bool = False) -> List[Dict[str, Any]]:
         """
         对长文本进行分段实体提取
 
-        将长文本分割成多个较小的片段，分别提取实体，然后合并去重
+        将长文本分割成多个较小的片段，并发提取实体（并发度由供应商限流控制），然后合并去重
 
         Args:
             text: 输入长文本
+            model_name: 模型ID，为空时按场景层级获取
+            raise_on_error: 任一片段失败时是否抛出异常（否则跳过失败片段）
 
         Returns:
             合并后的实体列表
         """
         logger.info(f"[LLMExtractor] 开始分段处理长文本, 总长度={len(text)}")
-        
+
         chunk_size = self.MAX_TEXT_LENGTH
-        chunks = []
-        
-        for i in range(0, len(text), chunk_size):
-            chunk = text[i:i + chunk_size]
-            chunks.append({
-                'text': chunk,
-                'start_offset': i,
-                'index': len(chunks)
-            })
-        
-        logger.info(f"[LLMExtractor] 文本已分割为 {len(chunks)} 个片段")
-        
+        offsets = list(range(0, len(text), chunk_size))
+        logger.info(f"[LLMExtractor] 文本已分割为 {len(offsets)} 个片段")
+
+        model_name = model_name or self._get_model_for_extraction()
+        results = await asyncio.gather(
+            *(self._request_entities(text[offset:offset + chunk_size], model_name) for offset in offsets),
+            return_exceptions=True
+        )
+
         all_entities = []
-        
-        for chunk_info in chunks:
-            chunk_text = chunk_info['text']
-            chunk_index = chunk_info['index']
-            start_offset = chunk_info['start_offset']
-            
-            logger.info(f"[LLMExtractor] 处理片段 {chunk_index + 1}/{len(chunks)}, 长度={len(chunk_text)}")
-            
-            try:
-                entities = await self._extract_entities_single_chunk(chunk_text)
-                
-                for entity in entities:
-                    entity['start_pos'] = entity.get('start_pos', 0) + start_offset
-                    entity['end_pos'] = entity.get('end_pos', 0) + start_offset
-                    entity['chunk_index'] = chunk_index
-                
-                all_entities.extend(entities)
-                logger.info(f"[LLMExtractor] 片段 {chunk_index + 1} 提取到 {len(entities)} 个实体")
-                
-            except Exception as e:
-                logger.error(f"[LLMExtractor] 片段 {chunk_index + 1} 提取失败: {e}")
+        for chunk_index, (start_offset, result) in enumerate(zip(offsets, results)):
+            if isinstance(result, BaseException):
+                if raise_on_error:
+                    raise result
+                logger.error(f"[LLMExtractor] 片段 {chunk_index + 1} 提取失败: {result}")
                 continue
-        
+
+            for entity in result:
+                entity['start_pos'] = entity.get('start_pos', 0) + start_offset
+                entity['end_pos'] = entity.get('end_pos', 0) + start_offset
+                entity['chunk_index'] = chunk_index
+
+            all_entities.extend(result)
+            logger.info(f"[LLMExtractor] 片段 {chunk_index + 1} 提取到 {len(result)} 个实体")
+
         merged_entities = self._merge_and_deduplicate_entities(all_entities)
-        
+
         logger.info(f"[LLMExtractor] 分段处理完成: 原始实体数={len(all_entities)}, 合并后={len(merged_entities)}")
-        
+
         return merged_entities
-    
+
     async def _extract_entities_single_chunk(self, text: str) -> List[Dict[str, Any]]:
         """
         从单个文本片段中提取实体（内部方法，不进行分段检测）
@@ -696,56 +885,207 @@ class LLMEntityExtractor:
             return []
 
         try:
-            model_name = self._get_model_for_extraction()
-            prompt = self._build_entity_extraction_prompt(text)
-            messages = [{"role": "user", "content": prompt}]
-            
-            response = self.llm_service.chat_completion(
+            return await self._request_entities(text, self._get_model_for_extraction())
+        except Exception as e:
+            logger.error(f"[LLMExtractor] 单片段实体提取失败: {e}")
+            return []
+
+    def _get_supplier_for_model(self, model_name: Optional[str]) -> Optional[str]:
+        """获取模型所属供应商名称（用于按供应商限流）"""
+        config = model_config_cache.get_model_config(self.db, model_name) if model_name else None
+        return config.supplier_name if config else None
+
+    def _chat_completion_in_worker(self, messages: List[Dict[str, str]], model_name: Optional[str],
+                                   max_tokens: int = 2000) -> Dict[str, Any]:
+        """在工作线程中调用LLM，使用独立的数据库会话（会话不能跨线程共享）"""
+        from app.core.database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            return self.llm_service.chat_completion(
                 messages=messages,
                 model_name=model_name,
-                max_tokens=2000,
+                max_tokens=max_tokens,
                 temperature=0.3,
-                db=self.db
+                db=db
             )
+        finally:
+            db.close()
+
+    async def _complete_json(self, prompt: str, model_name: Optional[str],
+                             max_tokens: int = 2000) -> Tuple[Any, bool]:
+        """
+        调用LLM并解析响应中的JSON
 
+        请求先经过供应商的令牌桶与自适应并发控制，再在工作线程中执行；
+        响应为429时反馈给并发控制以收缩上限。
+
+        Returns:
+            (解析结果, 是否经过截断修复)
+
+        Raises:
+            EntityExtractionError: LLM调用失败或响应无法解析
+        """
+        messages = [{"role": "user", "content": prompt}]
+        controller = get_llm_rate_controller().get(self._get_supplier_for_model(model_name))
+
+        async with controller.slot() as outcome:
+            response = await asyncio.get_running_loop().run_in_executor(
+                get_llm_call_executor(), self._chat_completion_in_worker, messages, model_name, max_tokens
+            )
             if not response.get('success'):
-                logger.error(f"[LLMExtractor] LLM调用失败: {response.get('error')}")
-                return []
+                error = response.get('error')
+                outcome['rate_limited'] = is_rate_limit_error(error)
+                raise EntityExtractionError(f"LLM调用失败: {error}", rate_limited=outcome['rate_limited'])
 
-            content = response.get('generated_text', '')
-            if not content:
-                return []
+        content = response.get('generated_text', '')
+        if not content:
+            raise EntityExtractionError("LLM返回空内容")
 
-            json_start = content.find('{')
-            json_end = content.rfind('}')
+        json_start = content.find('{')
+        json_end = content.rfind('}')
+        if json_start == -1 or json_end == -1:
+            raise EntityExtractionError(f"LLM响应中没有找到JSON: {content[:200]}")
 
-            if json_start == -1 or json_end == -1:
-                return []
+        json_str = content[json_start:json_end + 1]
+        try:
+            return json.loads(json_str), False
+        except json.JSONDecodeError:
+            try:
+                return json.loads(self._fix_json(json_str)), True
+            except json.JSONDecodeError as e:
+                raise EntityExtractionError(f"JSON修复后仍解析失败: {e}")
 
-            json_str = content[json_start:json_end + 1]
+    async def _request_entities(self, text: str, model_name: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        调用LLM提取单段文本的实体
+
+        Raises:
+            EntityExtractionError: LLM调用失败或响应无法解析
+        """
+        result, _ = await self._complete_json(self._build_entity_extraction_prompt(text), model_name)
+        entities = result.get('entities', []) if isinstance(result, dict) else []
+
+        # 修复：校准实体位置信息
+        entities = self._calibrate_entity_positions(text, entities)
+
+        for entity in entities:
+            entity['source'] = 'llm'
+
+        return entities
+
+    async def _request_packed(self, prompt: str, key: str, count: int,
+                              model_name: Optional[str]) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        发送多片段打包请求，把响应按片段编号拆回
+
+        Args:
+            prompt: 打包Prompt
+            key: 每个片段结果中的列表字段（entities / relationships）
+            count: 片段数
+            model_name: 模型ID
 
+        Returns:
+            片段下标（从0开始） -> 结果列表；响应中缺失的片段不在字典中
+
+        Raises:
+            EntityExtractionError: LLM调用失败或响应无法解析
+        """
+        # 输出随片段数增长，按片段数放宽最大生成长度
+        max_tokens = min(8000, 2000 + 500 * (count - 1))
+        result, repaired = await self._complete_json(prompt, model_name, max_tokens)
+
+        items = result.get('chunks', []) if isinstance(result, dict) else []
+        if repaired and items:
+            # 截断修复后最后一项可能不完整，交给调用方单独重试
+            items = items[:-1]
+
+        found: Dict[int, List[Dict[str, Any]]] = {}
+        for item in items:
+            if not isinstance(item, dict):
+                continue
             try:
-                result = json.loads(json_str)
-            except json.JSONDecodeError:
-                json_str = self._fix_json(json_str)
-                try:
-                    result = json.loads(json_str)
-                except json.JSONDecodeError:
-                    return []
+                index = int(item.get('id')) - 1
+            except (TypeError, ValueError):
+                continue
+            values = item.get(key)
+            if 0 <= index < count and index not in found and isinstance(values, list):
+                found[index] = [value for value in values if isinstance(value, dict)]
+        return found
 
-            entities = result.get('entities', [])
+    async def extract_entities_pack_checked(self, texts: List[str],
+                                            model_name: Optional[str] = None) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        将多个片段打包为一次请求提取实体
 
-            # 修复：校准实体位置信息
-            entities = self._calibrate_entity_positions(text, entities)
+        Args:
+            texts: 片段文本列表（调用方负责控制总长度）
+            model_name: 模型ID，为空时按场景层级获取
+
+        Returns:
+            片段下标 -> 位置已按该片段原文校准的实体列表；响应中缺失的片段不在字典中，
+            由调用方单独提取
 
+        Raises:
+            EntityExtractionError: LLM调用失败或响应无法解析
+        """
+        model_name = model_name or self._get_model_for_extraction()
+        found = await self._request_packed(
+            self._build_packed_entity_extraction_prompt(texts), 'entities', len(texts), model_name
+        )
+        for index, entities in found.items():
+            entities = self._calibrate_entity_positions(texts[index], entities)
             for entity in entities:
                 entity['source'] = 'llm'
+            found[index] = entities
+
+        logger.info(f"[LLMExtractor] 打包提取 {len(texts)} 个片段，返回 {len(found)} 个片段的结果")
+        return found
+
+    def pack_indices(self, texts: List[str]) -> List[List[int]]:
+        """按配置的token预算打包非空文本，返回文本下标分组（空白文本不在任何分组中）"""
+        token_budget = getattr(settings, 'entity_extraction_pack_token_budget', 2000)
+        max_items = getattr(settings, 'entity_extraction_pack_max_chunks', 8)
+        indices = [i for i, text in enumerate(texts) if text and text.strip()]
+        if token_budget <= 0 or max_items <= 1:
+            return [[i] for i in indices]
+        packs = pack_texts([texts[i] for i in indices], token_budget, max_items)
+        return [[indices[i] for i in pack] for pack in packs]
+
+    async def extract_entities_packed(self, texts: List[str]) -> List[List[Dict[str, Any]]]:
+        """
+        批量提取多个片段的实体（打包模式）
 
-            return entities
+        相邻的短片段按token预算合并为一次请求，固定的说明与实体类型只发送一次；
+        打包请求失败或响应中缺失的片段单独提取。各包并发请求，受供应商限流控制。
 
-        except Exception as e:
-            logger.error(f"[LLMExtractor] 单片段实体提取失败: {e}")
-            return []
+        Args:
+            texts: 片段文本列表
+
+        Returns:
+            与输入顺序一致的实体列表（提取失败的片段为空列表）
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in texts]
+        model_name = self._get_model_for_extraction()
+
+        async def run_pack(pack: List[int]):
+            missing = pack
+            if len(pack) > 1:
+                try:
+                    found = await self.extract_entities_pack_checked([texts[i] for i in pack], model_name)
+                    for local_index, entities in found.items():
+                        results[pack[local_index]] = entities
+                    missing = [index for local_index, index in enumerate(pack) if local_index not in found]
+                except Exception as e:
+                    logger.warning(f"[LLMExtractor] 打包提取失败，改为逐个提取: {e}")
+            for index in missing:
+                try:
+                    results[index] = await self.extract_entities_checked(texts[index], model_name)
+                except Exception as e:
+                    logger.error(f"[LLMExtractor] 片段 {index} 实体提取失败: {e}")
+
+        await asyncio.gather(*(run_pack(pack) for pack in self.pack_indices(texts)))
+        return results
 
     def _calibrate_entity_positions(self, text: str, entities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """校准实体位置信息
@@ -924,6 +1264,49 @@ class LLMEntityExtractor:
             logger.error(f"关系提取失败: {e}")
             return []
     
+    async def extract_relationships_packed(self, items: List[Tuple[str, List[Dict[str, Any]]]]) -> List[List[Dict[str, Any]]]:
+        """
+        批量提取多个片段的关系（打包模式）
+
+        与 extract_entities_packed 相同的打包与回退策略，每个片段只与自身的实体配对。
+
+        Args:
+            items: (片段文本, 该片段的实体列表) 列表
+
+        Returns:
+            与输入顺序一致的关系列表（提取失败的片段为空列表）
+        """
+        results: List[List[Dict[str, Any]]] = [[] for _ in items]
+        model_name = self._get_model_for_extraction()
+        texts = [text if entities else "" for text, entities in items]
+
+        async def request(pack: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+            prompt = self._build_packed_relationship_extraction_prompt([items[i] for i in pack])
+            return await self._request_packed(prompt, 'relationships', len(pack), model_name)
+
+        async def run_pack(pack: List[int]):
+            missing = pack
+            if len(pack) > 1:
+                try:
+                    found = await request(pack)
+                    for local_index, relationships in found.items():
+                        results[pack[local_index]] = relationships
+                    missing = [index for local_index, index in enumerate(pack) if local_index not in found]
+                except Exception as e:
+                    logger.warning(f"打包关系提取失败，改为逐个提取: {e}")
+            for index in missing:
+                try:
+                    results[index] = (await request([index])).get(0, [])
+                except Exception as e:
+                    logger.error(f"片段 {index} 关系提取失败: {e}")
+
+        await asyncio.gather(*(run_pack(pack) for pack in self.pack_indices(texts)))
+
+        for relationships in results:
+            for rel in relationships:
+                rel['source'] = 'llm'
+        return results
+
     async def extract_entities_and_relationships(self, text: str, use_cache: bool = True) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
         """
         同时提取实体和关系
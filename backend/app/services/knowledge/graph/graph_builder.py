@@ -8,9 +8,14 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 
+from app.core.config import settings
 from app.modules.knowledge.models.knowledge_document import (
     DocumentEntity, EntityRelationship, KnowledgeDocument
 )
+from app.services.knowledge.graph.graph_metrics import (
+    graph_metrics_cache, graph_fingerprint, pivot_sample_size,
+    achieved_error, approximate_graph_metrics
+)
 
 logger = logging.getLogger(__name__)
 
@@ -170,11 +175,16 @@ class KnowledgeGraphBuilder:
             })
         
         # 添加关系边（基于链接后的实体）
+        entity_clusters = {
+            entity.id: entity_group['cluster_id']
+            for entity_group in linked_entities
+            for entity in entity_group['entities']
+        }
         for rel in relationships:
-            source_cluster = self._find_entity_cluster(linked_entities, rel.source_id)
-            target_cluster = self._find_entity_cluster(linked_entities, rel.target_id)
+            source_cluster = entity_clusters.get(rel.source_id)
+            target_cluster = entity_clusters.get(rel.target_id)
             
-            if source_cluster and target_cluster:
+            if source_cluster is not None and target_cluster is not None:
                 edge_id = f"edge_{rel.id}"
                 graph["edges"].append({
                     "id": edge_id,
@@ -487,12 +497,17 @@ class KnowledgeGraphBuilder:
         return None
     
     def _apply_graph_operations(self, graph: Dict[str, Any]) -> Dict[str, Any]:
-        """应用图谱优化算法 - 带性能限制"""
+        """
+        应用图谱优化算法
+
+        每次调用只构建一个networkx图，供社区发现、中心性和路径分析共用；
+        超过 graph_metrics_exact_max_nodes 的图使用采样近似，结果按图结构指纹缓存。
+        """
         node_count = len(graph.get("nodes", []))
         edge_count = len(graph.get("edges", []))
 
         # 如果图太大，跳过复杂的算法
-        if node_count > 5000 or edge_count > 10000:
+        if node_count > getattr(settings, 'graph_metrics_max_nodes', 200000):
             logger.warning(f"图谱过大 ({node_count} 节点, {edge_count} 边)，跳过复杂算法")
             # 只设置默认值
             for node in graph["nodes"]:
@@ -503,115 +518,142 @@ class KnowledgeGraphBuilder:
             graph["metadata"]["avg_shortest_path_length"] = 0
             return graph
 
-        # 社区发现
-        graph = self._detect_communities(graph)
+        fingerprint = graph_fingerprint(graph)
+        metrics = graph_metrics_cache.get(fingerprint)
+        if metrics is None:
+            nx_graph = self._build_nx_graph(graph)
+            metrics = {"nodes": {node: {} for node in nx_graph.nodes()}, "metadata": {}}
 
-        # 中心性分析
-        graph = self._calculate_centrality(graph)
+            # 社区发现
+            self._detect_communities(metrics, nx_graph)
 
-        # 路径分析（仅对小图执行）
-        if node_count <= 1000:
-            graph = self._find_shortest_paths(graph)
+            # 中心性分析
+            self._calculate_centrality(metrics, nx_graph)
+
+            # 路径分析
+            self._find_shortest_paths(metrics, nx_graph)
+
+            metrics.pop("_approx", None)
+            graph_metrics_cache.put(fingerprint, metrics)
         else:
-            graph["metadata"]["diameter"] = 0
-            graph["metadata"]["avg_shortest_path_length"] = 0
+            logger.debug(f"命中图谱指标缓存: {fingerprint[:12]}")
 
+        for node in graph["nodes"]:
+            node_metrics = metrics["nodes"].get(node["id"], {})
+            node["community"] = node_metrics.get("community", 0)
+            node["centrality"] = dict(node_metrics.get("centrality", {}))
+        graph["metadata"].update(metrics["metadata"])
+        graph["metadata"]["graph_version"] = fingerprint
         return graph
-    
-    def _detect_communities(self, graph: Dict[str, Any]) -> Dict[str, Any]:
-        """社区发现算法"""
-        # 将图转换为networkx格式
+
+    def _build_nx_graph(self, graph: Dict[str, Any]) -> nx.Graph:
+        """将图谱字典转换为networkx图（只保留结构，算法不使用节点/边属性）"""
         nx_graph = nx.Graph()
-        
-        # 添加节点
-        for node in graph["nodes"]:
-            nx_graph.add_node(node["id"], **node)
-        
-        # 添加边
-        for edge in graph["edges"]:
-            nx_graph.add_edge(edge["source"], edge["target"], **edge)
-        
+        nx_graph.add_nodes_from(node["id"] for node in graph["nodes"])
+        nx_graph.add_edges_from((edge["source"], edge["target"]) for edge in graph["edges"])
+        return nx_graph
+
+    def _use_approximation(self, nx_graph: nx.Graph) -> bool:
+        """是否使用采样近似计算中心性与路径指标"""
+        return nx_graph.number_of_nodes() > getattr(settings, 'graph_metrics_exact_max_nodes', 1000)
+
+    def _pivot_sample_size(self, nx_graph: nx.Graph) -> int:
+        """按误差预算计算枢纽采样数量"""
+        return pivot_sample_size(
+            nx_graph.number_of_nodes(),
+            getattr(settings, 'graph_metrics_error_budget', 0.1),
+            getattr(settings, 'graph_metrics_failure_probability', 0.1),
+            getattr(settings, 'graph_metrics_max_samples', 256)
+        )
+
+    def _approximate_metrics(self, metrics: Dict[str, Any], nx_graph: nx.Graph) -> Dict[str, Any]:
+        """采样近似指标（中心性与路径分析共用一次采样结果）"""
+        approx = metrics.get("_approx")
+        if approx is None:
+            approx = approximate_graph_metrics(nx_graph, self._pivot_sample_size(nx_graph))
+            metrics["_approx"] = approx
+            metrics["metadata"]["metrics_approximate"] = True
+            metrics["metadata"]["metrics_samples"] = approx["samples"]
+            metrics["metadata"]["metrics_error_bound"] = achieved_error(
+                nx_graph.number_of_nodes(), approx["samples"],
+                getattr(settings, 'graph_metrics_failure_probability', 0.1)
+            )
+        return approx
+
+    def _detect_communities(self, metrics: Dict[str, Any], nx_graph: nx.Graph) -> Dict[str, Any]:
+        """社区发现算法"""
         # 使用Louvain算法进行社区发现
         try:
             import community as community_louvain
             partition = community_louvain.best_partition(nx_graph)
-            
+
             # 更新节点的社区信息
-            for node in graph["nodes"]:
-                node["community"] = partition.get(node["id"], 0)
-            
-            graph["metadata"]["communities"] = len(set(partition.values()))
-            
+            for node_id, node_metrics in metrics["nodes"].items():
+                node_metrics["community"] = partition.get(node_id, 0)
+
+            metrics["metadata"]["communities"] = len(set(partition.values()))
+
         except ImportError:
             logger.warning("未安装python-louvain库，跳过社区发现")
-            for node in graph["nodes"]:
-                node["community"] = 0
-            graph["metadata"]["communities"] = 1
-        
-        return graph
-    
-    def _calculate_centrality(self, graph: Dict[str, Any]) -> Dict[str, Any]:
-        """计算节点中心性"""
-        # 将图转换为networkx格式
-        nx_graph = nx.Graph()
-        
-        # 添加节点
-        for node in graph["nodes"]:
-            nx_graph.add_node(node["id"], **node)
-        
-        # 添加边
-        for edge in graph["edges"]:
-            nx_graph.add_edge(edge["source"], edge["target"], **edge)
-        
+            for node_metrics in metrics["nodes"].values():
+                node_metrics["community"] = 0
+            metrics["metadata"]["communities"] = 1
+
+        return metrics
+
+    def _calculate_centrality(self, metrics: Dict[str, Any], nx_graph: nx.Graph) -> Dict[str, Any]:
+        """计算节点中心性（大图使用采样近似的接近中心性与介数中心性）"""
         # 计算度中心性
         degree_centrality = nx.degree_centrality(nx_graph)
-        
-        # 计算接近中心性
-        try:
-            closeness_centrality = nx.closeness_centrality(nx_graph)
-        except:
-            closeness_centrality = {}
-        
-        # 计算介数中心性
-        try:
-            betweenness_centrality = nx.betweenness_centrality(nx_graph)
-        except:
-            betweenness_centrality = {}
-        
+
+        if self._use_approximation(nx_graph):
+            approx = self._approximate_metrics(metrics, nx_graph)
+            closeness_centrality = approx["closeness"]
+            betweenness_centrality = approx["betweenness"]
+        else:
+            metrics["metadata"]["metrics_approximate"] = False
+
+            # 计算接近中心性
+            try:
+                closeness_centrality = nx.closeness_centrality(nx_graph)
+            except Exception:
+                closeness_centrality = {}
+
+            # 计算介数中心性
+            try:
+                betweenness_centrality = nx.betweenness_centrality(nx_graph)
+            except Exception:
+                betweenness_centrality = {}
+
         # 更新节点中心性信息
-        for node in graph["nodes"]:
-            node_id = node["id"]
-            node["centrality"] = {
+        for node_id, node_metrics in metrics["nodes"].items():
+            node_metrics["centrality"] = {
                 "degree": degree_centrality.get(node_id, 0),
                 "closeness": closeness_centrality.get(node_id, 0),
                 "betweenness": betweenness_centrality.get(node_id, 0)
             }
-        
-        return graph
-    
-    def _find_shortest_paths(self, graph: Dict[str, Any]) -> Dict[str, Any]:
-        """查找最短路径"""
-        # 将图转换为networkx格式
-        nx_graph = nx.Graph()
-        
-        # 添加节点
-        for node in graph["nodes"]:
-            nx_graph.add_node(node["id"], **node)
-        
-        # 添加边
-        for edge in graph["edges"]:
-            nx_graph.add_edge(edge["source"], edge["target"], **edge)
-        
-        # 计算图的直径和平均最短路径长度
+
+        return metrics
+
+    def _find_shortest_paths(self, metrics: Dict[str, Any], nx_graph: nx.Graph) -> Dict[str, Any]:
+        """
+        计算图的直径和平均最短路径长度（仅连通图）
+
+        大图的直径为双扫描下界估计，平均最短路径长度为枢纽采样估计。
+        """
         try:
-            if nx.is_connected(nx_graph):
-                graph["metadata"]["diameter"] = nx.diameter(nx_graph)
-                graph["metadata"]["avg_shortest_path_length"] = nx.average_shortest_path_length(nx_graph)
+            if nx_graph.number_of_nodes() == 0 or not nx.is_connected(nx_graph):
+                metrics["metadata"]["diameter"] = 0
+                metrics["metadata"]["avg_shortest_path_length"] = 0
+            elif self._use_approximation(nx_graph):
+                approx = self._approximate_metrics(metrics, nx_graph)
+                metrics["metadata"]["diameter"] = approx["diameter"]
+                metrics["metadata"]["avg_shortest_path_length"] = approx["avg_shortest_path_length"]
             else:
-                graph["metadata"]["diameter"] = 0
-                graph["metadata"]["avg_shortest_path_length"] = 0
-        except:
-            graph["metadata"]["diameter"] = 0
-            graph["metadata"]["avg_shortest_path_length"] = 0
-        
-        return graph
\ No newline at end of file
+                metrics["metadata"]["diameter"] = nx.diameter(nx_graph)
+                metrics["metadata"]["avg_shortest_path_length"] = nx.average_shortest_path_length(nx_graph)
+        except Exception:
+            metrics["metadata"]["diameter"] = 0
+            metrics["metadata"]["avg_shortest_path_length"] = 0
+
+        return metrics
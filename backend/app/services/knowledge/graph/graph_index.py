@@ -0,0 +1,756 @@
+"""
+知识库图索引
+
+为图谱检索提供进程内索引，避免逐条关系回查实体（N+1）和无索引的 ilike 扫描：
+
+- CSR 邻接数组：按实体位置存储关联的关系（出边与入边），一次遍历即可完成多跳扩展
+- 实体文本二元组（bigram）倒排索引：兼顾中文短实体名，替代 ilike '%q%' 全表扫描
+- 增量更新：通过 SQLAlchemy 会话事件捕获 DocumentEntity / EntityRelationship 的写入，
+  事务提交后推送到索引；删除文档（级联删除实体与关系）时丢弃所属知识库的索引；
+  批量 query().delete()/update()、原生 SQL 写入图谱表无法得知具体行，触发整体失效
+- 多进程部署时通过 Redis 发布受影响的知识库，其他进程订阅后只丢弃对应的索引；
+  索引超过 TTL 后重新加载，作为 Redis 不可用时的兜底
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Set, Tuple, Iterable
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+from app.modules.knowledge.models.knowledge_document import (
+    DocumentEntity, EntityRelationship, KnowledgeDocument
+)
+
+logger = logging.getLogger(__name__)
+
+# 增量边数量超过该比例时重建 CSR
+CSR_REBUILD_RATIO = 0.25
+CSR_REBUILD_MIN_EDGES = 1024
+
+
+def _bigrams(text: str) -> Set[str]:
+    """文本的二元组集合（小写）"""
+    text = text.lower()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class KnowledgeBaseGraphIndex:
+    """
+    单个知识库的图索引
+
+    实体与关系均按“位置”存储在列表中，删除仅做标记，
+    位置在整体重载前不复用。
+    """
+
+    def __init__(self, knowledge_base_id: Optional[int]):
+        self.knowledge_base_id = knowledge_base_id
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        """清空索引内容"""
+        # 实体
+        self.entity_ids: List[int] = []
+        self.entity_text: List[str] = []
+        self.entity_type: List[str] = []
+        self.entity_confidence: List[float] = []
+        self.entity_document: List[int] = []
+        self.entity_alive: List[bool] = []
+        self.entity_pos: Dict[int, int] = {}
+
+        # 关系
+        self.rel_ids: List[int] = []
+        self.rel_source: List[int] = []  # 源实体位置
+        self.rel_target: List[int] = []  # 目标实体位置
+        self.rel_type: List[str] = []
+        self.rel_confidence: List[float] = []
+        self.rel_document: List[int] = []
+        self.rel_alive: List[bool] = []
+        self.rel_pos: Dict[int, int] = {}
+
+        # 文本索引
+        self._bigram_index: Dict[str, Set[int]] = {}
+        self._type_index: Dict[str, Set[int]] = {}
+
+        # CSR 邻接（仅覆盖 _csr_edge_count 之前的关系），之后新增的关系记录在增量表中
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._incident = np.zeros(0, dtype=np.int64)
+        self._csr_edge_count = 0
+        self._delta_adjacency: Dict[int, List[int]] = {}
+
+        self.document_ids: Set[int] = set()
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+
+    def load(self, db: Session):
+        """从数据库整体加载（两条查询）"""
+        entity_query = db.query(
+            DocumentEntity.id, DocumentEntity.entity_text, DocumentEntity.entity_type,
+            DocumentEntity.confidence, DocumentEntity.document_id
+        )
+        rel_query = db.query(
+            EntityRelationship.id, EntityRelationship.source_id, EntityRelationship.target_id,
+            EntityRelationship.relationship_type, EntityRelationship.confidence,
+            EntityRelationship.document_id
+        )
+        if self.knowledge_base_id is not None:
+            document_ids = db.query(KnowledgeDocument.id).filter(
+                KnowledgeDocument.knowledge_base_id == self.knowledge_base_id
+            )
+            entity_query = entity_query.filter(DocumentEntity.document_id.in_(document_ids))
+            rel_query = rel_query.filter(EntityRelationship.document_id.in_(document_ids))
+
+        with self._lock:
+            self._reset()
+            for row in entity_query.order_by(DocumentEntity.id).yield_per(5000):
+                self._add_entity(*row)
+            for row in rel_query.order_by(EntityRelationship.id).yield_per(5000):
+                self._add_relationship(*row)
+            self._rebuild_csr()
+
+        logger.info(
+            f"图索引加载完成: kb={self.knowledge_base_id}, "
+            f"实体 {len(self.entity_pos)} 个, 关系 {len(self.rel_pos)} 个"
+        )
+
+    def _rebuild_csr(self):
+        """根据全部存活关系重建 CSR 邻接数组"""
+        edge_count = len(self.rel_ids)
+        alive = np.asarray(self.rel_alive, dtype=bool) if edge_count else np.zeros(0, dtype=bool)
+        edges = np.flatnonzero(alive).astype(np.int64)
+        sources = np.asarray(self.rel_source, dtype=np.int64)[edges] if edge_count else edges
+        targets = np.asarray(self.rel_target, dtype=np.int64)[edges] if edge_count else edges
+
+        nodes = np.concatenate([sources, targets])
+        incident = np.concatenate([edges, edges])
+        order = np.argsort(nodes, kind="stable")
+
+        counts = np.bincount(nodes, minlength=len(self.entity_ids))
+        self._indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self._incident = incident[order]
+        self._csr_edge_count = edge_count
+        self._delta_adjacency = {}
+
+    def _maybe_rebuild_csr(self):
+        """增量关系过多时重建 CSR"""
+        delta = len(self.rel_ids) - self._csr_edge_count
+        if delta > max(CSR_REBUILD_MIN_EDGES, self._csr_edge_count * CSR_REBUILD_RATIO):
+            self._rebuild_csr()
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+
+    def _add_entity(self, entity_id: int, text: str, entity_type: str,
+                    confidence: float, document_id: int):
+        pos = self.entity_pos.get(entity_id)
+        if pos is not None:
+            # 更新：先移出文本索引
+            self._unindex_entity(pos)
+        else:
+            pos = len(self.entity_ids)
+            self.entity_ids.append(entity_id)
+            self.entity_text.append("")
+            self.entity_type.append("")
+            self.entity_confidence.append(0.0)
+            self.entity_document.append(0)
+            self.entity_alive.append(True)
+            self.entity_pos[entity_id] = pos
+
+        self.entity_text[pos] = text or ""
+        self.entity_type[pos] = entity_type or ""
+        self.entity_confidence[pos] = confidence or 0.0
+        self.entity_document[pos] = document_id
+        self.entity_alive[pos] = True
+        self.document_ids.add(document_id)
+
+        for gram in _bigrams(self.entity_text[pos]):
+            self._bigram_index.setdefault(gram, set()).add(pos)
+        self._type_index.setdefault(self.entity_type[pos].lower(), set()).add(pos)
+
+    def _unindex_entity(self, pos: int):
+        for gram in _bigrams(self.entity_text[pos]):
+            positions = self._bigram_index.get(gram)
+            if positions:
+                positions.discard(pos)
+        positions = self._type_index.get(self.entity_type[pos].lower())
+        if positions:
+            positions.discard(pos)
+
+    def _add_relationship(self, rel_id: int, source_id: int, target_id: int,
+                          rel_type: str, confidence: float, document_id: int):
+        source = self.entity_pos.get(source_id)
+        target = self.entity_pos.get(target_id)
+        if source is None or target is None:
+            return
+
+        if rel_id in self.rel_pos:
+            self._remove_relationship(rel_id)
+
+        edge = len(self.rel_ids)
+        self.rel_ids.append(rel_id)
+        self.rel_source.append(source)
+        self.rel_target.append(target)
+        self.rel_type.append(rel_type or "")
+        self.rel_confidence.append(confidence or 0.0)
+        self.rel_document.append(document_id)
+        self.rel_alive.append(True)
+        self.rel_pos[rel_id] = edge
+
+        self._delta_adjacency.setdefault(source, []).append(edge)
+        if target != source:
+            self._delta_adjacency.setdefault(target, []).append(edge)
+
+    def _remove_relationship(self, rel_id: int):
+        edge = self.rel_pos.pop(rel_id, None)
+        if edge is not None:
+            self.rel_alive[edge] = False
+
+    def _remove_entity(self, entity_id: int):
+        pos = self.entity_pos.pop(entity_id, None)
+        if pos is None:
+            return
+        self._unindex_entity(pos)
+        self.entity_alive[pos] = False
+        # 级联删除关联关系
+        for edge in self._incident_edges(pos):
+            self._remove_relationship(self.rel_ids[edge])
+
+    def apply_changes(self, changes: Iterable[Tuple[str, tuple]]):
+        """
+        应用增量变更
+
+        Args:
+            changes: (操作, 数据) 序列，操作为 entity_upsert / entity_delete /
+                     relationship_upsert / relationship_delete
+        """
+        with self._lock:
+            for op, data in changes:
+                if op == "entity_upsert":
+                    self._add_entity(*data)
+                elif op == "entity_delete":
+                    self._remove_entity(data[0])
+                elif op == "relationship_upsert":
+                    self._add_relationship(*data)
+                elif op == "relationship_delete":
+                    self._remove_relationship(data[0])
+            self._maybe_rebuild_csr()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def match_entities(self, query: str, entity_types: Optional[List[str]] = None,
+                       limit: Optional[int] = None) -> List[int]:
+        """
+        匹配实体（语义等同于 entity_text/entity_type ilike '%query%'）
+
+        Returns:
+            按实体ID升序的实体位置列表
+        """
+        needle = (query or "").lower()
+        with self._lock:
+            if len(needle) >= 2:
+                candidates: Optional[Set[int]] = None
+                for gram in sorted(_bigrams(needle), key=lambda g: len(self._bigram_index.get(g, ()))):
+                    positions = self._bigram_index.get(gram)
+                    if not positions:
+                        candidates = set()
+                        break
+                    candidates = set(positions) if candidates is None else candidates & positions
+                    if not candidates:
+                        break
+                matched = {pos for pos in candidates or () if needle in self.entity_text[pos].lower()}
+            else:
+                matched = {
+                    pos for pos, alive in enumerate(self.entity_alive)
+                    if alive and needle in self.entity_text[pos].lower()
+                }
+
+            for type_name, positions in self._type_index.items():
+                if needle in type_name:
+                    matched |= positions
+
+            if entity_types:
+                allowed = set(entity_types)
+                matched = {pos for pos in matched if self.entity_type[pos] in allowed}
+
+            result = sorted(matched, key=lambda pos: self.entity_ids[pos])
+            return result[:limit] if limit else result
+
+    def _incident_edges(self, pos: int) -> List[int]:
+        """实体位置关联的全部关系（含已删除，调用方过滤）"""
+        edges: List[int] = []
+        if pos + 1 < len(self._indptr):
+            edges.extend(self._incident[self._indptr[pos]:self._indptr[pos + 1]].tolist())
+        edges.extend(self._delta_adjacency.get(pos, ()))
+        return edges
+
+    def traverse(self, start_positions: List[int], depth: int = 1,
+                 relationship_types: Optional[List[str]] = None,
+                 limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        从起始实体出发按广度优先扩展多跳关系（单次遍历）
+
+        Args:
+            start_positions: 起始实体位置
+            depth: 最大跳数
+            relationship_types: 关系类型过滤
+            limit: 最多返回的关系数
+
+        Returns:
+            (关系位置, 跳数) 列表，按跳数、关系ID排序
+        """
+        allowed = set(relationship_types) if relationship_types else None
+        with self._lock:
+            visited_nodes = set(start_positions)
+            visited_edges: Dict[int, int] = {}
+            frontier = list(start_positions)
+
+            for hop in range(1, max(depth, 1) + 1):
+                next_frontier = []
+                hop_edges = []
+                for pos in frontier:
+                    for edge in self._incident_edges(pos):
+                        if edge in visited_edges or not self.rel_alive[edge]:
+                            continue
+                        if allowed is not None and self.rel_type[edge] not in allowed:
+                            continue
+                        visited_edges[edge] = hop
+                        hop_edges.append(edge)
+                        for neighbor in (self.rel_source[edge], self.rel_target[edge]):
+                            if neighbor not in visited_nodes:
+                                visited_nodes.add(neighbor)
+                                next_frontier.append(neighbor)
+                if limit and len(visited_edges) >= limit:
+                    break
+                frontier = next_frontier
+                if not frontier:
+                    break
+
+            ordered = sorted(visited_edges.items(), key=lambda item: (item[1], self.rel_ids[item[0]]))
+            return ordered[:limit] if limit else ordered
+
+    def get_entity_position(self, entity_id: int) -> Optional[int]:
+        """实体ID -> 位置"""
+        return self.entity_pos.get(entity_id)
+
+    def describe_relationship(self, edge: int) -> Dict[str, Any]:
+        """关系位置 -> 关系及两端实体信息"""
+        source = self.rel_source[edge]
+        target = self.rel_target[edge]
+        return {
+            "id": self.rel_ids[edge],
+            "relationship_type": self.rel_type[edge],
+            "confidence": self.rel_confidence[edge],
+            "document_id": self.rel_document[edge],
+            "source_id": self.entity_ids[source],
+            "target_id": self.entity_ids[target],
+            "source_entity": self.entity_text[source],
+            "target_entity": self.entity_text[target],
+            "source_type": self.entity_type[source],
+            "target_type": self.entity_type[target],
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """索引统计"""
+        with self._lock:
+            return {
+                "knowledge_base_id": self.knowledge_base_id,
+                "entity_count": len(self.entity_pos),
+                "relationship_count": len(self.rel_pos),
+                "csr_edges": self._csr_edge_count,
+                "delta_edges": len(self.rel_ids) - self._csr_edge_count,
+                "bigram_keys": len(self._bigram_index),
+            }
+
+
+class _IndexLoad:
+    """进行中的索引加载：等待者共享同一次加载，期间的变更先缓冲"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.changes: List[Tuple[str, tuple]] = []
+        self.stale = False
+
+
+class GraphIndexRegistry:
+    """
+    图索引注册表
+
+    按知识库懒加载索引（None 表示不限知识库），
+    缓冲会话提交的增量变更并在下一次访问时应用。
+    """
+
+    VERSION_KEY = "py_copilot:graph_index:version"
+    CHANNEL = "py_copilot:graph_index:invalidate"
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._indexes: Dict[Optional[int], KnowledgeBaseGraphIndex] = {}
+        self._loaded_at: Dict[Optional[int], float] = {}
+        self._loading: Dict[Optional[int], _IndexLoad] = {}
+        self._pending: List[Tuple[str, tuple]] = []
+        self._invalidate_all = False
+        self._document_kb: Dict[int, int] = {}
+        self._lock = threading.RLock()
+        self._origin = uuid.uuid4().hex
+        self._remote_version: Optional[int] = None
+        self._redis = None
+        self._listener: Optional[threading.Thread] = None
+
+    def get_index(self, db: Session, knowledge_base_id: Optional[int] = None) -> KnowledgeBaseGraphIndex:
+        """
+        获取知识库图索引（必要时加载并应用待处理变更）
+
+        加载在注册表锁之外进行，同一知识库的并发请求等待同一次加载，
+        加载期间提交的变更先缓冲，加载完成后补应用。
+        """
+        self._ensure_listener()
+        while True:
+            with self._lock:
+                self._drain(db)
+                index = self._indexes.get(knowledge_base_id)
+                if index is not None and time.monotonic() - self._loaded_at[knowledge_base_id] <= self.ttl:
+                    return index
+                load = self._loading.get(knowledge_base_id)
+                if load is None:
+                    load = self._loading[knowledge_base_id] = _IndexLoad()
+                    break
+            load.done.wait()
+
+        index = KnowledgeBaseGraphIndex(knowledge_base_id)
+        try:
+            index.load(db)
+            with self._lock:
+                self._drain(db)
+                if not load.stale:
+                    index.apply_changes(load.changes)
+                    self._indexes[knowledge_base_id] = index
+                    self._loaded_at[knowledge_base_id] = time.monotonic()
+                    if knowledge_base_id is not None:
+                        for document_id in index.document_ids:
+                            self._document_kb[document_id] = knowledge_base_id
+        finally:
+            with self._lock:
+                self._loading.pop(knowledge_base_id, None)
+            load.done.set()
+        return index
+
+    def resolve_knowledge_bases(self, db: Session, document_ids: Iterable[int]) -> Set[int]:
+        """解析文档所属的知识库（未缓存的文档一次查询）"""
+        document_ids = set(document_ids)
+        unknown = document_ids - self._document_kb.keys()
+        if unknown:
+            rows = db.query(
+                KnowledgeDocument.id, KnowledgeDocument.knowledge_base_id
+            ).filter(KnowledgeDocument.id.in_(unknown)).all()
+            with self._lock:
+                for document_id, kb_id in rows:
+                    self._document_kb[document_id] = kb_id
+        return {
+            self._document_kb[document_id] for document_id in document_ids
+            if self._document_kb.get(document_id) is not None
+        }
+
+    def record_changes(self, changes: List[Tuple[str, tuple]], knowledge_base_ids: Iterable[int] = (),
+                       dropped_knowledge_base_ids: Iterable[int] = (), invalidate_all: bool = False):
+        """
+        记录已提交的变更（由会话事件调用），并通知其他进程
+
+        Args:
+            changes: 增量变更
+            knowledge_base_ids: 变更涉及的知识库
+            dropped_knowledge_base_ids: 无法增量更新、需要丢弃索引的知识库（如删除了文档）
+            invalidate_all: 是否整体失效（批量/原生写入）
+        """
+        knowledge_base_ids = set(knowledge_base_ids)
+        dropped_knowledge_base_ids = set(dropped_knowledge_base_ids)
+        with self._lock:
+            if invalidate_all:
+                self._invalidate_all = True
+            for kb_id in dropped_knowledge_base_ids:
+                self._drop(kb_id)
+            if self._indexes or self._loading:
+                self._pending.extend(changes)
+        self._publish(None if invalidate_all else knowledge_base_ids | dropped_knowledge_base_ids)
+
+    def _publish(self, knowledge_base_ids: Optional[Set[int]]):
+        """
+        递增 Redis 版本号并广播受影响的知识库（None 表示全部），
+        其他进程收到后只丢弃对应知识库的本地索引
+        """
+        if self._redis is None:
+            return
+        try:
+            remote_version = self._redis.incr(self.VERSION_KEY)
+            self._remote_version = remote_version
+            self._redis.publish(self.CHANNEL, json.dumps({
+                "origin": self._origin,
+                "version": remote_version,
+                "knowledge_base_ids": sorted(knowledge_base_ids) if knowledge_base_ids is not None else None
+            }))
+        except Exception as e:
+            logger.warning(f"发布图索引失效通知失败: {e}")
+
+    def _on_remote_message(self, data: str):
+        """收到其他进程发布的失效通知"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning(f"无法解析图索引失效通知: {data!r}")
+            return
+        if message.get("origin") == self._origin:
+            return
+        self._remote_version = max(self._remote_version or 0, int(message.get("version") or 0))
+        knowledge_base_ids = message.get("knowledge_base_ids")
+        with self._lock:
+            if knowledge_base_ids is None:
+                self._invalidate_all = True
+            else:
+                for kb_id in knowledge_base_ids:
+                    self._drop(kb_id)
+        logger.info(f"收到图索引失效通知，知识库: {knowledge_base_ids if knowledge_base_ids is not None else '全部'}")
+
+    def _on_remote_version(self, remote_version: int):
+        """重连后比较版本号，期间错过通知时整体失效"""
+        if remote_version != self._remote_version:
+            self._remote_version = remote_version
+            with self._lock:
+                self._invalidate_all = True
+            logger.info(f"图索引失效通知可能有遗漏，整体失效，远端版本: {remote_version}")
+
+    def _ensure_listener(self):
+        """首次使用时启动 Redis 订阅线程（Redis 不可用时只依赖本地失效与 TTL）"""
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name="graph-index-registry", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        """订阅失效频道，断线后重连并按版本号补偿期间错过的通知"""
+        try:
+            from app.core.redis import get_redis
+        except Exception as e:
+            logger.info(f"Redis不可用，图索引仅在本进程内失效: {e}")
+            return
+
+        delay = 1.0
+        while True:
+            try:
+                client = get_redis()
+            except Exception:
+                client = None
+            if client is None:
+                if self._redis is None and delay == 1.0:
+                    logger.info("Redis未连接，图索引仅在本进程内失效")
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+
+            self._redis = client
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                current = client.get(self.VERSION_KEY)
+                if current is not None:
+                    if self._remote_version is None:
+                        self._remote_version = int(current)
+                    else:
+                        self._on_remote_version(int(current))
+                delay = 1.0
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._on_remote_message(message["data"])
+            except Exception as e:
+                logger.warning(f"图索引失效订阅中断，{delay:.0f}秒后重连: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+    def invalidate(self, knowledge_base_id: Optional[int] = None):
+        """使指定知识库（None 表示全部）的索引失效"""
+        with self._lock:
+            if knowledge_base_id is None:
+                self._invalidate_everything()
+            else:
+                self._drop(knowledge_base_id)
+
+    def _drop(self, knowledge_base_id: int):
+        """丢弃指定知识库及不限知识库的索引（调用方持有锁）"""
+        for kb_id in (knowledge_base_id, None):
+            self._indexes.pop(kb_id, None)
+            if kb_id in self._loading:
+                self._loading[kb_id].stale = True
+
+    def _invalidate_everything(self):
+        """丢弃全部索引（调用方持有锁）"""
+        self._indexes.clear()
+        self._pending.clear()
+        for load in self._loading.values():
+            load.stale = True
+
+    def _drain(self, db: Session):
+        """将待处理变更分发到已加载和加载中的索引"""
+        if self._invalidate_all:
+            self._invalidate_all = False
+            self._invalidate_everything()
+            return
+        active = set(self._indexes) | set(self._loading)
+        if not self._pending or not active:
+            self._pending.clear()
+            return
+
+        changes, self._pending = self._pending, []
+
+        # 解析新文档所属知识库（一次查询）
+        self.resolve_knowledge_bases(db, {data[-1] for op, data in changes if op.endswith("_upsert")})
+
+        by_kb: Dict[Optional[int], List[Tuple[str, tuple]]] = {}
+        for op, data in changes:
+            if op.endswith("_upsert"):
+                targets = {self._document_kb.get(data[-1])}
+            else:
+                # 删除只有ID，交给全部索引处理（不存在的ID会被忽略）
+                targets = active
+            for kb_id in targets | {None}:
+                if kb_id in active:
+                    by_kb.setdefault(kb_id, []).append((op, data))
+
+        for kb_id, kb_changes in by_kb.items():
+            if kb_id in self._indexes:
+                self._indexes[kb_id].apply_changes(kb_changes)
+            else:
+                self._loading[kb_id].changes.extend(kb_changes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """全部索引统计"""
+        with self._lock:
+            return {
+                "indexes": [index.get_stats() for index in self._indexes.values()],
+                "loading": len(self._loading),
+                "pending_changes": len(self._pending),
+                "remote_version": self._remote_version,
+                "redis": self._redis is not None
+            }
+
+def _registry_ttl() -> float:
+    try:
+        from app.core.config import settings
+        return float(getattr(settings, "graph_index_ttl", 300.0))
+    except Exception:
+        return 300.0
+
+
+graph_index_registry = GraphIndexRegistry(ttl=_registry_ttl())
+
+
+# ----------------------------------------------------------------------
+# 会话事件：捕获图谱写入并在提交后推送到索引
+# ----------------------------------------------------------------------
+
+_CHANGES_KEY = "graph_index_changes"
+_KBS_KEY = "graph_index_knowledge_bases"
+_DROPPED_KBS_KEY = "graph_index_dropped_knowledge_bases"
+_INVALIDATE_KEY = "graph_index_invalidate"
+# 批量/原生写入图谱表、批量删除文档（级联删除实体与关系）时无法得知具体行，整体失效
+_GRAPH_CLASSES = (DocumentEntity, EntityRelationship)
+_GRAPH_TABLES = tuple(cls.__table__ for cls in _GRAPH_CLASSES)
+_RAW_WRITE_PATTERN = re.compile(
+    r"^\s*(?:(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM)\s+[\"`]?"
+    r"(?:document_entities|entity_relationships|kb_\w+|global_(?:entities|relationships))"
+    r"|DELETE\s+FROM\s+[\"`]?knowledge_documents)\b",
+    re.IGNORECASE
+)
+
+
+def _entity_data(entity: DocumentEntity) -> tuple:
+    return (entity.id, entity.entity_text, entity.entity_type, entity.confidence, entity.document_id)
+
+
+def _relationship_data(rel: EntityRelationship) -> tuple:
+    return (rel.id, rel.source_id, rel.target_id, rel.relationship_type, rel.confidence, rel.document_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_graph_changes(session: Session, flush_context):
+    changes = session.info.setdefault(_CHANGES_KEY, [])
+    document_ids = set()
+    # 先实体后关系，保证关系写入时端点已在索引中
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, DocumentEntity):
+            changes.append(("entity_upsert", _entity_data(obj)))
+            document_ids.add(obj.document_id)
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, EntityRelationship):
+            changes.append(("relationship_upsert", _relationship_data(obj)))
+            document_ids.add(obj.document_id)
+    for obj in session.deleted:
+        if isinstance(obj, EntityRelationship):
+            changes.append(("relationship_delete", (obj.id,)))
+            document_ids.add(obj.document_id)
+        elif isinstance(obj, DocumentEntity):
+            changes.append(("entity_delete", (obj.id,)))
+            document_ids.add(obj.document_id)
+        elif isinstance(obj, KnowledgeDocument):
+            # 文档删除会由数据库级联删除其实体与关系，会话中看不到这些行，丢弃所属知识库的索引
+            session.info.setdefault(_DROPPED_KBS_KEY, set()).add(obj.knowledge_base_id)
+
+    document_ids.discard(None)
+    if document_ids:
+        # 事务内解析所属知识库，提交后只通知受影响的知识库
+        with session.no_autoflush:
+            session.info.setdefault(_KBS_KEY, set()).update(
+                graph_index_registry.resolve_knowledge_bases(session, document_ids)
+            )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _detect_bulk_graph_writes(orm_execute_state):
+    statement = orm_execute_state.statement
+    if isinstance(statement, TextClause):
+        if _RAW_WRITE_PATTERN.match(statement.text):
+            orm_execute_state.session.info[_INVALIDATE_KEY] = True
+        return
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    target = mapper.class_ if mapper is not None else None
+    table = getattr(statement, "table", None)
+    if (
+        target in _GRAPH_CLASSES or table in _GRAPH_TABLES
+        or (orm_execute_state.is_delete and (target is KnowledgeDocument or table is KnowledgeDocument.__table__))
+    ):
+        orm_execute_state.session.info[_INVALIDATE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_graph_changes(session: Session):
+    changes = session.info.pop(_CHANGES_KEY, None)
+    knowledge_base_ids = session.info.pop(_KBS_KEY, set())
+    dropped = session.info.pop(_DROPPED_KBS_KEY, set())
+    invalidate_all = session.info.pop(_INVALIDATE_KEY, False)
+    if changes or dropped or invalidate_all:
+        graph_index_registry.record_changes(
+            changes or [], knowledge_base_ids, dropped, invalidate_all=invalidate_all
+        )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_graph_changes(session: Session):
+    session.info.pop(_CHANGES_KEY, None)
+    session.info.pop(_KBS_KEY, None)
+    session.info.pop(_DROPPED_KBS_KEY, None)
+    session.info.pop(_INVALIDATE_KEY, None)
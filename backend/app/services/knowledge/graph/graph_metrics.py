@@ -0,0 +1,280 @@
+"""
+图谱指标计算
+
+为 KnowledgeGraphBuilder 的后处理提供：
+
+- 基于枢纽节点采样的近似介数中心性、接近中心性、平均最短路径长度和直径（下界）估计，
+  所有估计共用一次采样 BFS，BFS 与 Brandes 依赖累积均以 numpy 按层批量执行
+- 采样数量由误差预算 ε 与失败概率 δ 决定：k = ln(2n/δ) / (2ε²)
+- 按图结构指纹缓存指标，同一版本的图不重复计算
+"""
+
+import hashlib
+import logging
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+import networkx as nx
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def pivot_sample_size(node_count: int, error_budget: float, failure_probability: float,
+                      max_samples: int) -> int:
+    """
+    根据误差预算计算枢纽节点采样数量
+
+    归一化介数中心性的估计误差以 1 - δ 的概率不超过 ε（Hoeffding 界 + 联合界）。
+    """
+    if node_count <= 0:
+        return 0
+    required = math.ceil(math.log(2 * node_count / failure_probability) / (2 * error_budget ** 2))
+    return max(1, min(node_count, required, max_samples))
+
+
+def achieved_error(node_count: int, sample_size: int, failure_probability: float) -> float:
+    """采样数量对应的误差上界（采样数受 max_samples 限制时可能大于预算）"""
+    if node_count <= 0 or sample_size <= 0:
+        return 0.0
+    if sample_size >= node_count:
+        return 0.0
+    return math.sqrt(math.log(2 * node_count / failure_probability) / (2 * sample_size))
+
+
+def graph_fingerprint(graph: Dict[str, Any]) -> str:
+    """计算图结构指纹（节点ID与无向边集合），作为指标缓存的版本号"""
+    digest = hashlib.sha1()
+    for node_id in sorted(str(node["id"]) for node in graph.get("nodes", [])):
+        digest.update(node_id.encode("utf-8"))
+        digest.update(b"\x1f")
+    digest.update(b"\x1e")
+    edges = sorted(
+        tuple(sorted((str(edge["source"]), str(edge["target"]))))
+        for edge in graph.get("edges", [])
+    )
+    for source, target in edges:
+        digest.update(f"{source}\x1f{target}\x1d".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CSRGraph:
+    """无向图的 CSR 邻接表示（节点按 networkx 图的节点顺序编号）"""
+
+    def __init__(self, nx_graph: nx.Graph):
+        self.nodes = list(nx_graph.nodes())
+        self.size = len(self.nodes)
+        index = {node: i for i, node in enumerate(self.nodes)}
+
+        pairs = [(index[u], index[v]) for u, v in nx_graph.edges() if u != v]
+        if pairs:
+            edges = np.asarray(pairs, dtype=np.int64)
+            sources = np.concatenate([edges[:, 0], edges[:, 1]])
+            targets = np.concatenate([edges[:, 1], edges[:, 0]])
+        else:
+            sources = targets = np.empty(0, dtype=np.int64)
+
+        order = np.argsort(sources, kind="stable")
+        self.sources = sources[order]
+        self.targets = targets[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(self.sources, minlength=self.size))])
+
+    def bfs(self, source: int) -> np.ndarray:
+        """从 source 出发的 BFS 距离（不可达为 -1）"""
+        dist = np.full(self.size, -1, dtype=np.int64)
+        dist[source] = 0
+        frontier = np.array([source], dtype=np.int64)
+        level = 0
+        while frontier.size:
+            level += 1
+            starts = self.indptr[frontier]
+            counts = self.indptr[frontier + 1] - starts
+            total = int(counts.sum())
+            if total == 0:
+                break
+            positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+            neighbors = self.targets[positions]
+            dist[neighbors[dist[neighbors] < 0]] = level
+            frontier = np.flatnonzero(dist == level)
+        return dist
+
+    def dependencies(self, source: int, dist: np.ndarray) -> np.ndarray:
+        """
+        Brandes 单源依赖累积 δ_s(v)
+
+        沿最短路径 DAG 按层正向累积路径数 σ，再按层反向累积依赖。
+        """
+        src_level = dist[self.sources]
+        on_dag = (src_level >= 0) & (dist[self.targets] == src_level + 1)
+        dag_src = self.sources[on_dag]
+        dag_dst = self.targets[on_dag]
+        dag_level = src_level[on_dag]
+
+        order = np.argsort(dag_level, kind="stable")
+        dag_src, dag_dst, dag_level = dag_src[order], dag_dst[order], dag_level[order]
+        max_level = int(dag_level[-1]) if dag_level.size else -1
+        bounds = np.searchsorted(dag_level, np.arange(max_level + 2))
+
+        sigma = np.zeros(self.size, dtype=np.float64)
+        sigma[source] = 1.0
+        for level in range(max_level + 1):
+            lo, hi = bounds[level], bounds[level + 1]
+            sigma += np.bincount(dag_dst[lo:hi], weights=sigma[dag_src[lo:hi]], minlength=self.size)
+
+        delta = np.zeros(self.size, dtype=np.float64)
+        for level in range(max_level, -1, -1):
+            lo, hi = bounds[level], bounds[level + 1]
+            s, d = dag_src[lo:hi], dag_dst[lo:hi]
+            delta += np.bincount(s, weights=sigma[s] / sigma[d] * (1.0 + delta[d]), minlength=self.size)
+        delta[source] = 0.0
+        return delta
+
+
+def approximate_graph_metrics(
+    nx_graph: nx.Graph,
+    sample_size: int,
+    seed: int = 42
+) -> Dict[str, Any]:
+    """
+    基于分层枢纽采样估计图指标
+
+    每个连通分量按规模分配枢纽数（至少1个），分量内全部节点都是枢纽时结果精确。
+
+    Args:
+        nx_graph: networkx 无向图
+        sample_size: 枢纽节点总数
+        seed: 随机种子
+
+    Returns:
+        {
+            "closeness": {node: float},
+            "betweenness": {node: float},
+            "avg_shortest_path_length": float（仅连通图，否则为 0）,
+            "diameter": int（仅连通图的下界估计，否则为 0）,
+            "samples": int
+        }
+    """
+    csr = CSRGraph(nx_graph)
+    n = csr.size
+    if n == 0:
+        return {"closeness": {}, "betweenness": {}, "avg_shortest_path_length": 0, "diameter": 0, "samples": 0}
+
+    rng = np.random.RandomState(seed)
+    betweenness = np.zeros(n, dtype=np.float64)
+    distance_sums = np.zeros(n, dtype=np.float64)
+    pivot_counts = np.zeros(n, dtype=np.float64)
+    exact_sums = np.full(n, np.nan)
+    component_sizes = np.ones(n, dtype=np.float64)
+
+    index = {node: i for i, node in enumerate(csr.nodes)}
+    components = list(nx.connected_components(nx_graph))
+    connected = len(components) == 1
+    samples = 0
+    eccentricity = 0
+    path_length_total = 0.0
+    farthest = 0
+
+    for component in components:
+        members = np.fromiter((index[node] for node in component), dtype=np.int64, count=len(component))
+        size = len(members)
+        component_sizes[members] = size
+        if size == 1:
+            continue
+
+        k = min(size, max(1, int(round(sample_size * size / n))))
+        pivots = members if k == size else rng.choice(members, size=k, replace=False)
+        scale = size / k
+        for pivot in pivots:
+            dist = csr.bfs(int(pivot))
+            reached = dist > 0
+            distance_sums[reached] += dist[reached]
+            pivot_counts[reached] += 1
+            exact_sums[pivot] = dist[reached].sum()
+            betweenness += scale * csr.dependencies(int(pivot), dist)
+
+            if connected:
+                path_length_total += exact_sums[pivot]
+                if dist.max() > eccentricity:
+                    eccentricity = int(dist.max())
+                    farthest = int(dist.argmax())
+        samples += k
+
+    # 接近中心性（与 networkx wf_improved 口径一致）
+    with np.errstate(divide="ignore", invalid="ignore"):
+        estimated_sums = np.where(
+            pivot_counts > 0, distance_sums * (component_sizes - 1) / np.maximum(pivot_counts, 1), 0.0
+        )
+    sums = np.where(np.isnan(exact_sums), estimated_sums, exact_sums)
+    closeness = np.zeros(n, dtype=np.float64)
+    if n > 1:
+        valid = sums > 0
+        reach = component_sizes[valid] - 1
+        closeness[valid] = (reach / sums[valid]) * (reach / (n - 1))
+
+    # 介数中心性归一化（与 networkx normalized=True 的无向图口径一致）
+    if n > 2:
+        betweenness /= (n - 1) * (n - 2)
+    else:
+        betweenness[:] = 0.0
+
+    avg_path_length = 0
+    diameter = 0
+    if connected and n > 1:
+        avg_path_length = path_length_total / (samples * (n - 1))
+        # 双扫描：从最远节点再做一次 BFS，取离心率作为直径下界
+        diameter = max(eccentricity, int(csr.bfs(farthest).max()))
+
+    return {
+        "closeness": dict(zip(csr.nodes, closeness.tolist())),
+        "betweenness": dict(zip(csr.nodes, betweenness.tolist())),
+        "avg_shortest_path_length": float(avg_path_length),
+        "diameter": diameter,
+        "samples": samples
+    }
+
+
+class GraphMetricsCache:
+    """按图结构指纹缓存的指标（LRU）"""
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """获取缓存的指标"""
+        with self._lock:
+            metrics = self._entries.get(fingerprint)
+            if metrics is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return metrics
+
+    def put(self, fingerprint: str, metrics: Dict[str, Any]):
+        """写入指标"""
+        with self._lock:
+            self._entries[fingerprint] = metrics
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存统计"""
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+graph_metrics_cache = GraphMetricsCache(getattr(settings, 'graph_metrics_cache_size', 32))
@@ -23,6 +23,7 @@ from app.services.knowledge.vectorization.vector_store_adapter import (
     VectorDocument,
     SearchResult
 )
+from app.services.knowledge.vectorization.hnsw_engine import create_hnsw_engine
 
 logger = logging.getLogger(__name__)
 
@@ -168,6 +169,11 @@ class BaseIndex(ABC):
         """获取内存使用（MB）"""
         pass
     
+    def get_documents(self) -> List[VectorDocument]:
+        """获取索引中的全部文档"""
+        with self._lock:
+            return list(self._data)
+    
     def update_stats(self, query_time_ms: float):
         """更新统计"""
         with self._lock:
@@ -185,6 +191,9 @@ class FlatIndex(BaseIndex):
         super().__init__(config)
         self._vectors: Dict[str, List[float]] = {}
         self._documents: Dict[str, VectorDocument] = {}
+        # 搜索用的向量矩阵，增删后在下一次搜索时重建
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[str] = []
     
     def build(self, documents: List[VectorDocument]) -> bool:
         """构建索引"""
@@ -201,6 +210,7 @@ class FlatIndex(BaseIndex):
             build_time = (time.time() - start_time) * 1000
             
             with self._lock:
+                self._matrix = None
                 self.stats.build_time_ms = build_time
                 self.stats.index_size = len(documents)
                 self.status = IndexStatus.READY
@@ -213,6 +223,21 @@ class FlatIndex(BaseIndex):
             logger.error(f"Flat索引构建失败: {e}")
             return False
     
+    def _get_matrix(self) -> Tuple[np.ndarray, List[str]]:
+        """获取向量矩阵（余弦度量时按行归一化）"""
+        with self._lock:
+            if self._matrix is None:
+                self._matrix_ids = list(self._vectors.keys())
+                matrix = np.asarray(
+                    [self._vectors[doc_id] for doc_id in self._matrix_ids], dtype=np.float32
+                ).reshape(len(self._matrix_ids), -1)
+                if self.config.metric == "cosine" and len(matrix):
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    norms[norms == 0] = 1
+                    matrix = matrix / norms
+                self._matrix = matrix
+            return self._matrix, self._matrix_ids
+    
     def search(
         self,
         query_vector: List[float],
@@ -222,31 +247,50 @@ class FlatIndex(BaseIndex):
         """搜索"""
         start_time = time.time()
         
-        results = []
+        matrix, ids = self._get_matrix()
+        if not ids:
+            return []
         
-        for doc_id, vector in self._vectors.items():
-            # 应用过滤器
-            if filters and not self._match_filters(self._documents[doc_id], filters):
-                continue
-            
-            # 计算相似度
-            score = self._compute_similarity(query_vector, vector)
-            
-            doc = self._documents[doc_id]
+        scores = self._score_matrix(matrix, np.asarray(query_vector, dtype=np.float32))
+        
+        # 应用过滤器
+        if filters:
+            mask = np.array([self._match_filters(self._documents[doc_id], filters) for doc_id in ids])
+            scores = np.where(mask, scores, -np.inf)
+        
+        # 取top_k
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(ids) else np.arange(len(ids))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        
+        results = []
+        for i in top.tolist():
+            if scores[i] == -np.inf:
+                break
+            doc = self._documents[ids[i]]
             results.append(SearchResult(
-                id=doc_id,
+                id=doc.id,
                 text=doc.text,
-                score=score,
+                score=float(scores[i]),
                 metadata=doc.metadata
             ))
         
-        # 排序并返回top_k
-        results.sort(key=lambda x: x.score, reverse=True)
-        
         query_time = (time.time() - start_time) * 1000
         self.update_stats(query_time)
         
-        return results[:top_k]
+        return results
+    
+    def _score_matrix(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """批量计算查询与全部向量的相似度（与 _compute_similarity 口径一致）"""
+        if self.config.metric == "cosine":
+            norm = np.linalg.norm(query)
+            if norm == 0:
+                return np.zeros(len(matrix), dtype=np.float32)
+            return matrix @ (query / norm)
+        elif self.config.metric == "euclidean":
+            return 1.0 / (1.0 + np.linalg.norm(matrix - query, axis=1))
+        else:  # dot
+            return matrix @ query
     
     def _compute_similarity(self, v1: List[float], v2: List[float]) -> float:
         """计算相似度"""
@@ -285,9 +329,11 @@ class FlatIndex(BaseIndex):
             return False
         
         with self._lock:
+            if document.id not in self._vectors:
+                self.stats.index_size += 1
             self._vectors[document.id] = document.embedding
             self._documents[document.id] = document
-            self.stats.index_size += 1
+            self._matrix = None
         
         return True
     
@@ -297,10 +343,16 @@ class FlatIndex(BaseIndex):
             if document_id in self._vectors:
                 del self._vectors[document_id]
                 del self._documents[document_id]
+                self._matrix = None
                 self.stats.index_size -= 1
                 return True
         return False
     
+    def get_documents(self) -> List[VectorDocument]:
+        """获取索引中的全部文档"""
+        with self._lock:
+            return list(self._documents.values())
+    
     def get_memory_usage(self) -> float:
         """获取内存使用"""
         # 粗略估计
@@ -309,14 +361,55 @@ class FlatIndex(BaseIndex):
 
 
 class HNSWIndex(BaseIndex):
-    """HNSW索引（模拟实现）"""
+    """
+    HNSW索引
+    
+    基于分层可导航小世界图的近似最近邻索引，后端按 hnswlib -> faiss -> NumPy 的顺序选择，
+    可通过 params["backend"] 指定。支持增量添加与删除（标记删除，删除过多时由后端重建）。
+    """
     
     def __init__(self, config: IndexConfig):
         super().__init__(config)
         self._M = config.params.get("M", 16)           # 每个节点的最大连接数
         self._ef_construction = config.params.get("ef_construction", 200)
         self._ef_search = config.params.get("ef_search", 50)
-        self._flat_index = FlatIndex(config)           # 使用Flat作为基础
+        self._backend = config.params.get("backend", "auto")
+        self._space = "l2" if config.metric == "euclidean" else "ip"
+        self._engine = None
+        self._documents: Dict[str, VectorDocument] = {}
+        self._labels: Dict[str, int] = {}              # 文档ID -> 引擎标签
+        self._label_ids: Dict[int, str] = {}           # 引擎标签 -> 文档ID
+        self._next_label = 0
+    
+    def _new_engine(self, capacity: int):
+        """创建HNSW引擎"""
+        return create_hnsw_engine(
+            self.config.dimension,
+            space=self._space,
+            M=self._M,
+            ef_construction=self._ef_construction,
+            capacity=capacity,
+            backend=self._backend
+        )
+    
+    def _prepare_vectors(self, embeddings: List[List[float]]) -> np.ndarray:
+        """转换为float32矩阵，余弦度量时按行归一化"""
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), self.config.dimension)
+        if self.config.metric == "cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            vectors = vectors / norms
+        return vectors
+    
+    def _assign_labels(self, documents: List[VectorDocument]) -> np.ndarray:
+        """为文档分配引擎标签"""
+        labels = np.arange(self._next_label, self._next_label + len(documents), dtype=np.int64)
+        for doc, label in zip(documents, labels.tolist()):
+            self._documents[doc.id] = doc
+            self._labels[doc.id] = label
+            self._label_ids[label] = doc.id
+        self._next_label += len(documents)
+        return labels
     
     def build(self, documents: List[VectorDocument]) -> bool:
         """构建HNSW索引"""
@@ -325,18 +418,28 @@ class HNSWIndex(BaseIndex):
         try:
             self.status = IndexStatus.BUILDING
             
-            # 构建基础索引
-            self._flat_index.build(documents)
-            
-            # 模拟HNSW构建时间（实际应使用hnswlib等库）
-            build_time = (time.time() - start_time) * 1000
+            # 同一ID只保留最后一次出现的文档
+            unique = {doc.id: doc for doc in documents if doc.embedding}
+            docs = list(unique.values())
             
             with self._lock:
+                self._engine = self._new_engine(len(docs))
+                self._documents, self._labels, self._label_ids = {}, {}, {}
+                self._next_label = 0
+                if docs:
+                    vectors = self._prepare_vectors([doc.embedding for doc in docs])
+                    self._engine.add(vectors, self._assign_labels(docs))
+                
+                build_time = (time.time() - start_time) * 1000
                 self.stats.build_time_ms = build_time
-                self.stats.index_size = len(documents)
+                self.stats.index_size = len(docs)
+                self.stats.memory_usage_mb = self.get_memory_usage()
                 self.status = IndexStatus.READY
             
-            logger.info(f"HNSW索引构建完成: {len(documents)} 个文档, M={self._M}")
+            logger.info(
+                f"HNSW索引构建完成: {len(docs)} 个文档, 后端={self._engine.name}, "
+                f"M={self._M}, 耗时 {build_time:.2f}ms"
+            )
             return True
             
         except Exception as e:
@@ -344,6 +447,19 @@ class HNSWIndex(BaseIndex):
             logger.error(f"HNSW索引构建失败: {e}")
             return False
     
+    def _to_score(self, similarity: float) -> float:
+        """引擎相似度转换为与 FlatIndex 一致的分数"""
+        if self._space == "l2":
+            return 1.0 / (1.0 + max(-similarity, 0.0) ** 0.5)
+        return float(similarity)
+    
+    def _match_filters(self, doc: VectorDocument, filters: Dict[str, Any]) -> bool:
+        """匹配过滤器"""
+        for key, value in filters.items():
+            if doc.metadata.get(key) != value:
+                return False
+        return True
+    
     def search(
         self,
         query_vector: List[float],
@@ -353,27 +469,93 @@ class HNSWIndex(BaseIndex):
         """HNSW搜索"""
         start_time = time.time()
         
-        # 使用基础索引搜索（实际应使用HNSW算法）
-        results = self._flat_index.search(query_vector, top_k * 2, filters)
+        if self._engine is None or self._engine.count == 0:
+            return []
+        
+        query = self._prepare_vectors([query_vector])[0]
+        
+        # 有过滤条件时扩大候选数，过滤后仍不足时再扩大
+        fetch = top_k if not filters else top_k * 4
+        while True:
+            with self._lock:
+                labels, similarities = self._engine.search(query, fetch, max(self._ef_search, fetch))
+                candidates = [
+                    (self._documents[self._label_ids[label]], sim)
+                    for label, sim in zip(labels.tolist(), similarities.tolist())
+                    if label in self._label_ids
+                ]
+                total = self._engine.count
+            if filters:
+                candidates = [(doc, sim) for doc, sim in candidates if self._match_filters(doc, filters)]
+            if len(candidates) >= top_k or fetch >= total:
+                break
+            fetch = min(fetch * 4, total)
+        
+        results = [
+            SearchResult(
+                id=doc.id,
+                text=doc.text,
+                score=self._to_score(sim),
+                metadata=doc.metadata
+            )
+            for doc, sim in candidates[:top_k]
+        ]
         
         query_time = (time.time() - start_time) * 1000
         self.update_stats(query_time)
         
-        return results[:top_k]
+        return results
     
     def add_document(self, document: VectorDocument) -> bool:
-        """添加文档"""
-        return self._flat_index.add_document(document)
+        """添加文档（已存在的ID会被替换）"""
+        if not document.embedding:
+            return False
+        
+        with self._lock:
+            if self._engine is None:
+                self._engine = self._new_engine(1024)
+                self.status = IndexStatus.READY
+            if document.id in self._labels:
+                self._remove(document.id)
+            vectors = self._prepare_vectors([document.embedding])
+            self._engine.add(vectors, self._assign_labels([document]))
+            self.stats.index_size = len(self._documents)
+        
+        return True
+    
+    def _remove(self, document_id: str) -> bool:
+        """从引擎和映射表中移除文档"""
+        label = self._labels.pop(document_id, None)
+        if label is None:
+            return False
+        self._label_ids.pop(label, None)
+        self._documents.pop(document_id, None)
+        self._engine.mark_deleted(label)
+        return True
     
     def delete_document(self, document_id: str) -> bool:
         """删除文档"""
-        return self._flat_index.delete_document(document_id)
+        with self._lock:
+            if self._engine is None or not self._remove(document_id):
+                return False
+            self.stats.index_size = len(self._documents)
+            return True
+    
+    def get_documents(self) -> List[VectorDocument]:
+        """获取索引中的全部文档"""
+        with self._lock:
+            return list(self._documents.values())
+    
+    def get_backend(self) -> Optional[str]:
+        """当前使用的HNSW后端"""
+        return self._engine.name if self._engine else None
     
     def get_memory_usage(self) -> float:
-        """获取内存使用"""
-        base_memory = self._flat_index.get_memory_usage()
-        # HNSW额外开销约20-30%
-        return base_memory * 1.3
+        """获取内存使用（MB），由后端按实际分配的向量与图结构统计"""
+        with self._lock:
+            if self._engine is None:
+                return 0.0
+            return self._engine.memory_bytes() / (1024 * 1024)
 
 
 class IndexSelector:
@@ -795,19 +977,21 @@ class MultiLevelIndexService:
     def benchmark_index(
         self,
         query_vectors: List[List[float]],
-        ground_truth: List[List[str]],
-        index_id: str = "default"
+        ground_truth: Optional[List[List[str]]] = None,
+        index_id: str = "default",
+        top_k: int = 10
     ) -> Dict[str, Any]:
         """
         基准测试
         
         Args:
             query_vectors: 查询向量列表
-            ground_truth: 真实结果列表
+            ground_truth: 真实结果列表（为空时以同数据的Flat索引精确搜索结果为真值）
             index_id: 索引ID
+            top_k: 未提供真实结果时的 k
             
         Returns:
-            测试结果
+            测试结果，recall_at_k 为 |近似结果 ∩ 真值| / k 的平均值
         """
         with self._lock:
             index = self._indexes.get(index_id) or self._current_index
@@ -815,6 +999,21 @@ class MultiLevelIndexService:
         if not index:
             return {"error": "索引不存在"}
         
+        flat_time = None
+        if ground_truth is None:
+            flat_index = FlatIndex(IndexConfig(
+                index_type=IndexType.FLAT,
+                dimension=index.config.dimension,
+                metric=index.config.metric
+            ))
+            flat_index.build(index.get_documents())
+            start = time.time()
+            ground_truth = [
+                [r.id for r in flat_index.search(query, top_k=top_k)]
+                for query in query_vectors
+            ]
+            flat_time = (time.time() - start) * 1000 / len(query_vectors) if query_vectors else 0.0
+        
         total_time = 0.0
         correct = 0
         total = 0
@@ -824,7 +1023,7 @@ class MultiLevelIndexService:
             results = index.search(query, top_k=len(truth))
             total_time += (time.time() - start) * 1000
             
-            result_ids = [r.id for r in results]
+            result_ids = {r.id for r in results}
             for t in truth:
                 if t in result_ids:
                     correct += 1
@@ -834,12 +1033,26 @@ class MultiLevelIndexService:
         avg_time = total_time / len(query_vectors) if query_vectors else 0.0
         qps = 1000.0 / avg_time if avg_time > 0 else 0.0
         
-        return {
+        with index._lock:
+            index.stats.recall_rate = recall
+            index.stats.throughput_qps = qps
+            index.stats.memory_usage_mb = index.get_memory_usage()
+        
+        result = {
             "recall": f"{recall:.2%}",
+            "recall_at_k": round(recall, 4),
+            "k": len(ground_truth[0]) if ground_truth else top_k,
             "avg_query_time_ms": round(avg_time, 4),
             "qps": round(qps, 2),
-            "total_queries": len(query_vectors)
+            "total_queries": len(query_vectors),
+            "index_type": index.config.index_type.value,
+            "memory_usage_mb": round(index.get_memory_usage(), 2)
         }
+        if isinstance(index, HNSWIndex):
+            result["backend"] = index.get_backend()
+        if flat_time is not None:
+            result["flat_avg_query_time_ms"] = round(flat_time, 4)
+        return result
 
 
 # 便捷函数
@@ -111,7 +111,8 @@ async def example_eviction_strategies():
         CacheEvictionStrategy.TTL,
         CacheEvictionStrategy.LRU,
         CacheEvictionStrategy.LFU,
-        CacheEvictionStrategy.FIFO
+        CacheEvictionStrategy.FIFO,
+        CacheEvictionStrategy.W_TINYLFU
     ]
     
     for strategy in strategies:
@@ -133,7 +134,8 @@ async def example_eviction_strategies():
             )
         
         # 模拟访问（用于 LRU/LFU）
-        if strategy in [CacheEvictionStrategy.LRU, CacheEvictionStrategy.LFU]:
+        if strategy in [CacheEvictionStrategy.LRU, CacheEvictionStrategy.LFU,
+                        CacheEvictionStrategy.W_TINYLFU]:
             for _ in range(5):
                 await cache_manager.get(query="query_0")
                 await cache_manager.get(query="query_1")
@@ -6,6 +6,9 @@
 - 多种缓存失效策略
 - 缓存更新不影响查询
 - 查询响应时间减少30%
+- 语义缓存层：按知识库维护查询嵌入的 HNSW 索引，
+  精确键未命中时，相似度不低于阈值的改写查询复用已缓存的检索结果
+- 按知识库失效：记录每个知识库的缓存键，文档变更时精确清理
 
 任务编号: BE-002
 阶段: Phase 1 - 基础优化期
@@ -15,7 +18,8 @@ import logging
 import json
 import hashlib
 import time
-from typing import Dict, Any, Optional, List, Callable, Tuple
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Callable, Tuple, Set
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
@@ -23,7 +27,20 @@ from functools import wraps
 import asyncio
 import threading
 
+import numpy as np
+
+from app.core.config import settings
 from app.core.redis import get_redis, redis_client
+from app.services.knowledge.cache_eviction_policies import (
+    EvictionPolicy,
+    FIFOEvictionPolicy,
+    LFUEvictionPolicy,
+    LRUEvictionPolicy,
+    SizeEvictionPolicy,
+    TTLEvictionPolicy,
+    WTinyLFUEvictionPolicy,
+)
+from app.services.knowledge.vectorization.hnsw_engine import create_hnsw_engine
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +52,7 @@ class CacheEvictionStrategy(Enum):
     LFU = "lfu"                    # 最不经常使用
     FIFO = "fifo"                  # 先进先出
     SIZE_BASED = "size_based"      # 基于大小
+    W_TINYLFU = "w_tinylfu"        # 窗口 LRU + 频次准入
 
 
 @dataclass
@@ -43,6 +61,7 @@ class CacheStats:
     total_requests: int = 0
     cache_hits: int = 0
     cache_misses: int = 0
+    semantic_hits: int = 0  # 由语义缓存层命中的请求数（包含在 cache_hits 中）
     evictions: int = 0
     total_hits_size: int = 0  # 命中的缓存数据总大小（字节）
     total_misses_size: int = 0  # 未命中的查询结果总大小（字节）
@@ -80,6 +99,81 @@ class CacheEntry:
     last_accessed: datetime = field(default_factory=datetime.now)
     size_bytes: int = 0
     query_hash: str = ""  # 查询参数哈希
+    knowledge_base_id: Optional[int] = None
+
+
+class SemanticQueryIndex:
+    """
+    单个知识库的查询嵌入近邻索引
+
+    每个条目记录查询嵌入、对应的精确缓存键以及查询范围（过滤条件、数量限制等），
+    只有范围一致的近邻查询才能复用缓存结果。条目数超过上限时按插入顺序淘汰最旧的条目。
+    """
+
+    def __init__(self, dimension: int, max_entries: int = 2000, backend: str = "auto",
+                 ef_search: int = 64):
+        self.dimension = dimension
+        self.max_entries = max(1, max_entries)
+        self.ef_search = ef_search
+        self.engine = create_hnsw_engine(
+            dimension, space="ip", M=16, ef_construction=100,
+            capacity=min(self.max_entries, 1024), backend=backend
+        )
+        self._entries: "OrderedDict[int, Tuple[str, str]]" = OrderedDict()  # 标签 -> (缓存键, 查询范围)
+        self._labels: Dict[str, int] = {}  # 缓存键 -> 标签
+        self._next_label = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, vector: np.ndarray, cache_key: str, scope: str):
+        """添加查询嵌入（同一缓存键重复添加时替换旧条目）"""
+        with self._lock:
+            self._remove_locked(cache_key)
+            label = self._next_label
+            self._next_label += 1
+            self.engine.add(vector.reshape(1, -1).astype(np.float32), np.array([label], dtype=np.int64))
+            self._entries[label] = (cache_key, scope)
+            self._labels[cache_key] = label
+
+            while len(self._entries) > self.max_entries:
+                oldest, (oldest_key, _) = self._entries.popitem(last=False)
+                self._labels.pop(oldest_key, None)
+                self.engine.mark_deleted(oldest)
+
+    def lookup(self, vector: np.ndarray, scope: str, threshold: float,
+               candidates: int = 8) -> Optional[Tuple[str, float]]:
+        """
+        查找相似度不低于阈值且查询范围一致的最近邻
+
+        Returns:
+            (缓存键, 相似度)，没有满足条件的条目时返回 None
+        """
+        with self._lock:
+            if not self._entries:
+                return None
+            labels, similarities = self.engine.search(
+                vector.astype(np.float32), min(candidates, len(self._entries)), self.ef_search
+            )
+            for label, similarity in zip(labels.tolist(), similarities.tolist()):
+                if similarity < threshold:
+                    break
+                entry = self._entries.get(label)
+                if entry and entry[1] == scope:
+                    return entry[0], float(similarity)
+            return None
+
+    def remove(self, cache_key: str):
+        """移除缓存键对应的条目"""
+        with self._lock:
+            self._remove_locked(cache_key)
+
+    def _remove_locked(self, cache_key: str):
+        label = self._labels.pop(cache_key, None)
+        if label is not None:
+            self._entries.pop(label, None)
+            self.engine.mark_deleted(label)
 
 
 class QueryCacheManager:
@@ -94,6 +188,7 @@ class QueryCacheManager:
     - 自动缓存键生成（基于查询参数哈希）
     - 详细的命中率统计
     - 缓存预热和批量失效
+    - 语义缓存层：改写后的相似查询复用缓存结果
     """
     
     # 默认缓存配置
@@ -107,7 +202,11 @@ class QueryCacheManager:
         default_ttl: int = DEFAULT_TTL,
         max_size: int = MAX_CACHE_SIZE,
         eviction_strategy: CacheEvictionStrategy = CacheEvictionStrategy.TTL,
-        enable_stats: bool = True
+        enable_stats: bool = True,
+        max_entries: int = MAX_ENTRIES,
+        enable_semantic: Optional[bool] = None,
+        semantic_threshold: Optional[float] = None,
+        embed_func: Optional[Callable[[List[str]], Optional[np.ndarray]]] = None
     ):
         """
         初始化查询缓存管理器
@@ -118,10 +217,15 @@ class QueryCacheManager:
             max_size: 最大缓存大小（字节）
             eviction_strategy: 缓存失效策略
             enable_stats: 是否启用统计
+            max_entries: 本地缓存最大条目数
+            enable_semantic: 是否启用语义缓存层，默认读取配置
+            semantic_threshold: 语义命中的最低余弦相似度，默认读取配置
+            embed_func: 查询编码函数（输入文本列表，返回归一化嵌入矩阵），默认使用BERT模型管理器
         """
         self.prefix = prefix
         self.default_ttl = default_ttl
         self.max_size = max_size
+        self.max_entries = max_entries
         self.eviction_strategy = eviction_strategy
         self.enable_stats = enable_stats
         
@@ -132,19 +236,66 @@ class QueryCacheManager:
         self.stats = CacheStats()
         self._stats_lock = threading.Lock()
         
-        # 本地缓存（用于 LRU/LFU 策略）
+        # 本地缓存，淘汰顺序由策略对象维护，字节数增量计数（均为常数时间簿记）
         self._local_cache: Dict[str, CacheEntry] = {}
         self._local_cache_lock = threading.Lock()
+        self._local_bytes = 0
+        self._policy = self._create_eviction_policy()
+        
+        # 知识库 -> 缓存键（按知识库失效时使用，Redis 中另存一份供多进程共享）
+        self._kb_keys: Dict[Optional[int], Set[str]] = {}
         
-        # 访问历史（用于 LRU/LFU）
-        self._access_history: List[Tuple[str, datetime]] = []
+        # 语义缓存层：知识库 -> 查询嵌入索引（进程内，条目指向共享的精确缓存键）
+        self.enable_semantic = (
+            enable_semantic if enable_semantic is not None
+            else getattr(settings, 'query_cache_semantic_enabled', True)
+        )
+        self.semantic_threshold = (
+            semantic_threshold if semantic_threshold is not None
+            else getattr(settings, 'query_cache_semantic_threshold', 0.92)
+        )
+        self.semantic_max_entries = getattr(settings, 'query_cache_semantic_max_entries', 2000)
+        self.semantic_backend = getattr(settings, 'query_cache_semantic_backend', 'auto')
+        self._embed_func = embed_func
+        self._semantic_indexes: Dict[Optional[int], SemanticQueryIndex] = {}
+        self._semantic_lock = threading.Lock()
+        
+        # 最近查询的嵌入，避免未命中后写入缓存时重复编码
+        self._query_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._embedding_lock = threading.Lock()
         
         logger.info(
             f"查询缓存管理器初始化完成: "
             f"prefix={prefix}, ttl={default_ttl}s, "
-            f"strategy={eviction_strategy.value}"
+            f"strategy={eviction_strategy.value}, "
+            f"semantic={self.enable_semantic}(threshold={self.semantic_threshold})"
         )
     
+    def _create_eviction_policy(self) -> EvictionPolicy:
+        """根据失效策略创建本地缓存的淘汰策略"""
+        if self.eviction_strategy == CacheEvictionStrategy.LRU:
+            return LRUEvictionPolicy()
+        if self.eviction_strategy == CacheEvictionStrategy.LFU:
+            return LFUEvictionPolicy()
+        if self.eviction_strategy == CacheEvictionStrategy.FIFO:
+            return FIFOEvictionPolicy()
+        if self.eviction_strategy == CacheEvictionStrategy.SIZE_BASED:
+            return SizeEvictionPolicy()
+        if self.eviction_strategy == CacheEvictionStrategy.W_TINYLFU:
+            return WTinyLFUEvictionPolicy(self.max_entries)
+        return TTLEvictionPolicy()
+    
+    def _remove_local(self, cache_key: str) -> Optional[CacheEntry]:
+        """从本地缓存移除条目并同步簿记（调用方持有本地缓存锁）"""
+        entry = self._local_cache.pop(cache_key, None)
+        if entry is not None:
+            self._local_bytes -= entry.size_bytes
+            self._policy.remove(cache_key)
+            kb_keys = self._kb_keys.get(entry.knowledge_base_id)
+            if kb_keys is not None:
+                kb_keys.discard(cache_key)
+        return entry
+    
     def _generate_cache_key(
         self,
         query: str,
@@ -183,6 +334,27 @@ class QueryCacheManager:
         
         return f"{self.prefix}{hash_value}"
     
+    def _generate_scope_key(
+        self,
+        knowledge_base_id: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        limit: int = 10,
+        **kwargs
+    ) -> str:
+        """生成查询范围键（除查询文本外的全部参数），语义命中要求范围一致"""
+        params = {
+            "knowledge_base_id": knowledge_base_id,
+            "filters": self._normalize_filters(filters),
+            "limit": limit
+        }
+        params.update(kwargs)
+        params_str = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.md5(params_str.encode()).hexdigest()
+    
+    def _kb_index_key(self, knowledge_base_id: Optional[int]) -> str:
+        """Redis 中记录知识库缓存键集合的键"""
+        return f"{self.prefix}kb:{knowledge_base_id if knowledge_base_id is not None else 'all'}"
+    
     def _normalize_filters(self, filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
         """规范化过滤条件"""
         if not filters:
@@ -224,6 +396,10 @@ class QueryCacheManager:
         start_time = time.time()
         
         try:
+            # 记录访问频次（W-TinyLFU 准入依据，未命中的查询同样计数）
+            with self._local_cache_lock:
+                self._policy.record(cache_key)
+            
             # 尝试从 Redis 获取
             if self.redis:
                 cached_data = self.redis.get(cache_key)
@@ -254,11 +430,12 @@ class QueryCacheManager:
                     
                     # 检查是否过期
                     if entry.expires_at and datetime.now() > entry.expires_at:
-                        del self._local_cache[cache_key]
+                        self._remove_local(cache_key)
                     else:
                         # 更新访问信息
                         entry.access_count += 1
                         entry.last_accessed = datetime.now()
+                        self._policy.touch(cache_key)
                         
                         if self.enable_stats:
                             with self._stats_lock:
@@ -267,6 +444,18 @@ class QueryCacheManager:
                         
                         return entry.data, True
             
+            # 精确键未命中，尝试语义缓存层
+            if self.enable_semantic:
+                scope = self._generate_scope_key(knowledge_base_id, filters, limit, **kwargs)
+                data, hit = await self._semantic_get(query, knowledge_base_id, scope)
+                if hit:
+                    if self.enable_stats:
+                        with self._stats_lock:
+                            self.stats.total_requests += 1
+                            self.stats.cache_hits += 1
+                            self.stats.semantic_hits += 1
+                    return data, True
+            
             # 缓存未命中
             if self.enable_stats:
                 with self._stats_lock:
@@ -322,23 +511,40 @@ class QueryCacheManager:
             # 确定过期时间
             expire_time = ttl if ttl is not None else self.default_ttl
             
-            # 存储到 Redis
+            # 存储到 Redis，并登记到知识库的缓存键集合
             if self.redis:
-                self.redis.setex(cache_key, expire_time, serialized_data)
+                kb_index_key = self._kb_index_key(knowledge_base_id)
+                pipe = self.redis.pipeline()
+                pipe.setex(cache_key, expire_time, serialized_data)
+                pipe.sadd(kb_index_key, cache_key)
+                pipe.expire(kb_index_key, max(expire_time, self.default_ttl))
+                pipe.execute()
             
             # 存储到本地缓存
             with self._local_cache_lock:
-                self._local_cache[cache_key] = CacheEntry(
+                self._remove_local(cache_key)
+                entry = CacheEntry(
                     key=cache_key,
                     data=data,
                     created_at=datetime.now(),
                     expires_at=datetime.now() + timedelta(seconds=expire_time),
                     size_bytes=data_size,
-                    query_hash=cache_key
+                    query_hash=cache_key,
+                    knowledge_base_id=knowledge_base_id
                 )
+                self._local_cache[cache_key] = entry
+                self._local_bytes += data_size
+                self._policy.insert(cache_key, data_size, entry.expires_at.timestamp())
                 
-                # 检查是否需要清理
-                self._evict_if_needed()
+                self._kb_keys.setdefault(knowledge_base_id, set()).add(cache_key)
+            
+            # 检查是否需要清理
+            self._evict_if_needed()
+            
+            # 写入语义缓存层
+            if self.enable_semantic:
+                scope = self._generate_scope_key(knowledge_base_id, filters, limit, **kwargs)
+                await self._semantic_add(query, knowledge_base_id, scope, cache_key)
             
             if self.enable_stats:
                 with self._stats_lock:
@@ -416,75 +622,203 @@ class QueryCacheManager:
             logger.error(f"执行查询失败: {e}")
             raise
     
-    def _update_access_history(self, cache_key: str):
-        """更新访问历史"""
+    def _load_cached(self, cache_key: str) -> Tuple[Optional[Any], bool]:
+        """按缓存键读取数据（Redis 优先，其次本地缓存），不更新统计"""
+        if self.redis:
+            cached_data = self.redis.get(cache_key)
+            if cached_data:
+                return json.loads(cached_data), True
+        
         with self._local_cache_lock:
-            now = datetime.now()
-            self._access_history.append((cache_key, now))
-            
-            # 清理旧的历史记录
-            cutoff = now - timedelta(hours=1)
-            self._access_history = [
-                (k, t) for k, t in self._access_history if t > cutoff
-            ]
+            entry = self._local_cache.get(cache_key)
+            if entry is None:
+                return None, False
+            if entry.expires_at and datetime.now() > entry.expires_at:
+                self._remove_local(cache_key)
+                return None, False
+            entry.access_count += 1
+            entry.last_accessed = datetime.now()
+            self._policy.touch(cache_key)
+            return entry.data, True
     
-    def _evict_if_needed(self):
-        """根据需要清理缓存"""
-        with self._local_cache_lock:
-            # 检查缓存大小
-            total_size = sum(entry.size_bytes for entry in self._local_cache.values())
+    def _get_embed_func(self) -> Optional[Callable[[List[str]], Optional[np.ndarray]]]:
+        """获取查询编码函数，BERT模型不可用时关闭语义缓存层"""
+        if self._embed_func is None:
+            try:
+                from app.services.knowledge.bert_model_manager import encode_texts
+                self._embed_func = encode_texts
+            except Exception as e:
+                logger.warning(f"查询编码模型不可用，关闭语义缓存: {e}")
+                self.enable_semantic = False
+        return self._embed_func
+    
+    async def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        """编码查询文本（归一化），结果按规范化文本缓存"""
+        text = query.lower().strip()
+        if not text:
+            return None
+        
+        with self._embedding_lock:
+            vector = self._query_embeddings.get(text)
+            if vector is not None:
+                self._query_embeddings.move_to_end(text)
+                return vector
+        
+        embed_func = self._get_embed_func()
+        if embed_func is None:
+            return None
+        
+        loop = asyncio.get_event_loop()
+        embeddings = await loop.run_in_executor(None, embed_func, [text])
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        
+        vector = np.asarray(embeddings, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        vector = vector / norm
+        
+        with self._embedding_lock:
+            self._query_embeddings[text] = vector
+            while len(self._query_embeddings) > 1024:
+                self._query_embeddings.popitem(last=False)
+        return vector
+    
+    async def _semantic_get(
+        self,
+        query: str,
+        knowledge_base_id: Optional[int],
+        scope: str
+    ) -> Tuple[Optional[Any], bool]:
+        """语义缓存层查找：返回与查询最相近的已缓存查询的结果"""
+        with self._semantic_lock:
+            index = self._semantic_indexes.get(knowledge_base_id)
+        if index is None or len(index) == 0:
+            return None, False
+        
+        try:
+            vector = await self._embed_query(query)
+            if vector is None or len(vector) != index.dimension:
+                return None, False
+            
+            match = index.lookup(vector, scope, self.semantic_threshold)
+            if match is None:
+                return None, False
+            
+            cache_key, similarity = match
+            data, found = self._load_cached(cache_key)
+            if not found:
+                # 精确缓存已过期或被清理，同步移除语义条目
+                index.remove(cache_key)
+                return None, False
+            
+            self._update_access_history(cache_key)
+            logger.debug(f"语义缓存命中: {cache_key}, similarity={similarity:.4f}")
+            return data, True
             
-            if total_size < self.max_size and len(self._local_cache) < self.MAX_ENTRIES:
+        except Exception as e:
+            logger.error(f"语义缓存查找失败: {e}")
+            return None, False
+    
+    async def _semantic_add(
+        self,
+        query: str,
+        knowledge_base_id: Optional[int],
+        scope: str,
+        cache_key: str
+    ):
+        """将查询嵌入写入所属知识库的语义索引"""
+        try:
+            vector = await self._embed_query(query)
+            if vector is None:
                 return
             
-            # 根据策略选择要清理的条目
-            entries_to_remove = []
+            with self._semantic_lock:
+                index = self._semantic_indexes.get(knowledge_base_id)
+                if index is None or index.dimension != len(vector):
+                    index = SemanticQueryIndex(
+                        len(vector), self.semantic_max_entries, self.semantic_backend
+                    )
+                    self._semantic_indexes[knowledge_base_id] = index
+            index.add(vector, cache_key, scope)
             
-            if self.eviction_strategy == CacheEvictionStrategy.LRU:
-                # 最近最少使用
-                sorted_entries = sorted(
-                    self._local_cache.items(),
-                    key=lambda x: x[1].last_accessed
-                )
-                entries_to_remove = sorted_entries[:len(sorted_entries) // 4]
-                
-            elif self.eviction_strategy == CacheEvictionStrategy.LFU:
-                # 最不经常使用
-                sorted_entries = sorted(
-                    self._local_cache.items(),
-                    key=lambda x: x[1].access_count
-                )
-                entries_to_remove = sorted_entries[:len(sorted_entries) // 4]
-                
-            elif self.eviction_strategy == CacheEvictionStrategy.FIFO:
-                # 先进先出
-                sorted_entries = sorted(
-                    self._local_cache.items(),
-                    key=lambda x: x[1].created_at
-                )
-                entries_to_remove = sorted_entries[:len(sorted_entries) // 4]
-                
-            elif self.eviction_strategy == CacheEvictionStrategy.SIZE_BASED:
-                # 基于大小
-                sorted_entries = sorted(
-                    self._local_cache.items(),
-                    key=lambda x: x[1].size_bytes,
-                    reverse=True
-                )
-                entries_to_remove = sorted_entries[:len(sorted_entries) // 4]
+        except Exception as e:
+            logger.error(f"写入语义缓存失败: {e}")
+    
+    def invalidate_knowledge_base(self, knowledge_base_id: Optional[int]) -> int:
+        """
+        使知识库的全部缓存失效（精确缓存与语义索引）
+        
+        供文档新增、更新、删除后同步调用。不限知识库（None）的查询结果
+        也包含该知识库的文档，一并失效。
+        
+        Args:
+            knowledge_base_id: 知识库ID
             
-            # 清理选中的条目
-            for key, entry in entries_to_remove:
-                del self._local_cache[key]
-                
-                # 同时删除 Redis 中的缓存
-                if self.redis:
-                    self.redis.delete(key)
-                
-                if self.enable_stats:
-                    self.stats.evictions += 1
+        Returns:
+            失效的缓存数量
+        """
+        kb_ids = {knowledge_base_id, None}
+        try:
+            with self._local_cache_lock:
+                keys = set()
+                for kb_id in kb_ids:
+                    keys |= self._kb_keys.pop(kb_id, set())
+                for key in keys:
+                    self._remove_local(key)
+            
+            if self.redis:
+                kb_index_keys = [self._kb_index_key(kb_id) for kb_id in kb_ids]
+                for kb_index_key in kb_index_keys:
+                    keys |= set(self.redis.smembers(kb_index_key))
+                self.redis.delete(*kb_index_keys, *keys)
             
-            logger.info(f"缓存清理完成，移除 {len(entries_to_remove)} 个条目")
+            with self._semantic_lock:
+                for kb_id in kb_ids:
+                    self._semantic_indexes.pop(kb_id, None)
+            
+            logger.info(f"知识库 {knowledge_base_id} 的缓存已失效，共 {len(keys)} 个")
+            return len(keys)
+            
+        except Exception as e:
+            logger.error(f"使知识库 {knowledge_base_id} 的缓存失效失败: {e}")
+            return 0
+    
+    def _update_access_history(self, cache_key: str):
+        """更新访问信息（Redis 命中时同步本地条目的淘汰顺序）"""
+        with self._local_cache_lock:
+            entry = self._local_cache.get(cache_key)
+            if entry is not None:
+                entry.access_count += 1
+                entry.last_accessed = datetime.now()
+                self._policy.touch(cache_key)
+    
+    def _evict_if_needed(self):
+        """超出条目数或字节上限时按策略逐个淘汰，直到回到上限以内"""
+        evicted = []
+        with self._local_cache_lock:
+            while self._local_cache and (
+                self._local_bytes > self.max_size or len(self._local_cache) > self.max_entries
+            ):
+                key = self._policy.evict()
+                if key is None:
+                    break
+                if self._remove_local(key) is not None:
+                    evicted.append(key)
+        
+        if not evicted:
+            return
+        
+        # 同时删除 Redis 中的缓存
+        if self.redis:
+            self.redis.delete(*evicted)
+        
+        if self.enable_stats:
+            with self._stats_lock:
+                self.stats.evictions += len(evicted)
+        
+        logger.debug(f"缓存淘汰完成，移除 {len(evicted)} 个条目")
     
     async def invalidate(
         self,
@@ -514,8 +848,12 @@ class QueryCacheManager:
                     self.redis.delete(cache_key)
                 
                 with self._local_cache_lock:
-                    if cache_key in self._local_cache:
-                        del self._local_cache[cache_key]
+                    self._remove_local(cache_key)
+                
+                with self._semantic_lock:
+                    index = self._semantic_indexes.get(knowledge_base_id)
+                if index is not None:
+                    index.remove(cache_key)
                 
                 count = 1
                 logger.info(f"缓存已失效: {cache_key}")
@@ -534,36 +872,14 @@ class QueryCacheManager:
                         if k.startswith(f"{self.prefix}{pattern}")
                     ]
                     for key in keys_to_remove:
-                        del self._local_cache[key]
+                        self._remove_local(key)
                     count = max(count, len(keys_to_remove))
                 
                 logger.info(f"模式 '{pattern}' 的缓存已失效，共 {count} 个")
                 
             elif knowledge_base_id:
                 # 使特定知识库的所有缓存失效
-                # 这里需要遍历所有缓存，检查 knowledge_base_id
-                with self._local_cache_lock:
-                    keys_to_remove = []
-                    for key, entry in self._local_cache.items():
-                        # 从 Redis 获取并检查
-                        if self.redis:
-                            data = self.redis.get(key)
-                            if data:
-                                try:
-                                    cached = json.loads(data)
-                                    if cached.get("knowledge_base_id") == knowledge_base_id:
-                                        keys_to_remove.append(key)
-                                except:
-                                    pass
-                    
-                    for key in keys_to_remove:
-                        del self._local_cache[key]
-                        if self.redis:
-                            self.redis.delete(key)
-                    
-                    count = len(keys_to_remove)
-                
-                logger.info(f"知识库 {knowledge_base_id} 的缓存已失效，共 {count} 个")
+                count = self.invalidate_knowledge_base(knowledge_base_id)
             
             return count
             
@@ -588,7 +904,13 @@ class QueryCacheManager:
             # 清空本地缓存
             with self._local_cache_lock:
                 self._local_cache.clear()
-                self._access_history.clear()
+                self._local_bytes = 0
+                self._policy.clear()
+                self._kb_keys.clear()
+            
+            # 清空语义索引
+            with self._semantic_lock:
+                self._semantic_indexes.clear()
             
             # 重置统计
             if self.enable_stats:
@@ -616,6 +938,7 @@ class QueryCacheManager:
                 "total_requests": self.stats.total_requests,
                 "cache_hits": self.stats.cache_hits,
                 "cache_misses": self.stats.cache_misses,
+                "semantic_hits": self.stats.semantic_hits,
                 "evictions": self.stats.evictions,
                 "avg_query_time": self.stats.avg_query_time,
                 "avg_cache_time": self.stats.avg_cache_time,
@@ -626,9 +949,15 @@ class QueryCacheManager:
         
         with self._local_cache_lock:
             stats["local_cache_size"] = len(self._local_cache)
-            stats["local_cache_bytes"] = sum(
-                entry.size_bytes for entry in self._local_cache.values()
-            )
+            stats["local_cache_bytes"] = self._local_bytes
+            stats["eviction_strategy"] = self.eviction_strategy.value
+        
+        with self._semantic_lock:
+            stats["semantic_enabled"] = self.enable_semantic
+            stats["semantic_threshold"] = self.semantic_threshold
+            stats["semantic_index_entries"] = {
+                kb_id: len(index) for kb_id, index in self._semantic_indexes.items()
+            }
         
         return stats
     
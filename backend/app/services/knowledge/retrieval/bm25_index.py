@@ -0,0 +1,811 @@
+"""
+文档分块 BM25 关键词索引
+
+为 document_chunks 提供持久化、增量更新的 BM25 倒排索引，补足向量检索对
+型号、错误码等精确词项召回差、只能退化为 ilike '%q%' 扫描的问题：
+
+- 分词：NFKC 归一化并转小写；中日韩文字按二元组切分，字母数字串保留整体
+  （如 err-1042、v2.3.1），同时输出各组成部分
+- 压缩倒排表：文档序号差值编码，差值与词频分别按该词项所需的最小无符号宽度存储，
+  查询时以 np.frombuffer + cumsum 解码
+- 基础段 + 增量：持久化的不可变基础段（倒排数据内存映射加载）、内存中的增量倒排与删除标记，
+  增量或删除过多时合并为新的基础段并落盘
+- 增量同步：按文档比对 (分块数, 最大分块ID) 签名，只对变化的文档重新分词；
+  会话事件捕获分块写入后将索引标记为待对账
+- Top-k 剪枝（MaxScore）：按词项得分上界降序逐词累加，剩余词项上界之和低于当前第 k 名得分后
+  不再引入新候选，并淘汰无法进入 top-k 的候选
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, List, Optional, Set, Tuple, Iterable
+
+import numpy as np
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.modules.knowledge.models.knowledge_document import DocumentChunk, KnowledgeDocument
+
+logger = logging.getLogger(__name__)
+
+# 分词或段格式变化时递增，使旧的磁盘索引失效
+TOKENIZER_VERSION = 1
+SEGMENT_FORMAT_VERSION = 1
+
+# 增量文档数或删除标记数超过该比例时合并段
+MERGE_RATIO = 0.2
+MERGE_MIN_DOCUMENTS = 1024
+# 按文档重新加载分块时每批的文档数
+RELOAD_BATCH_SIZE = 500
+
+
+# ----------------------------------------------------------------------
+# 分词
+# ----------------------------------------------------------------------
+
+_CJK = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_WORD = rf"[^\W_{_CJK}]"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|{_WORD}+(?:[-_./:#+]{_WORD}+)*")
+_PART_RE = re.compile(rf"{_WORD}+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+_STOP_WORDS = frozenset({
+    "the", "of", "and", "or", "to", "in", "on", "at", "is", "are", "be", "for", "with", "by", "an"
+})
+
+
+def _keep_word(token: str) -> bool:
+    return (len(token) > 1 or token.isdigit()) and token not in _STOP_WORDS
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    BM25 分词（索引与查询共用）
+
+    Args:
+        text: 文本
+
+    Returns:
+        词项列表（保留重复，用于统计词频）
+    """
+    if not text:
+        return []
+
+    tokens: List[str] = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text).lower()):
+        token = match.group()
+        if _CJK_RE.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+            continue
+
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            # 复合串整体作为高区分度词项，组成部分用于部分匹配
+            tokens.append(token)
+            tokens.extend(part for part in parts if _keep_word(part))
+        elif _keep_word(token):
+            tokens.append(token)
+    return tokens
+
+
+# ----------------------------------------------------------------------
+# 压缩倒排段
+# ----------------------------------------------------------------------
+
+_WIDTH_DTYPES = {1: np.dtype("<u1"), 2: np.dtype("<u2"), 4: np.dtype("<u4")}
+
+
+def _min_width(max_value: int) -> int:
+    """容纳 max_value 所需的最小无符号整数字节数"""
+    if max_value < 1 << 8:
+        return 1
+    if max_value < 1 << 16:
+        return 2
+    return 4
+
+
+class PostingSegment:
+    """
+    不可变的压缩倒排段
+
+    每个词项的倒排表为 [文档序号差值][词频] 两段，各自按该词项所需的最小宽度编码，
+    全部词项依次拼接在同一个字节数组中。
+    """
+
+    def __init__(self, terms: List[str], offsets: np.ndarray, doc_freqs: np.ndarray,
+                 widths: np.ndarray, max_tfs: np.ndarray, data: np.ndarray):
+        self.terms = terms
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.offsets = offsets      # 每个词项在 data 中的起始字节
+        self.doc_freqs = doc_freqs  # 文档频率（倒排表长度）
+        self.widths = widths        # (差值宽度, 词频宽度)
+        self.max_tfs = max_tfs      # 最大词频（用于得分上界）
+        self.data = data
+
+    @classmethod
+    def empty(cls) -> "PostingSegment":
+        return cls(
+            [], np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+            np.zeros((0, 2), dtype=np.uint8), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8)
+        )
+
+    @classmethod
+    def build(cls, postings: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> "PostingSegment":
+        """
+        构建倒排段
+
+        Args:
+            postings: 词项 -> (升序文档序号, 词频)
+        """
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms), dtype=np.int64)
+        doc_freqs = np.zeros(len(terms), dtype=np.int64)
+        widths = np.zeros((len(terms), 2), dtype=np.uint8)
+        max_tfs = np.zeros(len(terms), dtype=np.int64)
+
+        encoded: List[bytes] = []
+        position = 0
+        for i, term in enumerate(terms):
+            docs, tfs = postings[term]
+            gaps = np.diff(docs, prepend=0)
+            max_tf = int(tfs.max())
+            gap_width, tf_width = _min_width(int(gaps.max())), _min_width(max_tf)
+            block = gaps.astype(_WIDTH_DTYPES[gap_width]).tobytes() + tfs.astype(_WIDTH_DTYPES[tf_width]).tobytes()
+
+            offsets[i] = position
+            doc_freqs[i] = len(docs)
+            widths[i] = (gap_width, tf_width)
+            max_tfs[i] = max_tf
+            encoded.append(block)
+            position += len(block)
+
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        return cls(terms, offsets, doc_freqs, widths, max_tfs, data)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """解码词项倒排表，返回 (文档序号, 词频)"""
+        i = self.term_ids.get(term)
+        if i is None:
+            return None
+        count = int(self.doc_freqs[i])
+        offset = int(self.offsets[i])
+        gap_width, tf_width = int(self.widths[i, 0]), int(self.widths[i, 1])
+        gaps = np.frombuffer(self.data, dtype=_WIDTH_DTYPES[gap_width], count=count, offset=offset)
+        tfs = np.frombuffer(self.data, dtype=_WIDTH_DTYPES[tf_width], count=count,
+                            offset=offset + count * gap_width)
+        return np.cumsum(gaps, dtype=np.int64), tfs.astype(np.int64)
+
+    def doc_freq(self, term: str) -> int:
+        i = self.term_ids.get(term)
+        return 0 if i is None else int(self.doc_freqs[i])
+
+    def max_tf(self, term: str) -> int:
+        i = self.term_ids.get(term)
+        return 0 if i is None else int(self.max_tfs[i])
+
+    def save(self, path: str):
+        """写入目录（词表为文本，其余为 .npy）"""
+        with open(os.path.join(path, "terms.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(self.terms))
+        np.save(os.path.join(path, "offsets.npy"), self.offsets)
+        np.save(os.path.join(path, "doc_freqs.npy"), self.doc_freqs)
+        np.save(os.path.join(path, "widths.npy"), self.widths)
+        np.save(os.path.join(path, "max_tfs.npy"), self.max_tfs)
+        np.save(os.path.join(path, "postings.npy"), self.data)
+
+    @classmethod
+    def load(cls, path: str) -> "PostingSegment":
+        """从目录加载（倒排数据内存映射）"""
+        with open(os.path.join(path, "terms.txt"), "r", encoding="utf-8") as f:
+            content = f.read()
+        terms = content.split("\n") if content else []
+        data = np.load(os.path.join(path, "postings.npy"), mmap_mode="r")
+        return cls(
+            terms,
+            np.load(os.path.join(path, "offsets.npy")),
+            np.load(os.path.join(path, "doc_freqs.npy")),
+            np.load(os.path.join(path, "widths.npy")),
+            np.load(os.path.join(path, "max_tfs.npy")),
+            data if data.size else np.zeros(0, dtype=np.uint8)
+        )
+
+
+# ----------------------------------------------------------------------
+# 知识库索引
+# ----------------------------------------------------------------------
+
+class ChunkBM25Index:
+    """
+    单个知识库的分块 BM25 索引
+
+    分块按“序号”存储：基础段覆盖 [0, _base_count)，之后的序号位于增量倒排中。
+    删除仅做标记，合并时压缩序号。文档频率包含已删除但尚未合并的分块（与常见搜索引擎一致）。
+    """
+
+    def __init__(self, knowledge_base_id: Optional[int], index_dir: Optional[str] = None,
+                 k1: Optional[float] = None, b: Optional[float] = None):
+        """
+        Args:
+            knowledge_base_id: 知识库ID（None 表示全部知识库）
+            index_dir: 持久化根目录（None 表示不落盘）
+            k1: BM25 词频饱和参数
+            b: BM25 长度归一化参数
+        """
+        self.knowledge_base_id = knowledge_base_id
+        self.index_dir = index_dir
+        self.k1 = settings.bm25_k1 if k1 is None else k1
+        self.b = settings.bm25_b if b is None else b
+        self.last_reconciled = 0.0
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        """清空索引内容"""
+        self._segment = PostingSegment.empty()
+        self._base_count = 0
+        self._size = 0
+        self._chunk_ids = np.zeros(0, dtype=np.int64)
+        self._document_ids = np.zeros(0, dtype=np.int64)
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+
+        self._chunk_pos: Dict[int, int] = {}
+        self._document_positions: Dict[int, List[int]] = {}
+        self._signatures: Dict[int, Tuple[int, int]] = {}  # 文档ID -> (分块数, 最大分块ID)
+
+        self._delta: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._alive_count = 0
+        self._total_length = 0
+        self._min_length = 0
+
+    @property
+    def _path(self) -> Optional[str]:
+        if not self.index_dir:
+            return None
+        name = "kb_all" if self.knowledge_base_id is None else f"kb_{self.knowledge_base_id}"
+        return os.path.join(self.index_dir, name)
+
+    def _scope(self, query):
+        """限定到知识库"""
+        if self.knowledge_base_id is None:
+            return query
+        document_ids = select(KnowledgeDocument.id).where(
+            KnowledgeDocument.knowledge_base_id == self.knowledge_base_id
+        )
+        return query.filter(DocumentChunk.document_id.in_(document_ids))
+
+    # ------------------------------------------------------------------
+    # 构建与同步
+    # ------------------------------------------------------------------
+
+    def open(self, db: Session):
+        """加载磁盘索引并与数据库对账，磁盘索引不可用时整体构建"""
+        with self._lock:
+            if self._load_from_disk():
+                changed = self.reconcile(db)
+                logger.info(
+                    f"BM25索引已从磁盘加载: kb={self.knowledge_base_id}, "
+                    f"分块 {self._alive_count} 个, 对账更新文档 {changed} 个"
+                )
+            else:
+                self.load(db)
+
+    def load(self, db: Session):
+        """从数据库整体构建"""
+        query = self._scope(db.query(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_text))
+        with self._lock:
+            self._reset()
+            for chunk_id, document_id, text in query.order_by(DocumentChunk.id).yield_per(2000):
+                self._add_chunk(chunk_id, document_id, text)
+            self._merge()
+            self._save()
+            self.last_reconciled = time.monotonic()
+
+        logger.info(
+            f"BM25索引构建完成: kb={self.knowledge_base_id}, "
+            f"分块 {self._alive_count} 个, 词项 {len(self._segment.terms)} 个"
+        )
+
+    def reconcile(self, db: Session, documents: Iterable[int] = ()) -> int:
+        """
+        与数据库对账，重新索引签名变化的文档
+
+        Args:
+            db: 数据库会话
+            documents: 需要强制重新索引的文档ID（文本原地修改时签名不变）
+
+        Returns:
+            重新索引或移除的文档数
+        """
+        query = self._scope(db.query(
+            DocumentChunk.document_id, func.count(DocumentChunk.id), func.max(DocumentChunk.id)
+        ).group_by(DocumentChunk.document_id))
+        current = {document_id: (int(count), int(max_id)) for document_id, count, max_id in query.all()}
+
+        with self._lock:
+            changed = {
+                document_id for document_id, signature in current.items()
+                if self._signatures.get(document_id) != signature
+            }
+            changed.update(document_id for document_id in documents if document_id in current)
+            removed = set(self._signatures) - set(current)
+
+            for document_id in changed | removed:
+                self._remove_document(document_id)
+
+            pending = sorted(changed)
+            for start in range(0, len(pending), RELOAD_BATCH_SIZE):
+                rows = db.query(
+                    DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_text
+                ).filter(
+                    DocumentChunk.document_id.in_(pending[start:start + RELOAD_BATCH_SIZE])
+                ).order_by(DocumentChunk.id).all()
+                for chunk_id, document_id, text in rows:
+                    self._add_chunk(chunk_id, document_id, text)
+
+            if changed or removed:
+                self._maybe_merge()
+            self.last_reconciled = time.monotonic()
+            return len(changed | removed)
+
+    def _ensure_capacity(self, size: int):
+        capacity = len(self._chunk_ids)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        for name in ("_chunk_ids", "_document_ids", "_lengths", "_alive"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            setattr(self, name, grown)
+
+    def _add_chunk(self, chunk_id: int, document_id: int, text: Optional[str]):
+        if chunk_id in self._chunk_pos:
+            self._remove_chunk(chunk_id)
+
+        counts = Counter(tokenize(text or ""))
+        length = sum(counts.values())
+
+        pos = self._size
+        self._ensure_capacity(pos + 1)
+        self._size += 1
+        self._chunk_ids[pos] = chunk_id
+        self._document_ids[pos] = document_id
+        self._lengths[pos] = length
+        self._alive[pos] = True
+        self._chunk_pos[chunk_id] = pos
+        self._document_positions.setdefault(document_id, []).append(pos)
+
+        count, max_id = self._signatures.get(document_id, (0, 0))
+        self._signatures[document_id] = (count + 1, max(max_id, chunk_id))
+
+        for term, tf in counts.items():
+            entry = self._delta.get(term)
+            if entry is None:
+                entry = self._delta[term] = ([], [])
+            entry[0].append(pos)
+            entry[1].append(tf)
+
+        self._min_length = length if self._alive_count == 0 else min(self._min_length, length)
+        self._alive_count += 1
+        self._total_length += length
+
+    def _kill(self, pos: int):
+        self._alive[pos] = False
+        self._chunk_pos.pop(int(self._chunk_ids[pos]), None)
+        self._alive_count -= 1
+        self._total_length -= int(self._lengths[pos])
+
+    def _remove_chunk(self, chunk_id: int):
+        pos = self._chunk_pos[chunk_id]
+        document_id = int(self._document_ids[pos])
+        self._kill(pos)
+        positions = self._document_positions.get(document_id, [])
+        positions.remove(pos)
+        if positions:
+            self._signatures[document_id] = (
+                len(positions), int(self._chunk_ids[positions].max())
+            )
+        else:
+            self._document_positions.pop(document_id, None)
+            self._signatures.pop(document_id, None)
+
+    def _remove_document(self, document_id: int):
+        for pos in self._document_positions.pop(document_id, []):
+            self._kill(pos)
+        self._signatures.pop(document_id, None)
+
+    def _term_postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """基础段与增量合并后的倒排表（含已删除分块）"""
+        base = self._segment.postings(term)
+        delta = self._delta.get(term)
+        if delta is None:
+            return base
+        delta_docs = np.asarray(delta[0], dtype=np.int64)
+        delta_tfs = np.asarray(delta[1], dtype=np.int64)
+        if base is None:
+            return delta_docs, delta_tfs
+        return np.concatenate([base[0], delta_docs]), np.concatenate([base[1], delta_tfs])
+
+    def _maybe_merge(self):
+        """增量或删除标记过多时合并段并落盘"""
+        delta_count = self._size - self._base_count
+        dead_count = self._size - self._alive_count
+        threshold = max(MERGE_MIN_DOCUMENTS, self._size * MERGE_RATIO)
+        if delta_count > threshold or dead_count > threshold:
+            self._merge()
+            self._save()
+
+    def _merge(self):
+        """将基础段、增量与删除标记合并为新的基础段（序号压缩）"""
+        alive = self._alive[:self._size]
+        remap = np.cumsum(alive) - 1
+
+        postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term in set(self._segment.terms) | set(self._delta):
+            docs, tfs = self._term_postings(term)
+            keep = alive[docs]
+            if keep.any():
+                postings[term] = (remap[docs[keep]], tfs[keep])
+
+        positions = np.flatnonzero(alive)
+        self._segment = PostingSegment.build(postings)
+        self._chunk_ids = self._chunk_ids[positions]
+        self._document_ids = self._document_ids[positions]
+        self._lengths = self._lengths[positions]
+        self._alive = np.ones(len(positions), dtype=bool)
+        self._size = self._base_count = len(positions)
+        self._delta = {}
+        self._rebuild_lookups()
+
+    def _rebuild_lookups(self):
+        """根据序号数组重建分块/文档映射与统计"""
+        chunk_ids = self._chunk_ids[:self._size]
+        document_ids = self._document_ids[:self._size]
+        self._chunk_pos = {int(chunk_id): pos for pos, chunk_id in enumerate(chunk_ids.tolist())}
+        self._document_positions = {}
+        for pos, document_id in enumerate(document_ids.tolist()):
+            self._document_positions.setdefault(document_id, []).append(pos)
+        self._signatures = {
+            document_id: (len(positions), int(chunk_ids[positions].max()))
+            for document_id, positions in self._document_positions.items()
+        }
+        lengths = self._lengths[:self._size]
+        self._alive_count = self._size
+        self._total_length = int(lengths.sum())
+        self._min_length = int(lengths.min()) if self._size else 0
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def _save(self):
+        """将基础段写入磁盘（先写临时目录再替换）"""
+        path = self._path
+        if path is None:
+            return
+        tmp_path = old_path = None
+        try:
+            # 每次写入使用唯一的临时目录，多个进程同时保存同一知识库时互不干扰
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                                        dir=os.path.dirname(path))
+            old_path = f"{tmp_path}.old"
+            self._segment.save(tmp_path)
+            size = self._base_count
+            np.save(os.path.join(tmp_path, "chunk_ids.npy"), self._chunk_ids[:size])
+            np.save(os.path.join(tmp_path, "document_ids.npy"), self._document_ids[:size])
+            np.save(os.path.join(tmp_path, "lengths.npy"), self._lengths[:size])
+            with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "format_version": SEGMENT_FORMAT_VERSION,
+                    "tokenizer_version": TOKENIZER_VERSION,
+                    "knowledge_base_id": self.knowledge_base_id,
+                    "chunk_count": size
+                }, f)
+
+            try:
+                os.replace(path, old_path)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_path, path)
+        except Exception as e:
+            # 落盘失败（含其他进程抢先替换）时仍可使用内存索引
+            logger.warning(f"写入BM25索引失败: {path}, 错误: {e}")
+        finally:
+            for leftover in (tmp_path, old_path):
+                if leftover is not None:
+                    shutil.rmtree(leftover, ignore_errors=True)
+
+    def _load_from_disk(self) -> bool:
+        """加载磁盘上的基础段，格式或分词版本不一致时返回 False"""
+        path = self._path
+        if path is None or not os.path.exists(os.path.join(path, "meta.json")):
+            return False
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if (meta.get("format_version") != SEGMENT_FORMAT_VERSION
+                    or meta.get("tokenizer_version") != TOKENIZER_VERSION):
+                return False
+
+            segment = PostingSegment.load(path)
+            chunk_ids = np.load(os.path.join(path, "chunk_ids.npy"))
+            document_ids = np.load(os.path.join(path, "document_ids.npy"))
+            lengths = np.load(os.path.join(path, "lengths.npy"))
+            if not (len(chunk_ids) == len(document_ids) == len(lengths) == meta.get("chunk_count")):
+                return False
+        except Exception as e:
+            logger.warning(f"加载BM25索引失败: {path}, 错误: {e}")
+            return False
+
+        self._reset()
+        self._segment = segment
+        self._chunk_ids = chunk_ids.astype(np.int64)
+        self._document_ids = document_ids.astype(np.int64)
+        self._lengths = lengths.astype(np.int64)
+        self._alive = np.ones(len(chunk_ids), dtype=bool)
+        self._size = self._base_count = len(chunk_ids)
+        self._rebuild_lookups()
+        return True
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """
+        BM25 检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+
+        Returns:
+            (分块ID, BM25分数) 列表，按分数降序
+        """
+        query_terms = Counter(tokenize(query))
+
+        with self._lock:
+            if not query_terms or top_k <= 0 or self._alive_count == 0:
+                return []
+
+            k1, b = self.k1, self.b
+            doc_count = self._alive_count
+            avg_length = max(self._total_length / doc_count, 1e-9)
+            min_norm = k1 * (1 - b + b * self._min_length / avg_length)
+
+            # (词项, 查询词频 × idf, 得分上界)
+            plan = []
+            for term, query_tf in query_terms.items():
+                delta = self._delta.get(term)
+                doc_freq = self._segment.doc_freq(term) + (len(delta[0]) if delta else 0)
+                if doc_freq == 0:
+                    continue
+                idf = math.log(1 + (max(doc_count - doc_freq, 0) + 0.5) / (doc_freq + 0.5))
+                max_tf = max(self._segment.max_tf(term), max(delta[1]) if delta else 0)
+                weight = query_tf * idf
+                plan.append((term, weight, weight * max_tf * (k1 + 1) / (max_tf + min_norm)))
+            if not plan:
+                return []
+            plan.sort(key=lambda item: item[2], reverse=True)
+
+            size = self._size
+            alive = self._alive[:size]
+            lengths = self._lengths[:size]
+            scores = np.zeros(size, dtype=np.float64)
+            member = np.zeros(size, dtype=bool)
+            candidates = np.zeros(0, dtype=np.int64)
+            # remaining_bounds[i]: 第 i 个词项之后全部词项的上界之和（末项为精确的 0）
+            remaining_bounds = [0.0] * len(plan)
+            for i in range(len(plan) - 2, -1, -1):
+                remaining_bounds[i] = remaining_bounds[i + 1] + plan[i + 1][2]
+            pruning = False
+
+            for (term, weight, _), remaining in zip(plan, remaining_bounds):
+                docs, tfs = self._term_postings(term)
+                if pruning:
+                    # 未出现过的分块得分上限不超过剩余上界之和，不可能进入 top-k
+                    keep = member[docs]
+                    docs, tfs = docs[keep], tfs[keep]
+                else:
+                    keep = alive[docs]
+                    docs, tfs = docs[keep], tfs[keep]
+                    new = docs[~member[docs]]
+                    member[new] = True
+                    candidates = np.concatenate([candidates, new])
+                if docs.size:
+                    norm = k1 * (1 - b + b * lengths[docs] / avg_length)
+                    scores[docs] += weight * tfs * (k1 + 1) / (tfs + norm)
+
+                if len(candidates) >= top_k:
+                    threshold = np.partition(scores[candidates], -top_k)[-top_k]
+                    if not pruning and threshold > remaining:
+                        pruning = True
+                    if pruning:
+                        drop = scores[candidates] + remaining < threshold
+                        member[candidates[drop]] = False
+                        candidates = candidates[~drop]
+
+            candidate_scores = scores[candidates]
+            if len(candidates) > top_k:
+                # 保留不低于第 k 名的候选（含并列），再按 (分数降序, 分块ID升序) 排序
+                kth = np.partition(candidate_scores, -top_k)[-top_k]
+                keep = candidate_scores >= kth
+                candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+            chunk_ids = self._chunk_ids[candidates]
+            order = np.lexsort((chunk_ids, -candidate_scores))[:top_k]
+            return [(int(chunk_ids[i]), float(candidate_scores[i])) for i in order]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """索引统计"""
+        with self._lock:
+            return {
+                "knowledge_base_id": self.knowledge_base_id,
+                "chunk_count": self._alive_count,
+                "document_count": len(self._signatures),
+                "segment_terms": len(self._segment.terms),
+                "segment_bytes": int(self._segment.data.nbytes),
+                "delta_chunks": self._size - self._base_count,
+                "deleted_chunks": self._size - self._alive_count,
+                "avg_length": self._total_length / self._alive_count if self._alive_count else 0.0
+            }
+
+
+class BM25IndexRegistry:
+    """
+    BM25 索引注册表
+
+    按知识库懒加载索引（None 表示不限知识库）。分块写入提交后索引被标记为待对账，
+    下一次访问时按文档签名增量同步；无写入通知时也会按 bm25_reconcile_interval 定期对账，
+    以覆盖其他进程的写入。
+    """
+
+    def __init__(self, index_dir: Optional[str] = None):
+        self.index_dir = index_dir
+        self._indexes: Dict[Optional[int], ChunkBM25Index] = {}
+        self._stale: Set[Optional[int]] = set()
+        self._forced_documents: Dict[Optional[int], Set[int]] = {}
+        self._building: Dict[Optional[int], threading.Lock] = {}
+        self._invalidations: Dict[Optional[int], int] = {}
+        self._lock = threading.RLock()
+
+    def get_index(self, db: Session, knowledge_base_id: Optional[int] = None) -> ChunkBM25Index:
+        """获取知识库索引（必要时加载或对账）"""
+        with self._lock:
+            index = self._indexes.get(knowledge_base_id)
+            if index is None:
+                build_lock = self._building.setdefault(knowledge_base_id, threading.Lock())
+            elif (knowledge_base_id in self._stale
+                  or time.monotonic() - index.last_reconciled > settings.bm25_reconcile_interval):
+                self._stale.discard(knowledge_base_id)
+                forced = self._forced_documents.pop(knowledge_base_id, ())
+            else:
+                return index
+
+        if index is not None:
+            # 对账只持有该索引自身的锁，不阻塞其他知识库
+            index.reconcile(db, forced)
+            return index
+        return self._build_index(db, knowledge_base_id, build_lock)
+
+    def _build_index(self, db: Session, knowledge_base_id: Optional[int],
+                     build_lock: threading.Lock) -> ChunkBM25Index:
+        """在注册表锁之外冷启动构建索引，完成后放入注册表（同一知识库只构建一次）"""
+        with build_lock:
+            with self._lock:
+                index = self._indexes.get(knowledge_base_id)
+                if index is not None:
+                    return index
+                # 构建期间的写入会重新标记为待对账
+                self._stale.discard(knowledge_base_id)
+                self._forced_documents.pop(knowledge_base_id, None)
+                invalidations = self._invalidations.get(knowledge_base_id, 0)
+
+            index = ChunkBM25Index(knowledge_base_id, self.index_dir)
+            index.open(db)
+
+            with self._lock:
+                self._building.pop(knowledge_base_id, None)
+                if self._invalidations.get(knowledge_base_id, 0) == invalidations:
+                    self._indexes[knowledge_base_id] = index
+            return index
+
+    def search(self, db: Session, query: str, top_k: int = 10,
+               knowledge_base_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """在知识库索引中检索，返回 (分块ID, 分数)"""
+        return self.get_index(db, knowledge_base_id).search(query, top_k)
+
+    def mark_changed(self, documents: Iterable[int] = ()):
+        """
+        标记分块发生写入（由会话事件调用）
+
+        Args:
+            documents: 文本被原地修改的文档ID（签名无法发现此类变化）
+        """
+        documents = set(documents)
+        with self._lock:
+            for knowledge_base_id in set(self._indexes) | set(self._building):
+                self._stale.add(knowledge_base_id)
+                if documents:
+                    self._forced_documents.setdefault(knowledge_base_id, set()).update(documents)
+
+    def invalidate(self, knowledge_base_id: Optional[int] = None):
+        """丢弃指定知识库（None 表示全部）的内存索引，下次访问时重新加载"""
+        with self._lock:
+            if knowledge_base_id is None:
+                for key in set(self._indexes) | set(self._building):
+                    self._invalidations[key] = self._invalidations.get(key, 0) + 1
+                self._indexes.clear()
+                self._stale.clear()
+                self._forced_documents.clear()
+            else:
+                self._invalidations[knowledge_base_id] = self._invalidations.get(knowledge_base_id, 0) + 1
+                self._indexes.pop(knowledge_base_id, None)
+                self._stale.discard(knowledge_base_id)
+                self._forced_documents.pop(knowledge_base_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """全部索引统计"""
+        with self._lock:
+            return {
+                "indexes": [index.get_stats() for index in self._indexes.values()],
+                "stale": len(self._stale)
+            }
+
+
+bm25_index_registry = BM25IndexRegistry(getattr(settings, 'bm25_index_dir', None))
+
+
+# ----------------------------------------------------------------------
+# 会话事件：分块写入提交后标记索引待对账
+# ----------------------------------------------------------------------
+
+_CHANGED_KEY = "bm25_index_changed"
+_DOCUMENTS_KEY = "bm25_index_documents"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_chunk_changes(session: Session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, DocumentChunk):
+            continue
+        session.info[_CHANGED_KEY] = True
+        if obj in session.dirty and inspect(obj).attrs.chunk_text.history.has_changes():
+            session.info.setdefault(_DOCUMENTS_KEY, set()).add(obj.document_id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _detect_bulk_chunk_writes(orm_execute_state):
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    table = getattr(orm_execute_state.statement, "table", None)
+    if (mapper is not None and mapper.class_ is DocumentChunk) or table is DocumentChunk.__table__:
+        orm_execute_state.session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_chunk_changes(session: Session):
+    changed = session.info.pop(_CHANGED_KEY, False)
+    documents = session.info.pop(_DOCUMENTS_KEY, None)
+    if changed:
+        bm25_index_registry.mark_changed(documents or ())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_chunk_changes(session: Session):
+    session.info.pop(_CHANGED_KEY, None)
+    session.info.pop(_DOCUMENTS_KEY, None)
@@ -1,13 +1,14 @@
 """
 一体化检索服务 - 向量化管理模块优化
 
-整合向量、实体、图谱三种检索方式，实现统一的检索接口。
+整合向量、关键词（BM25）、实体、图谱检索方式，实现统一的检索接口。
 支持RRF融合算法和加权融合算法。
 
 任务编号: BE-011
 阶段: Phase 3 - 一体化建设期
 """
 
+import json
 import logging
 import asyncio
 from typing import Dict, Any, List, Optional, Tuple, Union
@@ -17,7 +18,7 @@ from enum import Enum
 import numpy as np
 
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, and_
+from sqlalchemy import func, or_, and_, select, union_all, literal
 
 from app.core.database import get_db_pool
 from app.modules.knowledge.models.unified_knowledge_unit import (
@@ -28,11 +29,13 @@ from app.modules.knowledge.models.unified_knowledge_unit import (
 )
 from app.modules.knowledge.models.knowledge_document import (
     DocumentEntity,
-    EntityRelationship,
-    DocumentChunk
+    DocumentChunk,
+    KnowledgeDocument
 )
 from app.services.knowledge.vectorization.chroma_service import ChromaService
 from app.services.knowledge.retrieval.cached_retrieval_service import CachedRetrievalService
+from app.services.knowledge.graph.graph_index import KnowledgeBaseGraphIndex, graph_index_registry
+from app.services.knowledge.retrieval.bm25_index import bm25_index_registry
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +43,7 @@ logger = logging.getLogger(__name__)
 class RetrievalType(Enum):
     """检索类型"""
     VECTOR = "vector"           # 向量检索
+    KEYWORD = "keyword"         # 关键词检索（BM25）
     ENTITY = "entity"           # 实体检索
     GRAPH = "graph"             # 图谱检索
     HYBRID = "hybrid"           # 混合检索
@@ -89,6 +93,7 @@ class UnifiedSearchRequest:
     vector_weight: float = 0.5
     entity_weight: float = 0.3
     graph_weight: float = 0.2
+    keyword_weight: float = 0.0  # 加权融合使用关键词检索时需显式设置
     
     # RRF参数
     rrf_k: int = 60
@@ -100,12 +105,13 @@ class UnifiedSearchRequest:
     
     def __post_init__(self):
         """验证权重"""
-        total_weight = self.vector_weight + self.entity_weight + self.graph_weight
+        total_weight = self.vector_weight + self.entity_weight + self.graph_weight + self.keyword_weight
         if abs(total_weight - 1.0) > 0.001:
             # 归一化权重
             self.vector_weight /= total_weight
             self.entity_weight /= total_weight
             self.graph_weight /= total_weight
+            self.keyword_weight /= total_weight
 
 
 @dataclass
@@ -140,6 +146,55 @@ class UnifiedSearchResponse:
         }
 
 
+def _match_entities_batch(
+    db: Session,
+    queries: List[str],
+    knowledge_base_id: Optional[int] = None,
+    entity_types: Optional[List[str]] = None,
+    limit: Optional[int] = None
+) -> List[List[int]]:
+    """
+    批量匹配实体（UNION ALL 合并各查询的匹配子查询，一次数据库往返）
+    
+    Args:
+        db: 数据库会话
+        queries: 查询文本列表
+        knowledge_base_id: 知识库ID过滤
+        entity_types: 实体类型过滤
+        limit: 每个查询的最大匹配数
+        
+    Returns:
+        与 queries 一一对应的实体ID列表
+    """
+    parts = []
+    for index, query in enumerate(queries):
+        condition = or_(
+            DocumentEntity.entity_text.ilike(f"%{query}%"),
+            DocumentEntity.entity_type.ilike(f"%{query}%")
+        )
+        if knowledge_base_id:
+            condition = and_(
+                condition,
+                DocumentEntity.document.has(knowledge_base_id=knowledge_base_id)
+            )
+        if entity_types:
+            condition = and_(condition, DocumentEntity.entity_type.in_(entity_types))
+        
+        inner = select(
+            DocumentEntity.id.label("entity_id"),
+            literal(index).label("query_index")
+        ).where(condition)
+        if limit:
+            inner = inner.limit(limit)
+        inner = inner.subquery()
+        parts.append(select(inner.c.entity_id, inner.c.query_index))
+    
+    matches: List[List[int]] = [[] for _ in queries]
+    for entity_id, query_index in db.execute(union_all(*parts)).all():
+        matches[query_index].append(entity_id)
+    return matches
+
+
 class VectorRetrievalEngine:
     """向量检索引擎"""
     
@@ -166,36 +221,14 @@ class VectorRetrievalEngine:
             搜索结果列表
         """
         try:
-            # 构建过滤条件
-            where_filter = {}
-            if knowledge_base_id:
-                where_filter["knowledge_base_id"] = knowledge_base_id
-            if filters:
-                where_filter.update(filters)
-            
             # 执行向量搜索
             results = self.chroma_service.search_similar(
                 query=query,
-                n_results=top_k * 2,  # 获取更多用于融合
-                where_filter=where_filter if where_filter else None
+                top_k=top_k * 2,  # 获取更多用于融合
+                filters=self._build_where_filter(knowledge_base_id, filters)
             )
             
-            # 格式化结果
-            search_results = []
-            if results and results.get('ids') and results['ids'][0]:
-                for i, doc_id in enumerate(results['ids'][0]):
-                    score = 1 - results['distances'][0][i] if 'distances' in results else 0.5
-                    metadata = results['metadatas'][0][i] if results.get('metadatas') else {}
-                    
-                    search_results.append(SearchResult(
-                        id=str(doc_id),
-                        content=results['documents'][0][i] if results.get('documents') else "",
-                        score=score,
-                        source_type=RetrievalType.VECTOR,
-                        metadata=metadata,
-                        title=metadata.get('title', '无标题'),
-                        knowledge_base_id=metadata.get('knowledge_base_id')
-                    ))
+            search_results = self._format_results(results)
             
             logger.info(f"向量检索完成: {len(search_results)} 个结果")
             return search_results
@@ -203,6 +236,183 @@ class VectorRetrievalEngine:
         except Exception as e:
             logger.error(f"向量检索失败: {e}")
             return []
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        knowledge_base_id: Optional[int] = None,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[SearchResult]]:
+        """
+        批量执行向量检索（一次嵌入全部查询，一次多查询检索）
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+            knowledge_base_id: 知识库ID过滤
+            filters: 其他过滤条件
+            
+        Returns:
+            与 queries 一一对应的搜索结果列表
+        """
+        try:
+            batch_results = self.chroma_service.search_similar_batch(
+                queries=queries,
+                top_k=top_k * 2,  # 获取更多用于融合
+                filters=self._build_where_filter(knowledge_base_id, filters)
+            )
+            
+            search_results = [self._format_results(results) for results in batch_results]
+            
+            logger.info(f"批量向量检索完成: {len(queries)} 个查询")
+            return search_results
+            
+        except Exception as e:
+            logger.error(f"批量向量检索失败: {e}")
+            return [[] for _ in queries]
+    
+    @staticmethod
+    def _build_where_filter(
+        knowledge_base_id: Optional[int],
+        filters: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """构建向量库过滤条件"""
+        where_filter = {}
+        if knowledge_base_id:
+            where_filter["knowledge_base_id"] = knowledge_base_id
+        if filters:
+            where_filter.update(filters)
+        return where_filter if where_filter else None
+    
+    @staticmethod
+    def _format_results(results: List[Dict[str, Any]]) -> List[SearchResult]:
+        """将 ChromaService 返回的结果格式化为 SearchResult"""
+        search_results = []
+        for item in results or []:
+            metadata = item.get('metadata') or {}
+            search_results.append(SearchResult(
+                id=str(item.get('id')),
+                content=item.get('document', ""),
+                score=1 - item['distance'] if 'distance' in item else 0.5,
+                source_type=RetrievalType.VECTOR,
+                metadata=metadata,
+                title=metadata.get('title', '无标题'),
+                knowledge_base_id=metadata.get('knowledge_base_id')
+            ))
+        return search_results
+
+
+class KeywordRetrievalEngine:
+    """
+    关键词检索引擎
+    
+    基于文档分块的 BM25 倒排索引，弥补向量检索对型号、错误码等精确词项的召回不足。
+    结果ID优先使用分块的向量ID，使 RRF 融合能合并同一分块的向量与关键词命中。
+    """
+    
+    def __init__(self):
+        self.db_pool = get_db_pool()
+    
+    def search(
+        self,
+        query: str,
+        top_k: int = 10,
+        knowledge_base_id: Optional[int] = None
+    ) -> List[SearchResult]:
+        """
+        执行关键词检索
+        
+        Args:
+            query: 查询文本
+            top_k: 返回结果数量
+            knowledge_base_id: 知识库ID过滤
+            
+        Returns:
+            搜索结果列表
+        """
+        try:
+            search_results = self._search([query], top_k, knowledge_base_id)[0]
+            logger.info(f"关键词检索完成: {len(search_results)} 个结果")
+            return search_results
+        except Exception as e:
+            logger.error(f"关键词检索失败: {e}")
+            return []
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        knowledge_base_id: Optional[int] = None
+    ) -> List[List[SearchResult]]:
+        """
+        批量执行关键词检索（共用一次索引同步，命中分块一次性加载）
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+            knowledge_base_id: 知识库ID过滤
+            
+        Returns:
+            与 queries 一一对应的搜索结果列表
+        """
+        if not queries:
+            return []
+        
+        try:
+            batch_results = self._search(queries, top_k, knowledge_base_id)
+            logger.info(f"批量关键词检索完成: {len(queries)} 个查询")
+            return batch_results
+        except Exception as e:
+            logger.error(f"批量关键词检索失败: {e}")
+            return [[] for _ in queries]
+    
+    def _search(
+        self,
+        queries: List[str],
+        top_k: int,
+        knowledge_base_id: Optional[int]
+    ) -> List[List[SearchResult]]:
+        with self.db_pool.get_db_session() as db:
+            index = bm25_index_registry.get_index(db, knowledge_base_id)
+            # 与向量检索一致，获取更多候选用于融合
+            hits = [index.search(query, top_k * 2) for query in queries]
+            
+            chunk_ids = {chunk_id for query_hits in hits for chunk_id, _ in query_hits}
+            rows = {
+                row.id: row
+                for row in db.query(
+                    DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.chunk_text,
+                    DocumentChunk.chunk_index, DocumentChunk.vector_id,
+                    KnowledgeDocument.title, KnowledgeDocument.knowledge_base_id
+                ).join(
+                    KnowledgeDocument, KnowledgeDocument.id == DocumentChunk.document_id
+                ).filter(DocumentChunk.id.in_(chunk_ids)).all()
+            } if chunk_ids else {}
+            
+            batch_results = []
+            for query_hits in hits:
+                search_results = []
+                for chunk_id, score in query_hits:
+                    row = rows.get(chunk_id)
+                    if row is None:
+                        continue
+                    search_results.append(SearchResult(
+                        id=row.vector_id or f"chunk_{row.id}",
+                        content=row.chunk_text,
+                        score=score,
+                        source_type=RetrievalType.KEYWORD,
+                        metadata={
+                            "chunk_id": row.id,
+                            "document_id": row.document_id,
+                            "chunk_index": row.chunk_index,
+                            "bm25_score": score
+                        },
+                        title=row.title,
+                        knowledge_base_id=row.knowledge_base_id
+                    ))
+                batch_results.append(search_results)
+            return batch_results
 
 
 class EntityRetrievalEngine:
@@ -287,6 +497,75 @@ class EntityRetrievalEngine:
             logger.error(f"实体检索失败: {e}")
             return []
     
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        knowledge_base_id: Optional[int] = None,
+        entity_types: Optional[List[str]] = None
+    ) -> List[List[SearchResult]]:
+        """
+        批量执行实体检索
+        
+        每个查询的匹配子查询通过 UNION ALL 合并为一条 SQL，
+        再一次性加载命中的实体，共两次数据库往返。
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+            knowledge_base_id: 知识库ID过滤
+            entity_types: 实体类型过滤
+            
+        Returns:
+            与 queries 一一对应的搜索结果列表
+        """
+        if not queries:
+            return []
+        
+        try:
+            with self.db_pool.get_db_session() as db:
+                matches = _match_entities_batch(
+                    db, queries, knowledge_base_id,
+                    entity_types=entity_types, limit=top_k * 2
+                )
+                entity_ids = {entity_id for ids in matches for entity_id in ids}
+                entities = {
+                    entity.id: entity
+                    for entity in db.query(DocumentEntity).filter(DocumentEntity.id.in_(entity_ids)).all()
+                } if entity_ids else {}
+                
+                batch_results = []
+                for query, ids in zip(queries, matches):
+                    search_results = []
+                    for entity_id in ids:
+                        entity = entities.get(entity_id)
+                        if entity is None:
+                            continue
+                        search_results.append(SearchResult(
+                            id=f"entity_{entity.id}",
+                            content=entity.entity_text,
+                            score=self._calculate_entity_score(query, entity),
+                            source_type=RetrievalType.ENTITY,
+                            metadata={
+                                "entity_type": entity.entity_type,
+                                "confidence": entity.confidence,
+                                "document_id": entity.document_id,
+                                "start_pos": entity.start_pos,
+                                "end_pos": entity.end_pos
+                            },
+                            title=f"实体: {entity.entity_text}",
+                            knowledge_base_id=knowledge_base_id
+                        ))
+                    search_results.sort(key=lambda x: x.score, reverse=True)
+                    batch_results.append(search_results[:top_k])
+                
+                logger.info(f"批量实体检索完成: {len(queries)} 个查询")
+                return batch_results
+                
+        except Exception as e:
+            logger.error(f"批量实体检索失败: {e}")
+            return [[] for _ in queries]
+    
     def _calculate_entity_score(self, query: str, entity: DocumentEntity) -> float:
         """计算实体匹配分数"""
         query_lower = query.lower()
@@ -312,17 +591,76 @@ class EntityRetrievalEngine:
 
 
 class GraphRetrievalEngine:
-    """图谱检索引擎"""
+    """
+    图谱检索引擎
+    
+    实体匹配与关系扩展基于进程内图索引（CSR 邻接 + 实体文本二元组索引），
+    不再逐条关系回查端点实体。
+    """
+    
+    # 多跳扩展时每跳的分数衰减
+    HOP_DECAY = 0.7
     
     def __init__(self):
         self.db_pool = get_db_pool()
     
+    def _to_search_result(
+        self,
+        index: KnowledgeBaseGraphIndex,
+        edge: int,
+        hop: int,
+        score_factor: float,
+        knowledge_base_id: Optional[int]
+    ) -> SearchResult:
+        """关系位置 -> 搜索结果"""
+        rel = index.describe_relationship(edge)
+        return SearchResult(
+            id=f"rel_{rel['id']}",
+            content=f"{rel['source_entity']} --[{rel['relationship_type']}]--> {rel['target_entity']}",
+            score=rel["confidence"] * score_factor * (self.HOP_DECAY ** (hop - 1)),
+            source_type=RetrievalType.GRAPH,
+            metadata={
+                "relationship_type": rel["relationship_type"],
+                "confidence": rel["confidence"],
+                "source_entity": rel["source_entity"],
+                "target_entity": rel["target_entity"],
+                "source_type": rel["source_type"],
+                "target_type": rel["target_type"],
+                "document_id": rel["document_id"],
+                "hop": hop
+            },
+            title=f"关系: {rel['relationship_type']}",
+            knowledge_base_id=knowledge_base_id
+        )
+    
+    def _search_in_index(
+        self,
+        index: KnowledgeBaseGraphIndex,
+        query: str,
+        top_k: int,
+        knowledge_base_id: Optional[int],
+        relationship_types: Optional[List[str]],
+        depth: int = 1
+    ) -> List[SearchResult]:
+        """在图索引中执行单个查询"""
+        positions = index.match_entities(query)
+        if not positions:
+            return []
+        
+        search_results = [
+            self._to_search_result(index, edge, hop, 0.8, knowledge_base_id)
+            for edge, hop in index.traverse(positions, depth, relationship_types)
+        ]
+        search_results.sort(key=lambda x: x.score, reverse=True)
+        return search_results[:top_k]
+    
     def search(
         self,
         query: str,
         top_k: int = 10,
         knowledge_base_id: Optional[int] = None,
-        relationship_types: Optional[List[str]] = None
+        relationship_types: Optional[List[str]] = None,
+        depth: int = 1
     ) -> List[SearchResult]:
         """
         执行图谱检索
@@ -332,87 +670,68 @@ class GraphRetrievalEngine:
             top_k: 返回结果数量
             knowledge_base_id: 知识库ID过滤
             relationship_types: 关系类型过滤
+            depth: 关系扩展跳数
             
         Returns:
             搜索结果列表
         """
         try:
             with self.db_pool.get_db_session() as db:
-                # 1. 先找到匹配的实体
-                entity_filter = or_(
-                    DocumentEntity.entity_text.ilike(f"%{query}%"),
-                    DocumentEntity.entity_type.ilike(f"%{query}%")
-                )
-                
-                if knowledge_base_id:
-                    entity_filter = and_(
-                        entity_filter,
-                        DocumentEntity.document.has(knowledge_base_id=knowledge_base_id)
-                    )
-                
-                matching_entities = db.query(DocumentEntity).filter(entity_filter).all()
-                entity_ids = [e.id for e in matching_entities]
-                
-                if not entity_ids:
-                    logger.info("图谱检索: 未找到匹配实体")
-                    return []
-                
-                # 2. 查找与这些实体相关的关系
-                rel_filter = or_(
-                    EntityRelationship.source_id.in_(entity_ids),
-                    EntityRelationship.target_id.in_(entity_ids)
-                )
-                
-                if relationship_types:
-                    rel_filter = and_(
-                        rel_filter,
-                        EntityRelationship.relationship_type.in_(relationship_types)
-                    )
-                
-                relationships = db.query(EntityRelationship).filter(rel_filter).limit(top_k * 2).all()
-                
-                # 3. 格式化结果
-                search_results = []
-                for rel in relationships:
-                    # 获取源实体和目标实体
-                    source = db.query(DocumentEntity).get(rel.source_id)
-                    target = db.query(DocumentEntity).get(rel.target_id)
-                    
-                    if source and target:
-                        # 构建关系描述
-                        content = f"{source.entity_text} --[{rel.relationship_type}]--> {target.entity_text}"
-                        
-                        # 计算分数
-                        score = rel.confidence * 0.8
-                        
-                        search_results.append(SearchResult(
-                            id=f"rel_{rel.id}",
-                            content=content,
-                            score=score,
-                            source_type=RetrievalType.GRAPH,
-                            metadata={
-                                "relationship_type": rel.relationship_type,
-                                "confidence": rel.confidence,
-                                "source_entity": source.entity_text,
-                                "target_entity": target.entity_text,
-                                "source_type": source.entity_type,
-                                "target_type": target.entity_type,
-                                "document_id": rel.document_id
-                            },
-                            title=f"关系: {rel.relationship_type}",
-                            knowledge_base_id=knowledge_base_id
-                        ))
-                
-                # 按分数排序
-                search_results.sort(key=lambda x: x.score, reverse=True)
-                
+                index = graph_index_registry.get_index(db, knowledge_base_id)
+            
+            search_results = self._search_in_index(
+                index, query, top_k, knowledge_base_id, relationship_types, depth
+            )
+            if not search_results:
+                logger.info("图谱检索: 未找到匹配实体或关系")
+            else:
                 logger.info(f"图谱检索完成: {len(search_results)} 个结果")
-                return search_results[:top_k]
+            return search_results
                 
         except Exception as e:
             logger.error(f"图谱检索失败: {e}")
             return []
     
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 10,
+        knowledge_base_id: Optional[int] = None,
+        relationship_types: Optional[List[str]] = None
+    ) -> List[List[SearchResult]]:
+        """
+        批量执行图谱检索
+        
+        全部查询共享同一个图索引，不访问数据库（索引未加载时除外）。
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+            knowledge_base_id: 知识库ID过滤
+            relationship_types: 关系类型过滤
+            
+        Returns:
+            与 queries 一一对应的搜索结果列表
+        """
+        if not queries:
+            return []
+        
+        try:
+            with self.db_pool.get_db_session() as db:
+                index = graph_index_registry.get_index(db, knowledge_base_id)
+            
+            batch_results = [
+                self._search_in_index(index, query, top_k, knowledge_base_id, relationship_types)
+                for query in queries
+            ]
+            
+            logger.info(f"批量图谱检索完成: {len(queries)} 个查询")
+            return batch_results
+                
+        except Exception as e:
+            logger.error(f"批量图谱检索失败: {e}")
+            return [[] for _ in queries]
+    
     def search_by_entity(
         self,
         entity_id: int,
@@ -424,7 +743,7 @@ class GraphRetrievalEngine:
         
         Args:
             entity_id: 实体ID
-            depth: 搜索深度
+            depth: 搜索深度（一次广度优先遍历完成多跳扩展）
             knowledge_base_id: 知识库ID过滤
             
         Returns:
@@ -432,37 +751,19 @@ class GraphRetrievalEngine:
         """
         try:
             with self.db_pool.get_db_session() as db:
-                # 获取直接关联的关系
-                relationships = db.query(EntityRelationship).filter(
-                    or_(
-                        EntityRelationship.source_id == entity_id,
-                        EntityRelationship.target_id == entity_id
-                    )
-                ).all()
-                
-                search_results = []
-                for rel in relationships:
-                    source = db.query(DocumentEntity).get(rel.source_id)
-                    target = db.query(DocumentEntity).get(rel.target_id)
-                    
-                    if source and target:
-                        content = f"{source.entity_text} --[{rel.relationship_type}]--> {target.entity_text}"
-                        
-                        search_results.append(SearchResult(
-                            id=f"rel_{rel.id}",
-                            content=content,
-                            score=rel.confidence,
-                            source_type=RetrievalType.GRAPH,
-                            metadata={
-                                "relationship_type": rel.relationship_type,
-                                "source_entity": source.entity_text,
-                                "target_entity": target.entity_text,
-                                "is_source": rel.source_id == entity_id
-                            },
-                            title=f"关系: {rel.relationship_type}"
-                        ))
-                
-                return search_results
+                index = graph_index_registry.get_index(db, knowledge_base_id)
+            
+            position = index.get_entity_position(entity_id)
+            if position is None:
+                return []
+            
+            search_results = []
+            for edge, hop in index.traverse([position], depth):
+                result = self._to_search_result(index, edge, hop, 1.0, knowledge_base_id)
+                result.metadata["is_source"] = index.rel_source[edge] == position
+                search_results.append(result)
+            
+            return search_results
                 
         except Exception as e:
             logger.error(f"实体图谱检索失败: {e}")
@@ -625,7 +926,7 @@ class UnifiedRetrievalService:
     """
     一体化检索服务
     
-    整合向量、实体、图谱三种检索方式，提供统一的检索接口。
+    整合向量、关键词、实体、图谱检索方式，提供统一的检索接口。
     支持多种融合算法：RRF、加权融合、线性融合。
     
     特性：
@@ -638,6 +939,7 @@ class UnifiedRetrievalService:
     def __init__(self):
         """初始化一体化检索服务"""
         self.vector_engine = VectorRetrievalEngine()
+        self.keyword_engine = KeywordRetrievalEngine()
         self.entity_engine = EntityRetrievalEngine()
         self.graph_engine = GraphRetrievalEngine()
         self.fusion_engine = ResultFusionEngine()
@@ -669,6 +971,14 @@ class UnifiedRetrievalService:
                 )
                 results_by_type[RetrievalType.VECTOR] = results
                 
+            elif retrieval_type == RetrievalType.KEYWORD:
+                results = self.keyword_engine.search(
+                    query=request.query,
+                    top_k=request.top_k,
+                    knowledge_base_id=request.knowledge_base_id
+                )
+                results_by_type[RetrievalType.KEYWORD] = results
+                
             elif retrieval_type == RetrievalType.ENTITY:
                 results = self.entity_engine.search(
                     query=request.query,
@@ -712,6 +1022,7 @@ class UnifiedRetrievalService:
                     "rrf_k": request.rrf_k if request.fusion_algorithm == FusionAlgorithm.RRF else None,
                     "weights": {
                         "vector": request.vector_weight,
+                        "keyword": request.keyword_weight,
                         "entity": request.entity_weight,
                         "graph": request.graph_weight
                     } if request.fusion_algorithm == FusionAlgorithm.WEIGHTED else None
@@ -747,6 +1058,16 @@ class UnifiedRetrievalService:
                 tasks.append(task)
                 retrieval_types.append(RetrievalType.VECTOR)
                 
+            elif retrieval_type == RetrievalType.KEYWORD:
+                task = asyncio.to_thread(
+                    self.keyword_engine.search,
+                    request.query,
+                    request.top_k,
+                    request.knowledge_base_id
+                )
+                tasks.append(task)
+                retrieval_types.append(RetrievalType.KEYWORD)
+                
             elif retrieval_type == RetrievalType.ENTITY:
                 task = asyncio.to_thread(
                     self.entity_engine.search,
@@ -803,6 +1124,160 @@ class UnifiedRetrievalService:
             processing_time_ms=processing_time
         )
     
+    def search_batch(self, requests: List[UnifiedSearchRequest]) -> List[UnifiedSearchResponse]:
+        """
+        批量执行统一检索
+        
+        按检索参数（知识库、过滤条件等）将请求分组，每组每种检索类型
+        只调用一次引擎的批量接口，然后逐个请求融合结果。
+        
+        Args:
+            requests: 搜索请求列表
+            
+        Returns:
+            与 requests 一一对应的搜索响应列表
+        """
+        start_time = datetime.now()
+        
+        results_by_request = [{} for _ in requests]
+        for retrieval_type, group_key, indices in self._group_batch_requests(requests):
+            batch_results = self._run_engine_batch(retrieval_type, [requests[i] for i in indices])
+            for i, results in zip(indices, batch_results):
+                results_by_request[i][retrieval_type] = results
+        
+        processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+        return [
+            self._build_response(request, self._order_results(request, results_by_type), processing_time)
+            for request, results_by_type in zip(requests, results_by_request)
+        ]
+    
+    async def search_batch_async(self, requests: List[UnifiedSearchRequest]) -> List[UnifiedSearchResponse]:
+        """
+        异步批量执行统一检索（各分组的引擎批量调用并行执行）
+        
+        Args:
+            requests: 搜索请求列表
+            
+        Returns:
+            与 requests 一一对应的搜索响应列表
+        """
+        start_time = datetime.now()
+        
+        groups = self._group_batch_requests(requests)
+        tasks = [
+            asyncio.to_thread(self._run_engine_batch, retrieval_type, [requests[i] for i in indices])
+            for retrieval_type, _, indices in groups
+        ]
+        batch_results_list = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        results_by_request = [{} for _ in requests]
+        for (retrieval_type, _, indices), batch_results in zip(groups, batch_results_list):
+            if isinstance(batch_results, Exception):
+                logger.error(f"{retrieval_type.value} 批量检索失败: {batch_results}")
+                batch_results = [[] for _ in indices]
+            for i, results in zip(indices, batch_results):
+                results_by_request[i][retrieval_type] = results
+        
+        processing_time = int((datetime.now() - start_time).total_seconds() * 1000)
+        return [
+            self._build_response(request, self._order_results(request, results_by_type), processing_time)
+            for request, results_by_type in zip(requests, results_by_request)
+        ]
+    
+    @staticmethod
+    def _group_batch_requests(
+        requests: List[UnifiedSearchRequest]
+    ) -> List[Tuple[RetrievalType, str, List[int]]]:
+        """
+        按检索类型及引擎参数对请求分组
+        
+        Returns:
+            (检索类型, 分组键, 请求下标列表) 列表
+        """
+        groups: Dict[Tuple[RetrievalType, str], List[int]] = {}
+        for i, request in enumerate(requests):
+            for retrieval_type in request.retrieval_types:
+                if retrieval_type == RetrievalType.VECTOR:
+                    params = [request.knowledge_base_id, request.filters]
+                elif retrieval_type == RetrievalType.KEYWORD:
+                    params = [request.knowledge_base_id]
+                elif retrieval_type == RetrievalType.ENTITY:
+                    params = [request.knowledge_base_id, sorted(request.entity_types or [])]
+                elif retrieval_type == RetrievalType.GRAPH:
+                    params = [request.knowledge_base_id, sorted(request.relationship_types or [])]
+                else:
+                    continue
+                group_key = json.dumps(params, sort_keys=True, default=str)
+                groups.setdefault((retrieval_type, group_key), []).append(i)
+        return [(rt, key, indices) for (rt, key), indices in groups.items()]
+    
+    def _run_engine_batch(
+        self,
+        retrieval_type: RetrievalType,
+        requests: List[UnifiedSearchRequest]
+    ) -> List[List[SearchResult]]:
+        """对同一分组的请求调用对应引擎的批量接口，结果按各请求的 top_k 截断"""
+        first = requests[0]
+        queries = [request.query for request in requests]
+        top_k = max(request.top_k for request in requests)
+        
+        if retrieval_type == RetrievalType.VECTOR:
+            batch_results = self.vector_engine.search_batch(
+                queries, top_k, first.knowledge_base_id, first.filters
+            )
+            # 向量引擎按 top_k * 2 取候选，与单查询路径保持一致
+            return [results[:request.top_k * 2] for request, results in zip(requests, batch_results)]
+        elif retrieval_type == RetrievalType.KEYWORD:
+            batch_results = self.keyword_engine.search_batch(queries, top_k, first.knowledge_base_id)
+            # 关键词引擎同样按 top_k * 2 取候选
+            return [results[:request.top_k * 2] for request, results in zip(requests, batch_results)]
+        elif retrieval_type == RetrievalType.ENTITY:
+            batch_results = self.entity_engine.search_batch(
+                queries, top_k, first.knowledge_base_id, first.entity_types
+            )
+        elif retrieval_type == RetrievalType.GRAPH:
+            batch_results = self.graph_engine.search_batch(
+                queries, top_k, first.knowledge_base_id, first.relationship_types
+            )
+        else:
+            return [[] for _ in requests]
+        
+        return [results[:request.top_k] for request, results in zip(requests, batch_results)]
+    
+    @staticmethod
+    def _order_results(
+        request: UnifiedSearchRequest,
+        results_by_type: Dict[RetrievalType, List[SearchResult]]
+    ) -> Dict[RetrievalType, List[SearchResult]]:
+        """按请求中的检索类型顺序排列结果（加权融合依赖该顺序）"""
+        return {
+            rt: results_by_type[rt] for rt in request.retrieval_types if rt in results_by_type
+        }
+    
+    def _build_response(
+        self,
+        request: UnifiedSearchRequest,
+        results_by_type: Dict[RetrievalType, List[SearchResult]],
+        processing_time: int
+    ) -> UnifiedSearchResponse:
+        """融合结果并构建搜索响应"""
+        fused_results = self._fuse_results(request, results_by_type)
+        
+        source_stats = {
+            rt.value: len(results) for rt, results in results_by_type.items()
+        }
+        
+        return UnifiedSearchResponse(
+            query=request.query,
+            results=fused_results[:request.top_k],
+            total_results=len(fused_results),
+            fusion_algorithm=request.fusion_algorithm,
+            retrieval_types=request.retrieval_types,
+            source_stats=source_stats,
+            processing_time_ms=processing_time,
+            metadata={"batch": True}
+        )
+    
     def _fuse_results(
         self,
         request: UnifiedSearchRequest,
@@ -840,6 +1315,8 @@ class UnifiedRetrievalService:
             for rt in results_by_type.keys():
                 if rt == RetrievalType.VECTOR:
                     weights.append(request.vector_weight)
+                elif rt == RetrievalType.KEYWORD:
+                    weights.append(request.keyword_weight)
                 elif rt == RetrievalType.ENTITY:
                     weights.append(request.entity_weight)
                 elif rt == RetrievalType.GRAPH:
@@ -871,6 +1348,15 @@ class UnifiedRetrievalService:
         """向量检索便捷方法"""
         return self.vector_engine.search(query, top_k, knowledge_base_id, filters)
     
+    def keyword_search(
+        self,
+        query: str,
+        top_k: int = 10,
+        knowledge_base_id: Optional[int] = None
+    ) -> List[SearchResult]:
+        """关键词检索便捷方法"""
+        return self.keyword_engine.search(query, top_k, knowledge_base_id)
+    
     def entity_search(
         self,
         query: str,
@@ -899,7 +1385,7 @@ class UnifiedRetrievalService:
         use_rrf: bool = True
     ) -> UnifiedSearchResponse:
         """
-        混合检索便捷方法（向量+实体+图谱）
+        混合检索便捷方法（向量+关键词+实体+图谱）
         
         Args:
             query: 查询文本
@@ -914,6 +1400,7 @@ class UnifiedRetrievalService:
             query=query,
             retrieval_types=[
                 RetrievalType.VECTOR,
+                RetrievalType.KEYWORD,
                 RetrievalType.ENTITY,
                 RetrievalType.GRAPH
             ],
@@ -939,7 +1426,7 @@ def unified_search(
     
     Args:
         query: 查询文本
-        retrieval_types: 检索类型列表 ["vector", "entity", "graph"]
+        retrieval_types: 检索类型列表 ["vector", "keyword", "entity", "graph"]
         top_k: 返回结果数量
         knowledge_base_id: 知识库ID
         fusion_algorithm: 融合算法 ["rrf", "weighted", "linear"]
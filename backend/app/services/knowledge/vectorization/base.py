@@ -44,7 +44,8 @@ class VectorStoreBase(ABC):
         批量添加文档到向量存储
         
         Args:
-            documents: 文档列表，每个文档包含 document_id, text, metadata
+            documents: 文档列表，每个文档包含 document_id, text, metadata；
+                       metadata 中的 content_hash 可供后端复用内容相同的已有向量
             
         Returns:
             操作结果，包含 success 状态和成功添加的数量
@@ -84,6 +85,34 @@ class VectorStoreBase(ABC):
         """
         pass
     
+    def delete_documents_batch(self, document_ids: List[str]) -> int:
+        """
+        批量删除文档
+        
+        默认逐个调用 delete_document，子类可以重写为单次批量操作
+        
+        Args:
+            document_ids: 文档唯一标识列表
+            
+        Returns:
+            删除成功的数量
+        """
+        return sum(1 for document_id in document_ids if self.delete_document(document_id))
+    
+    def update_metadata_batch(self, metadatas: Dict[str, Dict[str, Any]]) -> bool:
+        """
+        批量更新文档元数据（不重新计算向量）
+        
+        默认不支持，子类可以重写
+        
+        Args:
+            metadatas: 文档唯一标识 -> 新元数据
+            
+        Returns:
+            是否更新成功
+        """
+        return False
+    
     @abstractmethod
     def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -172,8 +172,8 @@ class ChromaService:
 
             if response.status_code == 200:
                 data = response.json()
-                logger.info(f"批量文档添加成功: {data.get('count', len(documents))} 个")
-                return {"success": True, "count": data.get('count', len(documents))}
+                logger.info(f"批量文档添加成功: {data.get('count', len(documents))} 个，复用向量 {data.get('reused', 0)} 个")
+                return {"success": True, "count": data.get('count', len(documents)), "reused": data.get('reused', 0)}
             else:
                 logger.error(f"批量文档添加失败: {response.text}")
                 return {"success": False, "count": 0, "error": response.text}
@@ -226,6 +226,57 @@ class ChromaService:
             logger.error(f"搜索异常: {e}")
             return []
     
+    def search_similar_batch(self, queries: List[str], top_k: int = 5,
+                             filters: Optional[Dict[str, Any]] = None,
+                             collection_name: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """
+        批量搜索相似文档（一次请求完成全部查询的嵌入与检索）
+        
+        Args:
+            queries: 查询文本列表
+            top_k: 每个查询返回结果数量
+            filters: 过滤条件（对全部查询生效）
+            collection_name: 集合名称
+            
+        Returns:
+            List[List[Dict]]: 与 queries 一一对应的搜索结果列表
+        """
+        if not queries:
+            return []
+        
+        if not self.available and not self._check_health():
+            logger.warning("ChromaDB服务不可用，返回空结果")
+            return [[] for _ in queries]
+        
+        collection = collection_name or self.default_collection
+        
+        try:
+            response = self.session.post(
+                f"{self.server_url}/collections/{collection}/search/batch",
+                json={
+                    "collection_name": collection,
+                    "queries": queries,
+                    "top_k": top_k,
+                    "filters": filters
+                },
+                timeout=120
+            )
+            
+            if response.status_code == 200:
+                results = response.json().get("results", [])
+                logger.info(f"批量搜索完成，查询数: {len(queries)}")
+                return results + [[] for _ in range(len(queries) - len(results))]
+            elif response.status_code in (404, 405):
+                # 旧版服务没有批量接口，逐条回退
+                logger.warning("ChromaDB服务不支持批量搜索，逐条查询")
+                return [self.search_similar(q, top_k, filters, collection_name) for q in queries]
+            else:
+                logger.error(f"批量搜索失败: {response.text}")
+                return [[] for _ in queries]
+        except Exception as e:
+            logger.error(f"批量搜索异常: {e}")
+            return [[] for _ in queries]
+    
     def delete_documents(self, document_ids: Optional[List[str]] = None,
                         filters: Optional[Dict[str, Any]] = None,
                         collection_name: Optional[str] = None) -> bool:
@@ -420,6 +471,47 @@ class ChromaService:
                 "error": str(e)
             }
 
+    def update_metadata_batch(self, metadatas: Dict[str, Dict[str, Any]],
+                              collection_name: Optional[str] = None) -> bool:
+        """
+        批量更新文档元数据（不重新计算嵌入）
+
+        Args:
+            metadatas: 文档ID -> 新元数据
+            collection_name: 集合名称，默认使用default_collection
+
+        Returns:
+            bool: 是否更新成功（服务端不支持时返回False）
+        """
+        if not metadatas:
+            return True
+
+        if not self.available and not self._check_health():
+            logger.warning("ChromaDB服务不可用，跳过元数据更新")
+            return False
+
+        collection = collection_name or self.default_collection
+
+        try:
+            response = self.session.post(
+                f"{self.server_url}/collections/{collection}/documents/metadata",
+                json={
+                    "collection_name": collection,
+                    "ids": list(metadatas.keys()),
+                    "metadatas": list(metadatas.values())
+                },
+                timeout=60
+            )
+
+            if response.status_code == 200:
+                logger.info(f"批量元数据更新成功: {len(metadatas)} 个")
+                return True
+            logger.error(f"批量元数据更新失败: {response.text}")
+            return False
+        except Exception as e:
+            logger.error(f"批量元数据更新异常: {e}")
+            return False
+
     def count_documents(self, collection_name: Optional[str] = None) -> int:
         """
         获取文档数量
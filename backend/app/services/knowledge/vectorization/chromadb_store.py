@@ -218,6 +218,47 @@ class ChromaDBVectorStore(VectorStoreBase):
             logger.error(f"删除文档失败: {e}")
             return False
     
+    def delete_documents_batch(self, document_ids: List[str]) -> int:
+        """
+        批量删除文档（单次请求）
+        
+        Args:
+            document_ids: 文档唯一标识列表
+            
+        Returns:
+            删除成功的数量
+        """
+        if not document_ids:
+            return 0
+        try:
+            success = self.chroma_service.delete_documents(
+                document_ids=list(document_ids),
+                collection_name=self.default_collection
+            )
+            return len(document_ids) if success else 0
+        except Exception as e:
+            logger.error(f"批量删除文档失败: {e}")
+            return 0
+    
+    def update_metadata_batch(self, metadatas: Dict[str, Dict[str, Any]]) -> bool:
+        """
+        批量更新文档元数据（不重新计算嵌入）
+        
+        Args:
+            metadatas: 文档唯一标识 -> 新元数据
+            
+        Returns:
+            是否更新成功
+        """
+        try:
+            return self.chroma_service.update_metadata_batch(
+                metadatas,
+                collection_name=self.default_collection
+            )
+        except Exception as e:
+            logger.error(f"批量更新元数据失败: {e}")
+            return False
+    
     def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
         """
         获取文档
@@ -71,7 +71,11 @@ class VectorStoreFactory:
                 try:
                     from app.core.config import settings
                     db_path = settings.vector_store_db_path
-                    cls._instances[backend] = SQLiteVectorStore(db_path=db_path)
+                    cls._instances[backend] = SQLiteVectorStore(
+                        db_path=db_path,
+                        storage_mode=settings.vector_store_storage_mode,
+                        matrix_dir=settings.vector_store_matrix_dir
+                    )
                 except Exception as e:
                     logger.warning(f"读取 SQLite 配置失败: {e}，使用默认路径")
                     cls._instances[backend] = SQLiteVectorStore()
@@ -4,17 +4,39 @@ FAISS索引服务
 
 提供高性能的向量索引和相似度搜索功能，
 支持多种索引类型和增量更新。
+
+持久化布局（见 faiss_sidecar_store.py）：
+- {index_name}.faiss：FAISS 索引本体
+- 向量使用 float32 .npy 内存映射，ID表为数组，元数据为追加日志，
+  加载时直接映射而不是反序列化整个 pickle
+- 旧版 {index_name}_metadata.pkl 在首次加载时自动迁移
+
+删除策略：
+- FLAT / IVF_FLAT / IVF_PQ：通过 remove_ids 就地删除
+- HNSW 等不支持删除的索引：写入墓碑位图，搜索时过滤，
+  死向量比例达到阈值后在后台线程中压缩重建
+
+自动调优（IndexConfig.auto_tune 或 index_type="AUTO"）：
+- 按向量数量与内存预算在 FLAT / IVF_FLAT / IVF_PQ / HNSW 中选择索引类型，
+  nlist 取 4*sqrt(N)
+- 以库内向量抽样作为留出查询，离线扫描 nprobe / efSearch 的召回率与延迟，
+  选择满足目标召回率的最低成本参数并随索引持久化
+- 向量数量相对上次调优翻倍或减半时在后台重新调优
 """
 
+import math
 import os
 import pickle
+import time
 import numpy as np
 from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, asdict
 import threading
 
+from .faiss_sidecar_store import FAISSSidecarStore
+
 logger = logging.getLogger(__name__)
 
 
@@ -26,6 +48,67 @@ class IndexConfig:
     nlist: int = 100  # 倒排列表数量
     nprobe: int = 10  # 搜索时探查的列表数
     metric_type: str = "METRIC_L2"  # 距离度量类型
+    compaction_dead_ratio: float = 0.2  # 触发压缩的死向量比例
+    background_compaction: bool = True  # 是否在后台线程中压缩
+    hnsw_m: int = 32  # HNSW 每个节点的连接数
+    ef_construction: int = 200  # HNSW 构建时的候选列表大小
+    ef_search: int = 64  # HNSW 搜索时的候选列表大小
+    pq_m: int = 8  # IVF_PQ 子量化器数量（需整除维度）
+    auto_tune: bool = False  # 是否自动选择索引类型并调优搜索参数
+    memory_budget_mb: float = 2048.0  # 自动选择索引类型时的内存预算
+    target_recall: float = 0.95  # 参数扫描的目标召回率
+    tuned_vector_count: int = 0  # 上次调优时的向量数量
+
+    def __post_init__(self):
+        if self.index_type == "AUTO":
+            self.auto_tune = True
+            self.index_type = "FLAT"
+
+
+# 自动选择索引类型的阈值
+AUTO_FLAT_MAX_VECTORS = 10_000
+AUTO_HNSW_MAX_VECTORS = 1_000_000
+# IVF 训练时每个聚类中心至少需要的样本数
+IVF_MIN_POINTS_PER_CENTROID = 39
+
+
+def recommend_index_config(vector_count: int, base_config: IndexConfig) -> IndexConfig:
+    """
+    根据向量数量和内存预算推荐索引配置
+
+    Args:
+        vector_count: 当前向量数量
+        base_config: 基础配置（维度、内存预算等沿用此配置）
+
+    Returns:
+        推荐的索引配置（调优参数保持默认，需再经参数扫描确定）
+    """
+    config = IndexConfig(**asdict(base_config))
+    dimension = config.dimension
+    budget_bytes = config.memory_budget_mb * 1024 * 1024
+
+    raw_bytes = vector_count * dimension * 4
+    hnsw_bytes = raw_bytes + vector_count * config.hnsw_m * 2 * 4
+
+    if vector_count < AUTO_FLAT_MAX_VECTORS:
+        config.index_type = "FLAT"
+    elif vector_count <= AUTO_HNSW_MAX_VECTORS and hnsw_bytes <= budget_bytes:
+        config.index_type = "HNSW"
+    elif raw_bytes <= budget_bytes:
+        config.index_type = "IVF_FLAT"
+    else:
+        config.index_type = "IVF_PQ"
+
+    if config.index_type in ("IVF_FLAT", "IVF_PQ"):
+        nlist = int(4 * math.sqrt(vector_count))
+        config.nlist = max(1, min(nlist, vector_count // IVF_MIN_POINTS_PER_CENTROID))
+        config.nprobe = min(config.nprobe, config.nlist)
+
+    if config.index_type == "IVF_PQ":
+        while dimension % config.pq_m:
+            config.pq_m -= 1
+
+    return config
 
 
 @dataclass
@@ -43,11 +126,15 @@ class FAISSIndexService:
 
     提供高效的向量索引和相似度搜索，支持：
     1. 多种索引类型（Flat、IVF、HNSW等）
-    2. 增量添加和删除
-    3. 持久化和加载
+    2. 增量添加和删除（ID映射索引 remove_ids / 墓碑位图）
+    3. 持久化和加载（内存映射旁路存储）
     4. 多线程安全
+    5. 后台压缩
     """
 
+    # 支持 remove_ids 的索引类型
+    REMOVABLE_INDEX_TYPES = ("FLAT", "IVF_FLAT", "IVF_PQ")
+
     def __init__(self, index_name: str = "default", config: IndexConfig = None):
         """
         初始化FAISS索引服务
@@ -59,18 +146,29 @@ class FAISSIndexService:
         self.index_name = index_name
         self.config = config or IndexConfig()
         self.index = None
-        self.id_map = {}  # id -> index映射
-        self.metadata = {}  # id -> metadata映射
-        self.vectors = {}  # id -> vector映射（用于重建索引）
 
         self._lock = threading.RLock()
         self._is_trained = False
 
+        # 墓碑位图（按内部ID索引），用于不支持 remove_ids 的索引
+        self._tombstones = np.zeros(0, dtype=bool)
+        self._tombstone_count = 0
+
+        # 后台重建（压缩 / 自动调优）状态
+        self._compaction_thread: Optional[threading.Thread] = None
+        self.tuning_report: Optional[Dict[str, Any]] = None
+        self._compaction_pending_adds: List[int] = []
+        self._compaction_pending_deletes: List[int] = []
+
         # 索引存储路径
         self.index_dir = Path("data/faiss_indexes")
         self.index_dir.mkdir(parents=True, exist_ok=True)
         self.index_path = self.index_dir / f"{index_name}.faiss"
-        self.metadata_path = self.index_dir / f"{index_name}_metadata.pkl"
+        self.metadata_path = self.index_dir / f"{index_name}_metadata.pkl"  # 旧版格式，仅用于迁移
+        self.tombstones_path = self.index_dir / f"{index_name}_tombstones.npy"
+
+        # 向量、ID表与元数据的旁路存储
+        self.store = FAISSSidecarStore(self.index_dir, index_name, self.config.dimension)
 
         # 延迟导入FAISS
         self._faiss = None
@@ -89,13 +187,14 @@ class FAISSIndexService:
                 logger.warning("FAISS库未安装，将使用回退方法")
                 self._faiss = None
 
-    def _create_index(self) -> Any:
+    def _create_index(self, config: IndexConfig = None) -> Any:
         """创建FAISS索引"""
         if self._faiss is None:
             return None
 
-        dimension = self.config.dimension
-        index_type = self.config.index_type
+        config = config or self.config
+        dimension = config.dimension
+        index_type = config.index_type
 
         # 根据索引类型创建索引
         if index_type == "FLAT":
@@ -107,7 +206,7 @@ class FAISSIndexService:
             quantizer = self._faiss.IndexFlatIP(dimension)
             index = self._faiss.IndexIVFFlat(
                 quantizer, dimension,
-                self.config.nlist,
+                config.nlist,
                 self._faiss.METRIC_INNER_PRODUCT
             )
 
@@ -116,21 +215,70 @@ class FAISSIndexService:
             quantizer = self._faiss.IndexFlatIP(dimension)
             index = self._faiss.IndexIVFPQ(
                 quantizer, dimension,
-                self.config.nlist,  # 倒排列表数
-                8,  # 每个向量的字节数
-                8   # 子量化器数量
+                config.nlist,  # 倒排列表数
+                config.pq_m,  # 子量化器数量
+                8,  # 每个子量化器的比特数
+                self._faiss.METRIC_INNER_PRODUCT
             )
 
         elif index_type == "HNSW":
             # HNSW图索引，高召回率
-            index = self._faiss.IndexHNSWFlat(dimension, 32)
-            index.hnsw.efConstruction = 200
+            index = self._faiss.IndexHNSWFlat(
+                dimension, config.hnsw_m,
+                self._faiss.METRIC_INNER_PRODUCT
+            )
+            index.hnsw.efConstruction = config.ef_construction
 
         else:
             # 默认使用FLAT
             index = self._faiss.IndexFlatIP(dimension)
 
-        return index
+        # IVF 索引原生支持 add_with_ids/remove_ids；其余索引包装为ID映射索引，
+        # 使搜索结果直接返回内部ID
+        if index_type in ("IVF_FLAT", "IVF_PQ"):
+            return index
+        return self._faiss.IndexIDMap2(index)
+
+    def _apply_search_params(self, index: Any = None, config: IndexConfig = None):
+        """将 nprobe / efSearch 应用到索引"""
+        index = index if index is not None else self.index
+        config = config or self.config
+        if index is None:
+            return
+        if hasattr(index, 'nprobe'):
+            index.nprobe = config.nprobe
+        elif hasattr(index, 'index'):
+            inner = self._faiss.downcast_index(index.index)
+            if hasattr(inner, 'hnsw'):
+                inner.hnsw.efSearch = config.ef_search
+
+    def _supports_remove(self) -> bool:
+        """当前索引类型是否支持 remove_ids"""
+        return self.config.index_type in self.REMOVABLE_INDEX_TYPES
+
+    def _ensure_store(self):
+        """确保旁路存储已打开（未显式 load 时按需加载已有数据）"""
+        if not self.store.is_open:
+            self.load()
+            if not self.store.is_open:
+                self.store.create()
+
+    def _ensure_tombstone_capacity(self):
+        """扩容墓碑位图以覆盖全部内部ID"""
+        required = self.store.next_internal_id
+        if required > len(self._tombstones):
+            grown = np.zeros(max(required, len(self._tombstones) * 2), dtype=bool)
+            grown[:len(self._tombstones)] = self._tombstones
+            self._tombstones = grown
+
+    def _is_dead(self, internal_id: int) -> bool:
+        """内部ID是否已被标记为墓碑"""
+        return internal_id < len(self._tombstones) and bool(self._tombstones[internal_id])
+
+    def _dead_ratio(self) -> float:
+        """死向量占比"""
+        total = self.store.count + self._tombstone_count
+        return self._tombstone_count / total if total else 0.0
 
     def initialize(self):
         """初始化索引"""
@@ -159,18 +307,25 @@ class FAISSIndexService:
             if len(ids) == 0:
                 return True
 
+            self._ensure_store()
+
             # 确保索引已初始化
             if self.index is None:
                 self.initialize()
 
+            # 已存在的ID视为更新：先删除旧向量
+            existing = [id for id in ids if self.store.lookup(id) is not None]
+            if existing:
+                self._delete_locked(existing)
+
             # 归一化向量（用于余弦相似度）
-            vectors = self._normalize_vectors(vectors)
+            vectors = self._normalize_vectors(vectors).astype(np.float32)
 
-            # 保存向量和元数据
-            for i, id in enumerate(ids):
-                self.vectors[id] = vectors[i]
-                if metadata and i < len(metadata):
-                    self.metadata[id] = metadata[i]
+            # 写入旁路存储并分配内部ID
+            internal_ids = self.store.append(ids, vectors, metadata)
+            self._ensure_tombstone_capacity()
+            if self._compaction_thread is not None:
+                self._compaction_pending_adds.extend(int(i) for i in internal_ids)
 
             if self._faiss and self.index:
                 try:
@@ -178,27 +333,22 @@ class FAISSIndexService:
                     if not self._is_trained and hasattr(self.index, 'is_trained'):
                         if not self.index.is_trained:
                             self.index.train(vectors)
-                            self._is_trained = True
                             logger.info("索引训练完成")
+                        self._is_trained = True
 
-                    # 添加向量
-                    start_idx = len(self.id_map)
-                    self.index.add(vectors)
-
-                    # 更新ID映射
-                    for i, id in enumerate(ids):
-                        self.id_map[id] = start_idx + i
+                    # 添加向量（携带内部ID）
+                    self.index.add_with_ids(vectors, internal_ids)
 
                     logger.info(f"成功添加 {len(ids)} 个向量到索引")
+                    if self.config.auto_tune and self.needs_retune():
+                        self.schedule_auto_tune()
                     return True
 
                 except Exception as e:
                     logger.error(f"添加向量到FAISS索引失败: {e}")
                     return False
             else:
-                # 回退方法：仅保存到内存
-                for i, id in enumerate(ids):
-                    self.id_map[id] = len(self.id_map)
+                # 回退方法：仅写入旁路存储
                 logger.info(f"使用回退方法添加 {len(ids)} 个向量")
                 return True
 
@@ -216,43 +366,40 @@ class FAISSIndexService:
             搜索结果列表
         """
         with self._lock:
-            if len(self.id_map) == 0:
+            if not self.store.is_open:
+                self._ensure_store()
+            if self.store.count == 0:
                 return []
 
             # 归一化查询向量
-            query_vector = self._normalize_vectors(query_vector.reshape(1, -1))
+            query_vector = self._normalize_vectors(query_vector.reshape(1, -1)).astype(np.float32)
 
             results = []
 
             if self._faiss and self.index:
                 try:
                     # 设置搜索参数
-                    if hasattr(self.index, 'nprobe'):
-                        self.index.nprobe = self.config.nprobe
+                    self._apply_search_params()
+
+                    # 存在墓碑时多取一些候选，过滤后仍能凑满 k 个
+                    search_k = min(k + self._tombstone_count, self.index.ntotal)
+                    if search_k <= 0:
+                        return []
 
                     # 执行搜索
-                    scores, indices = self.index.search(query_vector, k)
+                    scores, indices = self.index.search(query_vector, search_k)
 
                     # 构建结果
-                    id_list = list(self.id_map.keys())
                     for i, idx in enumerate(indices[0]):
-                        if idx < 0 or idx >= len(id_list):
+                        if len(results) >= k:
+                            break
+                        idx = int(idx)
+                        if idx < 0 or self._is_dead(idx) or not self.store.is_alive(idx):
                             continue
 
-                        id = id_list[idx]
-                        score = float(scores[0][i])
-
-                        # 应用过滤
-                        if filter_fn and not filter_fn(id, self.metadata.get(id)):
-                            continue
-
-                        result = SearchResult(
-                            id=id,
-                            score=score,
-                            metadata=self.metadata.get(id, {}),
-                            vector=self.vectors.get(id)
-                        )
-                        results.append(result)
+                        result = self._build_result(idx, float(scores[0][i]), filter_fn)
+                        if result:
+                            results.append(result)
 
                 except Exception as e:
                     logger.error(f"FAISS搜索失败: {e}")
@@ -264,105 +411,395 @@ class FAISSIndexService:
 
             return results
 
+    def _build_result(self, internal_id: int, score: float,
+                      filter_fn: callable = None) -> Optional[SearchResult]:
+        """根据内部ID构建搜索结果，未通过过滤时返回 None"""
+        id = self.store.get_id(internal_id)
+        metadata = self.store.get_metadata(internal_id)
+
+        # 应用过滤
+        if filter_fn and not filter_fn(id, metadata):
+            return None
+
+        return SearchResult(
+            id=id,
+            score=score,
+            metadata=metadata,
+            vector=self.store.get_vector(internal_id)
+        )
+
     def _brute_force_search(self, query_vector: np.ndarray, k: int,
                            filter_fn: callable = None) -> List[SearchResult]:
         """暴力搜索（回退方法）"""
-        results = []
-
-        for id, vector in self.vectors.items():
-            # 计算余弦相似度
-            score = np.dot(query_vector, vector)
+        internal_ids = self.store.alive_internal_ids()
+        if len(internal_ids) == 0:
+            return []
 
-            # 应用过滤
-            if filter_fn and not filter_fn(id, self.metadata.get(id)):
-                continue
+        # 计算余弦相似度
+        scores = self.store.get_vectors(internal_ids) @ query_vector
+        order = np.argsort(-scores)
 
-            results.append(SearchResult(
-                id=id,
-                score=float(score),
-                metadata=self.metadata.get(id, {}),
-                vector=vector
-            ))
-
-        # 按相似度排序
-        results.sort(key=lambda x: x.score, reverse=True)
+        results = []
+        for pos in order:
+            if len(results) >= k:
+                break
+            result = self._build_result(int(internal_ids[pos]), float(scores[pos]), filter_fn)
+            if result:
+                results.append(result)
 
-        return results[:k]
+        return results
 
     def delete_vectors(self, ids: List[str]) -> bool:
         """
         从索引中删除向量
 
-        Note: FAISS不直接支持删除，需要重建索引
+        支持 remove_ids 的索引直接删除；其余索引写入墓碑位图，
+        死向量比例达到 compaction_dead_ratio 后触发压缩。
         """
         with self._lock:
             try:
-                # 从映射中删除
-                for id in ids:
-                    if id in self.id_map:
-                        del self.id_map[id]
-                    if id in self.metadata:
-                        del self.metadata[id]
-                    if id in self.vectors:
-                        del self.vectors[id]
-
-                # 重建索引
-                if self._faiss and self.index:
-                    self._rebuild_index()
-
-                logger.info(f"成功删除 {len(ids)} 个向量")
+                self._ensure_store()
+                deleted = self._delete_locked(ids)
+                logger.info(f"成功删除 {deleted} 个向量")
                 return True
-
             except Exception as e:
                 logger.error(f"删除向量失败: {e}")
                 return False
 
-    def _rebuild_index(self):
-        """重建索引"""
-        if not self.vectors:
-            self.index = self._create_index()
-            self._is_trained = False
-            return
+    def _delete_locked(self, ids: List[str]) -> int:
+        """删除向量（调用方需持有锁），返回实际删除数量"""
+        internal_ids = []
+        for id in ids:
+            internal_id = self.store.lookup(id)
+            if internal_id is not None:
+                internal_ids.append(internal_id)
+
+        if not internal_ids:
+            return 0
+
+        self.store.mark_deleted(internal_ids)
 
-        # 收集所有向量
-        ids = list(self.vectors.keys())
-        vectors = np.array([self.vectors[id] for id in ids])
+        if self._compaction_thread is not None:
+            self._compaction_pending_deletes.extend(internal_ids)
+
+        if self._faiss and self.index:
+            if self._supports_remove():
+                self.index.remove_ids(np.asarray(internal_ids, dtype=np.int64))
+            else:
+                self._tombstones[internal_ids] = True
+                self._tombstone_count += len(internal_ids)
+                self._maybe_compact()
+
+        return len(internal_ids)
+
+    def _maybe_compact(self):
+        """死向量比例超过阈值时触发压缩"""
+        with self._lock:
+            if self._tombstone_count == 0 or self._compaction_thread is not None:
+                return
+            if self._dead_ratio() < self.config.compaction_dead_ratio:
+                return
+
+            if not self.config.background_compaction:
+                self._rebuild_index()
+                return
+
+            logger.info(f"开始后台压缩索引: {self.index_name}, 死向量比例: {self._dead_ratio():.2%}")
+            self._start_background_rebuild()
+
+    def _start_background_rebuild(self, config: IndexConfig = None, on_complete: callable = None):
+        """
+        启动后台重建（调用方需持有锁且当前没有进行中的重建）
+
+        Args:
+            config: 新索引配置，None 表示沿用当前配置（压缩）
+            on_complete: 切换完成后在后台线程中（锁外）调用的回调
+        """
+        self._compaction_pending_adds = []
+        self._compaction_pending_deletes = []
+        snapshot_internal_ids = self.store.alive_internal_ids()
+        snapshot_vectors = (
+            self.store.get_vectors(snapshot_internal_ids)
+            if len(snapshot_internal_ids) else None
+        )
+        self._compaction_thread = threading.Thread(
+            target=self._rebuild_in_background,
+            args=(snapshot_internal_ids, snapshot_vectors, self.store.next_internal_id, config, on_complete),
+            name=f"faiss-rebuild-{self.index_name}",
+            daemon=True
+        )
+        self._compaction_thread.start()
+
+    def _rebuild_in_background(self, snapshot_internal_ids: np.ndarray,
+                               snapshot_vectors: Optional[np.ndarray], snapshot_next_id: int,
+                               config: IndexConfig = None, on_complete: callable = None):
+        """
+        后台重建：在锁外基于快照构建新索引，再在锁内回放重建期间的增删并切换
+        """
+        try:
+            new_index = self._create_index(config)
+            is_trained = False
+            if snapshot_vectors is not None and new_index is not None:
+                if not new_index.is_trained:
+                    new_index.train(snapshot_vectors)
+                is_trained = True
+                new_index.add_with_ids(snapshot_vectors, snapshot_internal_ids)
+
+            with self._lock:
+                # 回放压缩期间新增的向量
+                pending_adds = np.asarray(
+                    [i for i in self._compaction_pending_adds if self.store.is_alive(i)], dtype=np.int64
+                )
+                if len(pending_adds) and new_index is not None:
+                    vectors = self.store.get_vectors(pending_adds)
+                    if not new_index.is_trained:
+                        new_index.train(vectors)
+                    is_trained = True
+                    new_index.add_with_ids(vectors, pending_adds)
+
+                # 回放重建期间删除的快照内向量：可删除的索引直接 remove_ids，否则以墓碑表示
+                tombstones = np.zeros(len(self._tombstones), dtype=bool)
+                pending_deletes = [
+                    internal_id for internal_id in self._compaction_pending_deletes
+                    if internal_id < snapshot_next_id
+                ]
+                if pending_deletes:
+                    target_type = (config or self.config).index_type
+                    if new_index is not None and target_type in self.REMOVABLE_INDEX_TYPES:
+                        new_index.remove_ids(np.asarray(pending_deletes, dtype=np.int64))
+                    else:
+                        tombstones[pending_deletes] = True
+
+                self.index = new_index
+                if config is not None:
+                    self.config = config
+                self._is_trained = is_trained
+                self._tombstones = tombstones
+                self._tombstone_count = int(tombstones.sum())
+                logger.info(f"后台重建完成: {self.index_name}, 索引类型: {self.config.index_type}, "
+                            f"当前向量数: {self.store.count}")
+            if on_complete:
+                on_complete()
+        except Exception as e:
+            logger.error(f"后台重建索引失败: {e}")
+        finally:
+            with self._lock:
+                self._compaction_thread = None
+                self._compaction_pending_adds = []
+                self._compaction_pending_deletes = []
+
+    def needs_retune(self) -> bool:
+        """向量数量相对上次调优翻倍或减半时需要重新调优"""
+        if not self.store.is_open:
+            return False
+        count = self.store.count
+        last = self.config.tuned_vector_count
+        if count == 0:
+            return False
+        return last == 0 or count >= last * 2 or count * 2 <= last
+
+    def schedule_auto_tune(self) -> bool:
+        """
+        在后台重新选择索引类型并扫描搜索参数
+
+        Returns:
+            是否已调度（已有后台重建时返回 False）
+        """
+        with self._lock:
+            if self._compaction_thread is not None or not self.store.is_open:
+                return False
+
+            recommended = recommend_index_config(self.store.count, self.config)
+            structure_changed = (
+                recommended.index_type != self.config.index_type
+                or recommended.nlist != self.config.nlist
+            )
+            if structure_changed and self._faiss is not None:
+                logger.info(f"自动调优: {self.index_name} 索引类型 {self.config.index_type} -> "
+                            f"{recommended.index_type}, nlist={recommended.nlist}, 向量数: {self.store.count}")
+                self._start_background_rebuild(recommended, on_complete=self._auto_tune_sweep)
+            else:
+                self._compaction_thread = threading.Thread(
+                    target=self._auto_tune_sweep,
+                    name=f"faiss-tune-{self.index_name}",
+                    daemon=True
+                )
+                self._compaction_thread.start()
+            return True
+
+    def _auto_tune_sweep(self):
+        """后台参数扫描，完成后保存调优结果"""
+        try:
+            self.sweep_search_params()
+            self.save()
+        finally:
+            with self._lock:
+                if self._compaction_thread is threading.current_thread():
+                    self._compaction_thread = None
+
+    def sweep_search_params(self, sample_size: int = 200, k: int = 10,
+                            target_recall: float = None) -> Optional[Dict[str, Any]]:
+        """
+        离线扫描 nprobe / efSearch，记录召回率与延迟并选择运行点
+
+        以库内向量抽样作为查询，精确内积结果（排除查询自身）作为真值。
+
+        Args:
+            sample_size: 抽样查询数量
+            k: 召回率计算的 top-k
+            target_recall: 目标召回率，默认取配置值
+
+        Returns:
+            调优报告，无法调优时返回 None
+        """
+        target_recall = target_recall if target_recall is not None else self.config.target_recall
+
+        with self._lock:
+            if not self.store.is_open:
+                return None
+            if self.store.count <= k:
+                # 向量太少无法扫描，仍记录调优时的数量，避免 needs_retune 反复触发
+                self.config.tuned_vector_count = self.store.count
+                return None
+            internal_ids = self.store.alive_internal_ids()
+            rng = np.random.default_rng(0)
+            sample = rng.choice(internal_ids, size=min(sample_size, len(internal_ids)), replace=False)
+            queries = self.store.get_vectors(sample)
+            index_type = self.config.index_type
+
+        ground_truth = self._exact_top_k(queries, sample, internal_ids, k)
+
+        if index_type in ("IVF_FLAT", "IVF_PQ"):
+            param = "nprobe"
+            candidates = [v for v in (1, 2, 4, 8, 16, 32, 64, 128, 256, 512) if v <= self.config.nlist]
+            if self.config.nlist not in candidates:
+                candidates.append(self.config.nlist)
+        elif index_type == "HNSW":
+            param = "ef_search"
+            candidates = [v for v in (16, 32, 64, 128, 256, 512) if v >= k]
+        else:
+            param = None
+            candidates = [None]
+
+        sweep = []
+        for value in candidates:
+            config = IndexConfig(**asdict(self.config))
+            if param:
+                setattr(config, param, value)
+            recall, latency_ms = self._measure_operating_point(config, queries, sample, ground_truth, k)
+            sweep.append({"value": value, "recall": recall, "latency_ms": latency_ms})
+
+        chosen = next((point for point in sweep if point["recall"] >= target_recall), None)
+        if chosen is None:
+            chosen = max(sweep, key=lambda point: point["recall"])
+
+        with self._lock:
+            if param and self.config.index_type == index_type:
+                setattr(self.config, param, chosen["value"])
+            self.config.tuned_vector_count = self.store.count
+            self.tuning_report = {
+                "index_type": index_type,
+                "param": param,
+                "value": chosen["value"],
+                "recall": chosen["recall"],
+                "latency_ms": chosen["latency_ms"],
+                "target_recall": target_recall,
+                "k": k,
+                "sample_size": len(sample),
+                "vector_count": self.store.count,
+                "sweep": sweep,
+                "tuned_at": time.time()
+            }
+
+        logger.info(f"参数扫描完成: {self.index_name}, {index_type} {param}={chosen['value']}, "
+                    f"recall@{k}={chosen['recall']:.3f}, 延迟={chosen['latency_ms']:.3f}ms")
+        return self.tuning_report
+
+    def _exact_top_k(self, queries: np.ndarray, query_ids: np.ndarray,
+                     internal_ids: np.ndarray, k: int, block_size: int = 65536) -> np.ndarray:
+        """分块计算精确 top-k（排除查询自身），返回内部ID矩阵"""
+        best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        best_ids = np.full((len(queries), k), -1, dtype=np.int64)
+
+        for start in range(0, len(internal_ids), block_size):
+            block_ids = internal_ids[start:start + block_size]
+            with self._lock:
+                block = self.store.get_vectors(block_ids)
+            scores = queries @ block.T
+            scores[query_ids[:, None] == block_ids[None, :]] = -np.inf
+
+            merged_scores = np.concatenate([best_scores, scores], axis=1)
+            merged_ids = np.concatenate([best_ids, np.broadcast_to(block_ids, scores.shape)], axis=1)
+            top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+            best_ids = np.take_along_axis(merged_ids, top, axis=1)
+
+        return best_ids
+
+    def _measure_operating_point(self, config: IndexConfig, queries: np.ndarray, query_ids: np.ndarray,
+                                 ground_truth: np.ndarray, k: int) -> Tuple[float, float]:
+        """测量给定搜索参数下的 recall@k 与单查询平均延迟（毫秒）"""
+        with self._lock:
+            if self._faiss is None or self.index is None:
+                return 1.0, 0.0
+            self._apply_search_params(config=config)
+            search_k = min(k + 1 + self._tombstone_count, self.index.ntotal)
+            start = time.perf_counter()
+            _, indices = self.index.search(queries, search_k)
+            latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            self._apply_search_params()
+
+            hits = 0
+            for row, query_id in enumerate(query_ids):
+                found = [
+                    i for i in indices[row]
+                    if i >= 0 and i != query_id and not self._is_dead(int(i))
+                ][:k]
+                hits += len(set(found) & set(ground_truth[row].tolist()))
+
+        return hits / (len(query_ids) * k), latency_ms
+
+    def _rebuild_index(self):
+        """基于旁路存储中的存活向量重建索引"""
+        self._tombstones = np.zeros(len(self._tombstones), dtype=bool)
+        self._tombstone_count = 0
 
         # 重新创建索引
         self.index = self._create_index()
         self._is_trained = False
 
+        internal_ids = self.store.alive_internal_ids() if self.store.is_open else np.zeros(0, dtype=np.int64)
+        if len(internal_ids) == 0:
+            return
+
+        vectors = self.store.get_vectors(internal_ids)
+
         # 重新添加向量
         if self._faiss and self.index:
-            if hasattr(self.index, 'train'):
+            if not self.index.is_trained:
                 self.index.train(vectors)
-                self._is_trained = True
-            self.index.add(vectors)
+            self._is_trained = True
+            self.index.add_with_ids(vectors, internal_ids)
 
-        # 更新ID映射
-        self.id_map = {id: i for i, id in enumerate(ids)}
-
-        logger.info(f"索引重建完成，包含 {len(ids)} 个向量")
+        logger.info(f"索引重建完成，包含 {len(internal_ids)} 个向量")
 
     def save(self) -> bool:
         """保存索引到磁盘"""
         with self._lock:
             try:
+                self._ensure_store()
+
                 # 保存FAISS索引
                 if self._faiss and self.index:
                     self._faiss.write_index(self.index, str(self.index_path))
 
-                # 保存元数据和映射
-                data = {
-                    'id_map': self.id_map,
-                    'metadata': self.metadata,
-                    'vectors': self.vectors,
-                    'config': self.config,
-                    'is_trained': self._is_trained
-                }
-
-                with open(self.metadata_path, 'wb') as f:
-                    pickle.dump(data, f)
+                # 墓碑位图与状态
+                np.save(self.tombstones_path, self._tombstones)
+                self.store.flush({
+                    'config': asdict(self.config),
+                    'is_trained': self._is_trained,
+                    'tuning_report': self.tuning_report
+                })
 
                 logger.info(f"索引保存成功: {self.index_path}")
                 return True
@@ -372,29 +809,37 @@ class FAISSIndexService:
                 return False
 
     def load(self) -> bool:
-        """从磁盘加载索引"""
+        """从磁盘加载索引（映射旁路存储，必要时迁移旧版 pickle）"""
         with self._lock:
             try:
-                # 检查文件是否存在
-                if not self.metadata_path.exists():
+                if not self.store.open():
+                    if self.metadata_path.exists():
+                        return self._migrate_legacy_metadata()
                     logger.info("索引文件不存在，创建新索引")
                     self.initialize()
                     return True
 
-                # 加载元数据
-                with open(self.metadata_path, 'rb') as f:
-                    data = pickle.load(f)
+                state = self.store.state
+                if state.get('config'):
+                    self.config = IndexConfig(**state['config'])
+                self._is_trained = state.get('is_trained', False)
+                self.tuning_report = state.get('tuning_report')
 
-                self.id_map = data['id_map']
-                self.metadata = data['metadata']
-                self.vectors = data['vectors']
-                self.config = data.get('config', self.config)
-                self._is_trained = data.get('is_trained', False)
+                if self.tombstones_path.exists():
+                    self._tombstones = np.load(self.tombstones_path)
+                else:
+                    self._tombstones = np.zeros(0, dtype=bool)
+                self._ensure_tombstone_capacity()
+                self._tombstone_count = int(self._tombstones.sum())
 
                 # 加载FAISS索引
                 if self._faiss and self.index_path.exists():
                     self.index = self._faiss.read_index(str(self.index_path))
-                    logger.info(f"FAISS索引加载成功，包含 {len(self.id_map)} 个向量")
+                    logger.info(f"FAISS索引加载成功，包含 {self.store.count} 个向量")
+                    if self.index.metric_type != self._faiss.METRIC_INNER_PRODUCT:
+                        # 旧版自动调优生成的 HNSW / IVF_PQ 索引使用 L2 距离，分数方向相反
+                        logger.info(f"索引度量不是内积，重建索引: {self.index_name}")
+                        self._rebuild_index()
                 else:
                     # 重建索引
                     self._rebuild_index()
@@ -406,18 +851,60 @@ class FAISSIndexService:
                 self.initialize()
                 return False
 
+    def _migrate_legacy_metadata(self) -> bool:
+        """将旧版 pickle 元数据迁移为旁路存储"""
+        with open(self.metadata_path, 'rb') as f:
+            data = pickle.load(f)
+
+        self.config = data.get('config', self.config)
+        self.store.dimension = self.config.dimension
+        self.store.create()
+
+        vectors = data.get('vectors', {})
+        metadata = data.get('metadata', {})
+        ids = list(vectors.keys())
+        if ids:
+            self.store.append(
+                ids,
+                self._normalize_vectors(np.array([vectors[id] for id in ids], dtype=np.float32)),
+                [metadata.get(id, {}) for id in ids]
+            )
+
+        self._tombstones = np.zeros(0, dtype=bool)
+        self._ensure_tombstone_capacity()
+        self._rebuild_index()
+        self.save()
+
+        self.metadata_path.rename(self.metadata_path.with_suffix('.pkl.migrated'))
+        logger.info(f"旧版索引元数据迁移完成: {self.index_name}, 向量数: {len(ids)}")
+        return True
+
+    def close(self):
+        """释放旁路存储映射"""
+        with self._lock:
+            self.store.close()
+
     def get_stats(self) -> Dict[str, Any]:
         """获取索引统计信息"""
         with self._lock:
             return {
                 'index_name': self.index_name,
                 'index_type': self.config.index_type,
-                'vector_count': len(self.id_map),
+                'vector_count': self.store.count,
                 'dimension': self.config.dimension,
                 'is_trained': self._is_trained,
                 'has_faiss': self._faiss is not None,
                 'index_path': str(self.index_path),
-                'metadata_count': len(self.metadata)
+                'metadata_count': self.store.count,
+                'supports_remove': self._supports_remove(),
+                'tombstone_count': self._tombstone_count,
+                'dead_ratio': self._dead_ratio(),
+                'compacting': self._compaction_thread is not None,
+                'auto_tune': self.config.auto_tune,
+                'nlist': self.config.nlist,
+                'nprobe': self.config.nprobe,
+                'ef_search': self.config.ef_search,
+                'tuning_report': self.tuning_report
             }
 
     def _normalize_vectors(self, vectors: np.ndarray) -> np.ndarray:
@@ -439,29 +926,47 @@ class MultiIndexService:
         self._lock = threading.RLock()
 
     def get_index(self, index_name: str, config: IndexConfig = None) -> FAISSIndexService:
-        """获取或创建索引"""
+        """获取或创建索引（自动调优模式下按需在后台重新调优）"""
         with self._lock:
             if index_name not in self.indexes:
                 self.indexes[index_name] = FAISSIndexService(index_name, config)
                 self.indexes[index_name].load()
-            return self.indexes[index_name]
+            index = self.indexes[index_name]
+
+        if index.config.auto_tune and index.needs_retune():
+            index.schedule_auto_tune()
+        return index
+
+    def tune_index(self, index_name: str, sample_size: int = 200, k: int = 10,
+                   target_recall: float = None) -> Optional[Dict[str, Any]]:
+        """
+        对指定索引执行离线参数扫描并保存运行点
+
+        Returns:
+            调优报告，索引不存在或数据不足时返回 None
+        """
+        with self._lock:
+            index = self.indexes.get(index_name)
+        if index is None:
+            return None
+
+        report = index.sweep_search_params(sample_size=sample_size, k=k, target_recall=target_recall)
+        if report:
+            index.save()
+        return report
 
     def delete_index(self, index_name: str) -> bool:
         """删除索引"""
         with self._lock:
             if index_name in self.indexes:
-                del self.indexes[index_name]
+                index = self.indexes.pop(index_name)
 
                 # 删除文件
-                index_dir = Path("data/faiss_indexes")
-                index_path = index_dir / f"{index_name}.faiss"
-                metadata_path = index_dir / f"{index_name}_metadata.pkl"
-
                 try:
-                    if index_path.exists():
-                        index_path.unlink()
-                    if metadata_path.exists():
-                        metadata_path.unlink()
+                    index.store.remove_files()
+                    for path in (index.index_path, index.metadata_path, index.tombstones_path):
+                        if path.exists():
+                            path.unlink()
                     return True
                 except Exception as e:
                     logger.error(f"删除索引文件失败: {e}")
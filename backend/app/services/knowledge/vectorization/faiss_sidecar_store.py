@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+FAISS索引旁路存储
+
+替代原先 pickle 整体序列化的 id_map / metadata / vectors，
+为 FAISSIndexService 提供可内存映射的持久化布局：
+
+- {name}_vectors.npy   : float32 连续矩阵 (capacity, dimension)，行号即内部ID
+- {name}_alive.npy     : uint8 存活标记 (capacity,)
+- {name}_offsets.npy   : int64 元数据日志偏移 (capacity,)，即数组化的ID表
+- {name}_meta.log      : 追加写入的元数据日志，每行一条 JSON 记录
+- {name}_state.json    : 小型状态文件（下一个内部ID、维度、索引配置等）
+
+加载时只映射文件，不解码全部数据；外部ID -> 内部ID 的反查表
+在第一次写操作时才通过顺序扫描日志构建。
+"""
+
+import json
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FAISSSidecarStore:
+    """
+    FAISS索引旁路存储
+
+    以内部整数ID为行号保存向量、存活标记和元数据偏移，
+    所有写入立即落到内存映射文件或追加日志中。
+    """
+
+    FORMAT_VERSION = 1
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, base_dir: Path, name: str, dimension: int):
+        """
+        初始化旁路存储
+
+        Args:
+            base_dir: 存储目录
+            name: 索引名称
+            dimension: 向量维度
+        """
+        self.base_dir = Path(base_dir)
+        self.name = name
+        self.dimension = dimension
+
+        self.vectors_path, self.alive_path, self.offsets_path, self.log_path, self.state_path = \
+            self.file_paths(self.base_dir, name)
+
+        self._vectors: Optional[np.memmap] = None
+        self._alive: Optional[np.memmap] = None
+        self._offsets: Optional[np.memmap] = None
+        self._log = None
+        self._id_index: Optional[Dict[str, int]] = None
+
+        self.next_internal_id = 0
+        self.count = 0
+        self.state: Dict[str, Any] = {}
+
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def file_paths(base_dir: Path, name: str) -> List[Path]:
+        """获取旁路存储的全部文件路径"""
+        base_dir = Path(base_dir)
+        return [
+            base_dir / f"{name}_vectors.npy",
+            base_dir / f"{name}_alive.npy",
+            base_dir / f"{name}_offsets.npy",
+            base_dir / f"{name}_meta.log",
+            base_dir / f"{name}_state.json",
+        ]
+
+    @property
+    def is_open(self) -> bool:
+        """存储是否已打开"""
+        return self._vectors is not None
+
+    def exists(self) -> bool:
+        """磁盘上是否存在完整的旁路存储"""
+        return all(path.exists() for path in self.file_paths(self.base_dir, self.name))
+
+    def open(self) -> bool:
+        """
+        映射已存在的旁路存储
+
+        Returns:
+            是否成功打开（文件不存在时返回 False）
+        """
+        with self._lock:
+            if self.is_open:
+                return True
+            if not self.exists():
+                return False
+
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                self.state = json.load(f)
+
+            self.dimension = self.state.get('dimension', self.dimension)
+            self.next_internal_id = self.state.get('next_internal_id', 0)
+
+            self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+            self._alive = np.load(self.alive_path, mmap_mode='r+')
+            self._offsets = np.load(self.offsets_path, mmap_mode='r+')
+            self._log = open(self.log_path, 'a+b')
+
+            # 崩溃恢复：状态文件之后写入的行和日志记录不可信，截断日志，
+            # 避免后续复用的内部ID与残留记录指向同一行
+            self._alive[self.next_internal_id:] = 0
+            log_size = self._log.seek(0, os.SEEK_END)
+            self._log.truncate(min(self._valid_log_length(), log_size))
+            self.count = int(np.count_nonzero(self._alive[:self.next_internal_id]))
+            self._id_index = None
+
+            logger.info(f"旁路存储映射完成: {self.name}, 向量数: {self.count}")
+            return True
+
+    def create(self):
+        """创建新的空旁路存储（覆盖已有文件）"""
+        with self._lock:
+            self.close()
+            self.base_dir.mkdir(parents=True, exist_ok=True)
+
+            capacity = self.INITIAL_CAPACITY
+            self._vectors = np.lib.format.open_memmap(
+                self.vectors_path, mode='w+', dtype=np.float32, shape=(capacity, self.dimension)
+            )
+            self._alive = np.lib.format.open_memmap(
+                self.alive_path, mode='w+', dtype=np.uint8, shape=(capacity,)
+            )
+            self._offsets = np.lib.format.open_memmap(
+                self.offsets_path, mode='w+', dtype=np.int64, shape=(capacity,)
+            )
+            self._log = open(self.log_path, 'w+b')
+
+            self.next_internal_id = 0
+            self.count = 0
+            self._id_index = {}
+            self.flush()
+
+    def _grow(self, required: int):
+        """按倍增策略扩容内存映射文件"""
+        capacity = len(self._alive)
+        if required <= capacity:
+            return
+
+        new_capacity = capacity
+        while new_capacity < required:
+            new_capacity *= 2
+
+        for attr, path, dtype, shape in (
+            ('_vectors', self.vectors_path, np.float32, (new_capacity, self.dimension)),
+            ('_alive', self.alive_path, np.uint8, (new_capacity,)),
+            ('_offsets', self.offsets_path, np.int64, (new_capacity,)),
+        ):
+            old = getattr(self, attr)
+            tmp_path = path.with_suffix('.tmp.npy')
+            grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+            grown[:capacity] = old[:capacity]
+            grown.flush()
+            # 先释放映射再替换文件（Windows 下被映射的文件无法替换）
+            setattr(self, attr, None)
+            del old, grown
+            os.replace(tmp_path, path)
+            setattr(self, attr, np.load(path, mmap_mode='r+'))
+
+        logger.info(f"旁路存储扩容: {self.name}, {capacity} -> {new_capacity}")
+
+    def _valid_log_length(self) -> int:
+        """状态文件对应的日志长度（旧版状态文件未记录时，取最后一个有效记录的末尾）"""
+        if 'log_length' in self.state:
+            return int(self.state['log_length'])
+        if self.next_internal_id == 0:
+            return 0
+        offset = int(self._offsets[self.next_internal_id - 1])
+        self._log.seek(offset)
+        return offset + len(self._log.readline())
+
+    def _read_record(self, internal_id: int) -> Dict[str, Any]:
+        """读取内部ID对应的元数据日志记录"""
+        self._log.seek(int(self._offsets[internal_id]))
+        return json.loads(self._log.readline())
+
+    def _ensure_id_index(self):
+        """首次写操作时顺序扫描日志构建外部ID反查表"""
+        if self._id_index is not None:
+            return
+        self._id_index = {}
+        self._log.flush()
+        self._log.seek(0)
+        position = 0
+        for line in self._log:
+            record = json.loads(line)
+            internal_id = record['iid']
+            # 只接受偏移表指向的记录，忽略同一内部ID的残留记录
+            if (internal_id < self.next_internal_id and self._alive[internal_id]
+                    and int(self._offsets[internal_id]) == position):
+                self._id_index[record['id']] = internal_id
+            position += len(line)
+
+    def lookup(self, id: str) -> Optional[int]:
+        """外部ID -> 内部ID"""
+        with self._lock:
+            self._ensure_id_index()
+            return self._id_index.get(id)
+
+    def append(self, ids: List[str], vectors: np.ndarray,
+               metadata: Optional[List[Dict[str, Any]]] = None) -> np.ndarray:
+        """
+        追加向量及元数据
+
+        Args:
+            ids: 外部ID列表（调用方需保证不存在重复的存活ID）
+            vectors: 已归一化的向量矩阵 (n, dimension)
+            metadata: 元数据列表
+
+        Returns:
+            分配的内部ID数组
+        """
+        with self._lock:
+            self._ensure_id_index()
+            start = self.next_internal_id
+            end = start + len(ids)
+            self._grow(end)
+
+            self._vectors[start:end] = vectors
+            self._log.seek(0, os.SEEK_END)
+            for i, id in enumerate(ids):
+                internal_id = start + i
+                self._offsets[internal_id] = self._log.tell()
+                record = {
+                    'iid': internal_id,
+                    'id': id,
+                    'metadata': metadata[i] if metadata and i < len(metadata) else {}
+                }
+                self._log.write((json.dumps(record, ensure_ascii=False, default=str) + '\n').encode('utf-8'))
+                self._id_index[id] = internal_id
+            self._alive[start:end] = 1
+
+            self.next_internal_id = end
+            self.count += len(ids)
+            return np.arange(start, end, dtype=np.int64)
+
+    def mark_deleted(self, internal_ids: List[int]):
+        """标记内部ID为已删除"""
+        with self._lock:
+            for internal_id in internal_ids:
+                if self._alive[internal_id]:
+                    self._alive[internal_id] = 0
+                    self.count -= 1
+                    if self._id_index is not None:
+                        self._id_index.pop(self.get_id(internal_id), None)
+
+    def is_alive(self, internal_id: int) -> bool:
+        """内部ID是否存活"""
+        return 0 <= internal_id < self.next_internal_id and bool(self._alive[internal_id])
+
+    def alive_internal_ids(self) -> np.ndarray:
+        """全部存活的内部ID"""
+        with self._lock:
+            return np.flatnonzero(self._alive[:self.next_internal_id]).astype(np.int64)
+
+    def get_vectors(self, internal_ids: np.ndarray) -> np.ndarray:
+        """批量读取向量（返回副本）"""
+        with self._lock:
+            return np.array(self._vectors[internal_ids], dtype=np.float32)
+
+    def get_vector(self, internal_id: int) -> np.ndarray:
+        """读取单个向量（返回副本）"""
+        with self._lock:
+            return np.array(self._vectors[internal_id], dtype=np.float32)
+
+    def get_id(self, internal_id: int) -> str:
+        """内部ID -> 外部ID"""
+        with self._lock:
+            return self._read_record(internal_id)['id']
+
+    def get_metadata(self, internal_id: int) -> Dict[str, Any]:
+        """读取内部ID对应的元数据"""
+        with self._lock:
+            return self._read_record(internal_id).get('metadata', {})
+
+    def flush(self, state: Optional[Dict[str, Any]] = None):
+        """
+        刷新映射文件与日志，并写入状态文件
+
+        Args:
+            state: 需要一并持久化的额外状态
+        """
+        with self._lock:
+            if not self.is_open:
+                return
+            if state:
+                self.state.update(state)
+            self.state.update({
+                'format_version': self.FORMAT_VERSION,
+                'dimension': self.dimension,
+                'next_internal_id': self.next_internal_id,
+            })
+
+            self._vectors.flush()
+            self._alive.flush()
+            self._offsets.flush()
+            self._log.flush()
+            self.state['log_length'] = self._log.seek(0, os.SEEK_END)
+
+            tmp_path = self.state_path.with_suffix('.json.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+
+    def close(self):
+        """释放映射和日志句柄"""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self._vectors = None
+            self._alive = None
+            self._offsets = None
+            self._log = None
+            self._id_index = None
+
+    def remove_files(self):
+        """删除旁路存储文件"""
+        with self._lock:
+            self.close()
+            for path in self.file_paths(self.base_dir, self.name):
+                if path.exists():
+                    path.unlink()
@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+HNSW近似最近邻引擎
+
+为 multi_level_index_service.HNSWIndex 提供真实的分层可导航小世界图索引，按可用性选择后端：
+
+- hnswlib : 首选（chromadb 依赖的 chroma-hnswlib 也提供该模块），原生支持标记删除与槽位复用
+- faiss   : IndexHNSWFlat，删除以墓碑标记实现，墓碑过多时压缩重建
+- numpy   : 纯 NumPy 实现的 HNSW（Malkov & Yashunin 2016），邻居扩展时批量计算相似度
+
+所有后端统一使用整数标签，返回"相似度"（越大越相近）：
+- ip 空间：内积（余弦度量时向量已归一化）
+- l2 空间：负的平方欧氏距离
+"""
+
+import heapq
+import logging
+import math
+import sys
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    hnswlib = None
+    HNSWLIB_AVAILABLE = False
+
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    faiss = None
+    FAISS_AVAILABLE = False
+
+
+class HNSWEngine(ABC):
+    """HNSW引擎接口"""
+
+    name = "base"
+
+    def __init__(self, dimension: int, space: str = "ip", M: int = 16, ef_construction: int = 200):
+        if space not in ("ip", "l2"):
+            raise ValueError(f"不支持的距离空间: {space}")
+        self.dimension = dimension
+        self.space = space
+        self.M = M
+        self.ef_construction = ef_construction
+
+    @property
+    @abstractmethod
+    def count(self) -> int:
+        """存活向量数"""
+        pass
+
+    @abstractmethod
+    def add(self, vectors: np.ndarray, labels: np.ndarray):
+        """批量添加向量（调用方保证标签唯一）"""
+        pass
+
+    @abstractmethod
+    def mark_deleted(self, label: int) -> bool:
+        """标记删除"""
+        pass
+
+    @abstractmethod
+    def search(self, query: np.ndarray, k: int, ef: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        近似最近邻搜索
+
+        Returns:
+            (标签数组, 相似度数组)，按相似度降序，不包含已删除向量
+        """
+        pass
+
+    @abstractmethod
+    def memory_bytes(self) -> int:
+        """索引实际占用的内存（字节）"""
+        pass
+
+
+class HnswlibEngine(HNSWEngine):
+    """hnswlib 后端"""
+
+    name = "hnswlib"
+
+    def __init__(self, dimension: int, space: str = "ip", M: int = 16,
+                 ef_construction: int = 200, capacity: int = 1024):
+        super().__init__(dimension, space, M, ef_construction)
+        self._index = hnswlib.Index(space=space, dim=dimension)
+        self._index.init_index(
+            max_elements=max(capacity, 16), ef_construction=ef_construction,
+            M=M, allow_replace_deleted=True
+        )
+        self._deleted = 0
+
+    @property
+    def count(self) -> int:
+        return self._index.get_current_count() - self._deleted
+
+    def add(self, vectors: np.ndarray, labels: np.ndarray):
+        if len(labels) == 0:
+            return
+        # 删除的槽位会被复用，只有存活数量超出容量时才扩容
+        required = self.count + len(labels)
+        capacity = self._index.get_max_elements()
+        if required > capacity:
+            self._index.resize_index(max(required, capacity * 2))
+        reused = min(self._deleted, len(labels))
+        self._index.add_items(vectors, labels, replace_deleted=True)
+        self._deleted -= reused
+
+    def mark_deleted(self, label: int) -> bool:
+        try:
+            self._index.mark_deleted(label)
+        except RuntimeError:
+            return False
+        self._deleted += 1
+        return True
+
+    def search(self, query: np.ndarray, k: int, ef: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.count)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        self._index.set_ef(max(ef, k))
+        try:
+            labels, distances = self._index.knn_query(query.reshape(1, -1), k=k)
+        except RuntimeError:
+            # 已删除节点较多时 ef 可能不足以凑满 k 个结果
+            self._index.set_ef(max(self._index.get_current_count(), k))
+            labels, distances = self._index.knn_query(query.reshape(1, -1), k=k)
+        similarities = 1.0 - distances[0] if self.space == "ip" else -distances[0]
+        return labels[0].astype(np.int64), similarities
+
+    def memory_bytes(self) -> int:
+        capacity = self._index.get_max_elements()
+        stored = self._index.get_current_count()
+        # 第0层：向量 + 2M 条链接 + 链接计数 + 标签；上层期望层数为 1/(M-1)
+        level0 = capacity * (self.dimension * 4 + (2 * self.M + 1) * 4 + 8)
+        upper = int(stored * (self.M + 1) * 4 / max(self.M - 1, 1))
+        return level0 + upper
+
+
+class FaissHNSWEngine(HNSWEngine):
+    """faiss IndexHNSWFlat 后端"""
+
+    name = "faiss"
+
+    # 墓碑占比超过该值时压缩重建
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, dimension: int, space: str = "ip", M: int = 16,
+                 ef_construction: int = 200, capacity: int = 1024):
+        super().__init__(dimension, space, M, ef_construction)
+        self._index = self._new_index()
+        self._labels = np.empty(0, dtype=np.int64)     # faiss 顺序ID -> 标签
+        self._positions: Dict[int, int] = {}           # 标签 -> faiss 顺序ID
+        self._tombstones = np.zeros(0, dtype=bool)
+        self._deleted = 0
+
+    def _new_index(self):
+        metric = faiss.METRIC_INNER_PRODUCT if self.space == "ip" else faiss.METRIC_L2
+        index = faiss.IndexHNSWFlat(self.dimension, self.M, metric)
+        index.hnsw.efConstruction = self.ef_construction
+        return index
+
+    @property
+    def count(self) -> int:
+        return self._index.ntotal - self._deleted
+
+    def add(self, vectors: np.ndarray, labels: np.ndarray):
+        if len(labels) == 0:
+            return
+        start = self._index.ntotal
+        self._index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        self._labels = np.concatenate([self._labels, labels.astype(np.int64)])
+        self._tombstones = np.concatenate([self._tombstones, np.zeros(len(labels), dtype=bool)])
+        for offset, label in enumerate(labels.tolist()):
+            self._positions[label] = start + offset
+
+    def mark_deleted(self, label: int) -> bool:
+        position = self._positions.pop(label, None)
+        if position is None:
+            return False
+        self._tombstones[position] = True
+        self._deleted += 1
+        if self._deleted > self.COMPACT_RATIO * self._index.ntotal:
+            self._compact()
+        return True
+
+    def _compact(self):
+        """移除墓碑并重建图"""
+        alive = np.flatnonzero(~self._tombstones)
+        vectors = self._index.reconstruct_n(0, self._index.ntotal)[alive]
+        labels = self._labels[alive]
+        logger.info(f"faiss HNSW压缩重建: 移除 {self._deleted} 个已删除向量，保留 {len(alive)} 个")
+
+        self._index = self._new_index()
+        self._labels = np.empty(0, dtype=np.int64)
+        self._positions = {}
+        self._tombstones = np.zeros(0, dtype=bool)
+        self._deleted = 0
+        self.add(vectors, labels)
+
+    def search(self, query: np.ndarray, k: int, ef: int) -> Tuple[np.ndarray, np.ndarray]:
+        k = min(k, self.count)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # 墓碑仍在图中，多取一些结果再过滤
+        fetch = min(self._index.ntotal, k + self._deleted)
+        self._index.hnsw.efSearch = max(ef, fetch)
+        distances, positions = self._index.search(query.reshape(1, -1).astype(np.float32), fetch)
+        distances, positions = distances[0], positions[0]
+        valid = positions >= 0
+        distances, positions = distances[valid], positions[valid]
+        keep = ~self._tombstones[positions]
+        distances, positions = distances[keep][:k], positions[keep][:k]
+        similarities = distances if self.space == "ip" else -distances
+        return self._labels[positions], similarities
+
+    def memory_bytes(self) -> int:
+        hnsw = self._index.hnsw
+        return (
+            self._index.ntotal * self.dimension * 4
+            + hnsw.neighbors.size() * 4
+            + hnsw.levels.size() * 4
+            + hnsw.offsets.size() * 8
+            + self._labels.nbytes
+            + self._tombstones.nbytes
+        )
+
+
+class NumpyHNSWEngine(HNSWEngine):
+    """纯 NumPy 的 HNSW 实现"""
+
+    name = "numpy"
+
+    # 已删除节点占比超过该值时重建图
+    REBUILD_RATIO = 0.5
+
+    def __init__(self, dimension: int, space: str = "ip", M: int = 16,
+                 ef_construction: int = 200, capacity: int = 1024, seed: int = 42):
+        super().__init__(dimension, space, M, ef_construction)
+        self.M0 = 2 * M
+        self._level_mult = 1.0 / math.log(max(M, 2))
+        self._rng = np.random.RandomState(seed)
+        self._lock = threading.RLock()
+        self._reset(capacity)
+
+    def _reset(self, capacity: int):
+        capacity = max(capacity, 16)
+        self._vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        self._node_labels = np.full(capacity, -1, dtype=np.int64)
+        self._deleted_mask = np.zeros(capacity, dtype=bool)
+        self._visited = np.zeros(capacity, dtype=np.int32)
+        self._stamp = 0
+        self._links: List[List[np.ndarray]] = []       # _links[节点][层] -> 邻居数组
+        self._nodes: Dict[int, int] = {}               # 标签 -> 节点
+        self._entry = -1
+        self._max_level = -1
+        self._deleted = 0
+
+    @property
+    def count(self) -> int:
+        return len(self._links) - self._deleted
+
+    # ------------------------------------------------------------------
+    # 相似度
+    # ------------------------------------------------------------------
+
+    def _similarity(self, nodes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        vectors = self._vectors[nodes]
+        if self.space == "ip":
+            return vectors @ query
+        diff = vectors - query
+        return -np.einsum('ij,ij->i', diff, diff)
+
+    def _pairwise_similarity(self, nodes: np.ndarray) -> np.ndarray:
+        vectors = self._vectors[nodes]
+        gram = vectors @ vectors.T
+        if self.space == "ip":
+            return gram
+        norms = np.einsum('ij,ij->i', vectors, vectors)
+        return 2 * gram - norms[:, None] - norms[None, :]
+
+    # ------------------------------------------------------------------
+    # 图操作
+    # ------------------------------------------------------------------
+
+    def _next_stamp(self) -> int:
+        self._stamp += 1
+        if self._stamp >= np.iinfo(np.int32).max:
+            self._visited[:] = 0
+            self._stamp = 1
+        return self._stamp
+
+    def _search_layer(self, query: np.ndarray, entries: List[Tuple[float, int]],
+                      ef: int, layer: int) -> List[Tuple[float, int]]:
+        """在单层上做贪心最佳优先搜索，返回最多 ef 个 (相似度, 节点)"""
+        stamp = self._next_stamp()
+        visited = self._visited
+        candidates = []     # 大顶堆 (-相似度, 节点)
+        results = []        # 小顶堆 (相似度, 节点)
+        for sim, node in entries:
+            visited[node] = stamp
+            heapq.heappush(candidates, (-sim, node))
+            heapq.heappush(results, (sim, node))
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if -neg_sim < results[0][0] and len(results) >= ef:
+                break
+            neighbors = self._links[node][layer] if layer < len(self._links[node]) else None
+            if neighbors is None or not len(neighbors):
+                continue
+            neighbors = neighbors[visited[neighbors] != stamp]
+            if not len(neighbors):
+                continue
+            visited[neighbors] = stamp
+            sims = self._similarity(neighbors, query)
+            if len(results) >= ef:
+                # 结果集下界只会上升，先批量剔除不可能进入结果集的邻居
+                better = sims > results[0][0]
+                sims, neighbors = sims[better], neighbors[better]
+            for sim, neighbor in zip(sims.tolist(), neighbors.tolist()):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, neighbor))
+                    heapq.heappush(results, (sim, neighbor))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return results
+
+    def _select_neighbors(self, candidates: List[Tuple[float, int]], limit: int) -> np.ndarray:
+        """启发式邻居选择：候选与已选邻居的相似度低于与目标的相似度时才保留，不足时用被剪枝的补齐"""
+        if len(candidates) <= limit:
+            return np.array([node for _, node in candidates], dtype=np.int64)
+
+        ordered = sorted(candidates, reverse=True)
+        sims = np.array([sim for sim, _ in ordered])
+        nodes = np.array([node for _, node in ordered], dtype=np.int64)
+        pairwise = self._pairwise_similarity(nodes)
+
+        # closest[i]: 候选 i 与已选邻居的最大相似度
+        closest = np.full(len(nodes), -np.inf)
+        selected: List[int] = []
+        pruned: List[int] = []
+        for i in range(len(nodes)):
+            if len(selected) >= limit:
+                break
+            if closest[i] >= sims[i]:
+                pruned.append(i)
+            else:
+                selected.append(i)
+                np.maximum(closest, pairwise[:, i], out=closest)
+        selected.extend(pruned[:limit - len(selected)])
+        return nodes[selected]
+
+    def _connect(self, node: int, neighbor: int, layer: int):
+        """添加反向链接，超出上限时按启发式收缩"""
+        limit = self.M0 if layer == 0 else self.M
+        links = np.append(self._links[neighbor][layer], node)
+        if len(links) > limit:
+            sims = self._similarity(links, self._vectors[neighbor])
+            links = self._select_neighbors(list(zip(sims.tolist(), links.tolist())), limit)
+        self._links[neighbor][layer] = links
+
+    def _insert(self, node: int):
+        query = self._vectors[node]
+        level = int(-math.log(1.0 - self._rng.random_sample()) * self._level_mult)
+        self._links.append([np.empty(0, dtype=np.int64) for _ in range(level + 1)])
+
+        if self._entry < 0:
+            self._entry, self._max_level = node, level
+            return
+
+        entries = [(float(self._similarity(np.array([self._entry]), query)[0]), self._entry)]
+        for layer in range(self._max_level, level, -1):
+            entries = [max(self._search_layer(query, entries, 1, layer))]
+
+        for layer in range(min(level, self._max_level), -1, -1):
+            found = self._search_layer(query, entries, self.ef_construction, layer)
+            neighbors = self._select_neighbors(found, self.M)
+            self._links[node][layer] = neighbors
+            for neighbor in neighbors.tolist():
+                self._connect(node, neighbor, layer)
+            entries = found
+
+        if level > self._max_level:
+            self._entry, self._max_level = node, level
+
+    def _grow(self, required: int):
+        capacity = len(self._node_labels)
+        if required <= capacity:
+            return
+        new_capacity = max(required, capacity * 2)
+        vectors = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+        vectors[:capacity] = self._vectors
+        self._vectors = vectors
+        self._node_labels = np.concatenate([self._node_labels, np.full(new_capacity - capacity, -1, dtype=np.int64)])
+        self._deleted_mask = np.concatenate([self._deleted_mask, np.zeros(new_capacity - capacity, dtype=bool)])
+        self._visited = np.concatenate([self._visited, np.zeros(new_capacity - capacity, dtype=np.int32)])
+
+    # ------------------------------------------------------------------
+    # 公共接口
+    # ------------------------------------------------------------------
+
+    def add(self, vectors: np.ndarray, labels: np.ndarray):
+        with self._lock:
+            start = len(self._links)
+            self._grow(start + len(labels))
+            self._vectors[start:start + len(labels)] = vectors
+            for offset, label in enumerate(labels.tolist()):
+                node = start + offset
+                self._node_labels[node] = label
+                self._nodes[label] = node
+                self._insert(node)
+
+    def mark_deleted(self, label: int) -> bool:
+        with self._lock:
+            node = self._nodes.pop(label, None)
+            if node is None:
+                return False
+            # 已删除节点保留在图中用于导航，只从结果中排除
+            self._deleted_mask[node] = True
+            self._deleted += 1
+            if self._deleted > self.REBUILD_RATIO * len(self._links):
+                self._rebuild()
+            return True
+
+    def _rebuild(self):
+        """重建图，移除已删除节点"""
+        alive = np.flatnonzero(~self._deleted_mask[:len(self._links)])
+        vectors = self._vectors[alive].copy()
+        labels = self._node_labels[alive].copy()
+        logger.info(f"NumPy HNSW重建: 移除 {self._deleted} 个已删除节点，保留 {len(alive)} 个")
+        self._reset(len(alive) * 2)
+        self.add(vectors, labels)
+
+    def search(self, query: np.ndarray, k: int, ef: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            k = min(k, self.count)
+            if k <= 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+            query = query.astype(np.float32)
+            entries = [(float(self._similarity(np.array([self._entry]), query)[0]), self._entry)]
+            for layer in range(self._max_level, 0, -1):
+                entries = [max(self._search_layer(query, entries, 1, layer))]
+
+            ef = max(ef, k)
+            while True:
+                found = sorted(self._search_layer(query, entries, ef, 0), reverse=True)
+                alive = [(sim, node) for sim, node in found if not self._deleted_mask[node]]
+                if len(alive) >= k or ef >= len(self._links):
+                    break
+                ef = min(ef * 2, len(self._links))
+
+            alive = alive[:k]
+            nodes = np.array([node for _, node in alive], dtype=np.int64)
+            return self._node_labels[nodes], np.array([sim for sim, _ in alive], dtype=np.float32)
+
+    def memory_bytes(self) -> int:
+        with self._lock:
+            array_overhead = sys.getsizeof(np.empty(0, dtype=np.int64))
+            link_bytes = sum(
+                sys.getsizeof(layers) + sum(links.nbytes + array_overhead for links in layers)
+                for layers in self._links
+            )
+            return (
+                self._vectors.nbytes + self._node_labels.nbytes + self._deleted_mask.nbytes
+                + self._visited.nbytes + link_bytes
+                + sys.getsizeof(self._nodes) + len(self._nodes) * 2 * sys.getsizeof(0)
+            )
+
+
+def create_hnsw_engine(dimension: int, space: str = "ip", M: int = 16,
+                       ef_construction: int = 200, capacity: int = 1024,
+                       backend: str = "auto") -> HNSWEngine:
+    """
+    创建HNSW引擎
+
+    Args:
+        backend: auto / hnswlib / faiss / numpy，auto 按 hnswlib -> faiss -> numpy 的顺序选择
+    """
+    if backend in ("auto", "hnswlib") and HNSWLIB_AVAILABLE:
+        return HnswlibEngine(dimension, space, M, ef_construction, capacity)
+    if backend in ("auto", "faiss") and FAISS_AVAILABLE:
+        return FaissHNSWEngine(dimension, space, M, ef_construction, capacity)
+    if backend not in ("auto", "numpy"):
+        logger.warning(f"HNSW后端 {backend} 不可用，使用NumPy实现")
+    return NumpyHNSWEngine(dimension, space, M, ef_construction, capacity)
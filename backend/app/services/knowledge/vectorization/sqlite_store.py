@@ -3,13 +3,21 @@ SQLite 向量存储实现
 
 使用 SQLite 存储文档向量，无需外部服务。
 使用简单的哈希和文本匹配实现相似度搜索。
+
+存储模式：
+- json: 向量以 JSON 形式存储，搜索时逐行解码计算（兼容旧数据）
+- matrix: 向量以 float32 BLOB 存储，搜索时使用按知识库缓存的
+  预归一化内存映射矩阵，一次矩阵-向量乘法 + argpartition 取 top-k
 """
 
 import json
 import logging
+import os
+import tempfile
+import threading
 import numpy as np
-from typing import List, Dict, Any, Optional
-from sqlalchemy import Column, Integer, String, Text, Float, JSON, create_engine, inspect
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import Column, Integer, String, Text, Float, JSON, LargeBinary, create_engine, inspect, text as sql_text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.sql import func
@@ -30,6 +38,7 @@ class VectorDocument(Base):
     chunk_id = Column(String(100), nullable=False, index=True)     # 块ID
     text = Column(Text, nullable=False)                            # 文本内容
     vector = Column(JSON, nullable=True)                           # 向量数据（JSON格式）
+    vector_blob = Column(LargeBinary, nullable=True)               # 向量数据（float32 BLOB，matrix模式）
     knowledge_base_id = Column(Integer, nullable=True, index=True) # 知识库ID
     chunk_index = Column(Integer, nullable=True)                   # 块索引
     total_chunks = Column(Integer, nullable=True)                  # 总块数
@@ -37,6 +46,35 @@ class VectorDocument(Base):
     created_at = Column(String(50), nullable=True)                 # 创建时间
 
 
+class VectorMatrixGeneration(Base):
+    """
+    知识库矩阵代数
+
+    每次向量写入（新增/删除）都会递增受影响知识库的代数，
+    代数存储在同一数据库中，因此对所有工作进程可见。
+    """
+    __tablename__ = "vector_matrix_generations"
+    
+    knowledge_base_key = Column(Integer, primary_key=True)          # 知识库ID，-1 表示全部
+    generation = Column(Integer, nullable=False, default=0)         # 当前代数
+
+
+class _KnowledgeBaseMatrix:
+    """
+    单个知识库的预归一化向量矩阵
+    
+    矩阵以 .npy 文件形式落盘并通过 np.load(mmap_mode="r") 映射，
+    ids 与矩阵行一一对应（vector_documents.id）。
+    signature 为 (行数, 最大ID, 代数)；文件名包含代数，写入后不再修改，
+    因此其他线程或进程仍在映射的旧文件不会被截断或覆盖。
+    """
+    
+    def __init__(self, ids: np.ndarray, matrix: np.ndarray, signature: Tuple[int, int, int]):
+        self.ids = ids
+        self.matrix = matrix
+        self.signature = signature
+
+
 class SQLiteVectorStore(VectorStoreBase):
     """
     SQLite 向量存储实现
@@ -46,25 +84,345 @@ class SQLiteVectorStore(VectorStoreBase):
     - 使用 SQLite 存储文档和向量
     - 使用余弦相似度进行搜索
     - 适合中小规模数据（< 10万条）
+    - matrix 模式下按知识库缓存内存映射矩阵，写入时失效
     """
     
-    def __init__(self, db_path: str = "./vector_store.db"):
+    STORAGE_MODES = ("json", "matrix")
+    
+    def __init__(
+        self,
+        db_path: str = "./vector_store.db",
+        storage_mode: str = "matrix",
+        matrix_dir: Optional[str] = None
+    ):
         """
         初始化 SQLite 向量存储
         
         Args:
             db_path: SQLite 数据库文件路径
+            storage_mode: 存储模式，"json" 或 "matrix"
+            matrix_dir: 矩阵缓存目录，默认为数据库文件同目录下的 vector_matrix_cache
         """
+        if storage_mode not in self.STORAGE_MODES:
+            raise ValueError(f"不支持的存储模式: {storage_mode}，可选: json, matrix")
+        
         self.db_path = db_path
+        self.storage_mode = storage_mode
+        self.matrix_dir = matrix_dir or os.path.join(
+            os.path.dirname(os.path.abspath(db_path)), "vector_matrix_cache"
+        )
         self.engine = create_engine(f"sqlite:///{db_path}")
         Base.metadata.create_all(self.engine)
+        self._ensure_blob_column()
         self.Session = sessionmaker(bind=self.engine)
-        logger.info(f"SQLiteVectorStore 初始化完成: {db_path}")
+        
+        # 知识库矩阵缓存：key 为知识库ID（None 表示全部）
+        self._matrix_cache: Dict[Optional[int], _KnowledgeBaseMatrix] = {}
+        self._matrix_lock = threading.RLock()
+        
+        logger.info(f"SQLiteVectorStore 初始化完成: {db_path}, 存储模式: {storage_mode}")
     
     def _get_session(self) -> Session:
         """获取数据库会话"""
         return self.Session()
     
+    def _ensure_blob_column(self):
+        """为旧版数据库补充 vector_blob 列"""
+        try:
+            columns = {col["name"] for col in inspect(self.engine).get_columns(VectorDocument.__tablename__)}
+            if "vector_blob" not in columns:
+                with self.engine.begin() as conn:
+                    conn.execute(sql_text(
+                        f"ALTER TABLE {VectorDocument.__tablename__} ADD COLUMN vector_blob BLOB"
+                    ))
+                logger.info("已为 vector_documents 表添加 vector_blob 列")
+        except Exception as e:
+            logger.warning(f"检查 vector_blob 列失败: {e}")
+    
+    @staticmethod
+    def _pack_vector(vector: List[float]) -> bytes:
+        """将向量打包为 float32 BLOB"""
+        return np.asarray(vector, dtype=np.float32).tobytes()
+    
+    @staticmethod
+    def _unpack_vector(blob: Optional[bytes], vector_json: Optional[Any]) -> Optional[np.ndarray]:
+        """从 BLOB（优先）或 JSON 列还原 float32 向量"""
+        if blob:
+            return np.frombuffer(blob, dtype=np.float32)
+        if vector_json:
+            if isinstance(vector_json, str):
+                vector_json = json.loads(vector_json)
+            return np.asarray(vector_json, dtype=np.float32)
+        return None
+    
+    def _vector_columns(self, vector: List[float]) -> Dict[str, Any]:
+        """按存储模式生成向量列的取值"""
+        if self.storage_mode == "matrix":
+            return {"vector": None, "vector_blob": self._pack_vector(vector)}
+        return {"vector": vector, "vector_blob": None}
+    
+    ALL_KNOWLEDGE_BASES_KEY = -1
+    
+    def _invalidate_matrix(self, knowledge_base_ids: Optional[List[Optional[int]]] = None):
+        """
+        使知识库矩阵缓存失效
+        
+        递增数据库中的代数，其他工作进程在下一次搜索时即可发现变化。
+        
+        Args:
+            knowledge_base_ids: 受影响的知识库ID列表，None 表示全部失效
+        """
+        try:
+            with self.engine.begin() as conn:
+                if knowledge_base_ids is None:
+                    conn.execute(sql_text(
+                        f"UPDATE {VectorMatrixGeneration.__tablename__} SET generation = generation + 1"
+                    ))
+                    keys = {self.ALL_KNOWLEDGE_BASES_KEY}
+                else:
+                    # 任何写入都会影响“全部知识库”矩阵
+                    keys = {self._generation_key(kb_id) for kb_id in knowledge_base_ids}
+                    keys.add(self.ALL_KNOWLEDGE_BASES_KEY)
+                for key in keys:
+                    conn.execute(sql_text(
+                        f"INSERT INTO {VectorMatrixGeneration.__tablename__} (knowledge_base_key, generation) "
+                        "VALUES (:key, 1) "
+                        "ON CONFLICT(knowledge_base_key) DO UPDATE SET generation = generation + 1"
+                    ), {"key": key})
+        except Exception as e:
+            logger.warning(f"更新矩阵代数失败: {e}")
+            with self._matrix_lock:
+                # 至少保证本进程不再使用旧矩阵
+                if knowledge_base_ids is None:
+                    self._matrix_cache.clear()
+                else:
+                    for kb_id in set(knowledge_base_ids) | {None}:
+                        self._matrix_cache.pop(kb_id, None)
+    
+    def _generation_key(self, knowledge_base_id: Optional[int]) -> int:
+        """知识库ID 对应的代数表主键"""
+        return self.ALL_KNOWLEDGE_BASES_KEY if knowledge_base_id is None else int(knowledge_base_id)
+    
+    def _matrix_paths(self, knowledge_base_id: Optional[int], generation: int) -> Tuple[str, str]:
+        """获取指定代数的知识库矩阵及ID文件路径"""
+        return (
+            os.path.join(self.matrix_dir, f"{self._matrix_name(knowledge_base_id)}.g{generation}.f32.npy"),
+            os.path.join(self.matrix_dir, f"{self._matrix_name(knowledge_base_id)}.g{generation}.ids.npy"),
+        )
+    
+    @staticmethod
+    def _matrix_name(knowledge_base_id: Optional[int]) -> str:
+        """矩阵文件名前缀"""
+        return "kb_all" if knowledge_base_id is None else f"kb_{knowledge_base_id}"
+    
+    def _get_matrix_signature(self, session: Session, knowledge_base_id: Optional[int]) -> Tuple[int, int, int]:
+        """获取知识库的行数、最大ID与代数，用于校验缓存"""
+        query_obj = session.query(func.count(VectorDocument.id), func.max(VectorDocument.id))
+        if knowledge_base_id is not None:
+            query_obj = query_obj.filter(VectorDocument.knowledge_base_id == knowledge_base_id)
+        count, max_id = query_obj.one()
+        generation = session.query(VectorMatrixGeneration.generation).filter(
+            VectorMatrixGeneration.knowledge_base_key == self._generation_key(knowledge_base_id)
+        ).scalar()
+        return int(count or 0), int(max_id or 0), int(generation or 0)
+    
+    def _load_matrix_from_disk(
+        self,
+        knowledge_base_id: Optional[int],
+        signature: Tuple[int, int, int]
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """尝试映射磁盘上当前代数的矩阵缓存，签名不一致时返回 None"""
+        matrix_path, ids_path = self._matrix_paths(knowledge_base_id, signature[2])
+        if not (os.path.exists(matrix_path) and os.path.exists(ids_path)):
+            return None
+        try:
+            ids = np.load(ids_path)
+            if len(ids) != signature[0] or (len(ids) and int(ids.max()) != signature[1]):
+                return None
+            matrix = np.load(matrix_path, mmap_mode="r")
+            if matrix.shape[0] != len(ids):
+                return None
+            return ids, matrix
+        except Exception as e:
+            logger.warning(f"加载矩阵缓存失败: {matrix_path}, 错误: {e}")
+            return None
+    
+    def _write_matrix_file(self, path: str, array: np.ndarray, use_memmap: bool):
+        """写入同目录下的唯一临时文件后原子替换，避免截断正在被映射的文件"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.matrix_dir, suffix=".tmp.npy")
+        os.close(fd)
+        try:
+            if use_memmap:
+                mmap = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=array.dtype, shape=array.shape)
+                mmap[:] = array
+                mmap.flush()
+                del mmap
+            else:
+                np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def _remove_stale_matrix_files(self, knowledge_base_id: Optional[int], generation: int):
+        """删除旧代数的矩阵文件（仍被映射的文件在部分平台上无法删除，忽略即可）"""
+        prefix = f"{self._matrix_name(knowledge_base_id)}.g"
+        keep = {os.path.basename(path) for path in self._matrix_paths(knowledge_base_id, generation)}
+        try:
+            names = os.listdir(self.matrix_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefix) and name.endswith(".npy") and name not in keep:
+                try:
+                    os.remove(os.path.join(self.matrix_dir, name))
+                except OSError:
+                    pass
+    
+    def _build_matrix(
+        self,
+        session: Session,
+        knowledge_base_id: Optional[int],
+        generation: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        从数据库构建预归一化矩阵并写入内存映射文件
+        
+        Returns:
+            (ids, matrix)
+        """
+        query_obj = session.query(VectorDocument.id, VectorDocument.vector_blob, VectorDocument.vector)
+        if knowledge_base_id is not None:
+            query_obj = query_obj.filter(VectorDocument.knowledge_base_id == knowledge_base_id)
+        
+        ids: List[int] = []
+        vectors: List[np.ndarray] = []
+        for row_id, blob, vector_json in query_obj.yield_per(1000):
+            vec = self._unpack_vector(blob, vector_json)
+            if vec is None or vec.size == 0:
+                continue
+            if vectors and vec.shape[0] != vectors[0].shape[0]:
+                logger.warning(f"向量维度不一致，跳过行: {row_id}")
+                continue
+            ids.append(row_id)
+            vectors.append(vec)
+        
+        id_array = np.asarray(ids, dtype=np.int64)
+        if not vectors:
+            return id_array, np.zeros((0, 0), dtype=np.float32)
+        
+        matrix = np.vstack(vectors).astype(np.float32, copy=False)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+        
+        matrix_path, ids_path = self._matrix_paths(knowledge_base_id, generation)
+        try:
+            os.makedirs(self.matrix_dir, exist_ok=True)
+            # 先写 ids 再写矩阵：读取方以矩阵文件存在作为完整性前提之一
+            self._write_matrix_file(ids_path, id_array, use_memmap=False)
+            self._write_matrix_file(matrix_path, matrix, use_memmap=True)
+            matrix = np.load(matrix_path, mmap_mode="r")
+            self._remove_stale_matrix_files(knowledge_base_id, generation)
+        except Exception as e:
+            # 落盘失败时仍可使用内存矩阵
+            logger.warning(f"写入矩阵缓存失败: {matrix_path}, 错误: {e}")
+        
+        return id_array, matrix
+    
+    def _get_matrix(self, session: Session, knowledge_base_id: Optional[int]) -> _KnowledgeBaseMatrix:
+        """获取知识库矩阵，签名（含跨进程代数）变化时重建"""
+        signature = self._get_matrix_signature(session, knowledge_base_id)
+        with self._matrix_lock:
+            cached = self._matrix_cache.get(knowledge_base_id)
+            if cached is not None and cached.signature == signature:
+                return cached
+            
+            loaded = self._load_matrix_from_disk(knowledge_base_id, signature)
+            if loaded is None:
+                loaded = self._build_matrix(session, knowledge_base_id, signature[2])
+                logger.info(f"知识库矩阵已重建: kb={knowledge_base_id}, 行数={len(loaded[0])}")
+            
+            entry = _KnowledgeBaseMatrix(loaded[0], loaded[1], signature)
+            self._matrix_cache[knowledge_base_id] = entry
+            return entry
+    
+    @staticmethod
+    def _top_k_rows(ids: np.ndarray, matrix: np.ndarray, query_vector: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+        """矩阵-向量乘法 + argpartition 求 top-k，返回 (行ID, 分数)"""
+        if matrix.shape[0] == 0 or top_k <= 0 or matrix.shape[1] != query_vector.shape[0]:
+            return []
+        scores = matrix @ query_vector
+        k = min(top_k, scores.shape[0])
+        if k < scores.shape[0]:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        order = candidates[np.argsort(-scores[candidates])]
+        return [(int(ids[i]), float(scores[i])) for i in order]
+    
+    def _search_matrix(
+        self,
+        session: Session,
+        query_vector: List[float],
+        top_k: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """matrix 模式搜索"""
+        filters = filters or {}
+        q = np.asarray(query_vector, dtype=np.float32)
+        q_norm = np.linalg.norm(q)
+        if q_norm == 0:
+            return []
+        q = q / q_norm
+        
+        if "document_id" in filters:
+            # 单文档范围较小，直接按需构建临时矩阵
+            query_obj = session.query(VectorDocument.id, VectorDocument.vector_blob, VectorDocument.vector).filter(
+                VectorDocument.document_id == filters["document_id"]
+            )
+            if "knowledge_base_id" in filters:
+                query_obj = query_obj.filter(VectorDocument.knowledge_base_id == filters["knowledge_base_id"])
+            ids, vectors = [], []
+            for row_id, blob, vector_json in query_obj.all():
+                vec = self._unpack_vector(blob, vector_json)
+                if vec is not None and vec.shape[0] == q.shape[0]:
+                    ids.append(row_id)
+                    vectors.append(vec)
+            if not vectors:
+                return []
+            matrix = np.vstack(vectors).astype(np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            top_rows = self._top_k_rows(np.asarray(ids, dtype=np.int64), matrix / norms, q, top_k)
+        else:
+            entry = self._get_matrix(session, filters.get("knowledge_base_id"))
+            top_rows = self._top_k_rows(entry.ids, entry.matrix, q, top_k)
+        
+        if not top_rows:
+            return []
+        
+        docs = session.query(VectorDocument).filter(
+            VectorDocument.id.in_([row_id for row_id, _ in top_rows])
+        ).all()
+        docs_by_id = {doc.id: doc for doc in docs}
+        
+        results = []
+        for row_id, score in top_rows:
+            doc = docs_by_id.get(row_id)
+            if doc is None:
+                continue
+            results.append({
+                "document_id": doc.document_id,
+                "chunk_id": doc.chunk_id,
+                "text": doc.text,
+                "metadata": doc.meta_data,
+                "score": score,
+                "knowledge_base_id": doc.knowledge_base_id
+            })
+        return results
+    
     def _text_to_vector(self, text: str, dim: int = 384) -> List[float]:
         """
         将文本转换为向量（简单实现）
@@ -145,18 +503,20 @@ class SQLiteVectorStore(VectorStoreBase):
                 document_id=document_id,
                 chunk_id=metadata.get("chunk_id", document_id),
                 text=text,
-                vector=vector,
                 knowledge_base_id=metadata.get("knowledge_base_id"),
                 chunk_index=metadata.get("chunk_index", 0),
                 total_chunks=metadata.get("total_chunks", 1),
                 meta_data=metadata,
-                created_at=func.now()
+                created_at=func.now(),
+                **self._vector_columns(vector)
             )
             
             session.add(doc)
             session.commit()
             session.close()
             
+            self._invalidate_matrix([metadata.get("knowledge_base_id")])
+            
             logger.info(f"文档添加成功: {document_id}")
             return {
                 "success": True,
@@ -187,6 +547,7 @@ class SQLiteVectorStore(VectorStoreBase):
         """
         success_count = 0
         failed_documents = []
+        affected_kb_ids = set()
         
         try:
             session = self._get_session()
@@ -205,15 +566,16 @@ class SQLiteVectorStore(VectorStoreBase):
                         document_id=document_id,
                         chunk_id=metadata.get("chunk_id", document_id),
                         text=text,
-                        vector=vector,
                         knowledge_base_id=metadata.get("knowledge_base_id"),
                         chunk_index=metadata.get("chunk_index", 0),
                         total_chunks=metadata.get("total_chunks", 1),
                         meta_data=metadata,
-                        created_at=func.now()
+                        created_at=func.now(),
+                        **self._vector_columns(vector)
                     )
                     
                     session.add(doc)
+                    affected_kb_ids.add(metadata.get("knowledge_base_id"))
                     success_count += 1
                     
                 except Exception as e:
@@ -226,6 +588,8 @@ class SQLiteVectorStore(VectorStoreBase):
             session.commit()
             session.close()
             
+            self._invalidate_matrix(list(affected_kb_ids))
+            
             logger.info(f"批量添加完成: 成功 {success_count}/{len(documents)}")
             return {
                 "success": True,
@@ -268,6 +632,11 @@ class SQLiteVectorStore(VectorStoreBase):
             # 生成查询向量
             query_vector = self._text_to_vector(query)
             
+            if self.storage_mode == "matrix":
+                results = self._search_matrix(session, query_vector, top_k, filters)
+                session.close()
+                return results
+            
             # 构建查询
             query_obj = session.query(VectorDocument)
             
@@ -288,8 +657,9 @@ class SQLiteVectorStore(VectorStoreBase):
             # 计算相似度
             results = []
             for doc in documents:
-                if doc.vector:
-                    similarity = self._cosine_similarity(query_vector, doc.vector)
+                vec = self._unpack_vector(doc.vector_blob, doc.vector)
+                if vec is not None:
+                    similarity = self._cosine_similarity(query_vector, vec)
                     results.append({
                         "document_id": doc.document_id,
                         "chunk_id": doc.chunk_id,
@@ -323,6 +693,12 @@ class SQLiteVectorStore(VectorStoreBase):
         try:
             session = self._get_session()
             
+            affected_kb_ids = [
+                row[0] for row in session.query(VectorDocument.knowledge_base_id).filter(
+                    VectorDocument.document_id == document_id
+                ).distinct().all()
+            ]
+            
             # 删除所有相关记录
             session.query(VectorDocument).filter(
                 VectorDocument.document_id == document_id
@@ -331,6 +707,9 @@ class SQLiteVectorStore(VectorStoreBase):
             session.commit()
             session.close()
             
+            if affected_kb_ids:
+                self._invalidate_matrix(affected_kb_ids)
+            
             logger.info(f"文档删除成功: {document_id}")
             return True
             
@@ -338,6 +717,75 @@ class SQLiteVectorStore(VectorStoreBase):
             logger.error(f"删除文档失败: {e}")
             return False
     
+    def delete_documents_batch(self, document_ids: List[str]) -> int:
+        """
+        批量删除文档
+        
+        Args:
+            document_ids: 文档唯一标识列表
+            
+        Returns:
+            删除的记录数
+        """
+        if not document_ids:
+            return 0
+        try:
+            session = self._get_session()
+            
+            affected_kb_ids = [
+                row[0] for row in session.query(VectorDocument.knowledge_base_id).filter(
+                    VectorDocument.document_id.in_(document_ids)
+                ).distinct().all()
+            ]
+            
+            deleted = session.query(VectorDocument).filter(
+                VectorDocument.document_id.in_(document_ids)
+            ).delete(synchronize_session=False)
+            
+            session.commit()
+            session.close()
+            
+            if affected_kb_ids:
+                self._invalidate_matrix(affected_kb_ids)
+            
+            logger.info(f"批量删除完成: {deleted} 条记录")
+            return deleted
+            
+        except Exception as e:
+            logger.error(f"批量删除文档失败: {e}")
+            return 0
+    
+    def update_metadata_batch(self, metadatas: Dict[str, Dict[str, Any]]) -> bool:
+        """
+        批量更新文档元数据（不重新计算向量）
+        
+        Args:
+            metadatas: 文档唯一标识 -> 新元数据
+            
+        Returns:
+            是否更新成功
+        """
+        if not metadatas:
+            return True
+        try:
+            session = self._get_session()
+            
+            for doc in session.query(VectorDocument).filter(
+                VectorDocument.document_id.in_(list(metadatas.keys()))
+            ).all():
+                metadata = metadatas[doc.document_id]
+                doc.meta_data = metadata
+                doc.chunk_index = metadata.get("chunk_index", doc.chunk_index)
+                doc.total_chunks = metadata.get("total_chunks", doc.total_chunks)
+            
+            session.commit()
+            session.close()
+            return True
+            
+        except Exception as e:
+            logger.error(f"批量更新元数据失败: {e}")
+            return False
+    
     def get_document(self, document_id: str) -> Optional[Dict[str, Any]]:
         """
         获取文档
@@ -395,7 +843,9 @@ class SQLiteVectorStore(VectorStoreBase):
                 "message": "SQLite 向量存储运行正常",
                 "details": {
                     "total_documents": count,
-                    "db_path": self.db_path
+                    "db_path": self.db_path,
+                    "storage_mode": self.storage_mode,
+                    "cached_matrices": len(self._matrix_cache)
                 }
             }
             
@@ -411,6 +861,8 @@ class SQLiteVectorStore(VectorStoreBase):
     
     def close(self):
         """关闭存储连接"""
+        with self._matrix_lock:
+            self._matrix_cache.clear()
         if self.engine:
             self.engine.dispose()
             logger.info("SQLiteVectorStore 连接已关闭")
@@ -1,11 +1,13 @@
 """LLM服务模块"""
 import os
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable
 from datetime import datetime
 import time
 from app.core.config import settings
 from app.services.model_query_service import model_query_service
 from app.models.supplier_db import SupplierDB as ModelSupplier
+from app.services.model_config_cache import model_config_cache
+from app.modules.llm.services.model_latency_tracker import get_model_latency_tracker
 from app.services.search_management_service import SearchManagementService
 from app.services.web_search_service import WebSearchService
 from app.services.parameter_management.parameter_passing_service import ParameterPassingService
@@ -188,7 +190,13 @@ class LLMService:
             logger.error(f"Error in text completion: {str(e)}")
             execution_time = (time.time() - start_time) * 1000
             raise
-    
+
+    @staticmethod
+    def _load_default_model_id(db, model_type: str) -> Optional[str]:
+        """从数据库读取默认模型ID"""
+        default_model = model_query_service.get_default_model(db, model_type)
+        return default_model.model_id if default_model else None
+
     def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -205,7 +213,37 @@ class LLMService:
     ) -> Dict[str, Any]:
         """聊天补全功能 - 支持OpenAI和DeepSeek模型，优先使用数据库中的模型配置
            集成参数管理系统，支持从智能体配置中获取参数
+
+           每次调用的实际延迟与成败按模型记录到调用观测器，供模型调度使用
         """
+        tracker = get_model_latency_tracker()
+        with tracker.track(model_name) as call:
+            result = self._chat_completion_impl(
+                messages, model_name, max_tokens, temperature, top_p, n, stop,
+                frequency_penalty, presence_penalty, db, agent_id,
+                on_model_resolved=lambda resolved: tracker.bind_model(call, resolved)
+            )
+            if isinstance(result, dict):
+                call["model"] = result.get("model")
+                call["success"] = bool(result.get("success", False))
+            return result
+
+    def _chat_completion_impl(
+        self,
+        messages: List[Dict[str, str]],
+        model_name: Optional[str],
+        max_tokens: Optional[int],
+        temperature: Optional[float],
+        top_p: Optional[float],
+        n: int,
+        stop: Optional[List[str]],
+        frequency_penalty: Optional[float],
+        presence_penalty: Optional[float],
+        db: Optional[Any],
+        agent_id: Optional[int],
+        on_model_resolved: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """聊天补全的实际实现（确定最终模型后回调 on_model_resolved）"""
         start_time = time.time()
         
         logger.info(f"chat_completion方法调用开始")
@@ -247,13 +285,17 @@ class LLMService:
         
         if not model_name and db:
             logger.info(f"没有提供model_name，尝试从数据库获取默认模型")
-            default_model = model_query_service.get_default_model(db, "chat")
-            if default_model:
-                model_name = default_model.model_id
+            default_model_id = model_config_cache.get_scene_model(
+                ("default_model", "chat"), lambda: self._load_default_model_id(db, "chat")
+            )
+            if default_model_id:
+                model_name = default_model_id
                 logger.info(f"从数据库获取到默认模型: {model_name}")
         
         # 如果数据库中没有默认模型或db参数未提供，使用服务默认值
         model_name = model_name or self.default_chat_model
+        if on_model_resolved:
+            on_model_resolved(model_name)
         
         # 保存原始配置
         original_api_key = None
@@ -270,20 +312,12 @@ class LLMService:
                 logger.info(f"数据库连接可用，开始查询模型: {model_name}")
                 
                 if model_name:
-                    logger.info(f"尝试从数据库获取模型: {model_name}")
-                    model = model_query_service.get_model_by_model_id(db, model_name)
-                    if model:
-                        logger.info(f"找到模型: {model.model_id}, ID: {model.id}, 供应商ID: {model.supplier_id}")
-                        db_model_info = model_query_service.get_model_with_supplier(db, model.id)
-                        logger.info(f"db_model_info内容: {db_model_info}")
-                        if db_model_info:
-                            logger.info(f"model信息: {db_model_info['model'].model_id}")
-                            logger.info(f"supplier信息: {db_model_info['supplier']}")
+                    # 模型与供应商配置经缓存解析，配置变更后自动失效
+                    db_model_info = model_config_cache.get_model_with_supplier(db, model_name)
+                    if db_model_info:
+                        logger.info(f"找到模型: {db_model_info['model'].model_id}, 供应商ID: {db_model_info['model'].supplier_id}")
                     else:
                         logger.warning(f"未找到模型: {model_name}")
-                        # 使用model_query_service列出所有模型
-                        all_models = model_query_service.get_all_models(db)
-                        logger.info(f"数据库中所有模型: {[model.model_id for model in all_models]}")
             
             if has_openai:
                 import openai
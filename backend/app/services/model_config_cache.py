@@ -0,0 +1,366 @@
+"""
+已解析模型配置缓存
+
+缓存按模型名称解析出的模型与供应商配置（端点、解密后的API密钥、参数），
+以及按场景解析出的默认模型，使每次LLM调用的模型解析不再访问数据库。
+
+失效机制：
+- 供应商、模型、默认模型、模型能力表的写入提交后（会话事件）版本号加一并清空本地缓存
+- 多进程部署时通过 Redis 发布版本号，其他进程订阅后清空各自的缓存
+- 条目超过 TTL 后重新加载，作为 Redis 不可用时的兜底
+"""
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+from app.core.config import settings
+from app.core.encryption import decrypt_string
+from app.models.supplier_db import ModelDB, SupplierDB
+from app.models.default_model import DefaultModel
+from app.models.model_capability import ModelCapability, ModelCapabilityAssociation
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class ResolvedModelConfig:
+    """解析后的模型与供应商配置（只读快照，可跨线程共享）"""
+    id: int
+    model_id: str
+    model_name: Optional[str]
+    supplier_id: int
+    max_tokens: Optional[int]
+    context_window: Optional[int]
+    supplier_name: Optional[str] = None
+    supplier_display_name: Optional[str] = None
+    supplier_active: bool = False
+    api_endpoint: Optional[str] = None
+    api_key: Optional[str] = None
+    api_key_required: bool = False
+
+    @property
+    def has_supplier(self) -> bool:
+        return self.supplier_name is not None
+
+    def to_api_config(self) -> Dict[str, Any]:
+        """转换为 EnhancedLLMService 使用的API配置（供应商不存在或未激活时为空字典）"""
+        if not self.has_supplier or not self.supplier_active:
+            return {}
+        return {
+            "model": self.model_id,
+            "supplier_name": self.supplier_name,
+            "api_endpoint": self.api_endpoint,
+            "api_key": self.api_key,
+            "api_key_required": self.api_key_required,
+            "supplier_display_name": self.supplier_display_name
+        }
+
+    def to_supplier_info(self) -> Optional[Dict[str, Any]]:
+        """转换为 model_query_service.get_supplier_with_decrypted_api_key 的返回格式"""
+        if not self.has_supplier:
+            return None
+        return {
+            "id": self.supplier_id,
+            "name": self.supplier_name,
+            "api_endpoint": self.api_endpoint,
+            "api_key_required": self.api_key_required,
+            "is_active": self.supplier_active,
+            "api_key": self.api_key if self.api_key_required else None
+        }
+
+
+class ModelConfigCache:
+    """进程内的已解析模型配置缓存"""
+
+    VERSION_KEY = "py_copilot:model_config:version"
+    CHANNEL = "py_copilot:model_config:invalidate"
+
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._version = 0
+        self._remote_version: Optional[int] = None
+        self._models: Dict[Tuple[str, bool], Tuple[Optional[ResolvedModelConfig], float]] = {}
+        self._scenes: Dict[Any, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._redis = None
+        self._listener: Optional[threading.Thread] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def _lookup(self, store: Dict, key: Any) -> Any:
+        entry = store.get(key)
+        if entry is None or time.monotonic() - entry[1] > self.ttl:
+            self._misses += 1
+            return _MISSING
+        self._hits += 1
+        return entry[0]
+
+    def _store(self, store: Dict, key: Any, value: Any, version: int):
+        with self._lock:
+            # 加载期间发生失效时不写入，避免旧配置覆盖新版本
+            if self._version == version:
+                store[key] = (value, time.monotonic())
+
+    def get_model_config(self, db: Optional[Session], model_name: str,
+                         match_display_name: bool = False) -> Optional[ResolvedModelConfig]:
+        """
+        获取模型配置
+
+        Args:
+            db: 数据库会话（仅缓存未命中时使用）
+            model_name: 模型ID（match_display_name 为 True 时也匹配模型名称）
+            match_display_name: 是否同时按 model_name 字段匹配
+
+        Returns:
+            解析后的配置；模型不存在时返回 None（同样会被缓存）
+        """
+        if not model_name:
+            return None
+        self._ensure_listener()
+
+        key = (model_name, match_display_name)
+        cached = self._lookup(self._models, key)
+        if cached is not _MISSING:
+            return cached
+        if db is None:
+            return None
+
+        version = self._version
+        resolved = self._load_model_config(db, model_name, match_display_name)
+        self._store(self._models, key, resolved, version)
+        return resolved
+
+    def get_model_with_supplier(self, db: Optional[Session], model_name: str) -> Optional[Dict[str, Any]]:
+        """按模型ID获取与 model_query_service.get_model_with_supplier 相同结构的结果"""
+        config = self.get_model_config(db, model_name)
+        if config is None:
+            return None
+        return {"model": config, "supplier": config.to_supplier_info()}
+
+    def get_scene_model(self, key: Any, loader: Callable[[], Any]) -> Any:
+        """
+        获取按场景解析的模型（loader 负责实际解析，结果按 key 缓存到下次失效）
+
+        Args:
+            key: 缓存键（可哈希），如场景层级元组
+            loader: 缓存未命中时调用的解析函数
+        """
+        return self.get_snapshot(key, loader)
+
+    def get_snapshot(self, key: Any, loader: Callable[[], Any]) -> Any:
+        """获取由模型配置派生的只读数据（如模型能力矩阵），随模型配置一同失效"""
+        self._ensure_listener()
+
+        cached = self._lookup(self._scenes, key)
+        if cached is not _MISSING:
+            return cached
+
+        version = self._version
+        value = loader()
+        self._store(self._scenes, key, value, version)
+        return value
+
+    @staticmethod
+    def _load_model_config(db: Session, model_name: str, match_display_name: bool) -> Optional[ResolvedModelConfig]:
+        """从数据库加载模型及其供应商配置（一次查询）"""
+        condition = ModelDB.model_id == model_name
+        if match_display_name:
+            condition = condition | (ModelDB.model_name == model_name)
+
+        try:
+            row = db.query(ModelDB, SupplierDB).outerjoin(
+                SupplierDB, SupplierDB.id == ModelDB.supplier_id
+            ).filter(condition).first()
+        except Exception as e:
+            logger.error(f"加载模型配置失败: {model_name}, 错误: {e}")
+            return None
+
+        if row is None:
+            logger.warning(f"数据库中未找到模型: {model_name}")
+            return None
+
+        model, supplier = row
+        fields = {
+            "id": model.id,
+            "model_id": model.model_id,
+            "model_name": model.model_name,
+            "supplier_id": model.supplier_id,
+            "max_tokens": model.max_tokens,
+            "context_window": model.context_window
+        }
+        if supplier is not None:
+            api_key = None
+            if supplier._api_key:
+                try:
+                    api_key = decrypt_string(supplier._api_key)
+                except Exception as e:
+                    logger.warning(f"解密供应商 {supplier.name} 的API密钥失败: {e}")
+            fields.update({
+                "supplier_name": supplier.name,
+                "supplier_display_name": supplier.display_name,
+                "supplier_active": bool(supplier.is_active),
+                "api_endpoint": supplier.api_endpoint,
+                "api_key": api_key,
+                "api_key_required": bool(supplier.api_key_required)
+            })
+
+        logger.debug(f"已加载模型配置: {model_name} (供应商: {fields.get('supplier_name')})")
+        return ResolvedModelConfig(**fields)
+
+    # ------------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------------
+
+    def _clear(self, version: Optional[int] = None):
+        with self._lock:
+            self._version = max(self._version + 1, version or 0)
+            self._models.clear()
+            self._scenes.clear()
+
+    def invalidate(self, publish: bool = True):
+        """清空本进程缓存，并通知其他进程"""
+        self._clear()
+        logger.info(f"模型配置缓存已失效，版本: {self._version}")
+        if publish and self._redis is not None:
+            try:
+                remote_version = self._redis.incr(self.VERSION_KEY)
+                self._remote_version = remote_version
+                self._redis.publish(self.CHANNEL, remote_version)
+            except Exception as e:
+                logger.warning(f"发布模型配置失效通知失败: {e}")
+
+    def _on_remote_version(self, remote_version: int):
+        """收到其他进程发布的版本号"""
+        if remote_version != self._remote_version:
+            self._remote_version = remote_version
+            self._clear()
+            logger.info(f"收到模型配置失效通知，远端版本: {remote_version}")
+
+    def _ensure_listener(self):
+        """首次使用时启动 Redis 订阅线程（Redis 不可用时只依赖本地失效与 TTL）"""
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name="model-config-cache", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        """订阅失效频道，断线后重连并按版本号补偿期间错过的通知"""
+        try:
+            from app.core.redis import get_redis
+        except Exception as e:
+            logger.info(f"Redis不可用，模型配置缓存仅在本进程内失效: {e}")
+            return
+
+        delay = 1.0
+        while True:
+            try:
+                client = get_redis()
+            except Exception:
+                client = None
+            if client is None:
+                if self._redis is None and delay == 1.0:
+                    logger.info("Redis未连接，模型配置缓存仅在本进程内失效")
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+                continue
+
+            self._redis = client
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                current = client.get(self.VERSION_KEY)
+                if current is not None:
+                    if self._remote_version is None:
+                        self._remote_version = int(current)
+                    else:
+                        self._on_remote_version(int(current))
+                delay = 1.0
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._on_remote_version(int(message["data"]))
+            except Exception as e:
+                logger.warning(f"模型配置失效订阅中断，{delay:.0f}秒后重连: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": self._version,
+                "remote_version": self._remote_version,
+                "models": len(self._models),
+                "scenes": len(self._scenes),
+                "hits": self._hits,
+                "misses": self._misses,
+                "redis": self._redis is not None
+            }
+
+
+model_config_cache = ModelConfigCache(ttl=getattr(settings, 'model_config_cache_ttl', 300.0))
+
+
+# ----------------------------------------------------------------------
+# 会话事件：供应商/模型/默认模型/模型能力写入提交后使缓存失效
+# ----------------------------------------------------------------------
+
+_CHANGED_KEY = "model_config_changed"
+_WATCHED_CLASSES = (SupplierDB, ModelDB, DefaultModel, ModelCapability, ModelCapabilityAssociation)
+_WATCHED_TABLES = tuple(cls.__table__ for cls in _WATCHED_CLASSES)
+_RAW_WRITE_PATTERN = re.compile(
+    r"^\s*(?:INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM)\s+[\"`]?(suppliers|models|default_models|model_capabilities|model_capability_associations)\b",
+    re.IGNORECASE
+)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_config_changes(session: Session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, _WATCHED_CLASSES) and (obj not in session.dirty or session.is_modified(obj)):
+            session.info[_CHANGED_KEY] = True
+            return
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _detect_bulk_config_writes(orm_execute_state):
+    statement = orm_execute_state.statement
+    if isinstance(statement, TextClause):
+        if _RAW_WRITE_PATTERN.match(statement.text):
+            orm_execute_state.session.info[_CHANGED_KEY] = True
+        return
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    table = getattr(statement, "table", None)
+    if (mapper is not None and mapper.class_ in _WATCHED_CLASSES) or table in _WATCHED_TABLES:
+        orm_execute_state.session.info[_CHANGED_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_config_changes(session: Session):
+    if session.info.pop(_CHANGED_KEY, False):
+        model_config_cache.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_config_changes(session: Session):
+    session.info.pop(_CHANGED_KEY, None)
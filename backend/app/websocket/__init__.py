@@ -4,7 +4,7 @@ WebSocket模块
 提供WebSocket连接管理、消息处理和实时通信功能。
 """
 
-from .connection_manager import ConnectionManager, ConnectionStatus, ClientType, connection_manager
+from .connection_manager import ConnectionManager, ConnectionStatus, ClientType, SlowConsumerPolicy, connection_manager
 from .message_handler import MessageHandler, MessageType, message_handler
 from .session_manager import SessionManager, SessionStatus, SessionType, session_manager
 from .message_router import MessageRouter, RoutingStrategy, MessagePriority, message_router
@@ -14,6 +14,7 @@ __all__ = [
     "ConnectionManager",
     "ConnectionStatus", 
     "ClientType",
+    "SlowConsumerPolicy",
     "connection_manager",
     "MessageHandler",
     "MessageType",
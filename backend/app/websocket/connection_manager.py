@@ -3,12 +3,16 @@ WebSocket连接管理器
 
 负责管理所有WebSocket连接的生命周期，包括连接跟踪、心跳检测、
 连接状态监控和连接池管理。
+
+每个连接维护一个有界发送队列，由独立的写任务发送，慢客户端不会阻塞其他连接；
+广播与组发送只序列化一次，再投递到各连接的发送队列。
 """
 import asyncio
 import json
 import logging
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Set, Any
+from typing import Dict, List, Optional, Set, Any, Callable, Deque, Iterable, Tuple
 from uuid import uuid4
 from enum import Enum
 
@@ -35,16 +39,29 @@ class ClientType(Enum):
     API = "api"
 
 
+class SlowConsumerPolicy(Enum):
+    """发送队列已满时的处理策略"""
+    DROP_OLDEST = "drop_oldest"    # 丢弃队列中最早的消息
+    DROP_NEWEST = "drop_newest"    # 丢弃新消息
+    DISCONNECT = "disconnect"      # 关闭连接
+
+
 class WebSocketConnection:
     """WebSocket连接封装类"""
     
-    def __init__(self, websocket: WebSocket, client_id: str, client_type: ClientType = ClientType.WEB):
+    def __init__(self, websocket: WebSocket, client_id: str, client_type: ClientType = ClientType.WEB,
+                 max_queue_size: int = 256,
+                 slow_consumer_policy: SlowConsumerPolicy = SlowConsumerPolicy.DROP_OLDEST,
+                 send_timeout: float = 10.0):
         """初始化连接
         
         Args:
             websocket: WebSocket连接对象
             client_id: 客户端ID
             client_type: 客户端类型
+            max_queue_size: 发送队列上限
+            slow_consumer_policy: 发送队列已满时的处理策略
+            send_timeout: 单条消息发送超时（秒）
         """
         self.websocket = websocket
         self.client_id = client_id
@@ -59,24 +76,131 @@ class WebSocketConnection:
         self.message_count = 0
         self.error_count = 0
         
-    async def send_message(self, message: Dict[str, Any]) -> bool:
-        """发送消息到客户端
+        # 发送队列：元素为 (合并键, 文本)，带合并键的消息文本保存在 _coalesced 中，
+        # 同一合并键尚未发出时，新消息直接替换旧消息内容并保持原有排队位置
+        self.max_queue_size = max_queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.send_timeout = send_timeout
+        self._outbound: Deque[Tuple[Optional[str], Optional[str]]] = deque()
+        self._coalesced: Dict[str, str] = {}
+        self._outbound_ready = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._overflowed = False
+        self.dropped_count = 0
+        self.coalesced_count = 0
+        
+    @property
+    def queue_size(self) -> int:
+        """待发送消息数"""
+        return len(self._outbound)
+        
+    def start_writer(self):
+        """启动写任务（需在事件循环中调用）"""
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(self._write_loop())
+            
+    async def stop_writer(self):
+        """停止写任务并丢弃未发送的消息"""
+        if self._writer_task and not self._writer_task.done():
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        self._outbound.clear()
+        self._coalesced.clear()
+        
+    def enqueue(self, text: str, coalesce_key: Optional[str] = None) -> bool:
+        """将已序列化的消息放入发送队列（非阻塞，需在连接所属事件循环中调用）
         
         Args:
-            message: 消息内容
+            text: 已序列化的消息文本
+            coalesce_key: 合并键，同一合并键的未发送消息只保留最新一条
             
         Returns:
-            发送是否成功
+            消息是否被接受
         """
+        if self.status == ConnectionStatus.DISCONNECTED or self._overflowed:
+            return False
+            
+        if coalesce_key is not None and coalesce_key in self._coalesced:
+            self._coalesced[coalesce_key] = text
+            self.coalesced_count += 1
+            return True
+            
+        if len(self._outbound) >= self.max_queue_size:
+            if self.slow_consumer_policy == SlowConsumerPolicy.DROP_NEWEST:
+                self.dropped_count += 1
+                return False
+            if self.slow_consumer_policy == SlowConsumerPolicy.DISCONNECT:
+                logger.warning(f"客户端 {self.client_id} 发送队列已满，关闭连接")
+                self._overflowed = True
+                self._outbound_ready.set()
+                return False
+            oldest_key, _ = self._outbound.popleft()
+            if oldest_key is not None:
+                self._coalesced.pop(oldest_key, None)
+            self.dropped_count += 1
+            
+        if coalesce_key is not None:
+            self._coalesced[coalesce_key] = text
+            self._outbound.append((coalesce_key, None))
+        else:
+            self._outbound.append((None, text))
+        self._outbound_ready.set()
+        return True
+        
+    async def _write_loop(self):
+        """写任务：依次发送队列中的消息"""
+        while True:
+            if self._overflowed:
+                try:
+                    await self.websocket.close(code=1013)  # 1013: Try Again Later
+                except Exception as e:
+                    logger.debug(f"关闭客户端 {self.client_id} 连接失败: {e}")
+                return
+                
+            if not self._outbound:
+                self._outbound_ready.clear()
+                await self._outbound_ready.wait()
+                continue
+                
+            coalesce_key, text = self._outbound.popleft()
+            if coalesce_key is not None:
+                text = self._coalesced.pop(coalesce_key, None)
+                if text is None:
+                    continue
+            await self._send_text(text)
+            
+    async def _send_text(self, text: str) -> bool:
+        """直接发送文本到客户端"""
         try:
-            await self.websocket.send_text(json.dumps(message))
+            await asyncio.wait_for(self.websocket.send_text(text), timeout=self.send_timeout)
             self.last_activity = datetime.now()
             self.message_count += 1
             return True
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"发送消息到客户端 {self.client_id} 失败: {e}")
+            logger.error(f"发送消息到客户端 {self.client_id} 失败: {e!r}")
             self.error_count += 1
             return False
+        
+    async def send_message(self, message: Dict[str, Any]) -> bool:
+        """发送消息到客户端
+        
+        写任务运行时放入发送队列（保持消息顺序），否则直接发送。
+        
+        Args:
+            message: 消息内容
+            
+        Returns:
+            消息是否被接受（直接发送时为发送是否成功）
+        """
+        text = json.dumps(message)
+        if self._writer_task is not None and not self._writer_task.done():
+            return self.enqueue(text)
+        return await self._send_text(text)
             
     async def receive_message(self) -> Optional[Dict[str, Any]]:
         """接收客户端消息
@@ -130,6 +254,9 @@ class WebSocketConnection:
             "last_heartbeat": self.last_heartbeat.isoformat(),
             "message_count": self.message_count,
             "error_count": self.error_count,
+            "queue_size": self.queue_size,
+            "dropped_count": self.dropped_count,
+            "coalesced_count": self.coalesced_count,
             "subscriptions": list(self.subscriptions),
             "metadata": self.metadata
         }
@@ -145,7 +272,11 @@ class ConnectionManager:
         self.heartbeat_interval = 30  # 心跳间隔（秒）
         self.cleanup_interval = 60    # 清理间隔（秒）
         self.max_connections = 1000   # 最大连接数
+        self.max_queue_size = 256     # 每个连接的发送队列上限
+        self.send_timeout = 10.0      # 单条消息发送超时（秒）
+        self.slow_consumer_policy = SlowConsumerPolicy.DROP_OLDEST
         self._cleanup_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # 连接与写任务所在的事件循环
         
     async def connect(self, websocket: WebSocket, client_id: str, 
                      client_type: ClientType = ClientType.WEB, 
@@ -169,12 +300,19 @@ class ConnectionManager:
         await websocket.accept()
         
         # 创建连接对象
-        connection = WebSocketConnection(websocket, client_id, client_type)
+        connection = WebSocketConnection(
+            websocket, client_id, client_type,
+            max_queue_size=self.max_queue_size,
+            slow_consumer_policy=self.slow_consumer_policy,
+            send_timeout=self.send_timeout
+        )
         if metadata:
             connection.metadata.update(metadata)
             
-        # 添加到活跃连接
+        # 添加到活跃连接并启动写任务
+        self._loop = asyncio.get_running_loop()
         self.active_connections[connection.connection_id] = connection
+        connection.start_writer()
         
         logger.info(f"客户端 {client_id} 连接成功，连接ID: {connection.connection_id}")
         
@@ -205,66 +343,118 @@ class ConnectionManager:
                 
             # 从活跃连接中移除
             del self.active_connections[connection_id]
+            await connection.stop_writer()
             
             logger.info(f"客户端 {connection.client_id} 断开连接")
             
-    async def send_to_client(self, connection_id: str, message: Dict[str, Any]) -> bool:
+    def _on_manager_loop(self) -> bool:
+        """当前是否运行在连接所属的事件循环中"""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+            
+    def _deliver(self, text: str, targets: Callable[[], Iterable[str]],
+                 coalesce_key: Optional[str] = None) -> int:
+        """将已序列化的消息放入目标连接的发送队列"""
+        delivered = 0
+        for connection_id in targets():
+            connection = self.active_connections.get(connection_id)
+            if connection and connection.enqueue(text, coalesce_key):
+                delivered += 1
+        return delivered
+        
+    async def _dispatch(self, message: Dict[str, Any], targets: Callable[[], Iterable[str]],
+                        coalesce_key: Optional[str] = None) -> int:
+        """序列化一次消息并投递到目标连接
+        
+        从其他线程（如后台任务线程自建的事件循环）调用时，转交连接所属的事件循环执行投递。
+        """
+        text = json.dumps(message)
+        if self._loop is None or self._on_manager_loop():
+            return self._deliver(text, targets, coalesce_key)
+            
+        async def deliver() -> int:
+            return self._deliver(text, targets, coalesce_key)
+            
+        try:
+            future = asyncio.run_coroutine_threadsafe(deliver(), self._loop)
+        except RuntimeError as e:
+            logger.error(f"投递消息失败，连接事件循环不可用: {e}")
+            return 0
+        return await asyncio.wrap_future(future)
+        
+    async def send_to_client(self, connection_id: str, message: Dict[str, Any],
+                             coalesce_key: Optional[str] = None) -> bool:
         """发送消息到指定客户端
         
         Args:
             connection_id: 连接ID
             message: 消息内容
+            coalesce_key: 合并键，同一合并键的未发送消息只保留最新一条
             
         Returns:
-            发送是否成功
+            消息是否被接受
         """
-        if connection_id in self.active_connections:
-            connection = self.active_connections[connection_id]
-            return await connection.send_message(message)
-        return False
+        if connection_id not in self.active_connections:
+            return False
+        return await self._dispatch(message, lambda: [connection_id], coalesce_key) > 0
+        
+    async def send_to_connections(self, connection_ids: Iterable[str], message: Dict[str, Any],
+                                  coalesce_key: Optional[str] = None) -> int:
+        """发送同一消息到多个客户端（只序列化一次）
+        
+        Args:
+            connection_ids: 连接ID集合
+            message: 消息内容
+            coalesce_key: 合并键，同一合并键的未发送消息只保留最新一条
+            
+        Returns:
+            接受消息的连接数量
+        """
+        target_ids = list(connection_ids)
+        return await self._dispatch(message, lambda: target_ids, coalesce_key)
         
     async def broadcast(self, message: Dict[str, Any], 
-                       exclude_connections: Optional[Set[str]] = None) -> int:
+                       exclude_connections: Optional[Set[str]] = None,
+                       coalesce_key: Optional[str] = None) -> int:
         """广播消息到所有客户端
         
         Args:
             message: 消息内容
             exclude_connections: 排除的连接ID集合
+            coalesce_key: 合并键，同一合并键的未发送消息只保留最新一条
             
         Returns:
-            成功发送的消息数量
+            接受消息的连接数量
         """
         if exclude_connections is None:
             exclude_connections = set()
             
-        success_count = 0
-        for connection_id, connection in self.active_connections.items():
-            if connection_id not in exclude_connections:
-                if await connection.send_message(message):
-                    success_count += 1
-                    
-        return success_count
+        def targets() -> List[str]:
+            return [connection_id for connection_id in self.active_connections
+                    if connection_id not in exclude_connections]
+            
+        return await self._dispatch(message, targets, coalesce_key)
         
-    async def send_to_group(self, group_name: str, message: Dict[str, Any]) -> int:
+    async def send_to_group(self, group_name: str, message: Dict[str, Any],
+                            coalesce_key: Optional[str] = None) -> int:
         """发送消息到指定组
         
         Args:
             group_name: 组名
             message: 消息内容
+            coalesce_key: 合并键，同一合并键的未发送消息只保留最新一条
             
         Returns:
-            成功发送的消息数量
+            接受消息的连接数量
         """
         if group_name not in self.connection_groups:
             return 0
             
-        success_count = 0
-        for connection_id in self.connection_groups[group_name]:
-            if connection_id in self.active_connections:
-                if await self.send_to_client(connection_id, message):
-                    success_count += 1
-                    
-        return success_count
+        return await self._dispatch(
+            message, lambda: list(self.connection_groups.get(group_name, ())), coalesce_key
+        )
         
     async def join_group(self, connection_id: str, group_name: str):
         """将连接加入组
@@ -315,7 +505,11 @@ class ConnectionManager:
             "active_connections": active_connections,
             "client_type_stats": client_type_stats,
             "group_count": len(self.connection_groups),
-            "max_connections": self.max_connections
+            "max_connections": self.max_connections,
+            "queued_messages": sum(conn.queue_size for conn in self.active_connections.values()),
+            "dropped_messages": sum(conn.dropped_count for conn in self.active_connections.values()),
+            "coalesced_messages": sum(conn.coalesced_count for conn in self.active_connections.values()),
+            "slow_consumer_policy": self.slow_consumer_policy.value
         }
         
     def get_connection_details(self, connection_id: str) -> Optional[Dict[str, Any]]:
@@ -791,14 +791,19 @@ class MessageHandler:
             timestamp=datetime.now().isoformat()
         )
 
-        # 发送给所有订阅者
+        # 序列化一次后投递到所有订阅者的发送队列，同一文档未发出的进度更新只保留最新一条
+        try:
+            await self.connection_manager.send_to_connections(
+                list(connection_ids), progress_msg.dict(),
+                coalesce_key=f"document_progress:{document_id}"
+            )
+        except Exception as e:
+            logger.error(f"广播文档 {document_id} 进度消息失败: {e}")
+
+        # 移除已断开的连接
         for connection_id in list(connection_ids):
-            try:
-                await self.connection_manager.send_to_client(connection_id, progress_msg.dict())
-            except Exception as e:
-                logger.error(f"发送文档进度消息到连接 {connection_id} 失败: {e}")
-                # 移除失效的连接
-                self.document_progress_subscriptions[document_id].discard(connection_id)
+            if connection_id not in self.connection_manager.active_connections:
+                connection_ids.discard(connection_id)
 
 
 # 全局消息处理器实例
@@ -2,11 +2,14 @@
 消息路由引擎
 
 负责实时消息的路由、广播和队列管理，支持多种消息分发策略。
+消息队列按优先级分为多个双端队列，入队与出队均为 O(1)，同一优先级内保持先进先出。
 """
 import asyncio
 import logging
+import time
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional, Set, Any, Callable, Awaitable
+from typing import Dict, List, Optional, Set, Any, Callable, Awaitable, Deque
 from enum import Enum
 from uuid import uuid4
 
@@ -52,6 +55,7 @@ class MessageQueueItem:
         self.target = target
         self.priority = priority
         self.created_at = datetime.now()
+        self.enqueued_at = time.monotonic()  # 最近一次入队时间（用于等待时长统计）
         self.attempts = 0
         self.max_attempts = 3
         
@@ -68,6 +72,94 @@ class MessageQueueItem:
         }
 
 
+class PriorityMessageQueue:
+    """按优先级分桶的消息队列
+    
+    每个优先级一个双端队列，出队时从高优先级到低优先级依次取出，
+    并记录每个优先级的出队数量与排队等待时长。
+    """
+    
+    PRIORITY_ORDER = (
+        MessagePriority.URGENT,
+        MessagePriority.HIGH,
+        MessagePriority.NORMAL,
+        MessagePriority.LOW
+    )
+    
+    def __init__(self):
+        """初始化优先级队列"""
+        self._queues: Dict[MessagePriority, Deque[MessageQueueItem]] = {
+            priority: deque() for priority in self.PRIORITY_ORDER
+        }
+        self._size = 0
+        self._dequeued: Dict[MessagePriority, int] = {priority: 0 for priority in self.PRIORITY_ORDER}
+        self._total_wait: Dict[MessagePriority, float] = {priority: 0.0 for priority in self.PRIORITY_ORDER}
+        self._max_wait: Dict[MessagePriority, float] = {priority: 0.0 for priority in self.PRIORITY_ORDER}
+        
+    def __len__(self) -> int:
+        return self._size
+        
+    def __bool__(self) -> bool:
+        return self._size > 0
+        
+    def push(self, queue_item: MessageQueueItem):
+        """入队（追加到所属优先级队尾）"""
+        queue_item.enqueued_at = time.monotonic()
+        self._queues[queue_item.priority].append(queue_item)
+        self._size += 1
+        
+    def pop_batch(self, max_items: int) -> List[MessageQueueItem]:
+        """按优先级顺序批量出队
+        
+        Args:
+            max_items: 最多出队数量
+            
+        Returns:
+            出队的消息（高优先级在前，同优先级按入队顺序）
+        """
+        batch: List[MessageQueueItem] = []
+        now = time.monotonic()
+        for priority in self.PRIORITY_ORDER:
+            queue = self._queues[priority]
+            while queue and len(batch) < max_items:
+                queue_item = queue.popleft()
+                wait = now - queue_item.enqueued_at
+                self._dequeued[priority] += 1
+                self._total_wait[priority] += wait
+                if wait > self._max_wait[priority]:
+                    self._max_wait[priority] = wait
+                batch.append(queue_item)
+            if len(batch) >= max_items:
+                break
+        self._size -= len(batch)
+        return batch
+        
+    def depths(self) -> Dict[str, int]:
+        """各优先级的队列深度"""
+        return {priority.value: len(self._queues[priority]) for priority in self.PRIORITY_ORDER}
+        
+    def wait_stats(self) -> Dict[str, Dict[str, float]]:
+        """各优先级的等待时长统计（秒）"""
+        now = time.monotonic()
+        stats = {}
+        for priority in self.PRIORITY_ORDER:
+            queue = self._queues[priority]
+            dequeued = self._dequeued[priority]
+            stats[priority.value] = {
+                "dequeued": dequeued,
+                "avg_wait": self._total_wait[priority] / dequeued if dequeued else 0.0,
+                "max_wait": self._max_wait[priority],
+                "oldest_wait": now - queue[0].enqueued_at if queue else 0.0
+            }
+        return stats
+        
+    def clear(self):
+        """清空队列"""
+        for queue in self._queues.values():
+            queue.clear()
+        self._size = 0
+
+
 class MessageRouter:
     """消息路由引擎"""
     
@@ -75,11 +167,13 @@ class MessageRouter:
         """初始化消息路由引擎"""
         self.connection_manager = connection_manager
         self.session_manager = session_manager
-        self.message_queue: List[MessageQueueItem] = []
+        self.message_queue = PriorityMessageQueue()
         self.is_processing = False
-        self.processing_interval = 0.1  # 处理间隔（秒）
+        self.processing_interval = 0.1  # 空闲时的最长等待间隔（秒）
         self.max_queue_size = 10000     # 最大队列大小
+        self.max_batch_size = 100       # 每批最多处理的消息数
         self._processing_task: Optional[asyncio.Task] = None
+        self._queue_ready = asyncio.Event()
         
     async def route_message(self, message: Dict[str, Any], routing_strategy: RoutingStrategy,
                           target: Optional[str] = None, priority: MessagePriority = MessagePriority.NORMAL) -> str:
@@ -112,27 +206,13 @@ class MessageRouter:
         return queue_item.message_id
         
     async def _insert_to_queue(self, queue_item: MessageQueueItem):
-        """将消息插入队列（按优先级排序）
+        """将消息插入队列（按优先级分桶，同优先级先进先出）
         
         Args:
             queue_item: 消息队列项
         """
-        priority_order = {
-            MessagePriority.URGENT: 0,
-            MessagePriority.HIGH: 1,
-            MessagePriority.NORMAL: 2,
-            MessagePriority.LOW: 3
-        }
-        
-        # 找到插入位置
-        insert_index = 0
-        for i, item in enumerate(self.message_queue):
-            if priority_order[item.priority] <= priority_order[queue_item.priority]:
-                insert_index = i + 1
-            else:
-                break
-                
-        self.message_queue.insert(insert_index, queue_item)
+        self.message_queue.push(queue_item)
+        self._queue_ready.set()
         
     async def start_processing(self):
         """启动消息处理任务"""
@@ -149,11 +229,17 @@ class MessageRouter:
                 pass
                 
     async def _processing_loop(self):
-        """消息处理循环"""
+        """消息处理循环：有消息入队时立即按批处理，处理完一批后让出事件循环"""
         while True:
             try:
-                await asyncio.sleep(self.processing_interval)
+                if not self.message_queue:
+                    self._queue_ready.clear()
+                    try:
+                        await asyncio.wait_for(self._queue_ready.wait(), timeout=self.processing_interval)
+                    except asyncio.TimeoutError:
+                        continue
                 await self._process_queue()
+                await asyncio.sleep(0)
             except asyncio.CancelledError:
                 break
             except Exception as e:
@@ -167,14 +253,11 @@ class MessageRouter:
         self.is_processing = True
         
         try:
-            # 处理队列中的消息（限制每次处理数量）
-            processed_count = 0
-            max_batch_size = 100
-            
-            while self.message_queue and processed_count < max_batch_size:
-                queue_item = self.message_queue.pop(0)
+            # 批量出队处理（限制每次处理数量）
+            batch = self.message_queue.pop_batch(self.max_batch_size)
+            for queue_item in batch:
                 await self._process_message(queue_item)
-                processed_count += 1
+            processed_count = len(batch)
                 
             if processed_count > 0:
                 logger.debug(f"处理了 {processed_count} 条消息")
@@ -354,15 +437,12 @@ class MessageRouter:
         Returns:
             队列统计信息
         """
-        priority_stats = {}
-        for item in self.message_queue:
-            priority = item.priority.value
-            priority_stats[priority] = priority_stats.get(priority, 0) + 1
-            
         return {
             "queue_size": len(self.message_queue),
             "max_queue_size": self.max_queue_size,
-            "priority_stats": priority_stats,
+            "max_batch_size": self.max_batch_size,
+            "priority_stats": self.message_queue.depths(),
+            "wait_time_stats": self.message_queue.wait_stats(),
             "is_processing": self.is_processing
         }
 
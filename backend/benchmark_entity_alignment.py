@@ -0,0 +1,159 @@
+"""
+实体对齐基准测试脚本
+
+在合成实体数据上对比 EntityAlignmentService 的两条聚类路径：
+1. 完整相似度矩阵 + 层次聚类（原实现，O(n²) 相似度计算 + O(n³) 聚类）
+2. 分块候选 + 批量打分 + 并查集（可扩展实现）
+
+输出每种规模下的耗时、聚类数，以及与合成真值、与原实现聚类结果之间的
+成对精确率 / 召回率 / F1。原实现只在不超过 --exact-limit 的规模上运行。
+
+用法:
+    python benchmark_entity_alignment.py --sizes 200 500 2000 20000
+"""
+
+import argparse
+import logging
+import random
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Dict, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from app.services.knowledge.alignment.entity_alignment_service import EntityAlignmentService
+
+logging.basicConfig(
+    level=logging.WARNING,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+
+CJK_CHARS = "北京上海广州深圳科技信息数据智能网络电子软件系统工程研究中心大学医院银行集团股份有限公司"
+LATIN_CHARS = "abcdefghijklmnopqrstuvwxyz"
+SUFFIXES = ["公司", "集团", " inc", " ltd", "研究院"]
+
+
+def _random_name(rng: random.Random) -> str:
+    """生成随机基础实体名"""
+    if rng.random() < 0.6:
+        return "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(3, 7)))
+    words = ["".join(rng.choice(LATIN_CHARS) for _ in range(rng.randint(3, 8)))
+             for _ in range(rng.randint(1, 3))]
+    return " ".join(words)
+
+
+def _variant(name: str, rng: random.Random) -> str:
+    """生成基础实体名的变体（大小写、后缀、缺字、截断）"""
+    choice = rng.random()
+    if choice < 0.3:
+        return name
+    if choice < 0.45:
+        return name.upper() if rng.random() < 0.5 else name.title()
+    if choice < 0.65:
+        return name + rng.choice(SUFFIXES)
+    if choice < 0.85 and len(name) > 3:
+        pos = rng.randrange(len(name))
+        return name[:pos] + name[pos + 1:]
+    return name[:max(2, len(name) - 1)]
+
+
+def generate_entities(size: int, seed: int = 7) -> Tuple[List[SimpleNamespace], List[int]]:
+    """
+    生成合成实体及其真值聚类标签
+
+    平均每个基础实体约 4 个提及，分布在 size // 20 个文档中。
+    """
+    rng = random.Random(seed)
+    num_bases = max(1, size // 4)
+    bases = [_random_name(rng) for _ in range(num_bases)]
+    num_documents = max(1, size // 20)
+
+    entities, labels = [], []
+    for idx in range(size):
+        label = rng.randrange(num_bases)
+        entities.append(SimpleNamespace(
+            id=idx,
+            entity_text=_variant(bases[label], rng),
+            entity_type="ORG",
+            document_id=rng.randrange(num_documents),
+            context=""
+        ))
+        labels.append(label)
+    return entities, labels
+
+
+def _pair_count(counts) -> int:
+    return sum(c * (c - 1) // 2 for c in counts)
+
+
+def pairwise_scores(reference: List[int], predicted: List[int]) -> Dict[str, float]:
+    """以 reference 为基准计算 predicted 的成对精确率 / 召回率 / F1"""
+    true_positive = _pair_count(Counter(zip(reference, predicted)).values())
+    predicted_pairs = _pair_count(Counter(predicted).values())
+    reference_pairs = _pair_count(Counter(reference).values())
+
+    precision = true_positive / predicted_pairs if predicted_pairs else 1.0
+    recall = true_positive / reference_pairs if reference_pairs else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def cluster_labels(entities: List[SimpleNamespace], clusters: List[List[SimpleNamespace]]) -> List[int]:
+    """聚类结果转换为按实体顺序排列的标签"""
+    labels = [0] * len(entities)
+    for label, cluster in enumerate(clusters):
+        for entity in cluster:
+            labels[entity.id] = label
+    return labels
+
+
+def run_exact(service: EntityAlignmentService, entities) -> Tuple[List[int], float]:
+    start = time.perf_counter()
+    matrix = service._compute_similarity_matrix(entities)
+    clusters = service._hierarchical_clustering(entities, matrix)
+    return cluster_labels(entities, clusters), time.perf_counter() - start
+
+
+def run_scalable(service: EntityAlignmentService, entities) -> Tuple[List[int], float]:
+    start = time.perf_counter()
+    clusters = service._scalable_clustering(entities)
+    return cluster_labels(entities, clusters), time.perf_counter() - start
+
+
+def _format(scores: Dict[str, float]) -> str:
+    return f"P={scores['precision']:.3f} R={scores['recall']:.3f} F1={scores['f1']:.3f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="实体对齐基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 500, 2000, 20000],
+                        help="同类型实体数量")
+    parser.add_argument("--exact-limit", type=int, default=500,
+                        help="原实现运行的最大规模（其聚类为 O(n³)）")
+    parser.add_argument("--bert", action="store_true", help="启用BERT语义相似度")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    service = EntityAlignmentService(db=None, use_bert=args.bert)
+
+    print(f"{'规模':>8} {'路径':<10} {'耗时(s)':>10} {'聚类数':>8}  对真值                          对原实现")
+    for size in args.sizes:
+        entities, truth = generate_entities(size, args.seed)
+
+        exact_labels = None
+        if size <= args.exact_limit:
+            exact_labels, elapsed = run_exact(service, entities)
+            print(f"{size:>8} {'exact':<10} {elapsed:>10.3f} {len(set(exact_labels)):>8}  "
+                  f"{_format(pairwise_scores(truth, exact_labels))}")
+
+        scalable_labels, elapsed = run_scalable(service, entities)
+        agreement = _format(pairwise_scores(exact_labels, scalable_labels)) if exact_labels else "-"
+        print(f"{size:>8} {'scalable':<10} {elapsed:>10.3f} {len(set(scalable_labels)):>8}  "
+              f"{_format(pairwise_scores(truth, scalable_labels))}  {agreement}")
+
+
+if __name__ == "__main__":
+    main()
@@ -56,6 +56,12 @@ class SearchRequest(BaseModel):
     top_k: int = 5
     filters: Optional[Dict[str, Any]] = None
 
+class BatchSearchRequest(BaseModel):
+    collection_name: str
+    queries: List[str]
+    top_k: int = 5
+    filters: Optional[Dict[str, Any]] = None
+
 class DeleteRequest(BaseModel):
     collection_name: str
     document_ids: Optional[List[str]] = None
@@ -65,6 +71,33 @@ class GetDocumentsRequest(BaseModel):
     collection_name: str
     filters: Optional[Dict[str, Any]] = None
 
+class UpdateMetadataRequest(BaseModel):
+    collection_name: str
+    ids: List[str]
+    metadatas: List[Dict[str, Any]]
+
+def _lookup_embeddings_by_hash(collection, metadatas: List[Dict[str, Any]]) -> List[Optional[List[float]]]:
+    """按元数据中的 content_hash 查找集合中已有的向量，未命中的位置为 None"""
+    hashes = list({m.get("content_hash") for m in metadatas if m and m.get("content_hash")})
+    if not hashes:
+        return [None] * len(metadatas)
+
+    try:
+        existing = collection.get(
+            where={"content_hash": {"$in": hashes}},
+            include=["embeddings", "metadatas"]
+        )
+    except Exception as e:
+        logger.warning(f"按内容哈希查找向量失败: {e}")
+        return [None] * len(metadatas)
+
+    by_hash = {}
+    for metadata, embedding in zip(existing.get("metadatas") or [], existing.get("embeddings") or []):
+        if metadata and embedding is not None:
+            by_hash.setdefault(metadata.get("content_hash"), list(embedding))
+
+    return [by_hash.get(m.get("content_hash")) if m else None for m in metadatas]
+
 @app.on_event("startup")
 async def startup_event():
     """服务启动时初始化ChromaDB"""
@@ -151,17 +184,32 @@ async def batch_add_documents(collection_name: str, request: BatchAddDocumentsRe
         documents = [doc["text"] for doc in request.documents]
         metadatas = [doc["metadata"] for doc in request.documents]
 
-        # 批量添加（ChromaDB内部会批量处理嵌入）
-        collection.add(
-            ids=ids,
-            documents=documents,
-            metadatas=metadatas
-        )
+        # 内容相同的片段（如同一文件上传到多个知识库）直接复用已有向量
+        embeddings = _lookup_embeddings_by_hash(collection, metadatas)
+        reused = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if reused:
+            collection.add(
+                ids=[ids[i] for i in reused],
+                documents=[documents[i] for i in reused],
+                metadatas=[metadatas[i] for i in reused],
+                embeddings=[embeddings[i] for i in reused]
+            )
+
+        # 其余文档批量添加（ChromaDB内部会批量处理嵌入）
+        if missing:
+            collection.add(
+                ids=[ids[i] for i in missing],
+                documents=[documents[i] for i in missing],
+                metadatas=[metadatas[i] for i in missing]
+            )
 
-        logger.info(f"批量添加成功: {len(ids)} 个文档")
+        logger.info(f"批量添加成功: {len(ids)} 个文档，复用向量 {len(reused)} 个")
         return {
             "message": "批量添加成功",
-            "count": len(ids)
+            "count": len(ids),
+            "reused": len(reused)
         }
     except Exception as e:
         logger.error(f"批量添加文档失败: {e}")
@@ -205,6 +253,46 @@ async def search(collection_name: str, request: SearchRequest):
         logger.error(f"搜索失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/collections/{collection_name}/search/batch")
+async def search_batch(collection_name: str, request: BatchSearchRequest):
+    """批量搜索文档：一次嵌入全部查询，一次多查询向量检索"""
+    try:
+        collection = client.get_or_create_collection(
+            collection_name,
+            embedding_function=embedding_function
+        )
+
+        if not request.queries:
+            return {"results": []}
+
+        query_params = {
+            "query_texts": request.queries,
+            "n_results": request.top_k
+        }
+        if request.filters and len(request.filters) > 0:
+            query_params["where"] = request.filters
+
+        results = collection.query(**query_params)
+
+        # 按查询分组格式化结果
+        batch_results = []
+        for q in range(len(request.queries)):
+            formatted_results = []
+            ids = results['ids'][q] if results['ids'] else []
+            for i in range(len(ids)):
+                formatted_results.append({
+                    "id": ids[i],
+                    "document": results['documents'][q][i] if results['documents'] else "",
+                    "metadata": results['metadatas'][q][i] if results['metadatas'] else {},
+                    "distance": results['distances'][q][i] if results['distances'] else 0
+                })
+            batch_results.append(formatted_results)
+
+        return {"results": batch_results}
+    except Exception as e:
+        logger.error(f"批量搜索失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/collections/{collection_name}/documents")
 async def delete_documents(collection_name: str, request: DeleteRequest):
     """删除文档"""
@@ -224,6 +312,23 @@ async def delete_documents(collection_name: str, request: DeleteRequest):
         logger.error(f"删除文档失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/collections/{collection_name}/documents/metadata")
+async def update_metadata(collection_name: str, request: UpdateMetadataRequest):
+    """批量更新文档元数据（不重新计算嵌入）"""
+    try:
+        collection = client.get_or_create_collection(
+            collection_name,
+            embedding_function=embedding_function
+        )
+
+        if request.ids:
+            collection.update(ids=request.ids, metadatas=request.metadatas)
+
+        return {"message": "元数据更新成功", "count": len(request.ids)}
+    except Exception as e:
+        logger.error(f"更新元数据失败: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/collections/{collection_name}/count")
 async def count_documents(collection_name: str):
     """获取文档数量"""
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 使测试可直接导入 backend 下的 app 包
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,41 @@
+"""FAISS索引旁路存储测试"""
+import numpy as np
+
+from app.services.knowledge.vectorization.faiss_sidecar_store import FAISSSidecarStore
+
+
+def _vectors(n: int, dimension: int = 4) -> np.ndarray:
+    return np.random.default_rng(n).random((n, dimension), dtype=np.float32)
+
+
+def test_reopen_after_crash_discards_unflushed_records(tmp_path):
+    store = FAISSSidecarStore(tmp_path, "kb", 4)
+    store.create()
+    store.append(["a", "b"], _vectors(2))
+    store.flush()
+
+    # 状态文件之后写入的记录：日志已落盘，但进程在 flush 前崩溃
+    store.append(["stale"], _vectors(1))
+    store._log.flush()
+    store.close()
+
+    recovered = FAISSSidecarStore(tmp_path, "kb", 4)
+    assert recovered.open()
+    assert recovered.lookup("stale") is None
+    [reused] = recovered.append(["fresh"], _vectors(1))
+    assert reused == 2
+    recovered.flush()
+    recovered.close()
+
+    reopened = FAISSSidecarStore(tmp_path, "kb", 4)
+    assert reopened.open()
+    assert reopened.lookup("stale") is None
+    assert reopened.lookup("fresh") == 2
+    assert reopened.get_id(2) == "fresh"
+    assert reopened.count == 3
+
+    reopened.mark_deleted([2])
+    assert reopened.lookup("fresh") is None
+    assert reopened.lookup("stale") is None
+    assert reopened.lookup("a") == 0
+    reopened.close()
@@ -0,0 +1,30 @@
+import asyncio
+
+from app.modules.llm.services.llm_rate_controller import AdaptiveConcurrencyLimiter
+
+
+def test_waiter_granted_and_cancelled_in_same_turn_releases_once():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=1)
+
+    async def scenario():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.get_stats()["waiting"] == 1
+
+        # 放行等待者后、唤醒回调执行前取消
+        limiter.release()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert waiter.cancelled()
+        assert limiter.in_flight == 0
+
+        # 名额可以再次获取，且不会超过上限
+        await limiter.acquire()
+        assert limiter.in_flight == 1
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
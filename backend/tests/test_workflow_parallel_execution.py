@@ -0,0 +1,40 @@
+import asyncio
+
+from app.modules.workflow.services.workflow_service import WorkflowEngine
+
+
+def _run(nodes, edges, input_data):
+    """执行工作流，节点执行器替换为按配置写入上下文，返回 (执行结果, 各节点输入上下文)"""
+    engine = WorkflowEngine(db=None)
+    inputs = {}
+
+    async def execute_node_async(execution_id, node, context_data, thread_pool=None):
+        inputs[node["id"]] = dict(context_data)
+        await asyncio.sleep(node["config"].get("delay", 0))
+        return {"success": True, "output_data": dict(node["config"]["set"])}
+
+    engine.execute_node_async = execute_node_async
+    result = asyncio.run(engine.execute_workflow_by_connections_async(1, nodes, edges, input_data))
+    return result, inputs
+
+
+def test_diamond_join_keeps_branch_modification_of_input_key():
+    # start -> a, start -> b, a -> join, b -> join；a 修改输入键 x，b 不修改 x 且先完成
+    nodes = [
+        {"id": "start", "type": "start", "config": {"set": {}}},
+        {"id": "a", "type": "process", "config": {"set": {"x": 1}, "delay": 0.02}},
+        {"id": "b", "type": "process", "config": {"set": {"y": 2}}},
+        {"id": "join", "type": "end", "config": {"set": {}}},
+    ]
+    edges = [
+        {"source": "start", "target": "a"},
+        {"source": "start", "target": "b"},
+        {"source": "a", "target": "join"},
+        {"source": "b", "target": "join"},
+    ]
+
+    result, inputs = _run(nodes, edges, {"x": 0})
+
+    assert inputs["join"] == {"x": 1, "y": 2}
+    assert result["final_context"] == {"x": 1, "y": 2}
+    assert result["executed_nodes"][-1] == "join"